@@ -0,0 +1,165 @@
+"""
+景點熱門度與活躍度彙總
+- 三張 rollup 表：景點 × 日（rollup_spot_day）、路線 × 週（rollup_route_week，以週一日期為 key）、
+  地區 × 月（rollup_region_month）
+- 打卡 / 取消時在同一個交易內增減對應的桶（取消扣回原打卡日期所在的桶）
+- /api/analytics/* 只讀 rollup 表的主鍵範圍，查詢成本取決於查詢區間，與 checkins 的歷史長度無關
+- rebuild_rollups 由 checkins 重新計算（PostgreSQL 也適用：只用 GROUP BY，週 / 月在 Python 換算）
+
+重建：
+    python analytics.py rebuild
+"""
+
+import sys
+from datetime import date, timedelta
+
+# 月份 → 季節
+SEASONS = {3: '春', 4: '春', 5: '春', 6: '夏', 7: '夏', 8: '夏',
+           9: '秋', 10: '秋', 11: '秋', 12: '冬', 1: '冬', 2: '冬'}
+
+# 每次 executemany 寫入的筆數
+REBUILD_CHUNK = 5000
+
+
+def week_key(day):
+    """日期（YYYY-MM-DD）所在週的週一"""
+    d = date.fromisoformat(day)
+    return (d - timedelta(days=d.weekday())).isoformat()
+
+
+def month_key(day):
+    return day[:7]
+
+
+def _bump(conn, table, key_columns, key_values, delta):
+    columns = ', '.join(key_columns)
+    placeholders = ', '.join('?' * (len(key_columns) + 1))
+    conn.execute(f'''
+        INSERT INTO {table} ({columns}, checkins) VALUES ({placeholders})
+        ON CONFLICT ({columns}) DO UPDATE SET checkins = {table}.checkins + excluded.checkins
+    ''', (*key_values, delta))
+
+
+def apply_checkin(conn, spot, day, delta):
+    """
+    打卡（delta=1）或取消（delta=-1）時更新三張 rollup 表，需與打卡寫入在同一交易內
+
+    Args:
+        spot: 含 id、route_id、region 的景點列
+        day: 打卡日期（取消時為原打卡日期）
+    """
+    if not day:
+        return
+    _bump(conn, 'rollup_spot_day', ('spot_id', 'day'), (spot['id'], day), delta)
+    _bump(conn, 'rollup_route_week', ('route_id', 'week'), (spot['route_id'], week_key(day)), delta)
+    _bump(conn, 'rollup_region_month', ('region', 'month'), (spot['region'] or '', month_key(day)), delta)
+
+
+def rebuild_rollups(conn):
+    """由 checkins 重新計算所有 rollup，由呼叫端 commit（需在寫入交易內執行，避免與打卡交錯）"""
+    spot_day, route_week, region_month = {}, {}, {}
+    rows = conn.execute('''
+        SELECT c.spot_id, s.route_id, r.region, c.checkin_date, COUNT(*) AS n
+        FROM checkins c JOIN spots s ON c.spot_id = s.id JOIN routes r ON s.route_id = r.id
+        WHERE c.checkin_date IS NOT NULL
+        GROUP BY c.spot_id, s.route_id, r.region, c.checkin_date
+    ''')
+    for spot_id, route_id, region, day, n in rows:
+        spot_day[(spot_id, day)] = n
+        key = (route_id, week_key(day))
+        route_week[key] = route_week.get(key, 0) + n
+        key = (region or '', month_key(day))
+        region_month[key] = region_month.get(key, 0) + n
+
+    for table, columns, buckets in (
+        ('rollup_spot_day', 'spot_id, day', spot_day),
+        ('rollup_route_week', 'route_id, week', route_week),
+        ('rollup_region_month', 'region, month', region_month),
+    ):
+        conn.execute(f"DELETE FROM {table}")
+        items = [(*key, n) for key, n in buckets.items()]
+        for start in range(0, len(items), REBUILD_CHUNK):
+            conn.executemany(f"INSERT INTO {table} ({columns}, checkins) VALUES (?, ?, ?)",
+                             items[start:start + REBUILD_CHUNK])
+    return {'spot_day': len(spot_day), 'route_week': len(route_week), 'region_month': len(region_month)}
+
+
+# ==================== 查詢 ====================
+
+def top_spots(conn, start, end, limit=10):
+    """區間內打卡最多的景點"""
+    rows = conn.execute('''
+        SELECT s.id, s.name, s.icon, s.rarity, r.name AS route_name, r.region, SUM(d.checkins) AS checkins
+        FROM rollup_spot_day d
+        JOIN spots s ON d.spot_id = s.id JOIN routes r ON s.route_id = r.id
+        WHERE d.day BETWEEN ? AND ?
+        GROUP BY s.id, s.name, s.icon, s.rarity, r.name, r.region
+        HAVING SUM(d.checkins) > 0
+        ORDER BY checkins DESC, s.id
+        LIMIT ?
+    ''', (start, end, limit)).fetchall()
+    return [dict(r) for r in rows]
+
+
+def spot_daily(conn, spot_id, start, end):
+    """單一景點每日打卡數"""
+    rows = conn.execute('''
+        SELECT day, checkins FROM rollup_spot_day
+        WHERE spot_id = ? AND day BETWEEN ? AND ? AND checkins != 0
+        ORDER BY day
+    ''', (spot_id, start, end)).fetchall()
+    return [{'day': r['day'], 'checkins': r['checkins']} for r in rows]
+
+
+def route_weekly(conn, start, end, route_id=None):
+    """路線每週打卡數（week 為該週週一）"""
+    query = '''
+        SELECT w.route_id, r.name AS route_name, r.region, w.week, w.checkins
+        FROM rollup_route_week w JOIN routes r ON w.route_id = r.id
+        WHERE w.week BETWEEN ? AND ? AND w.checkins != 0
+    '''
+    params = [week_key(start), end]
+    if route_id is not None:
+        query += " AND w.route_id = ?"
+        params.append(route_id)
+    query += " ORDER BY w.week, w.route_id"
+    return [dict(r) for r in conn.execute(query, params).fetchall()]
+
+
+def region_monthly(conn, start_month, end_month):
+    """地區每月打卡數"""
+    rows = conn.execute('''
+        SELECT region, month, checkins FROM rollup_region_month
+        WHERE month BETWEEN ? AND ? AND checkins != 0
+        ORDER BY month, region
+    ''', (start_month, end_month)).fetchall()
+    return [dict(r) for r in rows]
+
+
+def region_seasons(conn, start_month, end_month):
+    """地區 × 季節打卡數（由月彙總加總）"""
+    seasons = {}
+    for row in region_monthly(conn, start_month, end_month):
+        key = (row['region'], SEASONS[int(row['month'][5:7])])
+        seasons[key] = seasons.get(key, 0) + row['checkins']
+    return [{'region': region, 'season': season, 'checkins': n}
+            for (region, season), n in sorted(seasons.items())]
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if argv[:1] != ['rebuild']:
+        print("用法：python analytics.py rebuild")
+        return 1
+    import app as retire_app
+
+    with retire_app.get_db(immediate=True) as conn:
+        counts = rebuild_rollups(conn)
+        conn.commit()
+    print(f"✅ rollup 已重建：景點×日 {counts['spot_day']:,}、路線×週 {counts['route_week']:,}、"
+          f"地區×月 {counts['region_month']:,}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
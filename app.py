@@ -6,8 +6,11 @@ Railway + LINE Bot 版本
 
 import os
 import json
+import base64
+import hashlib
 from datetime import datetime, timezone, timedelta
-from flask import Flask, request, abort, render_template, jsonify, redirect, url_for, session
+from flask import Flask, request, abort, render_template, jsonify, redirect, url_for, session, send_file
+from itsdangerous import URLSafeTimedSerializer, BadSignature
 from linebot.v3 import WebhookHandler
 from linebot.v3.messaging import (
     Configuration, ApiClient, MessagingApi,
@@ -19,6 +22,22 @@ from linebot.v3.webhooks import MessageEvent, TextMessageContent, LocationMessag
 from linebot.v3.exceptions import InvalidSignatureError
 import sqlite3
 from contextlib import contextmanager
+from profiling import init_profiling, connection_factory
+from auth import require_token
+from compression import init_compression
+from assets import init_assets, bundle_urls
+from db_writer import (SQLITE_BUSY_TIMEOUT_MS, SQLITE_GROUP_COMMIT, GroupCommitWriter,
+                       configure_connection, enable_wal)
+from storage import create_backend, IntegrityError
+from change_bus import change_bus, record_change
+from leaderboard import leaderboard, apply_checkin, rebuild_scores, mask_user_id, OVERALL
+import analytics
+import repository
+from atlas_clusters import ClusterIndex, bitset_to_mask, parse_bbox
+from photo_import import photo_importer, IMPORT_MAX_FILES
+from user_archive import user_archive, ArchiveError, ARCHIVE_MAX_UPLOAD_BYTES
+from upload_store import upload_store, upload_filename, UPLOAD_URL_PREFIX
+import photo_server
 
 # 台灣時區 (UTC+8)
 TW_TIMEZONE = timezone(timedelta(hours=8))
@@ -40,6 +59,15 @@ app = Flask(__name__, static_folder='static', static_url_path='/static')
 # Session 密鑰（用於 Google OAuth）
 app.secret_key = os.environ.get('FLASK_SECRET_KEY', 'retire-reading-secret-key-2025')
 
+# 請求效能分析（Server-Timing + /metrics）
+init_profiling(app)
+
+# 前端打包檔（帶內容雜湊的 CSS / JS，需在預壓縮之前建置）
+init_assets(app)
+
+# 回應壓縮（gzip / brotli）與預壓縮靜態檔
+init_compression(app)
+
 # 註冊 Google Blueprint（可選功能）
 GOOGLE_ENABLED = False
 try:
@@ -53,9 +81,11 @@ except Exception as e:
 # LINE Bot 設定
 LINE_CHANNEL_SECRET = os.environ.get('LINE_CHANNEL_SECRET', '')
 LINE_CHANNEL_ACCESS_TOKEN = os.environ.get('LINE_CHANNEL_ACCESS_TOKEN', '')
+# Messaging API 位址（壓測時指向 fake_line_api.py，預設為 LINE 官方）
+LINE_API_HOST = os.environ.get('LINE_API_HOST', '')
 
 if LINE_CHANNEL_SECRET and LINE_CHANNEL_ACCESS_TOKEN:
-    configuration = Configuration(access_token=LINE_CHANNEL_ACCESS_TOKEN)
+    configuration = Configuration(access_token=LINE_CHANNEL_ACCESS_TOKEN, host=LINE_API_HOST or None)
     handler = WebhookHandler(LINE_CHANNEL_SECRET)
 else:
     configuration = None
@@ -63,18 +93,74 @@ else:
 
 DATABASE = os.environ.get('DATABASE_PATH', 'retire_reading.db')
 
-@contextmanager
-def get_db():
-    conn = sqlite3.connect(DATABASE)
+def connect_sqlite(path):
+    conn = sqlite3.connect(path, timeout=SQLITE_BUSY_TIMEOUT_MS / 1000, factory=connection_factory())
     conn.row_factory = sqlite3.Row
-    try:
+    configure_connection(conn)
+    return conn
+
+# 儲存後端（設定 DATABASE_URL=postgresql://... 時改用 PostgreSQL）
+db_backend = create_backend(os.environ.get('DATABASE_URL', ''), lambda: DATABASE, connect_sqlite)
+
+@contextmanager
+def get_db(immediate=False):
+    """
+    取得資料庫連線
+    immediate=True 時直接以 BEGIN IMMEDIATE 開始交易（先讀後寫的流程用，避免升級 lock 時失敗）
+    """
+    with db_backend.connect(immediate) as conn:
         yield conn
-    finally:
-        conn.close()
+
+# 選用的 writer thread（group commit）
+db_writer = GroupCommitWriter(get_db) if SQLITE_GROUP_COMMIT else None
+
+# 跨 worker 快取失效：SQLite 以不經過效能分析的專用連線檢查 data_version
+change_bus.configure(
+    get_db,
+    (lambda: sqlite3.connect(DATABASE, check_same_thread=False)) if db_backend.name == 'sqlite' else None
+)
+leaderboard.configure(get_db)
+
+# Google token 與相簿媒體快取存在同一個資料庫
+if GOOGLE_ENABLED:
+    from google_tokens import token_store
+    from google_media_cache import media_cache
+    token_store.configure(get_db)
+    media_cache.configure(get_db)
+
+def google_session_token():
+    """目前 session 的 Google access token（未連動或未載入 Google 模組時回傳 None）"""
+    if not GOOGLE_ENABLED:
+        return None
+    from google_tokens import session_access_token
+    return session_access_token()
+
+def google_session_owner():
+    """目前 session 的 Google email（media_cache 以此快取使用者的相簿 id）"""
+    from google_tokens import session_user
+    return (session_user() or {}).get('email')
+
+def run_write(fn, *args):
+    """
+    執行寫入 fn(conn, *args)，fn 內不 commit，回傳 fn 的結果
+    啟用 group commit 時交給 writer thread 與其他寫入合併提交，否則以 BEGIN IMMEDIATE 直接寫入
+    """
+    if db_writer:
+        return db_writer.run(fn, *args)
+    with get_db(immediate=True) as conn:
+        result = fn(conn, *args)
+        conn.commit()
+        return result
+
+# 打卡照片目錄（uploads 表記錄每個檔案的大小與參照數）
+UPLOAD_DIR = os.path.join(app.static_folder or 'static', 'uploads')
+upload_store.configure(get_db, run_write, UPLOAD_DIR)
 
 def init_db():
     """初始化資料庫"""
     with get_db() as conn:
+        if db_backend.name == 'sqlite':
+            enable_wal(conn)
         conn.executescript('''
             -- 願望清單
             CREATE TABLE IF NOT EXISTS wishes (
@@ -190,17 +276,187 @@ def init_db():
                 total_spots INTEGER DEFAULT 0,
                 created_at TEXT DEFAULT CURRENT_TIMESTAMP
             );
+            
+            -- 打卡異動紀錄（PWA 增量同步用，id 即版本號）
+            CREATE TABLE IF NOT EXISTS checkin_events (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id TEXT NOT NULL,
+                spot_id INTEGER NOT NULL,
+                action TEXT NOT NULL,
+                created_at TEXT DEFAULT CURRENT_TIMESTAMP
+            );
+            CREATE INDEX IF NOT EXISTS idx_checkin_events_user ON checkin_events(user_id, id);
+            
+            -- 打卡冪等鍵（離線佇列重送時不重複打卡）
+            CREATE TABLE IF NOT EXISTS checkin_requests (
+                user_id TEXT NOT NULL,
+                idempotency_key TEXT NOT NULL,
+                spot_id INTEGER,
+                response TEXT,
+                created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (user_id, idempotency_key)
+            );
+            
+            -- Google OAuth token（cookie 只存 session_id，token 留在伺服器端）
+            CREATE TABLE IF NOT EXISTS google_tokens (
+                session_id TEXT PRIMARY KEY,
+                access_token TEXT,
+                refresh_token TEXT,
+                expires_at REAL NOT NULL,
+                refresh_lease_until REAL,
+                email TEXT,
+                name TEXT,
+                picture TEXT,
+                created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+                updated_at TEXT DEFAULT CURRENT_TIMESTAMP
+            );
+            
+            -- Google 相簿媒體索引快取（etag = 相簿的 mediaItemsCount）
+            CREATE TABLE IF NOT EXISTS google_media_albums (
+                album_id TEXT PRIMARY KEY,
+                owner TEXT,
+                title TEXT,
+                etag TEXT,
+                item_count INTEGER DEFAULT 0,
+                newest_creation_time TEXT,
+                generation INTEGER DEFAULT 0,
+                synced_at REAL,
+                checked_at REAL
+            );
+            
+            CREATE TABLE IF NOT EXISTS google_media_items (
+                album_id TEXT NOT NULL,
+                generation INTEGER NOT NULL,
+                position INTEGER NOT NULL,
+                media_id TEXT NOT NULL,
+                base_url TEXT,
+                product_url TEXT,
+                filename TEXT,
+                mime_type TEXT,
+                description TEXT,
+                creation_time TEXT,
+                PRIMARY KEY (album_id, generation, position)
+            );
+            
+            -- 資料異動紀錄（各 worker 追蹤後淘汰行程內快取）
+            CREATE TABLE IF NOT EXISTS change_log (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                scope TEXT NOT NULL,
+                user_id TEXT,
+                created_at REAL NOT NULL
+            );
+            
+            -- 收集分數（稀有度加權，打卡 / 取消時增減；region='' 為全台）
+            CREATE TABLE IF NOT EXISTS user_scores (
+                user_id TEXT NOT NULL,
+                region TEXT NOT NULL DEFAULT '',
+                score INTEGER NOT NULL DEFAULT 0,
+                checkin_count INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (user_id, region)
+            );
+            
+            -- 打卡數彙總（打卡 / 取消時增減；week 為週一日期）
+            CREATE TABLE IF NOT EXISTS rollup_spot_day (
+                spot_id INTEGER NOT NULL,
+                day TEXT NOT NULL,
+                checkins INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (spot_id, day)
+            );
+            
+            CREATE TABLE IF NOT EXISTS rollup_route_week (
+                route_id INTEGER NOT NULL,
+                week TEXT NOT NULL,
+                checkins INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (route_id, week)
+            );
+            
+            CREATE TABLE IF NOT EXISTS rollup_region_month (
+                region TEXT NOT NULL,
+                month TEXT NOT NULL,
+                checkins INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (region, month)
+            );
+            
+            -- 相簿匯入工作與每張照片的比對結果
+            CREATE TABLE IF NOT EXISTS import_jobs (
+                id TEXT PRIMARY KEY,
+                user_id TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'queued',
+                radius_m REAL NOT NULL,
+                total INTEGER NOT NULL DEFAULT 0,
+                processed INTEGER NOT NULL DEFAULT 0,
+                created INTEGER NOT NULL DEFAULT 0,
+                error TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                finished_at TIMESTAMP
+            );
+            
+            CREATE TABLE IF NOT EXISTS import_job_items (
+                job_id TEXT NOT NULL,
+                position INTEGER NOT NULL,
+                filename TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'pending',
+                spot_id INTEGER,
+                distance_m REAL,
+                taken_at TEXT,
+                message TEXT,
+                PRIMARY KEY (job_id, position)
+            );
+            
+            -- 上傳檔（打卡照片）：參照數為 0 的檔案由 GC 清除
+            CREATE TABLE IF NOT EXISTS uploads (
+                filename TEXT PRIMARY KEY,
+                user_id TEXT,
+                size INTEGER NOT NULL DEFAULT 0,
+                refcount INTEGER NOT NULL DEFAULT 0,
+                created_at REAL NOT NULL,
+                orphaned_at REAL
+            );
+            
+            -- 依用戶查詢與彙總用的索引
+            CREATE INDEX IF NOT EXISTS idx_uploads_user ON uploads(user_id);
+            CREATE INDEX IF NOT EXISTS idx_uploads_orphaned ON uploads(refcount, orphaned_at);
+            CREATE INDEX IF NOT EXISTS idx_import_jobs_user ON import_jobs(user_id, created_at);
+            CREATE INDEX IF NOT EXISTS idx_rollup_spot_day_day ON rollup_spot_day(day);
+            CREATE INDEX IF NOT EXISTS idx_rollup_route_week_week ON rollup_route_week(week);
+            CREATE INDEX IF NOT EXISTS idx_rollup_region_month_month ON rollup_region_month(month);
+            CREATE INDEX IF NOT EXISTS idx_user_scores_rank ON user_scores(region, score DESC);
+            CREATE INDEX IF NOT EXISTS idx_google_media_albums_owner ON google_media_albums(owner, title);
+            CREATE INDEX IF NOT EXISTS idx_checkins_user_spot ON checkins(user_id, spot_id);
+            CREATE INDEX IF NOT EXISTS idx_spots_route ON spots(route_id);
+            CREATE INDEX IF NOT EXISTS idx_wishes_user ON wishes(user_id, completed);
+            CREATE INDEX IF NOT EXISTS idx_travel_logs_user ON travel_logs(user_id);
         ''')
         conn.commit()
         
-        cursor = conn.cursor()
-        cursor.execute("SELECT COUNT(*) FROM routes")
-        if cursor.fetchone()[0] == 0:
+        if conn.execute("SELECT COUNT(*) FROM routes").fetchone()[0] == 0:
             insert_sample_data(conn)
         
-        cursor.execute("SELECT COUNT(*) FROM achievements")
-        if cursor.fetchone()[0] == 0:
+        if conn.execute("SELECT COUNT(*) FROM achievements").fetchone()[0] == 0:
             insert_achievements(conn)
+        
+        # 既有資料庫升級：依現有打卡計算分數
+        if conn.execute(
+            "SELECT EXISTS (SELECT 1 FROM checkins) AND NOT EXISTS (SELECT 1 FROM user_scores)"
+        ).fetchone()[0]:
+            rebuild_scores(conn)
+            conn.commit()
+            print("✅ 已依既有打卡計算收集分數")
+        
+        if conn.execute(
+            "SELECT EXISTS (SELECT 1 FROM checkins) AND NOT EXISTS (SELECT 1 FROM rollup_spot_day)"
+        ).fetchone()[0]:
+            analytics.rebuild_rollups(conn)
+            conn.commit()
+            print("✅ 已依既有打卡建立 rollup")
+        
+        if not conn.execute("SELECT EXISTS (SELECT 1 FROM uploads)").fetchone()[0] and (
+            os.path.isdir(UPLOAD_DIR) and any(not name.startswith('.') for name in os.listdir(UPLOAD_DIR))
+        ):
+            result = upload_store.reconcile(conn)
+            conn.commit()
+            print(f"✅ 已登記既有上傳檔 {result['files']} 個")
 
 def insert_achievements(conn):
     """插入成就資料"""
@@ -535,6 +791,7 @@ def insert_sample_data(conn):
                 ''', (current_route_id, name, stype, desc, 1, 1, 1, 1, lat, lng, spot_num, icon, rarity))
                 spot_num += 1
     
+    record_change(conn, 'catalog')
     conn.commit()
     print(f"✅ 已插入 {route_id-1} 條路線與 144 個景點")
 
@@ -542,90 +799,328 @@ def insert_sample_data(conn):
 
 def check_achievements(user_id):
     """檢查並解鎖成就"""
-    unlocked = []
+    # 取得用戶統計
+    stats = get_user_stats(user_id)
     
     with get_db() as conn:
-        # 取得用戶統計
-        stats = get_user_stats(user_id)
-        
         # 取得所有成就
-        achievements = conn.execute("SELECT * FROM achievements").fetchall()
+        achievements = repository.get_achievements(conn)
         
         # 已解鎖的成就
-        unlocked_ids = [r['achievement_id'] for r in conn.execute(
-            "SELECT achievement_id FROM user_achievements WHERE user_id = ?", (user_id,)
-        ).fetchall()]
-        
-        for ach in achievements:
-            if ach['id'] in unlocked_ids:
-                continue
-            
-            # 檢查條件
-            should_unlock = False
-            ct = ach['condition_type']
-            cv = ach['condition_value']
-            
-            if ct == 'checkin_count' and stats['checkin_count'] >= cv:
-                should_unlock = True
-            elif ct == 'photo_count' and stats['photo_count'] >= cv:
-                should_unlock = True
-            elif ct == 'total_distance' and stats['total_distance'] >= cv:
-                should_unlock = True
-            elif ct == 'wish_complete' and stats['wish_complete'] >= cv:
-                should_unlock = True
-            elif ct == 'diary_count' and stats['diary_count'] >= cv:
-                should_unlock = True
-            
-            if should_unlock:
-                conn.execute('''
-                    INSERT OR IGNORE INTO user_achievements (user_id, achievement_id)
-                    VALUES (?, ?)
-                ''', (user_id, ach['id']))
+        unlocked_ids = repository.get_unlocked_achievement_ids(conn, user_id)
+    
+    candidates = [ach for ach in achievements
+                  if ach['id'] not in unlocked_ids and is_achievement_met(ach, stats)]
+    if not candidates:
+        return []
+    
+    def unlock(conn):
+        unlocked = []
+        for ach in candidates:
+            # 同時有兩個請求解鎖時，只有實際寫入的那個回報
+            if repository.unlock_achievement(conn, user_id, ach['id']):
                 unlocked.append(ach)
-        
-        conn.commit()
+        if unlocked:
+            record_change(conn, 'user', user_id)
+        return unlocked
     
-    return unlocked
+    return run_write(unlock)
+
+def is_achievement_met(ach, stats):
+    """判斷成就條件是否達成（stats 格式同 get_user_stats）"""
+    ct = ach['condition_type']
+    cv = ach['condition_value']
+    
+    if ct in ('checkin_count', 'photo_count', 'total_distance', 'wish_complete', 'diary_count'):
+        return stats[ct] >= cv
+    return False
+
+# 用戶統計快取（用戶的打卡、願望、日記、成就寫入時 record_change 淘汰）
+user_stats_cache = change_bus.cache('user')
 
 def get_user_stats(user_id):
     """取得用戶統計"""
-    with get_db() as conn:
-        checkin_count = conn.execute(
-            "SELECT COUNT(*) FROM checkins WHERE user_id = ?", (user_id,)
-        ).fetchone()[0]
-        
-        photo_count = conn.execute(
-            "SELECT COUNT(*) FROM checkins WHERE user_id = ? AND photo_url IS NOT NULL", (user_id,)
-        ).fetchone()[0]
+    def load():
+        with get_db() as conn:
+            return repository.get_user_stats(conn, user_id)
+    return dict(user_stats_cache.get(user_id, load))
+
+# ============ 圖鑑同步 ============
+
+_atlas_catalog_cache = {}
+change_bus.subscribe('catalog', lambda _: _atlas_catalog_cache.clear())
+
+def record_checkin_event(conn, user_id, spot_id, action, checkin_date):
+    """
+    記錄打卡異動（action: checkin / cancel），並更新收集分數與 rollup，需與打卡寫入在同一交易內
+    checkin_date 為該筆打卡的日期（取消時扣回原本的日期）
+    """
+    repository.insert_checkin_event(conn, user_id, spot_id, action)
+    spot = repository.get_spot_scoring(conn, spot_id)
+    if spot:
+        delta = 1 if action == 'checkin' else -1
+        apply_checkin(conn, user_id, spot, delta)
+        analytics.apply_checkin(conn, spot, checkin_date, delta)
+    record_change(conn, 'user', user_id)
+
+def get_atlas_catalog():
+    """
+    取得圖鑑靜態目錄（路線 + 景點）
+    景點資料只在初始化時寫入，每個 worker 查詢一次後快取
+    """
+    if 'body' not in _atlas_catalog_cache:
+        with get_db() as conn:
+            routes, spots = repository.get_atlas_catalog(conn)
         
-        wish_complete = conn.execute(
-            "SELECT COUNT(*) FROM wishes WHERE user_id = ? AND completed = 1", (user_id,)
-        ).fetchone()[0]
+        payload = {
+            'routes': [dict(r) for r in routes],
+            'spots': [dict(s) for s in spots]
+        }
+        body = json.dumps(payload, ensure_ascii=False, separators=(',', ':'))
+        _atlas_catalog_cache['body'] = body
+        _atlas_catalog_cache['etag'] = hashlib.sha1(body.encode('utf-8')).hexdigest()
+        _atlas_catalog_cache['max_spot_id'] = max((s['id'] for s in spots), default=0)
+        _atlas_catalog_cache['clusters'] = ClusterIndex(payload['spots'])
+    return _atlas_catalog_cache
+
+# 用戶已收集景點的 bitset（地圖群集用，打卡 / 取消時淘汰）
+collected_mask_cache = change_bus.cache('user')
+
+def get_collected_mask(user_id):
+    def load():
+        with get_db() as conn:
+            return bitset_to_mask(repository.get_collected_spot_ids(conn, user_id))
+    return collected_mask_cache.get(user_id, load)
+
+def encode_spot_bitset(spot_ids, max_spot_id):
+    """
+    將景點 id 編碼為 bitset（base64）
+    第 id 個位元 = byte[id // 8] 的第 (id % 8) 位（最低位在前）
+    """
+    bits = bytearray(max_spot_id // 8 + 1)
+    for spot_id in spot_ids:
+        if 0 <= spot_id <= max_spot_id:
+            bits[spot_id // 8] |= 1 << (spot_id % 8)
+    return base64.b64encode(bytes(bits)).decode('ascii')
+
+def get_collection_sync(user_id, since=0):
+    """
+    取得用戶收集狀態
+    since <= 0 或大於目前版本時回傳完整 bitset，否則只回傳 since 之後的打卡 / 取消
+    """
+    catalog = get_atlas_catalog()
+    
+    with get_db() as conn:
+        # 先讀版本再讀資料：期間若有新異動，下次同步會重送一次，客戶端套用是冪等的
+        version = repository.get_collection_version(conn, user_id)
         
-        diary_count = conn.execute(
-            "SELECT COUNT(*) FROM travel_logs WHERE user_id = ? AND diary IS NOT NULL AND diary != ''", (user_id,)
-        ).fetchone()[0]
+        if since <= 0 or since > version:
+            spot_ids = repository.get_collected_spot_ids(conn, user_id)
+            return {
+                'user_id': user_id,
+                'version': version,
+                'full': True,
+                'count': len(spot_ids),
+                'max_spot_id': catalog['max_spot_id'],
+                'bitset': encode_spot_bitset(spot_ids, catalog['max_spot_id'])
+            }
         
-        # 取得總距離
-        settings = conn.execute(
-            "SELECT total_distance FROM user_settings WHERE user_id = ?", (user_id,)
-        ).fetchone()
-        total_distance = settings['total_distance'] if settings else 0
+        # 同一景點多次異動只保留最後一次
+        final_actions = {}
+        for e in repository.get_checkin_events(conn, user_id, since, version):
+            final_actions[e['spot_id']] = e['action']
         
-        # 取得成就數
-        achievement_count = conn.execute(
-            "SELECT COUNT(*) FROM user_achievements WHERE user_id = ?", (user_id,)
-        ).fetchone()[0]
+        added_ids = [sid for sid, action in final_actions.items() if action == 'checkin']
+        checkins = repository.get_checkins_for_spots(conn, user_id, added_ids)
     
     return {
-        'checkin_count': checkin_count,
-        'photo_count': photo_count,
-        'wish_complete': wish_complete,
-        'diary_count': diary_count,
-        'total_distance': total_distance,
-        'achievement_count': achievement_count
+        'user_id': user_id,
+        'version': version,
+        'full': False,
+        'since': since,
+        'checkins': checkins,
+        'cancels': [sid for sid, action in final_actions.items() if action == 'cancel']
     }
 
+def load_idempotent_response(conn, user_id, idempotency_key, spot_id=None):
+    """
+    在指定連線上查詢冪等鍵是否已處理過，回傳先前的結果（未處理過回傳 None）
+    帶 spot_id 時檢查冪等鍵是否用在同一個景點：用在其他景點時回傳 key_conflict，不重播別的景點的結果
+    """
+    if not idempotency_key:
+        return None
+    row = repository.get_checkin_request(conn, user_id, idempotency_key)
+    if not row:
+        return None
+    if spot_id is not None and row['spot_id'] is not None and row['spot_id'] != spot_id:
+        return {'success': False, 'key_conflict': True, 'message': '這個冪等鍵已用於其他景點的打卡'}
+    # 打卡已寫入但結果尚未存回（處理中或中途失敗）
+    result = json.loads(row['response']) if row['response'] else {'success': True, 'message': '已完成打卡'}
+    result['replayed'] = True
+    return result
+
+def get_idempotent_response(user_id, idempotency_key, spot_id=None):
+    """查詢冪等鍵是否已處理過，回傳先前的結果（未處理過回傳 None）"""
+    if not idempotency_key:
+        return None
+    with get_db() as conn:
+        return load_idempotent_response(conn, user_id, idempotency_key, spot_id)
+
+def save_idempotent_response(user_id, idempotency_key, result):
+    """存回冪等鍵對應的結果，供之後重送時直接回傳"""
+    if not idempotency_key:
+        return
+    run_write(repository.save_checkin_response, user_id, idempotency_key,
+              json.dumps(result, ensure_ascii=False))
+
+def save_checkin_photo(photo, user_id, spot_id):
+    """
+    儲存打卡照片到 static/uploads
+
+    Returns:
+        tuple: (photo_url, photo_data, photo_filename)，沒有照片或儲存失敗時皆為 None
+    """
+    import uuid
+
+    if not photo or not photo.filename:
+        return None, None, None
+
+    try:
+        # 讀取照片資料
+        photo_data = photo.read()
+        if not photo_data:
+            return None, None, None
+
+        os.makedirs(UPLOAD_DIR, exist_ok=True)
+
+        # 生成唯一檔名
+        ext = photo.filename.rsplit('.', 1)[-1].lower() if '.' in photo.filename else 'jpg'
+        photo_filename = f"{user_id}_{spot_id}_{uuid.uuid4().hex[:8]}.{ext}"
+        with open(os.path.join(UPLOAD_DIR, photo_filename), 'wb') as f:
+            f.write(photo_data)
+        # 先登記（參照數 0），沒有打卡參照時由 GC 清除
+        upload_store.register(photo_filename, user_id, len(photo_data))
+
+        photo_url = f"/static/uploads/{photo_filename}"
+        print(f"✅ 照片已儲存: {photo_url}, 大小: {len(photo_data)} bytes")
+        return photo_url, photo_data, photo_filename
+    except Exception as e:
+        print(f"❌ 照片處理錯誤: {e}")
+        return None, None, None
+
+def insert_checkin(conn, user_id, spot_id, note, photo_url, idempotency_key=None, checkin_date=None):
+    """
+    寫入一筆打卡（重複檢查 + 冪等鍵 + 異動紀錄），由呼叫端 commit
+    checkin_date 預設為今天（相簿匯入時為照片拍攝日期）
+
+    Returns:
+        tuple: (status, spot)，status 為 created / duplicate / not_found / conflict
+    """
+    # 檢查是否已打卡
+    if repository.get_checkin(conn, user_id, spot_id):
+        return 'duplicate', None
+
+    # 取得景點資訊
+    spot = repository.get_spot(conn, spot_id)
+    if not spot:
+        return 'not_found', None
+
+    if idempotency_key:
+        # SAVEPOINT：衝突時只回滾這一筆（PostgreSQL 出錯後整個交易都不能再用）
+        conn.execute('SAVEPOINT idempotency_key')
+        try:
+            repository.insert_checkin_request(conn, user_id, idempotency_key, spot_id)
+            conn.execute('RELEASE idempotency_key')
+        except IntegrityError:
+            conn.execute('ROLLBACK TO idempotency_key')
+            conn.execute('RELEASE idempotency_key')
+            return 'conflict', spot
+
+    # 新增打卡
+    checkin_date = checkin_date or get_tw_date_str()
+    repository.insert_checkin(conn, user_id, spot_id, spot['route_id'], checkin_date, note, photo_url)
+    upload_store.acquire(conn, photo_url)
+    record_checkin_event(conn, user_id, spot_id, 'checkin', checkin_date)
+    return 'created', spot
+
+def remove_upload_file(photo_url):
+    """刪除沒有打卡參照的照片檔案（找不到就略過；刪除失敗時留給 GC）"""
+    try:
+        upload_store.discard(photo_url)
+    except Exception as e:
+        print(f"⚠️ 照片檔案刪除失敗: {e}")
+
+# ============ Service Worker ============
+
+SW_PRECACHE_ASSETS = [
+    '/static/manifest.json',
+    '/static/icon-192.png',
+    '/static/icon-512.png',
+]
+
+_sw_cache = {}
+
+def get_service_worker_script():
+    """
+    組出 Service Worker 內容（預快取清單含前端打包檔）
+    建置版本取自 BUILD_VERSION / RAILWAY_GIT_COMMIT_SHA，否則以 sw.js 與預快取資源的內容雜湊代替
+    """
+    if 'script' not in _sw_cache:
+        static_dir = app.static_folder or 'static'
+        with open(os.path.join(static_dir, 'sw.js'), encoding='utf-8') as f:
+            script = f.read()
+        precache_urls = SW_PRECACHE_ASSETS + bundle_urls()
+        
+        version = os.environ.get('BUILD_VERSION') or os.environ.get('RAILWAY_GIT_COMMIT_SHA', '')
+        if not version:
+            digest = hashlib.sha1(script.encode('utf-8'))
+            for url in precache_urls:
+                with open(os.path.join(static_dir, url[len('/static/'):]), 'rb') as f:
+                    digest.update(f.read())
+            version = digest.hexdigest()
+        
+        script = script.replace("'__BUILD_VERSION__'", json.dumps(version[:12]))
+        script = script.replace("['__PRECACHE_URLS__']", json.dumps(precache_urls))
+        _sw_cache['script'] = script
+    return _sw_cache['script']
+
+@app.route('/sw.js')
+def service_worker():
+    """Service Worker（放在根路徑才能控制整個網站）"""
+    response = app.response_class(get_service_worker_script(), mimetype='application/javascript')
+    response.cache_control.no_cache = True
+    return response
+
+# ============ 打卡照片 ============
+
+# 模板用：{{ c.photo_url | photo_src(640) }} → /photos/<檔名>?w=640
+app.add_template_filter(photo_server.photo_src, 'photo_src')
+
+@app.route('/photos/<name>')
+def serve_photo(name):
+    """
+    打卡照片（?w= 取縮圖）：檔名不會重複使用，回應 immutable 長效快取
+    支援 Range / 條件請求；設定 PHOTO_ACCEL_REDIRECT 時交給 nginx 送檔
+    """
+    filename = upload_filename(UPLOAD_URL_PREFIX + name)
+    if not filename or not os.path.isfile(os.path.join(UPLOAD_DIR, filename)):
+        abort(404)
+    
+    width = photo_server.variant_width(request.args.get('w', type=int))
+    relpath = photo_server.ensure_variant(UPLOAD_DIR, filename, width) or filename
+    
+    if photo_server.PHOTO_ACCEL_REDIRECT:
+        import mimetypes
+        response = app.response_class(mimetype=mimetypes.guess_type(relpath)[0] or 'application/octet-stream')
+        response.headers['X-Accel-Redirect'] = photo_server.PHOTO_ACCEL_REDIRECT + relpath
+    else:
+        response = send_file(os.path.join(UPLOAD_DIR, relpath), conditional=True, etag=True,
+                             max_age=photo_server.PHOTO_MAX_AGE)
+    response.cache_control.public = True
+    response.cache_control.max_age = photo_server.PHOTO_MAX_AGE
+    response.cache_control.immutable = True
+    return response
+
 # ============ 網頁路由 ============
 
 @app.route('/bind')
@@ -651,40 +1146,22 @@ def index():
     user_id = request.args.get('user', 'default')
     
     with get_db() as conn:
-        wishes_total = conn.execute("SELECT COUNT(*) FROM wishes WHERE user_id = ?", (user_id,)).fetchone()[0]
-        wishes_done = conn.execute("SELECT COUNT(*) FROM wishes WHERE user_id = ? AND completed = 1", (user_id,)).fetchone()[0]
-        routes_total = conn.execute("SELECT COUNT(*) FROM routes").fetchone()[0]
-        spots_total = conn.execute("SELECT COUNT(*) FROM spots").fetchone()[0]
-        
-        checkin_count = conn.execute("SELECT COUNT(*) FROM checkins WHERE user_id = ?", (user_id,)).fetchone()[0]
-        achievement_count = conn.execute("SELECT COUNT(*) FROM user_achievements WHERE user_id = ?", (user_id,)).fetchone()[0]
+        summary = repository.get_home_summary(conn, user_id)
         
         # 本季推薦
         month = get_tw_time().month
         season = '春' if month in [3,4,5] else '夏' if month in [6,7,8] else '秋' if month in [9,10,11] else '冬'
         
-        seasonal_routes = conn.execute('''
-            SELECT * FROM routes 
-            WHERE best_season LIKE ? OR best_season LIKE '%四季%'
-            ORDER BY accessibility DESC LIMIT 6
-        ''', (f'%{season}%',)).fetchall()
-        
-        recent_checkins = conn.execute('''
-            SELECT c.*, s.name as spot_name, s.icon, r.name as route_name
-            FROM checkins c
-            JOIN spots s ON c.spot_id = s.id
-            JOIN routes r ON c.route_id = r.id
-            WHERE c.user_id = ?
-            ORDER BY c.created_at DESC LIMIT 5
-        ''', (user_id,)).fetchall()
+        seasonal_routes = repository.get_seasonal_routes(conn, season, 6)
+        recent_checkins = repository.get_recent_checkins(conn, user_id, 5)
         
     return render_template('index.html',
-                          wishes_total=wishes_total,
-                          wishes_done=wishes_done,
-                          routes_total=routes_total,
-                          spots_total=spots_total,
-                          checkin_count=checkin_count,
-                          achievement_count=achievement_count,
+                          wishes_total=summary['wishes_total'],
+                          wishes_done=summary['wishes_done'],
+                          routes_total=summary['routes_total'],
+                          spots_total=summary['spots_total'],
+                          checkin_count=summary['checkin_count'],
+                          achievement_count=summary['achievement_count'],
                           seasonal_routes=seasonal_routes,
                           recent_checkins=recent_checkins,
                           current_season=season,
@@ -697,15 +1174,7 @@ def atlas():
     
     with get_db() as conn:
         # 所有景點與收集狀態
-        spots = conn.execute('''
-            SELECT s.*, r.name as route_name, r.region,
-                   CASE WHEN c.id IS NOT NULL THEN 1 ELSE 0 END as collected,
-                   c.checkin_date, c.photo_url, c.note as checkin_note
-            FROM spots s
-            JOIN routes r ON s.route_id = r.id
-            LEFT JOIN checkins c ON s.id = c.spot_id AND c.user_id = ?
-            ORDER BY r.region, r.name, s.order_num
-        ''', (user_id,)).fetchall()
+        spots = repository.get_atlas_spots(conn, user_id)
         
         # 統計
         total = len(spots)
@@ -733,14 +1202,7 @@ def achievements_page():
     user_id = request.args.get('user', 'default')
     
     with get_db() as conn:
-        achievements = conn.execute('''
-            SELECT a.*, 
-                   CASE WHEN ua.id IS NOT NULL THEN 1 ELSE 0 END as unlocked,
-                   ua.unlocked_at
-            FROM achievements a
-            LEFT JOIN user_achievements ua ON a.id = ua.achievement_id AND ua.user_id = ?
-            ORDER BY a.rarity DESC, a.condition_value
-        ''', (user_id,)).fetchall()
+        achievements = repository.get_achievements_with_status(conn, user_id)
         
         total = len(achievements)
         unlocked = sum(1 for a in achievements if a['unlocked'])
@@ -758,34 +1220,27 @@ def checkins_page():
     
     with get_db() as conn:
         # 取得所有打卡記錄
-        checkins = conn.execute('''
-            SELECT c.*, s.name as spot_name, s.icon, s.spot_type,
-                   r.name as route_name, r.region
-            FROM checkins c
-            JOIN spots s ON c.spot_id = s.id
-            JOIN routes r ON c.route_id = r.id
-            WHERE c.user_id = ?
-            ORDER BY c.checkin_date DESC, c.id DESC
-        ''', (user_id,)).fetchall()
+        checkins = repository.get_user_checkins(conn, user_id)
         
         # 統計
         photo_count = sum(1 for c in checkins if c['photo_url'])
         note_count = sum(1 for c in checkins if c['note'])
     
     # 檢查 Google 連動狀態
-    google_connected = 'google_access_token' in session
+    google_access_token = google_session_token()
+    google_connected = bool(google_access_token)
     album_url = None
     doc_url = None
     
     if google_connected:
         try:
-            from google_integration import get_or_create_album, get_or_create_travel_doc
+            from google_integration import get_or_create_travel_doc
             
-            album = get_or_create_album(session['google_access_token'])
+            album = media_cache.album_info(google_access_token, google_session_owner())
             if album.get('productUrl'):
                 album_url = album['productUrl']
             
-            doc = get_or_create_travel_doc(session['google_access_token'])
+            doc = get_or_create_travel_doc(google_access_token)
             if doc.get('documentId'):
                 doc_url = f"https://docs.google.com/document/d/{doc['documentId']}/edit"
         except:
@@ -807,45 +1262,36 @@ def wishes_list():
     filter_region = request.args.get('region', 'all')
     
     with get_db() as conn:
-        query = "SELECT * FROM wishes WHERE user_id = ?"
-        params = [user_id]
-        
-        if filter_status == 'pending':
-            query += " AND completed = 0"
-        elif filter_status == 'done':
-            query += " AND completed = 1"
-            
-        if filter_region != 'all':
-            query += " AND region = ?"
-            params.append(filter_region)
-            
-        query += " ORDER BY priority ASC, created_at DESC"
-        
-        wishes = conn.execute(query, params).fetchall()
-        regions = conn.execute("SELECT DISTINCT region FROM wishes WHERE region IS NOT NULL AND user_id = ?", (user_id,)).fetchall()
+        wishes = repository.get_wishes(
+            conn, user_id,
+            status=filter_status if filter_status != 'all' else None,
+            region=filter_region if filter_region != 'all' else None
+        )
+        regions = repository.get_wish_regions(conn, user_id)
         
     return render_template('wishes.html', wishes=wishes, regions=regions,
                           filter_status=filter_status, filter_region=filter_region, user_id=user_id)
 
+def wish_form_fields():
+    """新增 / 編輯願望表單的欄位"""
+    return {
+        'name': request.form['name'],
+        'region': request.form['region'],
+        'description': request.form['description'],
+        'best_season': request.form['best_season'],
+        'budget': int(request.form.get('budget', 0) or 0),
+        'priority': int(request.form.get('priority', 3)),
+        'notes': request.form.get('notes', ''),
+    }
+
 @app.route('/wishes/add', methods=['GET', 'POST'])
 def add_wish():
     user_id = request.args.get('user', 'default')
     
     if request.method == 'POST':
         with get_db() as conn:
-            conn.execute('''
-                INSERT INTO wishes (name, region, description, best_season, budget, priority, notes, user_id)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (
-                request.form['name'],
-                request.form['region'],
-                request.form['description'],
-                request.form['best_season'],
-                int(request.form.get('budget', 0) or 0),
-                int(request.form.get('priority', 3)),
-                request.form.get('notes', ''),
-                user_id
-            ))
+            repository.insert_wish(conn, user_id, wish_form_fields())
+            record_change(conn, 'user', user_id)
             conn.commit()
         return redirect(url_for('wishes_list', user=user_id))
     return render_template('wish_form.html', wish=None, user_id=user_id)
@@ -856,36 +1302,23 @@ def edit_wish(wish_id):
     
     with get_db() as conn:
         if request.method == 'POST':
-            conn.execute('''
-                UPDATE wishes SET name=?, region=?, description=?, best_season=?, 
-                                 budget=?, priority=?, notes=?
-                WHERE id=? AND user_id=?
-            ''', (
-                request.form['name'],
-                request.form['region'],
-                request.form['description'],
-                request.form['best_season'],
-                int(request.form.get('budget', 0) or 0),
-                int(request.form.get('priority', 3)),
-                request.form.get('notes', ''),
-                wish_id,
-                user_id
-            ))
+            repository.update_wish(conn, user_id, wish_id, wish_form_fields())
+            record_change(conn, 'user', user_id)
             conn.commit()
             return redirect(url_for('wishes_list', user=user_id))
         
-        wish = conn.execute("SELECT * FROM wishes WHERE id=? AND user_id=?", (wish_id, user_id)).fetchone()
+        wish = repository.get_wish(conn, user_id, wish_id)
     return render_template('wish_form.html', wish=wish, user_id=user_id)
 
 @app.route('/wishes/<int:wish_id>/complete', methods=['POST'])
 def complete_wish(wish_id):
     user_id = request.json.get('user_id', 'default')
     
-    with get_db() as conn:
-        conn.execute('''
-            UPDATE wishes SET completed = 1, completed_date = ? WHERE id = ? AND user_id = ?
-        ''', (get_tw_date_str(), wish_id, user_id))
-        conn.commit()
+    def complete(conn):
+        repository.complete_wish(conn, user_id, wish_id, get_tw_date_str())
+        record_change(conn, 'user', user_id)
+    
+    run_write(complete)
     
     # 檢查成就
     unlocked = check_achievements(user_id)
@@ -896,9 +1329,11 @@ def complete_wish(wish_id):
 def delete_wish(wish_id):
     user_id = request.json.get('user_id', 'default')
     
-    with get_db() as conn:
-        conn.execute("DELETE FROM wishes WHERE id=? AND user_id=?", (wish_id, user_id))
-        conn.commit()
+    def delete(conn):
+        repository.delete_wish(conn, user_id, wish_id)
+        record_change(conn, 'user', user_id)
+    
+    run_write(delete)
     return jsonify({'success': True})
 
 @app.route('/routes')
@@ -908,32 +1343,13 @@ def routes_list():
     user_id = request.args.get('user', 'default')
     
     with get_db() as conn:
-        query = "SELECT * FROM routes WHERE 1=1"
-        params = []
-        
-        if filter_region != 'all':
-            query += " AND region = ?"
-            params.append(filter_region)
-            
-        if filter_difficulty != 'all':
-            query += " AND difficulty = ?"
-            params.append(filter_difficulty)
-            
-        query += " ORDER BY accessibility DESC, name"
-        
-        routes = conn.execute(query, params).fetchall()
-        regions = conn.execute("SELECT DISTINCT region FROM routes").fetchall()
-        
-        # 加入收集進度
-        routes_with_progress = []
-        for r in routes:
-            total = conn.execute("SELECT COUNT(*) FROM spots WHERE route_id=?", (r['id'],)).fetchone()[0]
-            collected = conn.execute('''
-                SELECT COUNT(*) FROM checkins c
-                JOIN spots s ON c.spot_id = s.id
-                WHERE s.route_id = ? AND c.user_id = ?
-            ''', (r['id'], user_id)).fetchone()[0]
-            routes_with_progress.append({**dict(r), 'total_spots': total, 'collected_spots': collected})
+        # 路線與收集進度一次查出
+        routes_with_progress = repository.get_routes_with_progress(
+            conn, user_id,
+            region=filter_region if filter_region != 'all' else None,
+            difficulty=filter_difficulty if filter_difficulty != 'all' else None
+        )
+        regions = repository.get_route_regions(conn)
         
     return render_template('routes.html', routes=routes_with_progress, regions=regions,
                           filter_region=filter_region, filter_difficulty=filter_difficulty, user_id=user_id)
@@ -943,16 +1359,8 @@ def route_detail(route_id):
     user_id = request.args.get('user', 'default')
     
     with get_db() as conn:
-        route = conn.execute("SELECT * FROM routes WHERE id=?", (route_id,)).fetchone()
-        spots = conn.execute('''
-            SELECT s.*, 
-                   CASE WHEN c.id IS NOT NULL THEN 1 ELSE 0 END as collected,
-                   c.checkin_date, c.photo_url, c.note as checkin_note
-            FROM spots s
-            LEFT JOIN checkins c ON s.id = c.spot_id AND c.user_id = ?
-            WHERE s.route_id = ?
-            ORDER BY s.order_num
-        ''', (user_id, route_id)).fetchall()
+        route = repository.get_route(conn, route_id)
+        spots = repository.get_route_spots(conn, route_id, user_id)
         
         total = len(spots)
         collected = sum(1 for s in spots if s['collected'])
@@ -963,95 +1371,73 @@ def route_detail(route_id):
 @app.route('/spot/<int:spot_id>/checkin', methods=['POST'])
 def checkin_spot(spot_id):
     """打卡景點（支援照片上傳 + Google 同步）"""
-    import uuid
     import traceback
     
     try:
         # 支援 JSON 或 FormData
-        if request.is_json:
-            user_id = request.json.get('user_id', 'default')
-            note = request.json.get('note', '')
-            photo_url = None
-            photo_data = None
-            photo_filename = None
-        else:
-            user_id = request.form.get('user_id', 'default')
-            note = request.form.get('note', '')
-            photo_url = None
-            photo_data = None
-            photo_filename = None
-            
-            # 處理照片上傳
-            if 'photo' in request.files:
-                photo = request.files['photo']
-                if photo and photo.filename:
-                    try:
-                        # 讀取照片資料
-                        photo_data = photo.read()
-                        
-                        if photo_data and len(photo_data) > 0:
-                            # 儲存照片到 static/uploads
-                            upload_dir = os.path.join(app.static_folder or 'static', 'uploads')
-                            os.makedirs(upload_dir, exist_ok=True)
-                            
-                            # 生成唯一檔名
-                            ext = photo.filename.rsplit('.', 1)[-1].lower() if '.' in photo.filename else 'jpg'
-                            photo_filename = f"{user_id}_{spot_id}_{uuid.uuid4().hex[:8]}.{ext}"
-                            filepath = os.path.join(upload_dir, photo_filename)
-                            
-                            # 使用 photo_data 寫入檔案
-                            with open(filepath, 'wb') as f:
-                                f.write(photo_data)
-                            
-                            photo_url = f"/static/uploads/{photo_filename}"
-                            print(f"✅ 照片已儲存: {photo_url}, 大小: {len(photo_data)} bytes")
-                    except Exception as e:
-                        print(f"❌ 照片處理錯誤: {e}")
-                        photo_data = None
-                        photo_filename = None
+        data = request.json if request.is_json else request.form
+        user_id = data.get('user_id', 'default')
+        note = data.get('note', '')
+        idempotency_key = request.headers.get('Idempotency-Key') or data.get('idempotency_key')
+        photo_url = None
+        photo_data = None
+        photo_filename = None
         
-        with get_db() as conn:
-            # 檢查是否已打卡
-            existing = conn.execute(
-                "SELECT id FROM checkins WHERE user_id = ? AND spot_id = ?",
-                (user_id, spot_id)
-            ).fetchone()
-            
-            if existing:
-                return jsonify({'success': False, 'message': '已經打卡過了'})
-            
-            # 取得景點資訊
-            spot = conn.execute("SELECT s.*, r.name as route_name, r.region FROM spots s JOIN routes r ON s.route_id = r.id WHERE s.id = ?", (spot_id,)).fetchone()
-            
-            # 新增打卡
-            conn.execute('''
-                INSERT INTO checkins (user_id, spot_id, route_id, checkin_date, note, photo_url)
-                VALUES (?, ?, ?, ?, ?, ?)
-            ''', (user_id, spot_id, spot['route_id'], get_tw_date_str(), note, photo_url))
-            
-            conn.commit()
+        # 離線佇列重送：已處理過的請求直接回傳原結果（照片也不再重存）
+        replayed = get_idempotent_response(user_id, idempotency_key, spot_id)
+        if replayed:
+            return jsonify(replayed), 409 if replayed.get('key_conflict') else 200
+        
+        # 處理照片上傳
+        if not request.is_json and 'photo' in request.files:
+            photo_url, photo_data, photo_filename = save_checkin_photo(
+                request.files['photo'], user_id, spot_id
+            )
+
+        # 重複檢查與寫入在同一個 IMMEDIATE 交易內，並行打卡不會重複或拿不到 lock
+        status, spot = run_write(insert_checkin, user_id, spot_id, note, photo_url, idempotency_key)
+        if status != 'created':
+            # 沒有打卡：剛存的照片沒有參照，直接刪除
+            remove_upload_file(photo_url)
+
+        if status == 'duplicate':
+            return jsonify({'success': False, 'message': '已經打卡過了'})
+        if status == 'not_found':
+            return jsonify({'success': False, 'message': '找不到景點'}), 404
+        if status == 'conflict':
+            # 同一個冪等鍵的請求同時抵達，由先寫入的那個負責打卡
+            replayed = get_idempotent_response(user_id, idempotency_key, spot_id)
+            return jsonify(replayed), 409 if replayed.get('key_conflict') else 200
         
         # ========== Google 同步 ==========
         google_result = None
         imgbb_error = None
         
-        if session.get('google_access_token'):
+        google_access_token = google_session_token()
+        if google_access_token:
             try:
                 from google_integration import save_checkin_with_photo
                 
                 # 組合地點資訊
                 location = f"{spot['region']} - {spot['route_name']}"
+                # 相簿步驟在執行緒池執行（沒有 request context），先在這裡取得 email
+                owner = google_session_owner()
                 
                 # 同步到 Google 相簿 + 文件
                 google_result = save_checkin_with_photo(
-                    access_token=session['google_access_token'],
+                    access_token=google_access_token,
                     spot_name=spot['name'],
                     location=location,
                     notes=note or f"打卡 {spot['name']}",
                     image_data=photo_data,
-                    filename=photo_filename
+                    filename=photo_filename,
+                    find_album=lambda token: media_cache.album_info(token, owner)
                 )
                 
+                # 新照片進了相簿：媒體索引快取下次讀取時重建
+                if google_result.get('photo') and google_result.get('album', {}).get('id'):
+                    media_cache.invalidate(google_result['album']['id'])
+                
                 # 檢查 ImgBB 結果
                 if google_result.get('imgbb') and not google_result['imgbb'].get('success'):
                     imgbb_error = google_result['imgbb'].get('error', '上傳失敗')
@@ -1086,6 +1472,7 @@ def checkin_spot(spot_id):
         else:
             result['google_sync'] = False
         
+        save_idempotent_response(user_id, idempotency_key, result)
         return jsonify(result)
         
     except Exception as e:
@@ -1103,48 +1490,141 @@ def cancel_checkin(spot_id):
     """取消打卡"""
     user_id = request.json.get('user_id', 'default')
     
-    with get_db() as conn:
+    def delete_checkin(conn):
         # 檢查打卡是否存在
-        checkin = conn.execute(
-            "SELECT id, photo_url FROM checkins WHERE user_id = ? AND spot_id = ?",
-            (user_id, spot_id)
-        ).fetchone()
-        
+        checkin = repository.get_checkin(conn, user_id, spot_id)
         if not checkin:
-            return jsonify({'success': False, 'message': '找不到打卡記錄'})
-        
-        # 刪除照片檔案（如果有）
-        if checkin['photo_url']:
-            import os
-            photo_path = os.path.join(app.static_folder or 'static', checkin['photo_url'].lstrip('/static/'))
-            if os.path.exists(photo_path):
-                try:
-                    os.remove(photo_path)
-                except:
-                    pass
-        
+            return None
+
         # 刪除打卡記錄
-        conn.execute(
-            "DELETE FROM checkins WHERE user_id = ? AND spot_id = ?",
-            (user_id, spot_id)
-        )
-        conn.commit()
-    
+        repository.delete_checkin(conn, user_id, spot_id)
+        upload_store.release(conn, checkin['photo_url'])
+        record_checkin_event(conn, user_id, spot_id, 'cancel', checkin['checkin_date'])
+        return checkin
+
+    checkin = run_write(delete_checkin)
+    if not checkin:
+        return jsonify({'success': False, 'message': '找不到打卡記錄'})
+
+    # 交易提交後再刪除照片檔案（如果有）
+    remove_upload_file(checkin['photo_url'])
+
     return jsonify({'success': True, 'message': '已取消打卡'})
 
+MAX_BATCH_CHECKINS = 100
+
+def set_replayed_result(result, replayed):
+    """批次打卡：把冪等鍵先前的結果填入該項目（用在其他景點時為 key_conflict）"""
+    if replayed.get('key_conflict'):
+        result.update(success=False, status='key_conflict', message=replayed['message'])
+    else:
+        result.update(success=replayed.get('success', True), status='replayed',
+                      message=replayed.get('message', ''))
+
+@app.route('/api/checkins/batch', methods=['POST'])
+def batch_checkin():
+    """
+    批次打卡（離線佇列重送、LINE 轉送等）
+
+    JSON: {"user_id": "...", "items": [{"spot_id": 1, "note": "", "idempotency_key": "...", "photo": "photo_0"}]}
+    multipart: payload 欄位放上述 JSON，照片以 item 的 photo 值作為檔案欄位名稱
+
+    所有打卡在同一個交易內寫入（經由 run_write，啟用 group commit 時交給 writer thread），
+    冪等鍵也在這個交易內查詢；成就只在最後檢查一次；不做 Google 同步
+    """
+    if request.is_json:
+        payload = request.get_json(silent=True) or {}
+    else:
+        try:
+            payload = json.loads(request.form.get('payload', '{}'))
+        except ValueError:
+            return jsonify({'success': False, 'message': 'payload 格式錯誤'}), 400
+
+    user_id = payload.get('user_id', 'default')
+    items = payload.get('items')
+    if not isinstance(items, list) or not items:
+        return jsonify({'success': False, 'message': '請提供打卡項目'}), 400
+    if len(items) > MAX_BATCH_CHECKINS:
+        return jsonify({'success': False, 'message': f'一次最多 {MAX_BATCH_CHECKINS} 筆'}), 413
+
+    results = []
+    pending = []
+    for item in items:
+        item = item if isinstance(item, dict) else {}
+        spot_id = item.get('spot_id')
+        result = {'spot_id': spot_id, 'idempotency_key': item.get('idempotency_key')}
+        results.append(result)
+
+        # bool 是 int 的子類別，true 不能當成景點 1
+        if not isinstance(spot_id, int) or isinstance(spot_id, bool):
+            result.update(success=False, status='invalid', message='景點 ID 無效')
+            continue
+
+        # 照片先寫檔（交易內不做檔案 I/O），交易失敗、重送或未打卡成功時再刪除
+        photo_url = None
+        photo_field = item.get('photo')
+        if photo_field and photo_field in request.files:
+            photo_url, _, _ = save_checkin_photo(request.files[photo_field], user_id, spot_id)
+        pending.append((result, item, photo_url))
+
+    def write(conn):
+        created = 0
+        for result, item, photo_url in pending:
+            key = item.get('idempotency_key')
+            # 先前的請求已處理過這個冪等鍵：重播結果（已打卡的景點在 insert_checkin 會先被判為 duplicate）
+            replayed = load_idempotent_response(conn, user_id, key, result['spot_id'])
+            if replayed:
+                set_replayed_result(result, replayed)
+                continue
+            status, spot = insert_checkin(
+                conn, user_id, result['spot_id'], item.get('note', ''), photo_url, key
+            )
+            if status == 'created':
+                result.update(success=True, status='created',
+                              message=f"成功打卡「{spot['name']}」！", has_photo=bool(photo_url))
+                if key:
+                    repository.save_checkin_response(conn, user_id, key, json.dumps(
+                        {'success': True, 'message': result['message'], 'has_photo': bool(photo_url)},
+                        ensure_ascii=False
+                    ))
+                created += 1
+            elif status == 'duplicate':
+                result.update(success=False, status='duplicate', message='已經打卡過了')
+            elif status == 'conflict':
+                # 冪等鍵在本批較前面的項目已用過：同一景點才重播結果
+                set_replayed_result(result, load_idempotent_response(conn, user_id, key, result['spot_id']))
+            else:
+                result.update(success=False, status='not_found', message='找不到景點')
+        return created
+
+    try:
+        created = run_write(write)
+    except Exception as e:
+        print(f"❌ 批次打卡錯誤: {e}")
+        for _, _, photo_url in pending:
+            remove_upload_file(photo_url)
+        return jsonify({'success': False, 'message': f'批次打卡失敗: {e}'}), 500
+
+    for result, _, photo_url in pending:
+        if result.get('status') != 'created':
+            remove_upload_file(photo_url)
+
+    # 檢查成就（整批只做一次）
+    unlocked = check_achievements(user_id) if created else []
+
+    return jsonify({
+        'success': True,
+        'created': created,
+        'results': results,
+        'unlocked': [{'name': a['name'], 'icon': a['icon']} for a in unlocked]
+    })
+
 @app.route('/logs')
 def travel_logs():
     user_id = request.args.get('user', 'default')
     
     with get_db() as conn:
-        logs = conn.execute('''
-            SELECT l.*, w.name as wish_name, r.name as route_name
-            FROM travel_logs l
-            LEFT JOIN wishes w ON l.wish_id = w.id
-            LEFT JOIN routes r ON l.route_id = r.id
-            WHERE l.user_id = ?
-            ORDER BY l.travel_date DESC
-        ''', (user_id,)).fetchall()
+        logs = repository.get_travel_logs(conn, user_id)
     return render_template('logs.html', logs=logs, user_id=user_id)
 
 @app.route('/logs/add', methods=['GET', 'POST'])
@@ -1153,18 +1633,15 @@ def add_log():
     
     with get_db() as conn:
         if request.method == 'POST':
-            conn.execute('''
-                INSERT INTO travel_logs (wish_id, route_id, travel_date, actual_budget, rating, diary, user_id)
-                VALUES (?, ?, ?, ?, ?, ?, ?)
-            ''', (
-                request.form.get('wish_id') or None,
-                request.form.get('route_id') or None,
-                request.form['travel_date'],
-                int(request.form.get('actual_budget', 0) or 0),
-                int(request.form.get('rating', 5)),
-                request.form.get('diary', ''),
-                user_id
-            ))
+            repository.insert_travel_log(conn, user_id, {
+                'wish_id': request.form.get('wish_id') or None,
+                'route_id': request.form.get('route_id') or None,
+                'travel_date': request.form['travel_date'],
+                'actual_budget': int(request.form.get('actual_budget', 0) or 0),
+                'rating': int(request.form.get('rating', 5)),
+                'diary': request.form.get('diary', ''),
+            })
+            record_change(conn, 'user', user_id)
             conn.commit()
             
             # 檢查成就
@@ -1172,8 +1649,8 @@ def add_log():
             
             return redirect(url_for('travel_logs', user=user_id))
         
-        wishes = conn.execute("SELECT id, name FROM wishes WHERE user_id = ? ORDER BY name", (user_id,)).fetchall()
-        routes = conn.execute("SELECT id, name FROM routes ORDER BY name").fetchall()
+        wishes = repository.get_wish_names(conn, user_id)
+        routes = repository.get_route_names(conn)
     return render_template('log_form.html', wishes=wishes, routes=routes, user_id=user_id)
 
 # ============ API ============
@@ -1183,20 +1660,278 @@ def api_user_stats(user_id):
     stats = get_user_stats(user_id)
     return jsonify(stats)
 
+@app.route('/api/leaderboard')
+def api_leaderboard():
+    """收集排行：?region=（空白為全台）&limit=（最多 100）&user=（附上該用戶名次）"""
+    region = request.args.get('region', OVERALL)
+    user_id = request.args.get('user')
+    entries, total = leaderboard.top(region, request.args.get('limit', 10, type=int))
+    return jsonify({
+        'region': region,
+        'total': total,
+        'top': [{'rank': e['rank'], 'user': mask_user_id(e['user_id']), 'score': e['score'],
+                 'checkins': e['checkins'], 'me': e['user_id'] == user_id} for e in entries],
+        'me': leaderboard.rank(user_id, region) if user_id else None,
+    })
+
+# 營運用 API 的 Bearer token（未設定時不開放，改用 python upload_store.py usage）
+ADMIN_TOKEN = os.environ.get('ADMIN_TOKEN', '')
+
+@app.route('/api/storage')
+def api_storage_totals():
+    """上傳檔總用量、待清除量、用量最多的用戶與磁碟空間（容量規劃用），需要 ADMIN_TOKEN"""
+    require_token(ADMIN_TOKEN)
+    return jsonify(upload_store.totals(request.args.get('top', 10, type=int)))
+
+@app.route('/api/storage/<user_id>')
+def api_storage_user(user_id):
+    """單一用戶的上傳檔用量，需要 ADMIN_TOKEN"""
+    require_token(ADMIN_TOKEN)
+    return jsonify(upload_store.usage(user_id))
+
 @app.route('/api/achievements/<user_id>')
 def api_user_achievements(user_id):
     with get_db() as conn:
-        achievements = conn.execute('''
-            SELECT a.*, ua.unlocked_at
-            FROM achievements a
-            JOIN user_achievements ua ON a.id = ua.achievement_id
-            WHERE ua.user_id = ?
-            ORDER BY ua.unlocked_at DESC
-        ''', (user_id,)).fetchall()
+        achievements = repository.get_unlocked_achievements(conn, user_id)
     return jsonify([dict(a) for a in achievements])
 
+@app.route('/api/atlas')
+def api_atlas_catalog():
+    """圖鑑靜態目錄（所有用戶共用，長時間快取 + ETag）"""
+    catalog = get_atlas_catalog()
+    response = app.response_class(catalog['body'], mimetype='application/json')
+    response.set_etag(catalog['etag'])
+    response.cache_control.public = True
+    response.cache_control.max_age = 7 * 24 * 3600
+    return response.make_conditional(request)
+
+@app.route('/api/atlas/<user_id>/collected')
+def api_atlas_collected(user_id):
+    """用戶收集狀態（bitset），帶 since=<version> 時只回傳增量"""
+    since = request.args.get('since', 0, type=int)
+    response = jsonify(get_collection_sync(user_id, since))
+    response.cache_control.no_cache = True
+    return response
+
+@app.route('/api/atlas/clusters')
+def api_atlas_clusters():
+    """
+    地圖群集：?z=<縮放層級>&bbox=<west,south,east,north>&user=<user_id>
+    只回傳可視範圍內的群集與單一景點，帶 user 時附上各群集的已收集數
+    """
+    try:
+        bbox = parse_bbox(request.args.get('bbox', ''))
+    except ValueError as e:
+        return jsonify({'error': f'bbox 格式錯誤: {e}'}), 400
+    z = request.args.get('z', 7, type=int)
+    user_id = request.args.get('user')
+    
+    index = get_atlas_catalog()['clusters']
+    response = jsonify(index.query(z, bbox, get_collected_mask(user_id) if user_id else 0))
+    if user_id:
+        response.cache_control.no_cache = True
+    else:
+        response.cache_control.public = True
+        response.cache_control.max_age = 3600
+    return response
+
+# ============ 相簿匯入 ============
+
+photo_importer.configure(
+    get_db, run_write, insert_checkin,
+    upload_dir=UPLOAD_DIR,
+    after_import=check_achievements,
+)
+
+@app.route('/api/import/photos', methods=['POST'])
+def api_import_photos():
+    """
+    相簿批次匯入（multipart）：user_id、photos（多個檔案）、radius_m（選填，公尺）
+    照片寫入暫存目錄後立即回應 202，背景依 EXIF GPS 比對景點並打卡
+    """
+    user_id = request.form.get('user_id', 'default')
+    files = [f for f in request.files.getlist('photos') if f and f.filename]
+    if not files:
+        return jsonify({'success': False, 'message': '請選擇照片'}), 400
+    if len(files) > IMPORT_MAX_FILES:
+        return jsonify({'success': False, 'message': f'一次最多 {IMPORT_MAX_FILES} 張'}), 413
+    radius_m = request.form.get('radius_m', type=float)
+    if radius_m is not None and not 0 < radius_m <= 5000:
+        return jsonify({'success': False, 'message': 'radius_m 需介於 0 到 5000 公尺'}), 400
+
+    job = photo_importer.create_job(user_id, files, radius_m)
+    return jsonify({
+        'success': True,
+        'job': job,
+        'status_url': url_for('api_import_status', job_id=job['id'], user_id=user_id),
+    }), 202
+
+@app.route('/api/import/<job_id>')
+def api_import_status(job_id):
+    """匯入進度：?user_id=&items=1（附上每張照片的比對結果）"""
+    user_id = request.args.get('user_id', 'default')
+    job = photo_importer.status(job_id, user_id, include_items=request.args.get('items') == '1')
+    if job is None:
+        return jsonify({'success': False, 'message': '找不到匯入工作'}), 404
+    response = jsonify({'success': True, 'job': job})
+    response.cache_control.no_cache = True
+    return response
+
+# ============ 用戶資料匯出 / 匯入 ============
+
+user_archive.configure(
+    get_db, run_write, insert_checkin, record_change,
+    upload_dir=UPLOAD_DIR,
+)
+
+# 下載連結只由 LINE Bot 發給本人（輸入「匯出」），以 secret_key 簽章並限時有效
+EXPORT_LINK_MAX_AGE = int(os.environ.get('EXPORT_LINK_MAX_AGE', '900'))
+export_signer = URLSafeTimedSerializer(app.secret_key, salt='user-export')
+
+def export_link(base_url, user_id):
+    """帶簽章的匯出下載網址（EXPORT_LINK_MAX_AGE 秒內有效）"""
+    token = export_signer.dumps(user_id)
+    return f"{base_url}/api/export/{user_id}?token={token}&openExternalBrowser=1"
+
+def verify_export_token(token, user_id):
+    try:
+        return export_signer.loads(token, max_age=EXPORT_LINK_MAX_AGE) == user_id
+    except BadSignature:  # 含逾期（SignatureExpired）
+        return False
+
+@app.route('/api/export/<user_id>')
+def api_export_user(user_id):
+    """下載用戶資料（ZIP 串流：各表 JSON Lines + 打卡照片），需要 LINE Bot 發出的 ?token="""
+    if not verify_export_token(request.args.get('token', ''), user_id):
+        return jsonify({'success': False, 'message': '下載連結無效或已過期，請在 LINE 輸入「匯出」重新取得'}), 403
+    filename = f"retire-reading-{user_id}-{get_tw_date_str()}.zip"
+    response = app.response_class(user_archive.export_stream(user_id), mimetype='application/zip')
+    response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+    response.cache_control.no_store = True
+    return response
+
+@app.route('/api/import/archive', methods=['POST'])
+def api_import_archive():
+    """
+    匯入用戶資料（multipart）：archive（匯出的 ZIP）、user_id（選填，預設為匯出檔內的用戶）
+    可寫入任何用戶，需要 ADMIN_TOKEN（站台間搬移用戶，與 python user_archive.py import 相同）
+    上傳檔先寫到暫存檔，再逐表分批寫入
+    """
+    import tempfile
+
+    require_token(ADMIN_TOKEN)
+    # 讀取表單前先檢查大小（需要 Content-Length）
+    if request.content_length is None or request.content_length > ARCHIVE_MAX_UPLOAD_BYTES:
+        return jsonify({'success': False,
+                        'message': f'匯入檔不可超過 {ARCHIVE_MAX_UPLOAD_BYTES // 1024 // 1024} MB'}), 413
+
+    archive = request.files.get('archive')
+    if not archive or not archive.filename:
+        return jsonify({'success': False, 'message': '請選擇匯出的 ZIP 檔'}), 400
+
+    fd, path = tempfile.mkstemp(suffix='.zip')
+    os.close(fd)
+    try:
+        archive.save(path)
+        result = user_archive.import_file(path, request.form.get('user_id') or None)
+    except ArchiveError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    finally:
+        os.remove(path)
+
+    unlocked = check_achievements(result['user_id']) if result['checkins'] else []
+    return jsonify({
+        'success': True,
+        'imported': result,
+        'unlocked': [{'name': a['name'], 'icon': a['icon']} for a in unlocked]
+    })
+
+# ============ 營運分析 ============
+
+def analytics_range(default_days):
+    """?from=&to=（YYYY-MM-DD），預設為到今天為止的 default_days 天；格式錯誤時回傳 None"""
+    try:
+        end = datetime.strptime(request.args.get('to') or get_tw_date_str(), '%Y-%m-%d')
+        start = request.args.get('from')
+        start = datetime.strptime(start, '%Y-%m-%d') if start else end - timedelta(days=default_days - 1)
+    except ValueError:
+        return None
+    return start.strftime('%Y-%m-%d'), end.strftime('%Y-%m-%d')
+
+def analytics_month_range(default_months):
+    """?from=&to=（YYYY-MM），預設為到本月為止的 default_months 個月；格式錯誤時回傳 None"""
+    try:
+        end = datetime.strptime(request.args.get('to') or get_tw_date_str()[:7], '%Y-%m')
+        start = request.args.get('from')
+        if start:
+            start = datetime.strptime(start, '%Y-%m')
+        else:
+            months = end.year * 12 + end.month - default_months
+            start = end.replace(year=months // 12, month=months % 12 + 1)
+    except ValueError:
+        return None
+    return start.strftime('%Y-%m'), end.strftime('%Y-%m')
+
+def bad_range():
+    return jsonify({'error': '日期格式錯誤（from / to）'}), 400
+
+@app.route('/api/analytics/spots')
+def api_analytics_spots():
+    """區間內熱門景點（預設近 30 天）"""
+    date_range = analytics_range(30)
+    if not date_range:
+        return bad_range()
+    limit = max(1, min(request.args.get('limit', 10, type=int), 144))
+    with get_db() as conn:
+        spots = analytics.top_spots(conn, *date_range, limit=limit)
+    return jsonify({'from': date_range[0], 'to': date_range[1], 'spots': spots})
+
+@app.route('/api/analytics/spots/<int:spot_id>/daily')
+def api_analytics_spot_daily(spot_id):
+    """單一景點每日打卡數（預設近 90 天）"""
+    date_range = analytics_range(90)
+    if not date_range:
+        return bad_range()
+    with get_db() as conn:
+        days = analytics.spot_daily(conn, spot_id, *date_range)
+    return jsonify({'spot_id': spot_id, 'from': date_range[0], 'to': date_range[1], 'days': days})
+
+@app.route('/api/analytics/routes')
+def api_analytics_routes():
+    """路線每週打卡數（預設近 12 週），?route_id= 只看單一路線"""
+    date_range = analytics_range(12 * 7)
+    if not date_range:
+        return bad_range()
+    with get_db() as conn:
+        weeks = analytics.route_weekly(conn, *date_range, route_id=request.args.get('route_id', type=int))
+    return jsonify({'from': date_range[0], 'to': date_range[1], 'weeks': weeks})
+
+@app.route('/api/analytics/regions')
+def api_analytics_regions():
+    """地區每月打卡數（預設近 12 個月）"""
+    month_range = analytics_month_range(12)
+    if not month_range:
+        return bad_range()
+    with get_db() as conn:
+        months = analytics.region_monthly(conn, *month_range)
+    return jsonify({'from': month_range[0], 'to': month_range[1], 'months': months})
+
+@app.route('/api/analytics/seasons')
+def api_analytics_seasons():
+    """地區 × 季節打卡數（預設近 12 個月）"""
+    month_range = analytics_month_range(12)
+    if not month_range:
+        return bad_range()
+    with get_db() as conn:
+        seasons = analytics.region_seasons(conn, *month_range)
+    return jsonify({'from': month_range[0], 'to': month_range[1], 'seasons': seasons})
+
 # ============ LINE Bot ============
 
+def is_reply_token_error(error_msg):
+    """reply 失敗是否因為 token 過期或已使用（應改用 push）"""
+    return 'Invalid reply token' in error_msg or '400' in error_msg
+
 def safe_reply(line_bot_api, reply_token, user_id, messages):
     """
     安全回覆函數：先嘗試 reply，失敗則降級為 push
@@ -1211,7 +1946,7 @@ def safe_reply(line_bot_api, reply_token, user_id, messages):
         )
     except Exception as e:
         error_msg = str(e)
-        if 'Invalid reply token' in error_msg or '400' in error_msg:
+        if is_reply_token_error(error_msg):
             # Reply token 過期或已使用，改用 push_message
             app.logger.warning(f"Reply token 失效，改用 push_message: {error_msg}")
             try:
@@ -1241,88 +1976,66 @@ def callback():
         abort(400)
     return 'OK'
 
+def build_line_reply(text, user_id):
+    """依指令產生回覆訊息（只查資料庫、不呼叫 LINE API，同步與非同步模式共用）"""
+    text = text.strip()
+    
+    if text in ['選單', '功能', 'menu', '?', '？']:
+        reply = create_menu_flex()
+        return [FlexMessage(alt_text='功能選單', contents=FlexContainer.from_dict(reply))]
+    elif text in ['願望', '清單', '想去']:
+        reply = get_wishes_flex(user_id)
+        return [FlexMessage(alt_text='願望清單', contents=FlexContainer.from_dict(reply))]
+    elif text in ['路線', '走讀', '推薦']:
+        reply = get_routes_flex()
+        return [FlexMessage(alt_text='推薦路線', contents=FlexContainer.from_dict(reply))]
+    elif text in ['圖鑑', '收集', '打卡']:
+        reply = get_atlas_flex(user_id)
+        return [FlexMessage(alt_text='探險圖鑑', contents=FlexContainer.from_dict(reply))]
+    elif text in ['成就', '徽章', '獎章']:
+        reply = get_achievements_flex(user_id)
+        return [FlexMessage(alt_text='成就徽章', contents=FlexContainer.from_dict(reply))]
+    elif text in ['統計', '進度', '紀錄']:
+        return [TextMessage(text=get_stats_message(user_id))]
+    elif text == '排行' or text.startswith('排行 '):
+        region = text.split(' ', 1)[1].strip() if ' ' in text else OVERALL
+        return [TextMessage(text=get_leaderboard_message(user_id, region))]
+    elif text.startswith('新增 ') or text.startswith('加入 '):
+        place_name = text.split(' ', 1)[1] if ' ' in text else ''
+        if place_name:
+            add_wish_from_line(place_name, user_id)
+            reply = f'✨ 已將「{place_name}」加入願望清單！'
+        else:
+            reply = '請輸入地點名稱，例如：新增 阿里山'
+        return [TextMessage(text=reply)]
+    elif text.startswith('完成 '):
+        place_name = text.split(' ', 1)[1] if ' ' in text else ''
+        return [TextMessage(text=mark_wish_complete_line(place_name, user_id))]
+    elif text in ['北部', '中部', '南部', '東部']:
+        reply = get_region_routes_flex(text)
+        return [FlexMessage(alt_text=f'{text}路線', contents=FlexContainer.from_dict(reply))]
+    elif text in ['網頁', '開啟', '打卡', '上傳']:
+        base_url = os.environ.get('BASE_URL', 'https://retire-reading-643a9.up.railway.app')
+        reply = create_web_links_flex(base_url, user_id)
+        return [FlexMessage(alt_text='網頁功能', contents=FlexContainer.from_dict(reply))]
+    elif text in ['匯出', '備份', '下載資料']:
+        base_url = os.environ.get('BASE_URL', 'https://retire-reading-643a9.up.railway.app')
+        minutes = max(EXPORT_LINK_MAX_AGE // 60, 1)
+        reply = (f"💾 個人資料下載連結（{minutes} 分鐘內有效，請勿轉傳）：\n"
+                 f"{export_link(base_url, user_id)}")
+        return [TextMessage(text=reply)]
+    else:
+        return [TextMessage(text=search_content(text, user_id))]
+
 if handler:
     @handler.add(MessageEvent, message=TextMessageContent)
     def handle_message(event):
-        text = event.message.text.strip()
         user_id = event.source.user_id
+        messages = build_line_reply(event.message.text, user_id)
         
         with ApiClient(configuration) as api_client:
             line_bot_api = MessagingApi(api_client)
-            
-            if text in ['選單', '功能', 'menu', '?', '？']:
-                reply = create_menu_flex()
-                safe_reply(
-                    line_bot_api, event.reply_token, user_id,
-                    [FlexMessage(alt_text='功能選單', contents=FlexContainer.from_dict(reply))]
-                )
-            elif text in ['願望', '清單', '想去']:
-                reply = get_wishes_flex(user_id)
-                safe_reply(
-                    line_bot_api, event.reply_token, user_id,
-                    [FlexMessage(alt_text='願望清單', contents=FlexContainer.from_dict(reply))]
-                )
-            elif text in ['路線', '走讀', '推薦']:
-                reply = get_routes_flex()
-                safe_reply(
-                    line_bot_api, event.reply_token, user_id,
-                    [FlexMessage(alt_text='推薦路線', contents=FlexContainer.from_dict(reply))]
-                )
-            elif text in ['圖鑑', '收集', '打卡']:
-                reply = get_atlas_flex(user_id)
-                safe_reply(
-                    line_bot_api, event.reply_token, user_id,
-                    [FlexMessage(alt_text='探險圖鑑', contents=FlexContainer.from_dict(reply))]
-                )
-            elif text in ['成就', '徽章', '獎章']:
-                reply = get_achievements_flex(user_id)
-                safe_reply(
-                    line_bot_api, event.reply_token, user_id,
-                    [FlexMessage(alt_text='成就徽章', contents=FlexContainer.from_dict(reply))]
-                )
-            elif text in ['統計', '進度', '紀錄']:
-                reply = get_stats_message(user_id)
-                safe_reply(
-                    line_bot_api, event.reply_token, user_id,
-                    [TextMessage(text=reply)]
-                )
-            elif text.startswith('新增 ') or text.startswith('加入 '):
-                place_name = text.split(' ', 1)[1] if ' ' in text else ''
-                if place_name:
-                    add_wish_from_line(place_name, user_id)
-                    reply = f'✨ 已將「{place_name}」加入願望清單！'
-                else:
-                    reply = '請輸入地點名稱，例如：新增 阿里山'
-                safe_reply(
-                    line_bot_api, event.reply_token, user_id,
-                    [TextMessage(text=reply)]
-                )
-            elif text.startswith('完成 '):
-                place_name = text.split(' ', 1)[1] if ' ' in text else ''
-                result = mark_wish_complete_line(place_name, user_id)
-                safe_reply(
-                    line_bot_api, event.reply_token, user_id,
-                    [TextMessage(text=result)]
-                )
-            elif text in ['北部', '中部', '南部', '東部']:
-                reply = get_region_routes_flex(text)
-                safe_reply(
-                    line_bot_api, event.reply_token, user_id,
-                    [FlexMessage(alt_text=f'{text}路線', contents=FlexContainer.from_dict(reply))]
-                )
-            elif text in ['網頁', '開啟', '打卡', '上傳']:
-                base_url = os.environ.get('BASE_URL', 'https://retire-reading-643a9.up.railway.app')
-                reply = create_web_links_flex(base_url, user_id)
-                safe_reply(
-                    line_bot_api, event.reply_token, user_id,
-                    [FlexMessage(alt_text='網頁功能', contents=FlexContainer.from_dict(reply))]
-                )
-            else:
-                reply = search_content(text, user_id)
-                safe_reply(
-                    line_bot_api, event.reply_token, user_id,
-                    [TextMessage(text=reply)]
-                )
+            safe_reply(line_bot_api, event.reply_token, user_id, messages)
 
 def create_menu_flex():
     return {
@@ -1346,11 +2059,13 @@ def create_menu_flex():
                 {"type": "text", "text": "🗺️ 輸入「圖鑑」看收集進度", "margin": "sm", "size": "sm"},
                 {"type": "text", "text": "🏆 輸入「成就」看徽章", "margin": "sm", "size": "sm"},
                 {"type": "text", "text": "📊 輸入「統計」看總覽", "margin": "sm", "size": "sm"},
+                {"type": "text", "text": "🥇 輸入「排行」看收集排名", "margin": "sm", "size": "sm"},
                 {"type": "separator", "margin": "lg"},
                 {"type": "text", "text": "➕「新增 地點」加入願望", "margin": "md", "size": "sm"},
                 {"type": "text", "text": "✅「完成 地點」標記完成", "margin": "sm", "size": "sm"},
                 {"type": "text", "text": "🧭「北部/中部/南部/東部」", "margin": "sm", "size": "sm"},
-                {"type": "text", "text": "🌐「網頁」開啟打卡上傳", "margin": "sm", "size": "sm"}
+                {"type": "text", "text": "🌐「網頁」開啟打卡上傳", "margin": "sm", "size": "sm"},
+                {"type": "text", "text": "💾「匯出」下載個人資料", "margin": "sm", "size": "sm"}
             ]
         }
     }
@@ -1436,10 +2151,7 @@ def create_web_links_flex(base_url, user_id):
 
 def get_wishes_flex(user_id):
     with get_db() as conn:
-        wishes = conn.execute(
-            "SELECT * FROM wishes WHERE completed = 0 AND user_id = ? ORDER BY priority LIMIT 8",
-            (user_id,)
-        ).fetchall()
+        wishes = repository.get_pending_wishes(conn, user_id, 8)
     
     if not wishes:
         return {"type": "bubble", "body": {"type": "box", "layout": "vertical", "contents": [
@@ -1471,11 +2183,7 @@ def get_routes_flex():
     season = '春' if month in [3,4,5] else '夏' if month in [6,7,8] else '秋' if month in [9,10,11] else '冬'
     
     with get_db() as conn:
-        routes = conn.execute('''
-            SELECT * FROM routes 
-            WHERE best_season LIKE ? OR best_season LIKE '%四季%'
-            ORDER BY accessibility DESC LIMIT 5
-        ''', (f'%{season}%',)).fetchall()
+        routes = repository.get_seasonal_routes(conn, season, 5)
     
     contents = []
     for r in routes:
@@ -1495,15 +2203,10 @@ def get_routes_flex():
 
 def get_atlas_flex(user_id):
     with get_db() as conn:
-        total = conn.execute("SELECT COUNT(*) FROM spots").fetchone()[0]
-        collected = conn.execute("SELECT COUNT(*) FROM checkins WHERE user_id = ?", (user_id,)).fetchone()[0]
-        
-        recent = conn.execute('''
-            SELECT s.name, s.icon FROM checkins c
-            JOIN spots s ON c.spot_id = s.id
-            WHERE c.user_id = ?
-            ORDER BY c.created_at DESC LIMIT 5
-        ''', (user_id,)).fetchall()
+        summary = repository.get_home_summary(conn, user_id)
+        recent = repository.get_recent_checkins(conn, user_id, 5)
+    total = summary['spots_total']
+    collected = summary['checkin_count']
     
     progress = (collected / total * 100) if total > 0 else 0
     bar = '█' * int(progress / 10) + '░' * (10 - int(progress / 10))
@@ -1517,7 +2220,7 @@ def get_atlas_flex(user_id):
         contents.append({"type": "separator", "margin": "lg"})
         contents.append({"type": "text", "text": "最近收集:", "size": "sm", "margin": "md", "color": "#888888"})
         for r in recent:
-            contents.append({"type": "text", "text": f"{r['icon']} {r['name']}", "size": "sm", "margin": "sm"})
+            contents.append({"type": "text", "text": f"{r['icon']} {r['spot_name']}", "size": "sm", "margin": "sm"})
     
     return {"type": "bubble",
             "header": {"type": "box", "layout": "vertical", "contents": [{"type": "text", "text": "🗺️ 探險圖鑑", "weight": "bold"}]},
@@ -1525,14 +2228,8 @@ def get_atlas_flex(user_id):
 
 def get_achievements_flex(user_id):
     with get_db() as conn:
-        unlocked = conn.execute('''
-            SELECT a.* FROM achievements a
-            JOIN user_achievements ua ON a.id = ua.achievement_id
-            WHERE ua.user_id = ?
-            ORDER BY ua.unlocked_at DESC LIMIT 6
-        ''', (user_id,)).fetchall()
-        
-        total = conn.execute("SELECT COUNT(*) FROM achievements").fetchone()[0]
+        unlocked = repository.get_unlocked_achievements(conn, user_id, limit=6)
+        total = repository.get_catalog_totals(conn)['achievements_total']
         unlocked_count = len(unlocked)
     
     if not unlocked:
@@ -1560,8 +2257,9 @@ def get_stats_message(user_id):
     stats = get_user_stats(user_id)
     
     with get_db() as conn:
-        total_spots = conn.execute("SELECT COUNT(*) FROM spots").fetchone()[0]
-        total_achievements = conn.execute("SELECT COUNT(*) FROM achievements").fetchone()[0]
+        totals = repository.get_catalog_totals(conn)
+    total_spots = totals['spots_total']
+    total_achievements = totals['achievements_total']
     
     progress = (stats['checkin_count'] / total_spots * 100) if total_spots > 0 else 0
     bar = '█' * int(progress / 10) + '░' * (10 - int(progress / 10))
@@ -1578,9 +2276,31 @@ def get_stats_message(user_id):
 
 {'🎉 持續探索，收集更多回憶！' if stats['checkin_count'] > 0 else '🚀 開始你的第一次打卡吧！'}"""
 
+def get_leaderboard_message(user_id, region=OVERALL):
+    entries, total = leaderboard.top(region, 10)
+    title = f"{region}收集排行" if region else '全台收集排行'
+    if not entries:
+        return f"🥇 {title}\n\n還沒有人打卡，成為第一名吧！"
+    
+    medals = {1: '🥇', 2: '🥈', 3: '🥉'}
+    lines = [f"🥇 {title}（共 {total} 人）", ""]
+    for e in entries:
+        me = ' ← 你' if e['user_id'] == user_id else ''
+        place = medals.get(e['rank'], f"{e['rank']}.")
+        lines.append(f"{place} {mask_user_id(e['user_id'])}  {e['score']} 分{me}")
+    
+    mine = leaderboard.rank(user_id, region)
+    lines.append("")
+    if mine:
+        lines.append(f"📍 你的名次：第 {mine['rank']} 名（{mine['score']} 分）")
+    else:
+        lines.append("📍 你還沒有收集分數，去打卡吧！")
+    lines.append("💡 稀有度越高分數越多：普通 1、稀有 3、史詩 8、傳說 20")
+    return '\n'.join(lines)
+
 def get_region_routes_flex(region):
     with get_db() as conn:
-        routes = conn.execute("SELECT * FROM routes WHERE region = ? ORDER BY accessibility DESC", (region,)).fetchall()
+        routes = repository.get_routes_by_region(conn, region)
     
     if not routes:
         return {"type": "bubble", "body": {"type": "box", "layout": "vertical", "contents": [
@@ -1606,46 +2326,31 @@ def get_region_routes_flex(region):
             "body": {"type": "box", "layout": "vertical", "contents": contents}}
 
 def add_wish_from_line(place_name, user_id):
-    with get_db() as conn:
-        conn.execute("INSERT INTO wishes (name, user_id) VALUES (?, ?)", (place_name, user_id))
-        conn.commit()
+    def add(conn):
+        repository.insert_wish(conn, user_id, {'name': place_name})
+        record_change(conn, 'user', user_id)
+    run_write(add)
 
 def mark_wish_complete_line(place_name, user_id):
-    with get_db() as conn:
-        cursor = conn.execute('''
-            UPDATE wishes SET completed = 1, completed_date = ?
-            WHERE name LIKE ? AND completed = 0 AND user_id = ?
-        ''', (get_tw_date_str(), f'%{place_name}%', user_id))
-        conn.commit()
-        
-        if cursor.rowcount > 0:
-            unlocked = check_achievements(user_id)
-            msg = f'🎉 恭喜完成「{place_name}」！'
-            if unlocked:
-                msg += f"\n🏆 解鎖成就: {', '.join([a['icon'] + a['name'] for a in unlocked])}"
-            return msg
-        else:
-            return f'❌ 找不到「{place_name}」在願望清單中'
+    def complete(conn):
+        updated = repository.complete_wishes_by_name(conn, user_id, place_name, get_tw_date_str())
+        if updated:
+            record_change(conn, 'user', user_id)
+        return updated
+    updated = run_write(complete)
+    
+    if updated > 0:
+        unlocked = check_achievements(user_id)
+        msg = f'🎉 恭喜完成「{place_name}」！'
+        if unlocked:
+            msg += f"\n🏆 解鎖成就: {', '.join([a['icon'] + a['name'] for a in unlocked])}"
+        return msg
+    else:
+        return f'❌ 找不到「{place_name}」在願望清單中'
 
 def search_content(keyword, user_id):
     with get_db() as conn:
-        routes = conn.execute('''
-            SELECT * FROM routes 
-            WHERE name LIKE ? OR region LIKE ? OR highlights LIKE ?
-            LIMIT 3
-        ''', (f'%{keyword}%', f'%{keyword}%', f'%{keyword}%')).fetchall()
-        
-        spots = conn.execute('''
-            SELECT s.*, r.name as route_name FROM spots s
-            JOIN routes r ON s.route_id = r.id
-            WHERE s.name LIKE ?
-            LIMIT 3
-        ''', (f'%{keyword}%',)).fetchall()
-        
-        wishes = conn.execute(
-            "SELECT * FROM wishes WHERE name LIKE ? AND user_id = ? LIMIT 3",
-            (f'%{keyword}%', user_id)
-        ).fetchall()
+        routes, spots, wishes = repository.search_content(conn, keyword, user_id)
     
     result = []
     
@@ -1674,6 +2379,12 @@ def search_content(keyword, user_id):
 # 應用啟動時自動初始化資料庫（gunicorn 和直接執行都會觸發）
 init_db()
 
+# 接手上次行程中斷的相簿匯入（每個 worker 啟動時執行，由暫存目錄的檔案鎖決定誰接手）
+try:
+    photo_importer.recover()
+except Exception as e:
+    print(f"⚠️ 相簿匯入工作接手失敗: {e}")
+
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 5000))
     app.run(host='0.0.0.0', port=port, debug=False)
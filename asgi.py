@@ -0,0 +1,288 @@
+"""
+退休走讀 - 非同步（ASGI）服務模式
+同步的 gunicorn worker 在呼叫 LINE / Google / ImgBB 時整段被卡住；此模式下：
+- /callback：在 event loop 上驗章、解析，以 aiohttp（AsyncMessagingApi）回覆 LINE
+- 查資料庫的部分（產生回覆、一般頁面）交給有上限的執行緒池，SQLite 連線數不會隨並行請求暴增
+- /google/* 與打卡（含 Google 同步）使用同步 HTTP client，改在另一個 I/O 執行緒池執行，不佔用資料庫執行緒
+- 其餘路由維持原本的 Flask app
+- 請求內容不先整包讀進記憶體：WSGI 執行緒讀 wsgi.input 時才向 event loop 取下一段（一次最多一段在手上）
+
+用法（需另外安裝 uvicorn、aiohttp）：
+    pip install uvicorn aiohttp
+    uvicorn asgi:app --host 0.0.0.0 --port $PORT --workers 2
+
+環境變數：
+    ASGI_DB_THREADS   資料庫 / 一般頁面的執行緒數（預設 8）
+    ASGI_IO_THREADS   /google/* 與打卡同步的執行緒數（預設 32）
+    ASGI_LINE_CONNECTIONS  非同步 LINE client 的連線上限（預設 64；SDK 預設為 CPU 數 × 5）
+"""
+
+import io
+import os
+import copy
+import sys
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+import app as retire_app
+from linebot.v3 import WebhookParser
+from linebot.v3.exceptions import InvalidSignatureError
+from linebot.v3.messaging import ReplyMessageRequest, PushMessageRequest
+from linebot.v3.webhooks import MessageEvent, TextMessageContent
+
+# 非同步 LINE client（可選功能，需要 aiohttp）
+ASYNC_LINE_ENABLED = False
+try:
+    import aiohttp  # noqa: F401  （AsyncApiClient 依賴）
+    from linebot.v3.messaging import AsyncApiClient, AsyncMessagingApi
+    ASYNC_LINE_ENABLED = True
+except ImportError:
+    print("⚠️ 未安裝 aiohttp，/callback 改用同步處理")
+
+ASGI_DB_THREADS = int(os.environ.get('ASGI_DB_THREADS', '8'))
+ASGI_IO_THREADS = int(os.environ.get('ASGI_IO_THREADS', '32'))
+ASGI_LINE_CONNECTIONS = int(os.environ.get('ASGI_LINE_CONNECTIONS', '64'))
+
+db_executor = ThreadPoolExecutor(max_workers=ASGI_DB_THREADS, thread_name_prefix='asgi-db')
+io_executor = ThreadPoolExecutor(max_workers=ASGI_IO_THREADS, thread_name_prefix='asgi-io')
+
+line_parser = WebhookParser(retire_app.LINE_CHANNEL_SECRET) if retire_app.handler else None
+_line_api_client = None
+_line_api = None
+
+
+def is_io_bound(method, path):
+    """主要時間花在等待外部 API 的路由"""
+    if path.startswith('/google/'):
+        return True
+    # 已連結 Google 時，打卡會在請求內上傳相簿 / 文件 / ImgBB
+    return method == 'POST' and path.startswith('/spot/') and path.endswith('/checkin')
+
+
+# ==================== WSGI 橋接 ====================
+
+# wsgi.input 的讀取緩衝大小（bytes）
+BODY_BUFFER_SIZE = 64 * 1024
+
+
+class RequestBody(io.RawIOBase):
+    """
+    wsgi.input：在 WSGI 執行緒讀取時才以 receive() 取下一段 http.request
+    Flask 讀多少就收多少，上傳大檔時記憶體只保留目前這一段；連線中斷視為結束（werkzeug 會判斷長度不足）
+    """
+
+    def __init__(self, receive, loop):
+        self._receive = receive
+        self._loop = loop
+        self._chunk = memoryview(b'')
+        self._done = False
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while not self._chunk and not self._done:
+            message = asyncio.run_coroutine_threadsafe(self._receive(), self._loop).result()
+            if message['type'] == 'http.disconnect':
+                self._done = True
+                break
+            self._chunk = memoryview(message.get('body', b''))
+            self._done = not message.get('more_body')
+        size = min(len(buffer), len(self._chunk))
+        buffer[:size] = self._chunk[:size]
+        self._chunk = self._chunk[size:]
+        return size
+
+
+async def read_body(receive):
+    chunks = []
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            break
+        chunks.append(message.get('body', b''))
+        if not message.get('more_body'):
+            break
+    return b''.join(chunks)
+
+
+def build_environ(scope, body):
+    """ASGI scope → WSGI environ（body 為 wsgi.input 的檔案物件）"""
+    root_path = scope.get('root_path', '')
+    path = scope.get('path', '/')
+    if root_path and path.startswith(root_path):
+        path = path[len(root_path):]
+    server = scope.get('server') or ('localhost', 80)
+
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        # PEP 3333：路徑以 latin-1 字串承載原始 bytes
+        'SCRIPT_NAME': root_path.encode('utf-8').decode('latin-1'),
+        'PATH_INFO': path.encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': body,
+        # 讀到結尾時 wsgi.input 會回傳空字串：沒有 Content-Length 的 chunked 上傳也能讀完
+        'wsgi.input_terminated': True,
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    if scope.get('client'):
+        environ['REMOTE_ADDR'], environ['REMOTE_PORT'] = scope['client'][0], str(scope['client'][1])
+
+    for name, value in scope.get('headers', []):
+        name, value = name.decode('latin-1'), value.decode('latin-1')
+        if name == 'content-type':
+            environ['CONTENT_TYPE'] = value
+        elif name == 'content-length':
+            environ['CONTENT_LENGTH'] = value
+        else:
+            key = 'HTTP_' + name.upper().replace('-', '_')
+            environ[key] = f"{environ[key]},{value}" if key in environ else value
+    return environ
+
+
+async def call_wsgi(scope, receive, send, executor):
+    """在執行緒池內執行 Flask app，回應內容逐段送回 event loop"""
+    loop = asyncio.get_running_loop()
+    body = io.BufferedReader(RequestBody(receive, loop), buffer_size=BODY_BUFFER_SIZE)
+    environ = build_environ(scope, body)
+
+    def send_from_thread(message):
+        asyncio.run_coroutine_threadsafe(send(message), loop).result()
+
+    def run():
+        response_start = {}
+
+        def start_response(status, headers, exc_info=None):
+            response_start['status'] = int(status.split(' ', 1)[0])
+            response_start['headers'] = [(k.lower().encode('latin-1'), v.encode('latin-1')) for k, v in headers]
+            return lambda data: send_body(data)
+
+        def send_body(data, more_body=True):
+            if 'sent' not in response_start:
+                send_from_thread({'type': 'http.response.start', 'status': response_start['status'],
+                                  'headers': response_start['headers']})
+                response_start['sent'] = True
+            if data or not more_body:
+                send_from_thread({'type': 'http.response.body', 'body': data, 'more_body': more_body})
+
+        result = retire_app.app(environ, start_response)
+        try:
+            for chunk in result:
+                send_body(chunk)
+            send_body(b'', more_body=False)
+        finally:
+            if hasattr(result, 'close'):
+                result.close()
+
+    await loop.run_in_executor(executor, run)
+
+
+async def send_text(send, status, text):
+    body = text.encode('utf-8')
+    await send({'type': 'http.response.start', 'status': status,
+                'headers': [(b'content-type', b'text/plain; charset=utf-8'),
+                            (b'content-length', str(len(body)).encode())]})
+    await send({'type': 'http.response.body', 'body': body})
+
+
+# ==================== LINE Bot（非同步） ====================
+
+def get_line_api():
+    """AsyncApiClient 綁定目前的 event loop，第一次使用時建立"""
+    global _line_api_client, _line_api
+    if _line_api is None:
+        configuration = copy.copy(retire_app.configuration)
+        configuration.connection_pool_maxsize = ASGI_LINE_CONNECTIONS
+        _line_api_client = AsyncApiClient(configuration)
+        _line_api = AsyncMessagingApi(_line_api_client)
+    return _line_api
+
+
+async def close_line_api():
+    global _line_api_client, _line_api
+    if _line_api_client is not None:
+        await _line_api_client.close()
+    _line_api_client = _line_api = None
+
+
+async def async_safe_reply(line_bot_api, reply_token, user_id, messages):
+    """與 app.safe_reply 相同：先 reply，token 失效時降級為 push"""
+    logger = retire_app.app.logger
+    try:
+        await line_bot_api.reply_message(ReplyMessageRequest(reply_token=reply_token, messages=messages))
+    except Exception as e:
+        error_msg = str(e)
+        if retire_app.is_reply_token_error(error_msg):
+            logger.warning(f"Reply token 失效，改用 push_message: {error_msg}")
+            try:
+                await line_bot_api.push_message(PushMessageRequest(to=user_id, messages=messages))
+            except Exception as push_error:
+                logger.error(f"Push message 也失敗: {push_error}")
+        else:
+            logger.error(f"Reply 發生未預期錯誤: {e}")
+            raise
+
+
+def build_line_reply(text, user_id):
+    with retire_app.app.app_context():
+        return retire_app.build_line_reply(text, user_id)
+
+
+async def line_callback(scope, receive, send):
+    body = (await read_body(receive)).decode('utf-8')
+    if not line_parser:
+        return await send_text(send, 400, 'LINE Bot not configured')
+
+    headers = dict(scope.get('headers', []))
+    signature = headers.get(b'x-line-signature', b'').decode('latin-1')
+    try:
+        events = line_parser.parse(body, signature)
+    except InvalidSignatureError:
+        return await send_text(send, 400, 'Bad Request')
+
+    loop = asyncio.get_running_loop()
+    line_bot_api = get_line_api()
+    # 同一次 webhook 的事件依序處理（例如先「新增」再「完成」）
+    for event in events:
+        if isinstance(event, MessageEvent) and isinstance(event.message, TextMessageContent):
+            user_id = event.source.user_id
+            messages = await loop.run_in_executor(db_executor, build_line_reply, event.message.text, user_id)
+            await async_safe_reply(line_bot_api, event.reply_token, user_id, messages)
+    await send_text(send, 200, 'OK')
+
+
+# ==================== ASGI app ====================
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            print(f"⚡ ASGI 模式（資料庫執行緒 {ASGI_DB_THREADS}、I/O 執行緒 {ASGI_IO_THREADS}）")
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await close_line_api()
+            db_executor.shutdown(wait=False)
+            io_executor.shutdown(wait=False)
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def app(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        return await lifespan(receive, send)
+    if scope['type'] != 'http':
+        return
+
+    method, path = scope['method'], scope['path']
+    if path == '/callback' and method == 'POST' and ASYNC_LINE_ENABLED:
+        return await line_callback(scope, receive, send)
+    executor = io_executor if is_io_bound(method, path) else db_executor
+    await call_wsgi(scope, receive, send, executor)
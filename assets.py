@@ -0,0 +1,262 @@
+"""
+前端資源打包（CSS / JS）
+- 原始檔放在 frontend/css、frontend/js；BUNDLES 定義每個輸出檔由哪些原始檔依序串接
+- 建置時壓縮（minify）後以內容雜湊命名寫到 static/dist/<名稱>.<雜湊>.<副檔名>，並寫出 static/dist/manifest.json
+- 模板以 {{ asset_url('atlas.css') }} 取得帶雜湊的網址；內容不變網址就不變，內容一改網址跟著換，
+  因此 /static/dist/ 下的檔案可以 immutable 長效快取，Service Worker 也會預快取
+- 已安裝 rcssmin / rjsmin 時用它們壓縮，否則使用內建的保守壓縮（去註解、縮排與空行）
+- 只保留本次與上一次建置的檔案，部署期間還拿著舊 HTML 的瀏覽器仍取得到舊版資源
+
+環境變數：
+    ASSETS_BUILD_AT_STARTUP  啟動時建置（預設 1，唯讀檔案系統請在建置時執行 build 並設為 0）
+    ASSETS_MAX_AGE           打包檔快取秒數（預設 31536000）
+
+命令列：
+    python assets.py build     # 建置 static/dist/
+"""
+
+import os
+import re
+import sys
+import json
+import hashlib
+import tempfile
+from flask import request
+
+# rcssmin / rjsmin（可選功能：未安裝時使用內建的保守壓縮）
+CSSMIN_ENABLED = False
+try:
+    import rcssmin
+    CSSMIN_ENABLED = True
+except ImportError:
+    rcssmin = None
+
+JSMIN_ENABLED = False
+try:
+    import rjsmin
+    JSMIN_ENABLED = True
+except ImportError:
+    rjsmin = None
+
+ASSETS_BUILD_AT_STARTUP = os.environ.get('ASSETS_BUILD_AT_STARTUP', '1') != '0'
+ASSETS_MAX_AGE = int(os.environ.get('ASSETS_MAX_AGE', str(365 * 24 * 3600)))
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+SOURCE_DIR = os.path.join(BASE_DIR, 'frontend')
+DIST_DIRNAME = 'dist'
+MANIFEST_NAME = 'manifest.json'
+HASH_LENGTH = 10
+
+# 輸出檔 → 原始檔（相對於 frontend/，依序串接）
+BUNDLES = {
+    'achievements.css': ['css/achievements.css'],
+    'atlas.css': ['css/atlas.css'],
+    'bind.css': ['css/bind.css'],
+    'checkins.css': ['css/checkins.css'],
+    'google-result.css': ['css/google-result.css'],
+    'google-settings.css': ['css/google-settings.css'],
+    'index.css': ['css/index.css'],
+    'log-form.css': ['css/log-form.css'],
+    'logs.css': ['css/logs.css'],
+    'route-detail.css': ['css/route-detail.css'],
+    'routes.css': ['css/routes.css'],
+    'wish-form.css': ['css/wish-form.css'],
+    'wishes.css': ['css/wishes.css'],
+    # LINE 帳號自動識別：每個頁面都要，單獨一檔讓各頁共用快取
+    'user-sync.js': ['js/user-sync.js'],
+    'atlas.js': ['js/user-sync.js', 'js/atlas.js'],
+    'bind.js': ['js/bind.js'],
+    'google-settings.js': ['js/google-settings.js'],
+    'index.js': ['js/user-sync.js', 'js/index.js'],
+    'log-form.js': ['js/log-form.js'],
+    'wish-form.js': ['js/wish-form.js'],
+    'wishes.js': ['js/user-sync.js', 'js/wishes.js'],
+}
+
+# 輸出檔 → dist 下的檔名（建置或讀取 manifest 後填入）
+_manifest = {}
+_url_prefix = '/static/'
+
+
+# ==================== 壓縮 ====================
+
+_CSS_COMMENT = re.compile(r'/\*.*?\*/', re.S)
+_CSS_SPACE = re.compile(r'\s+')
+_CSS_PUNCT = re.compile(r'\s*([{};,>])\s*')
+
+
+def minify_css(text):
+    """去掉註解與多餘空白（不動字串與括號內的空白，calc() 等不受影響）"""
+    if CSSMIN_ENABLED:
+        return rcssmin.cssmin(text)
+    text = _CSS_COMMENT.sub('', text)
+    text = _CSS_SPACE.sub(' ', text)
+    text = _CSS_PUNCT.sub(r'\1', text)
+    text = re.sub(r':\s+', ':', text)
+    return text.replace(';}', '}').strip()
+
+
+def minify_js(text):
+    """
+    保守壓縮：只去掉縮排、空行與整行 // 註解
+    保留換行，不依賴自動分號插入以外的任何語法分析
+    """
+    if JSMIN_ENABLED:
+        return rjsmin.jsmin(text)
+    lines = []
+    for line in text.splitlines():
+        line = line.strip()
+        if line and not line.startswith('//'):
+            lines.append(line)
+    return '\n'.join(lines)
+
+
+MINIFIERS = {'.css': minify_css, '.js': minify_js}
+
+
+# ==================== 建置 ====================
+
+def hashed_name(name, content):
+    """atlas.css + 內容 → atlas.<雜湊>.css"""
+    stem, ext = os.path.splitext(name)
+    digest = hashlib.sha256(content).hexdigest()[:HASH_LENGTH]
+    return f'{stem}.{digest}{ext}'
+
+
+def _read_bundle(name, sources, source_dir):
+    parts = []
+    for source in sources:
+        with open(os.path.join(source_dir, source), encoding='utf-8') as f:
+            parts.append(f.read())
+    text = '\n'.join(parts)
+    minify = MINIFIERS.get(os.path.splitext(name)[1])
+    if minify:
+        text = minify(text)
+    return (text + '\n').encode('utf-8')
+
+
+def _write_atomic(path, data):
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp-')
+    with os.fdopen(fd, 'wb') as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+def _load_manifest(dist_dir):
+    try:
+        with open(os.path.join(dist_dir, MANIFEST_NAME), encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def build_assets(static_dir, source_dir=SOURCE_DIR, bundles=None):
+    """
+    建置所有打包檔到 static/dist/，寫出 manifest，刪除比上一次建置更舊的檔案
+
+    Returns:
+        dict: {'manifest': {名稱: dist 下的檔名}, 'written': 新寫入的檔案數,
+               'removed': 刪除的舊檔數, 'source_bytes': 原始大小, 'bytes': 壓縮後大小}
+    """
+    bundles = BUNDLES if bundles is None else bundles
+    dist_dir = os.path.join(static_dir, DIST_DIRNAME)
+    os.makedirs(dist_dir, exist_ok=True)
+    previous = _load_manifest(dist_dir)
+
+    manifest = {}
+    result = {'manifest': manifest, 'written': 0, 'removed': 0, 'source_bytes': 0, 'bytes': 0}
+    for name, sources in bundles.items():
+        content = _read_bundle(name, sources, source_dir)
+        filename = hashed_name(name, content)
+        manifest[name] = filename
+        result['source_bytes'] += sum(os.path.getsize(os.path.join(source_dir, s)) for s in sources)
+        result['bytes'] += len(content)
+        target = os.path.join(dist_dir, filename)
+        if not os.path.exists(target):
+            _write_atomic(target, content)
+            result['written'] += 1
+
+    if manifest != previous:
+        _write_atomic(os.path.join(dist_dir, MANIFEST_NAME),
+                      json.dumps(manifest, ensure_ascii=False, indent=2, sort_keys=True).encode('utf-8'))
+
+    # 只保留本次與上一次建置的檔案（含預壓縮的 .gz / .br）
+    keep = set(manifest.values()) | set(previous.values()) | {MANIFEST_NAME}
+    for entry in os.listdir(dist_dir):
+        base = re.sub(r'\.(gz|br)$', '', entry)
+        if base in keep or entry.startswith('.'):
+            continue
+        try:
+            os.remove(os.path.join(dist_dir, entry))
+            result['removed'] += 1
+        except OSError:
+            pass
+    return result
+
+
+# ==================== 模板與快取 ====================
+
+def asset_url(name):
+    """模板用：{{ asset_url('atlas.css') }} → /static/dist/atlas.<雜湊>.css"""
+    try:
+        return f'{_url_prefix}{DIST_DIRNAME}/{_manifest[name]}'
+    except KeyError:
+        raise KeyError(f'找不到打包檔 {name}，請先執行 python assets.py build') from None
+
+
+def bundle_urls():
+    """所有打包檔的網址（Service Worker 預快取用）"""
+    return [asset_url(name) for name in sorted(_manifest)]
+
+
+def _cache_bundles(response):
+    """after_request：帶雜湊的打包檔永遠不會變，給 immutable 長效快取"""
+    if request.endpoint != 'static' or response.status_code not in (200, 206, 304):
+        return response
+    filename = (request.view_args or {}).get('filename', '')
+    if filename.startswith(DIST_DIRNAME + '/') and not filename.endswith('/' + MANIFEST_NAME):
+        response.cache_control.no_cache = None
+        response.cache_control.public = True
+        response.cache_control.max_age = ASSETS_MAX_AGE
+        response.cache_control.immutable = True
+    return response
+
+
+def init_assets(app):
+    """建置（或讀取）打包檔，註冊 asset_url 模板函式與長效快取"""
+    global _url_prefix
+    static_dir = app.static_folder
+    _url_prefix = app.static_url_path.rstrip('/') + '/'
+
+    if ASSETS_BUILD_AT_STARTUP:
+        try:
+            result = build_assets(static_dir)
+            _manifest.update(result['manifest'])
+            if result['written']:
+                print(f"✅ 已建置 {result['written']} 個前端打包檔")
+        except OSError as e:
+            print(f"⚠️ 前端打包失敗，改用現有的 manifest: {e}")
+    if not _manifest:
+        _manifest.update(_load_manifest(os.path.join(static_dir, DIST_DIRNAME)))
+        if not _manifest:
+            print("⚠️ 找不到前端打包檔 manifest，請執行 python assets.py build")
+
+    app.add_template_global(asset_url, 'asset_url')
+    app.after_request(_cache_bundles)
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if argv[:1] != ['build']:
+        print("用法：python assets.py build [static 目錄]")
+        return 1
+    static_dir = argv[1] if len(argv) > 1 else os.path.join(BASE_DIR, 'static')
+    result = build_assets(static_dir)
+    saved = 1 - result['bytes'] / result['source_bytes'] if result['source_bytes'] else 0
+    print(f"✅ {len(result['manifest'])} 個打包檔，新寫入 {result['written']} 個、刪除舊檔 {result['removed']} 個，"
+          f"{result['source_bytes']:,} → {result['bytes']:,} bytes（減少 {saved:.0%}）")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,200 @@
+"""
+圖鑑地圖的景點群集（伺服器端預先計算）
+- 以 Web Mercator 投影，從最大縮放層級往下逐層以格網合併（每格 CLUSTER_RADIUS_PX 像素），
+  下一層的群集一定完整落在上一層的某個群集內（階層式，放大時群集只會分裂不會重組）
+- 每層依 256px 圖磚建立索引，查詢只取出 bbox 覆蓋的圖磚（bbox 先裁到景點範圍；
+  覆蓋的圖磚數比有內容的圖磚多時改掃有內容的圖磚，查詢成本不隨 bbox 面積與縮放層級放大）
+- 每個群集記錄成員景點的 bitset（位元 id = 景點 id，與 /api/atlas/<user>/collected 相同），
+  用戶已收集數 = popcount(群集 bitset & 用戶 bitset)
+- 景點只在初始化時寫入：每個 worker 建一次，與圖鑑目錄快取一起失效
+"""
+
+import math
+
+CLUSTER_MIN_ZOOM = 5
+CLUSTER_MAX_ZOOM = 16
+CLUSTER_RADIUS_PX = 60
+TILE_SIZE = 256
+
+# Web Mercator 可投影的緯度上限
+MAX_LATITUDE = 85.05112878
+
+
+def project(lat, lng):
+    """經緯度 → 0..1 的世界座標（y 向南增加）"""
+    lat = max(-MAX_LATITUDE, min(MAX_LATITUDE, lat))
+    x = (lng + 180.0) / 360.0
+    sin_lat = math.sin(math.radians(lat))
+    y = 0.5 - math.log((1 + sin_lat) / (1 - sin_lat)) / (4 * math.pi)
+    return x, y
+
+
+def unproject(x, y):
+    lng = x * 360.0 - 180.0
+    lat = math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * y))))
+    return lat, lng
+
+
+def bitset_to_mask(spot_ids):
+    """景點 id 列表 → 整數 bitset"""
+    mask = 0
+    for spot_id in spot_ids:
+        mask |= 1 << spot_id
+    return mask
+
+
+class Cluster:
+    __slots__ = ('x', 'y', 'count', 'mask', 'spot', 'expansion_zoom', 'bounds')
+
+    def __init__(self, x, y, count, mask, spot=None, expansion_zoom=None, bounds=None):
+        self.x = x
+        self.y = y
+        self.count = count
+        self.mask = mask
+        self.spot = spot
+        self.expansion_zoom = expansion_zoom
+        self.bounds = bounds or (x, y, x, y)
+
+
+class ClusterIndex:
+    """各縮放層級的群集與圖磚索引"""
+
+    def __init__(self, spots, min_zoom=CLUSTER_MIN_ZOOM, max_zoom=CLUSTER_MAX_ZOOM, radius=CLUSTER_RADIUS_PX):
+        self.min_zoom = min_zoom
+        self.max_zoom = max_zoom
+        self.levels = {}
+
+        # 比最大層級再深一層：每個景點各自一點
+        level = []
+        for spot in spots:
+            if spot['lat'] is None or spot['lng'] is None:
+                continue
+            x, y = project(spot['lat'], spot['lng'])
+            level.append(Cluster(x, y, 1, 1 << spot['id'], spot=spot))
+        self.levels[max_zoom + 1] = self._tile_index(level, max_zoom + 1)
+        # 所有景點的世界座標範圍，查詢的 bbox 先裁到這個範圍
+        if level:
+            self.extent = (min(c.x for c in level), min(c.y for c in level),
+                           max(c.x for c in level), max(c.y for c in level))
+        else:
+            self.extent = None
+
+        for z in range(max_zoom, min_zoom - 1, -1):
+            level = self._merge(level, z, radius / (TILE_SIZE * 2 ** z))
+            self.levels[z] = self._tile_index(level, z)
+
+    @staticmethod
+    def _merge(children, z, cell):
+        cells = {}
+        for child in children:
+            cells.setdefault((int(child.x // cell), int(child.y // cell)), []).append(child)
+
+        merged = []
+        for group in cells.values():
+            if len(group) == 1:
+                merged.append(group[0])
+                continue
+            count = sum(c.count for c in group)
+            mask = 0
+            for c in group:
+                mask |= c.mask
+            merged.append(Cluster(
+                sum(c.x * c.count for c in group) / count,
+                sum(c.y * c.count for c in group) / count,
+                count, mask,
+                expansion_zoom=z + 1,
+                bounds=(min(c.bounds[0] for c in group), min(c.bounds[1] for c in group),
+                        max(c.bounds[2] for c in group), max(c.bounds[3] for c in group)),
+            ))
+        return merged
+
+    @staticmethod
+    def _tile_index(clusters, z):
+        tiles = {}
+        scale = 2 ** z
+        for c in clusters:
+            tiles.setdefault((int(c.x * scale), int(c.y * scale)), []).append(c)
+        return tiles
+
+    def query(self, z, bbox=None, user_mask=0):
+        """
+        取得可視範圍內的群集與單一景點
+
+        Args:
+            z: 縮放層級（超出範圍時取最近的層級）
+            bbox: (west, south, east, north) 經緯度，None 表示全部
+            user_mask: 用戶已收集景點的 bitset
+
+        Returns:
+            dict: {'z', 'clusters': [...], 'spots': [...]}
+        """
+        z = max(self.min_zoom, min(int(z), self.max_zoom + 1))
+        tiles = self.levels[z]
+        if bbox is None:
+            candidates = [c for cs in tiles.values() for c in cs]
+            x0 = y0 = 0.0
+            x1 = y1 = 1.0
+        elif self.extent is None:
+            candidates = []
+        else:
+            west, south, east, north = bbox
+            x0, y1 = project(south, west)
+            x1, y0 = project(north, east)
+            ex0, ey0, ex1, ey1 = self.extent
+            x0, y0, x1, y1 = max(x0, ex0), max(y0, ey0), min(x1, ex1), min(y1, ey1)
+            if x0 > x1 or y0 > y1:
+                candidates = []
+            else:
+                scale = 2 ** z
+                tx0, tx1 = int(x0 * scale), int(x1 * scale)
+                ty0, ty1 = int(y0 * scale), int(y1 * scale)
+                if (tx1 - tx0 + 1) * (ty1 - ty0 + 1) > len(tiles):
+                    # 範圍內的圖磚比實際有景點的圖磚多：直接掃有內容的圖磚，工作量不隨 bbox 面積放大
+                    candidates = [c for (tx, ty), cs in tiles.items()
+                                  if tx0 <= tx <= tx1 and ty0 <= ty <= ty1 for c in cs]
+                else:
+                    candidates = []
+                    for tx in range(tx0, tx1 + 1):
+                        for ty in range(ty0, ty1 + 1):
+                            candidates.extend(tiles.get((tx, ty), ()))
+
+        clusters, spots = [], []
+        for c in candidates:
+            if not (x0 <= c.x <= x1 and y0 <= c.y <= y1):
+                continue
+            if c.spot is not None:
+                spot = c.spot
+                spots.append({
+                    'id': spot['id'], 'lat': spot['lat'], 'lng': spot['lng'], 'name': spot['name'],
+                    'icon': spot['icon'], 'rarity': spot['rarity'],
+                    'collected': bool(user_mask & c.mask),
+                })
+                continue
+            lat, lng = unproject(c.x, c.y)
+            north, west = unproject(c.bounds[0], c.bounds[1])
+            south, east = unproject(c.bounds[2], c.bounds[3])
+            clusters.append({
+                'lat': round(lat, 6), 'lng': round(lng, 6),
+                'count': c.count,
+                'collected': (c.mask & user_mask).bit_count(),
+                'expansion_zoom': c.expansion_zoom,
+                'bbox': [round(west, 6), round(south, 6), round(east, 6), round(north, 6)],
+            })
+        return {'z': z, 'clusters': clusters, 'spots': spots}
+
+
+def parse_bbox(text):
+    """'west,south,east,north' → tuple；空字串回傳 None，格式錯誤丟出 ValueError"""
+    if not text:
+        return None
+    parts = [float(p) for p in text.split(',')]
+    if len(parts) != 4:
+        raise ValueError('bbox 需要 4 個數值')
+    if not all(math.isfinite(p) for p in parts):
+        raise ValueError('bbox 數值必須是有限數')
+    west, south, east, north = parts
+    if west > east or south > north:
+        raise ValueError('bbox 範圍錯誤')
+    west, east = max(-180.0, west), min(180.0, east)
+    south, north = max(-MAX_LATITUDE, south), min(MAX_LATITUDE, north)
+    return west, south, east, north
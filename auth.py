@@ -0,0 +1,25 @@
+"""
+營運用端點的 Bearer token 驗證（/metrics、/api/storage 等）
+- token 由環境變數設定，未設定時端點不開放（回 404），不符時回 401
+- 以 hmac.compare_digest 比對，比對時間與內容無關
+"""
+
+import hmac
+from flask import request, abort
+from werkzeug.datastructures import WWWAuthenticate
+
+
+def bearer_token_matches(expected):
+    """請求的 Authorization: Bearer <token> 是否等於 expected（expected 為空時一律不符）"""
+    scheme, _, token = request.headers.get('Authorization', '').partition(' ')
+    if not expected or scheme.lower() != 'bearer':
+        return False
+    return hmac.compare_digest(token.strip().encode('utf-8'), expected.encode('utf-8'))
+
+
+def require_token(expected):
+    """未設定 token 時回 404（不開放），token 不符時回 401"""
+    if not expected:
+        abort(404)
+    if not bearer_token_matches(expected):
+        abort(401, www_authenticate=WWWAuthenticate('Bearer'))
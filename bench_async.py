@@ -0,0 +1,196 @@
+"""
+退休走讀 - 同步 / 非同步服務模式的單一 worker 容量比較
+以本機 LINE API 模擬伺服器（fake_line_api.py，含延遲）為對象，對同一個 worker 送出大量 LINE webhook：
+- sync：Flask WSGI app，由 --sync-threads 條執行緒處理（預設 1，等同 gunicorn sync worker）
+- async：asgi.app，在單一 event loop 上同時處理 --concurrency 個請求
+
+回報吞吐量、延遲與同時處理中的請求數（每個 worker 的並行容量）
+
+用法：
+    python bench_async.py --requests 300 --concurrency 64 --api-latency-ms 100
+    python bench_async.py --sync-threads 8      # 對照 gunicorn --threads 8
+"""
+
+import os
+import sys
+import time
+import asyncio
+import logging
+import argparse
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from werkzeug.serving import make_server
+
+from fake_line_api import FakeLinePlatform, create_app, sign_body, build_text_webhook, percentile
+
+BENCH_LINE_SECRET = 'bench-async-channel-secret'
+
+# 每個請求輪流使用的指令（都會查資料庫再呼叫 reply API）
+COMMANDS = ['統計', '願望', '路線', '選單', '成就']
+
+
+class InFlight:
+    """同時處理中的請求數"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.current = 0
+        self.peak = 0
+
+    def __enter__(self):
+        with self._lock:
+            self.current += 1
+            self.peak = max(self.peak, self.current)
+
+    def __exit__(self, *exc):
+        with self._lock:
+            self.current -= 1
+
+
+def webhook_request(i):
+    body = build_text_webhook(f"Ubenchasync{i % 50:04d}", COMMANDS[i % len(COMMANDS)])
+    return body.encode('utf-8'), sign_body(BENCH_LINE_SECRET, body)
+
+
+def summarize(mode, latencies, elapsed, peak, failures):
+    latencies.sort()
+    return {
+        'mode': mode,
+        'requests': len(latencies),
+        'failures': failures,
+        'throughput': len(latencies) / elapsed if elapsed else 0.0,
+        'p50': percentile(latencies, 50),
+        'p95': percentile(latencies, 95),
+        'peak_in_flight': peak,
+    }
+
+
+def run_sync(retire_app, args):
+    """單一同步 worker：請求全部到達後排隊，由 sync_threads 條執行緒依序處理"""
+    client = retire_app.app.test_client()
+    in_flight = InFlight()
+    latencies, failures = [], [0]
+
+    def handle(i, queued_at):
+        body, signature = webhook_request(i)
+        with in_flight:
+            response = client.post('/callback', data=body, headers={
+                'Content-Type': 'application/json', 'X-Line-Signature': signature})
+        if response.status_code != 200:
+            failures[0] += 1
+        latencies.append((time.perf_counter() - queued_at) * 1000)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.sync_threads) as pool:
+        for i in range(args.requests):
+            pool.submit(handle, i, time.perf_counter())
+    return summarize(f'sync ×{args.sync_threads}', latencies, time.perf_counter() - started,
+                     in_flight.peak, failures[0])
+
+
+async def asgi_post(asgi_app, path, body, headers):
+    """直接呼叫 ASGI app（不經過 HTTP server）"""
+    scope = {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1',
+        'method': 'POST', 'scheme': 'http', 'path': path, 'root_path': '', 'query_string': b'',
+        'headers': [(k.lower().encode('latin-1'), v.encode('latin-1')) for k, v in headers.items()],
+        'client': ('127.0.0.1', 50000), 'server': ('127.0.0.1', 80),
+    }
+    received = [False]
+    status = [None]
+
+    async def receive():
+        if received[0]:
+            await asyncio.Event().wait()
+        received[0] = True
+        return {'type': 'http.request', 'body': body, 'more_body': False}
+
+    async def send(message):
+        if message['type'] == 'http.response.start':
+            status[0] = message['status']
+
+    await asgi_app(scope, receive, send)
+    return status[0]
+
+
+async def run_async(asgi, args):
+    in_flight = InFlight()
+    semaphore = asyncio.Semaphore(args.concurrency)
+    latencies, failures = [], [0]
+
+    async def handle(i):
+        queued_at = time.perf_counter()
+        body, signature = webhook_request(i)
+        async with semaphore:
+            with in_flight:
+                status = await asgi_post(asgi.app, '/callback', body, {
+                    'Content-Type': 'application/json', 'X-Line-Signature': signature})
+        if status != 200:
+            failures[0] += 1
+        latencies.append((time.perf_counter() - queued_at) * 1000)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(handle(i) for i in range(args.requests)))
+    elapsed = time.perf_counter() - started
+    await asgi.close_line_api()
+    return summarize(f'async ×{args.concurrency}', latencies, elapsed, in_flight.peak, failures[0])
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='同步 / 非同步服務模式容量比較')
+    parser.add_argument('--requests', type=int, default=200, help='每種模式送出的 webhook 數')
+    parser.add_argument('--concurrency', type=int, default=64, help='async 模式同時處理的請求上限')
+    parser.add_argument('--sync-threads', type=int, default=1, help='sync worker 的執行緒數')
+    parser.add_argument('--api-latency-ms', type=float, default=100.0, help='模擬 LINE API 的延遲')
+    parser.add_argument('--db', help='資料庫路徑（預設為暫存檔）')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+
+    # reply token 不會過期，量到的是純 reply 路徑
+    platform = FakeLinePlatform(token_ttl=3600, latency_ms=args.api_latency_ms)
+    server = make_server('127.0.0.1', 0, create_app(platform), threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    os.environ.update({
+        'LINE_CHANNEL_SECRET': BENCH_LINE_SECRET,
+        'LINE_CHANNEL_ACCESS_TOKEN': 'bench-async-token',
+        'LINE_API_HOST': f'http://127.0.0.1:{server.server_port}',
+        'DATABASE_PATH': args.db or os.path.join(tempfile.mkdtemp(prefix='bench_async_'), 'bench.db'),
+        'SLOW_QUERY_MS': '0',
+    })
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import app as retire_app
+    import asgi
+
+    if not asgi.ASYNC_LINE_ENABLED:
+        print("❌ async 模式需要 aiohttp")
+        return 1
+
+    print(f"⏱️ {args.requests} 個 webhook / 模式，LINE API 延遲 {args.api_latency_ms:g} ms")
+    results = [run_sync(retire_app, args), asyncio.run(run_async(asgi, args))]
+
+    print(f"\n   {'模式':<14}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'同時處理':>10}{'失敗':>6}")
+    for r in results:
+        print(f"   {r['mode']:<14}{r['throughput']:>10.1f}{r['p50']:>10.1f}{r['p95']:>10.1f}"
+              f"{r['peak_in_flight']:>10}{r['failures']:>6}")
+    sync, async_ = results
+    if sync['throughput']:
+        print(f"\n📊 async 吞吐量為 sync 的 {async_['throughput'] / sync['throughput']:.1f} 倍")
+
+    # 確認每個 webhook 都真的回覆到模擬平台
+    counts = platform.stats()['counts']
+    print(f"   LINE API：reply 成功 {counts['reply_ok']}、push {counts['push_ok']}（預期 reply {args.requests * 2}）")
+    server.shutdown()
+    if any(r['failures'] for r in results) or counts['reply_ok'] != args.requests * 2:
+        print("❌ 有請求失敗")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,76 @@
+"""
+退休走讀 - 傳輸量量測
+以 Flask test client 取得各頁面 / API / 靜態檔，比較未壓縮、gzip、brotli 的實際傳輸 bytes，
+並量測壓縮帶來的伺服器端時間（median ms）
+
+用法：
+    python bench_compression.py                    # small 資料集（自動產生到 bench_data/）
+    python bench_compression.py --dataset medium --rounds 20
+"""
+
+import os
+import sys
+import argparse
+
+from benchmark import ensure_dataset, expect_ok, measure
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='回應壓縮傳輸量量測')
+    parser.add_argument('--dataset', default='small', help='small / medium / large')
+    parser.add_argument('--rounds', type=int, default=10, help='計時量測次數')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    db_path = ensure_dataset(args.dataset)
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import app as retire_app
+    import compression
+
+    retire_app.DATABASE = db_path
+    retire_app.init_db()
+    client = retire_app.app.test_client()
+    with retire_app.get_db() as conn:
+        row = conn.execute('''
+            SELECT user_id, COUNT(*) AS n FROM checkins GROUP BY user_id ORDER BY n DESC LIMIT 1
+        ''').fetchone()
+        user_id = row['user_id'] if row else 'benchmark-user'
+        route_id = conn.execute("SELECT MIN(id) FROM routes").fetchone()[0]
+
+    paths = [f'/?user={user_id}', f'/atlas?user={user_id}', f'/routes?user={user_id}',
+             f'/routes/{route_id}?user={user_id}', f'/checkins?user={user_id}',
+             f'/achievements?user={user_id}', f'/wishes?user={user_id}', f'/logs?user={user_id}',
+             '/api/atlas', f'/api/stats/{user_id}', '/sw.js', '/static/manifest.json']
+    encodings = ['identity', 'gzip'] + (['br'] if compression.BROTLI_ENABLED else [])
+
+    def fetch(path, encoding):
+        response = expect_ok(client.get(path, headers={'Accept-Encoding': encoding}))
+        return len(response.get_data())
+
+    print(f"⏱️ {args.dataset} 資料集，用戶 {user_id}"
+          + ('' if compression.BROTLI_ENABLED else '（未安裝 brotli，只量測 gzip）'))
+    header = f"   {'路徑':<36}" + ''.join(f'{e:>10}' for e in encodings) + f"{'節省':>8}{'原始 ms':>10}{'壓縮 ms':>10}"
+    print(header)
+
+    totals = dict.fromkeys(encodings, 0)
+    for path in paths:
+        sizes = {e: fetch(path, e) for e in encodings}
+        for e in encodings:
+            totals[e] += sizes[e]
+        best = min(sizes.values())
+        saved = 1 - best / sizes['identity'] if sizes['identity'] else 0
+        plain_ms = measure(lambda: fetch(path, 'identity'), args.rounds, warmup=1)['median_ms']
+        packed_ms = measure(lambda: fetch(path, encodings[-1]), args.rounds, warmup=1)['median_ms']
+        label = path.split('?')[0].replace(user_id, '<user>')
+        print(f"   {label:<36}" + ''.join(f'{sizes[e]:>10,}' for e in encodings)
+              + f"{saved:>8.0%}{plain_ms:>10.2f}{packed_ms:>10.2f}")
+
+    best = min(totals.values())
+    print(f"\n📊 合計 {totals['identity']:,} → {best:,} bytes（減少 {1 - best / totals['identity']:.0%}）")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,134 @@
+"""
+退休走讀 - 收集排行榜量測
+在大量用戶的資料集上比較：
+- 每次對 checkins JOIN spots 做 GROUP BY 算分數再排名（未維護分數時的做法）
+- user_scores + 每個 worker 的 Fenwick tree（名次 O(log 最高分)，前 N 名走索引）
+
+同時確認兩種做法算出的名次一致，並量測打卡後（其他 worker 寫入）重新載入單一用戶的成本
+
+用法：
+    python bench_leaderboard.py                       # 10 萬用戶（資料集存放於 bench_data/）
+    python bench_leaderboard.py --users 20000 --lookups 500
+"""
+
+import os
+import sys
+import random
+import argparse
+
+from benchmark import BENCH_DATA_DIR, measure
+
+NAIVE_SCORES_SQL = '''
+    WITH scores AS (
+        SELECT c.user_id, SUM(CASE s.rarity WHEN 'rare' THEN 3 WHEN 'epic' THEN 8
+                                            WHEN 'legendary' THEN 20 ELSE 1 END) AS score
+        FROM checkins c JOIN spots s ON c.spot_id = s.id
+        GROUP BY c.user_id
+    )
+'''
+
+
+def naive_rank(conn, user_id):
+    row = conn.execute(NAIVE_SCORES_SQL + '''
+        SELECT (SELECT COUNT(*) FROM scores WHERE score > me.score) + 1, me.score
+        FROM scores me WHERE me.user_id = ?
+    ''', (user_id,)).fetchone()
+    return (row[0], row[1]) if row else None
+
+
+def naive_top(conn, limit):
+    return conn.execute(NAIVE_SCORES_SQL + '''
+        SELECT user_id, score FROM scores ORDER BY score DESC, user_id LIMIT ?
+    ''', (limit,)).fetchall()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='收集排行榜量測')
+    parser.add_argument('--users', type=int, default=100_000, help='資料集用戶數')
+    parser.add_argument('--db', help='資料庫路徑（預設 bench_data/leaderboard_<users>.db）')
+    parser.add_argument('--lookups', type=int, default=200, help='Fenwick 名次查詢次數')
+    parser.add_argument('--naive-rounds', type=int, default=10, help='GROUP BY 做法的量測次數')
+    parser.add_argument('--seed', type=int, default=42)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    db_path = args.db or os.path.join(BENCH_DATA_DIR, f'leaderboard_{args.users}.db')
+    if not os.path.exists(db_path):
+        import gen_dataset
+        os.makedirs(os.path.dirname(db_path) or '.', exist_ok=True)
+        gen_dataset.generate(gen_dataset.parse_args(
+            ['--db', db_path, '--users', str(args.users), '--seed', str(args.seed)]))
+
+    os.environ['DATABASE_PATH'] = db_path
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import app as retire_app
+    from leaderboard import leaderboard
+
+    retire_app.DATABASE = db_path
+    rng = random.Random(args.seed)
+    with retire_app.get_db() as conn:
+        user_ids = [r[0] for r in conn.execute("SELECT user_id FROM user_scores WHERE region = ''")]
+        spot_count = conn.execute("SELECT COUNT(*) FROM spots").fetchone()[0]
+    if not user_ids:
+        print("❌ 資料集沒有打卡資料")
+        return 1
+    samples = [rng.choice(user_ids) for _ in range(args.lookups)]
+    print(f"⏱️ {len(user_ids):,} 位有分數的用戶，{args.lookups} 次名次查詢")
+
+    results = {}
+    with retire_app.get_db() as conn:
+        results['GROUP BY 名次'] = measure(lambda: naive_rank(conn, rng.choice(samples)),
+                                         args.naive_rounds, warmup=1)
+        results['GROUP BY 前 10 名'] = measure(lambda: naive_top(conn, 10), args.naive_rounds, warmup=1)
+
+        # 名次一致性（同分同名次）
+        mismatches = 0
+        for user_id in samples[:min(len(samples), args.naive_rounds * 2)]:
+            expected = naive_rank(conn, user_id)
+            actual = leaderboard.rank(user_id)
+            if actual is None or (actual['rank'], actual['score']) != expected:
+                mismatches += 1
+
+    results['建立 Fenwick（冷啟動）'] = measure(
+        lambda: leaderboard.rank(samples[0]), 3, warmup=0,
+        setup=leaderboard.reset)
+    lookups = iter(samples * 1000)
+    results['Fenwick 名次'] = measure(lambda: leaderboard.rank(next(lookups)), args.lookups)
+    results['索引 前 10 名'] = measure(lambda: leaderboard.top('', 10), args.lookups)
+
+    # 打卡 → 其他請求查名次：change_bus 通知後只重新載入該用戶
+    client = retire_app.app.test_client()
+    writer = next((u for u in samples
+                   if retire_app.get_user_stats(u)['checkin_count'] < spot_count), samples[0])
+    with retire_app.get_db() as conn:
+        free_spot = conn.execute('''
+            SELECT MIN(id) FROM spots WHERE id NOT IN (SELECT spot_id FROM checkins WHERE user_id = ?)
+        ''', (writer,)).fetchone()[0]
+    state = {'checked_in': False}
+
+    def toggle():
+        action = 'checkin/cancel' if state['checked_in'] else 'checkin'
+        client.post(f'/spot/{free_spot}/{action}', json={'user_id': writer})
+        state['checked_in'] = not state['checked_in']
+
+    results['打卡後 Fenwick 名次'] = measure(lambda: leaderboard.rank(writer), args.lookups // 4 or 1,
+                                         setup=toggle)
+    if state['checked_in']:
+        toggle()
+
+    print(f"\n   {'情境':<24}{'median ms':>12}{'p95 ms':>10}")
+    for case, stats in results.items():
+        print(f"   {case:<24}{stats['median_ms']:>12.3f}{stats['p95_ms']:>10.3f}")
+    speedup = results['GROUP BY 名次']['median_ms'] / max(results['Fenwick 名次']['median_ms'], 1e-6)
+    print(f"\n📊 名次查詢快 {speedup:,.0f} 倍；重新載入用戶 {leaderboard.stats['reloaded_users']} 次")
+    if mismatches:
+        print(f"❌ {mismatches} 個用戶的名次與 GROUP BY 結果不一致")
+        return 1
+    print("✅ 名次與 GROUP BY 結果一致")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,268 @@
+"""
+退休走讀 - 效能基準測試
+以 Flask test client 量測所有頁面、打卡 / 取消、願望完成與 LINE 指令處理時間
+
+- 資料集由 gen_dataset.py 產生（small / medium / large），存放於 bench_data/
+- LINE 路徑走完整的 /callback：簽章後的假 webhook → handler → 指令處理，Messaging API 以假物件取代
+- 結果可存成 JSON 基準，之後比對並在退步超過容忍值時以非 0 結束（供 CI 使用）
+
+用法：
+    python benchmark.py --datasets small,medium --save benchmark_baseline.json
+    python benchmark.py --datasets small --compare benchmark_baseline.json --tolerance 0.25
+"""
+
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import statistics
+from datetime import datetime
+from fake_line_api import sign_body, build_text_webhook
+
+BENCH_DATA_DIR = os.environ.get('BENCH_DATA_DIR', 'bench_data')
+BENCH_LINE_SECRET = 'benchmark-channel-secret'
+
+# LINE 指令（每個分支至少一個）
+LINE_COMMANDS = ['選單', '願望', '路線', '圖鑑', '成就', '統計', '排行', '新增 基準測試景點',
+                 '完成 基準測試景點', '北部', '網頁', '台北']
+
+# 基準測試不寫慢查詢紀錄；LINE handler 需要在 import app 前設定
+os.environ.setdefault('SLOW_QUERY_MS', '0')
+os.environ.setdefault('LINE_CHANNEL_SECRET', BENCH_LINE_SECRET)
+os.environ.setdefault('LINE_CHANNEL_ACCESS_TOKEN', 'benchmark-access-token')
+
+
+# ==================== LINE ====================
+
+class FakeMessagingApi:
+    """取代 MessagingApi：只記錄呼叫次數，不連線 LINE"""
+
+    calls = {'reply': 0, 'push': 0}
+
+    def __init__(self, api_client=None):
+        pass
+
+    def reply_message(self, request):
+        FakeMessagingApi.calls['reply'] += 1
+
+    def push_message(self, request):
+        FakeMessagingApi.calls['push'] += 1
+
+
+# ==================== 量測 ====================
+
+def measure(fn, rounds, warmup=2, setup=None):
+    """執行 fn 多次，回傳毫秒統計；setup 不計入時間"""
+    samples = []
+    for i in range(warmup + rounds):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        fn()
+        elapsed = (time.perf_counter() - start) * 1000
+        if i >= warmup:
+            samples.append(elapsed)
+    samples.sort()
+    return {
+        'rounds': rounds,
+        'min_ms': round(samples[0], 3),
+        'median_ms': round(statistics.median(samples), 3),
+        'p95_ms': round(samples[min(len(samples) - 1, int(len(samples) * 0.95))], 3),
+        'mean_ms': round(statistics.fmean(samples), 3),
+    }
+
+
+def ensure_dataset(name, seed=42):
+    """資料集不存在時呼叫 gen_dataset 產生"""
+    import gen_dataset
+
+    os.makedirs(BENCH_DATA_DIR, exist_ok=True)
+    db_path = os.path.join(BENCH_DATA_DIR, f'{name}.db')
+    if not os.path.exists(db_path):
+        gen_dataset.generate(gen_dataset.parse_args(['--db', db_path, '--preset', name, '--seed', str(seed)]))
+    return db_path
+
+
+def expect_ok(response):
+    if response.status_code >= 400:
+        raise RuntimeError(f'{response.request.path} → {response.status_code}')
+    return response
+
+
+class BenchmarkRunner:
+    """對單一資料集執行所有情境"""
+
+    def __init__(self, retire_app, db_path, rounds):
+        self.retire_app = retire_app
+        self.rounds = rounds
+        retire_app.DATABASE = db_path
+        retire_app.init_db()
+        self.client = retire_app.app.test_client()
+
+        with retire_app.get_db() as conn:
+            # 以打卡數最多的用戶作為最差情況
+            row = conn.execute('''
+                SELECT user_id, COUNT(*) AS n FROM checkins GROUP BY user_id ORDER BY n DESC LIMIT 1
+            ''').fetchone()
+            self.user_id = row['user_id'] if row else 'benchmark-user'
+            # 打卡 / 取消需要一個尚未收集的景點；最重度用戶可能已全收集，改用次一位
+            row = conn.execute('''
+                SELECT c.user_id, MIN(s.id) AS spot_id
+                FROM (SELECT user_id, COUNT(*) AS n FROM checkins GROUP BY user_id
+                      HAVING n < (SELECT COUNT(*) FROM spots) ORDER BY n DESC LIMIT 1) c
+                JOIN spots s
+                WHERE s.id NOT IN (SELECT spot_id FROM checkins WHERE user_id = c.user_id)
+            ''').fetchone()
+            self.checkin_user_id = row['user_id'] or self.user_id
+            self.free_spot_id = row['spot_id'] or conn.execute("SELECT MIN(id) FROM spots").fetchone()[0]
+            self.route_id = conn.execute("SELECT MIN(id) FROM routes").fetchone()[0]
+
+    def run(self):
+        results = {}
+        uid = self.user_id
+        client = self.client
+
+        pages = ['/', '/atlas', '/routes', f'/routes/{self.route_id}', '/checkins',
+                 '/achievements', '/wishes', '/logs']
+        for path in pages:
+            results[f'GET {path}'] = measure(
+                lambda p=path: expect_ok(client.get(f'{p}?user={uid}')), self.rounds)
+        results['GET /api/stats'] = measure(
+            lambda: expect_ok(client.get(f'/api/stats/{uid}')), self.rounds)
+        results['GET /api/leaderboard'] = measure(
+            lambda: expect_ok(client.get(f'/api/leaderboard?user={uid}')), self.rounds)
+
+        spot_id, checkin_uid = self.free_spot_id, self.checkin_user_id
+        results['POST checkin'] = measure(
+            lambda: expect_ok(client.post(f'/spot/{spot_id}/checkin', json={'user_id': checkin_uid})),
+            self.rounds, setup=lambda: self._cancel(spot_id))
+        results['POST checkin/cancel'] = measure(
+            lambda: expect_ok(client.post(f'/spot/{spot_id}/checkin/cancel', json={'user_id': checkin_uid})),
+            self.rounds, setup=lambda: self._checkin(spot_id))
+        self._cancel(spot_id)
+
+        wish_id = self._pending_wish()
+        results['POST wish complete'] = measure(
+            lambda: expect_ok(client.post(f'/wishes/{wish_id}/complete', json={'user_id': uid})),
+            self.rounds, setup=lambda: self._reset_wish(wish_id))
+
+        if self.retire_app.handler:
+            self.retire_app.MessagingApi = FakeMessagingApi
+            for text in LINE_COMMANDS:
+                results[f'LINE {text}'] = measure(lambda t=text: self._line(t), self.rounds,
+                                                  setup=lambda t=text: self._line_setup(t))
+        return results
+
+    # ---------- 情境準備（不計時） ----------
+
+    def _checkin(self, spot_id):
+        self.client.post(f'/spot/{spot_id}/checkin', json={'user_id': self.checkin_user_id})
+
+    def _cancel(self, spot_id):
+        self.client.post(f'/spot/{spot_id}/checkin/cancel', json={'user_id': self.checkin_user_id})
+
+    def _pending_wish(self):
+        with self.retire_app.get_db() as conn:
+            cursor = conn.execute(
+                "INSERT INTO wishes (name, user_id) VALUES (?, ?)", ('基準測試願望', self.user_id)
+            )
+            conn.commit()
+            return cursor.lastrowid
+
+    def _reset_wish(self, wish_id):
+        with self.retire_app.get_db() as conn:
+            conn.execute("UPDATE wishes SET completed = 0 WHERE id = ?", (wish_id,))
+            conn.commit()
+
+    def _line_setup(self, text):
+        # 「完成」需要有未完成的同名願望
+        if text.startswith('完成 '):
+            self.retire_app.add_wish_from_line(text.split(' ', 1)[1], self.user_id)
+
+    def _line(self, text):
+        body = build_text_webhook(self.user_id, text)
+        secret = os.environ['LINE_CHANNEL_SECRET']
+        expect_ok(self.client.post('/callback', data=body.encode('utf-8'), headers={
+            'Content-Type': 'application/json',
+            'X-Line-Signature': sign_body(secret, body),
+        }))
+
+
+# ==================== 基準比對 ====================
+
+def compare(current, baseline, tolerance):
+    """回傳退步項目（median 超過 baseline × (1 + tolerance)）"""
+    regressions = []
+    for dataset, cases in current.items():
+        for case, stats in cases.items():
+            base = baseline.get(dataset, {}).get(case)
+            if not base:
+                continue
+            limit = base['median_ms'] * (1 + tolerance)
+            if stats['median_ms'] > limit:
+                regressions.append((dataset, case, base['median_ms'], stats['median_ms']))
+    return regressions
+
+
+def print_results(results):
+    for dataset, cases in results.items():
+        print(f"\n📊 {dataset}")
+        print(f"   {'情境':<28}{'median':>10}{'p95':>10}{'min':>10}")
+        for case, stats in cases.items():
+            print(f"   {case:<28}{stats['median_ms']:>10.2f}{stats['p95_ms']:>10.2f}{stats['min_ms']:>10.2f}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='退休走讀效能基準測試')
+    parser.add_argument('--datasets', default='small', help='逗號分隔：small,medium,large')
+    parser.add_argument('--rounds', type=int, default=20, help='每個情境的量測次數')
+    parser.add_argument('--save', help='將結果存成基準 JSON')
+    parser.add_argument('--compare', help='與基準 JSON 比對')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='容許的 median 退步比例')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    datasets = [d.strip() for d in args.datasets.split(',') if d.strip()]
+
+    db_paths = {name: ensure_dataset(name) for name in datasets}
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import app as retire_app
+
+    results = {}
+    for name, db_path in db_paths.items():
+        print(f"⏱️ 執行 {name} 資料集…")
+        results[name] = BenchmarkRunner(retire_app, db_path, args.rounds).run()
+    print_results(results)
+
+    if args.save:
+        with open(args.save, 'w', encoding='utf-8') as f:
+            json.dump({
+                'meta': {
+                    'created_at': datetime.now().isoformat(timespec='seconds'),
+                    'python': platform.python_version(),
+                    'platform': platform.platform(),
+                    'rounds': args.rounds,
+                },
+                'results': results,
+            }, f, ensure_ascii=False, indent=2)
+        print(f"\n💾 基準已存到 {args.save}")
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)['results']
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print(f"\n❌ {len(regressions)} 個情境退步超過 {args.tolerance:.0%}：")
+            for dataset, case, base_ms, now_ms in regressions:
+                print(f"   [{dataset}] {case}: {base_ms:.2f} → {now_ms:.2f} ms")
+            return 1
+        print(f"\n✅ 沒有超過 {args.tolerance:.0%} 的退步")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,220 @@
+"""
+跨 worker 快取失效
+- 每個用戶資料寫入時，在同一個交易內於 change_log 附加一筆 (scope, user_id)，交易回滾時紀錄也一起消失
+- 各 worker 讀快取前先 poll：SQLite 以專用連線查 PRAGMA data_version（其他連線有 commit 才會變），
+  沒變就不查表；有變才以 id > 上次看到的 id 取出新紀錄，只淘汰受影響用戶的快取
+- 不需要 Redis 等外部服務；PostgreSQL 沒有 data_version，改為每隔 CHANGE_POLL_MS 直接查表
+- change_log 只保留 CHANGE_LOG_RETENTION_SECONDS 秒；worker 超過保留時間沒有 poll（可能漏看）時清空全部快取
+- 過期紀錄由寫入端清除：record_change 每隔 PRUNE_INTERVAL_SECONDS 在所屬交易內順便刪除
+  （寫入鎖本來就在手上，poll 不必另開寫入交易，也不會在持有 bus 鎖時等待寫入鎖）
+
+用法：
+    stats_cache = change_bus.cache('user')           # 依 user_id 快取，scope='user' 的異動會淘汰
+    record_change(conn, 'user', user_id)             # 寫入時呼叫（fn(conn) 內，不 commit）
+
+環境變數：
+    CHANGE_POLL_MS                 兩次 poll 的最短間隔（預設 0：每次讀快取都確認）
+    CHANGE_LOG_RETENTION_SECONDS   change_log 保留秒數（預設 3600）
+"""
+
+import os
+import time
+import threading
+from collections import defaultdict, OrderedDict
+
+CHANGE_POLL_MS = float(os.environ.get('CHANGE_POLL_MS', '0'))
+CHANGE_LOG_RETENTION_SECONDS = float(os.environ.get('CHANGE_LOG_RETENTION_SECONDS', '3600'))
+
+# 多久清一次過期的 change_log（秒）
+PRUNE_INTERVAL_SECONDS = 300
+# 每次從 change_log 取出的筆數上限
+TAIL_BATCH = 1000
+# 每個快取最多保留的用戶數
+CACHE_MAX_ENTRIES = 10000
+
+
+def record_change(conn, scope, user_id=None):
+    """記錄一筆異動（需與資料寫入在同一交易內；user_id=None 表示整個 scope）"""
+    now = time.time()
+    conn.execute(
+        "INSERT INTO change_log (scope, user_id, created_at) VALUES (?, ?, ?)",
+        (scope, user_id, now)
+    )
+    if change_bus.prune_due(now):
+        prune_change_log(conn, now)
+
+
+def prune_change_log(conn, now=None):
+    """
+    刪除超過保留時間的 change_log（在呼叫端的交易內，不 commit）
+    紀錄依 id 遞增寫入：從頭找到第一筆未過期的紀錄，刪除它之前的範圍，不掃整張表
+    """
+    cutoff = (now or time.time()) - CHANGE_LOG_RETENTION_SECONDS
+    conn.execute('''
+        DELETE FROM change_log WHERE id < COALESCE(
+            (SELECT id FROM change_log WHERE created_at >= ? ORDER BY id LIMIT 1),
+            (SELECT MAX(id) + 1 FROM change_log)
+        )
+    ''', (cutoff,))
+
+
+class UserCache:
+    """依 user_id 的行程內快取（LRU），異動由 ChangeBus 淘汰"""
+
+    def __init__(self, bus, scope, max_entries=CACHE_MAX_ENTRIES):
+        self.bus = bus
+        self.scope = scope
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self.stats = {'hits': 0, 'misses': 0, 'evictions': 0}
+
+    def get(self, user_id, load):
+        """取得快取，沒有時以 load() 取得並存入"""
+        self.bus.poll()
+        with self._lock:
+            if user_id in self._entries:
+                self._entries.move_to_end(user_id)
+                self.stats['hits'] += 1
+                return self._entries[user_id][1]
+            self.stats['misses'] += 1
+            version = self.bus.version
+
+        value = load()
+        with self._lock:
+            # 讀取期間有異動：結果可能已過期，不存入
+            if self.bus.version == version:
+                self._entries[user_id] = (version, value)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return value
+
+    def evict(self, user_id):
+        """淘汰單一用戶（user_id=None 表示全部）"""
+        with self._lock:
+            if user_id is None:
+                self.stats['evictions'] += len(self._entries)
+                self._entries.clear()
+            elif self._entries.pop(user_id, None) is not None:
+                self.stats['evictions'] += 1
+
+
+class ChangeBus:
+    """
+    每個 worker 一個：追蹤 change_log 並通知訂閱者
+    open_db 與 get_db 相同介面；watch_connect 回傳 SQLite 專用連線（PostgreSQL 時為 None）
+    """
+
+    def __init__(self):
+        self.open_db = None
+        self.watch_connect = None
+        self._lock = threading.Lock()
+        self._subscribers = defaultdict(list)
+        self._pid = None
+        self._watch_conn = None
+        self._data_version = None
+        self._last_id = 0
+        self._last_poll = 0.0
+        self._last_prune = 0.0
+        self._prune_lock = threading.Lock()
+        # 每次淘汰都加一，UserCache 用來判斷載入期間是否有異動
+        self.version = 0
+        self.stats = {'polls': 0, 'tails': 0, 'changes': 0, 'flushes': 0}
+
+    def configure(self, open_db, watch_connect=None):
+        self.open_db = open_db
+        self.watch_connect = watch_connect
+
+    def subscribe(self, scope, fn):
+        """scope 有異動時呼叫 fn(user_id)（user_id=None 表示整個 scope）"""
+        self._subscribers[scope].append(fn)
+
+    def cache(self, scope):
+        """建立一個會被 scope 異動淘汰的 UserCache"""
+        user_cache = UserCache(self, scope)
+        self.subscribe(scope, user_cache.evict)
+        return user_cache
+
+    def _reset(self):
+        """啟動或 fork 後：從目前最新的紀錄開始追，行程內快取清空"""
+        if self._watch_conn is not None and self._pid == os.getpid():
+            self._watch_conn.close()
+        self._watch_conn = self.watch_connect() if self.watch_connect else None
+        self._data_version = None
+        with self.open_db() as conn:
+            self._last_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM change_log").fetchone()[0]
+        self._pid = os.getpid()
+        self._last_poll = time.time()
+        self._notify_all()
+
+    def _notify(self, scope, user_id):
+        self.version += 1
+        for fn in self._subscribers.get(scope, ()):
+            fn(user_id)
+
+    def _notify_all(self):
+        self.stats['flushes'] += 1
+        for scope in list(self._subscribers):
+            self._notify(scope, None)
+
+    def _changed(self):
+        """SQLite：data_version 沒變就表示沒有其他連線 commit 過，不必查表"""
+        if self._watch_conn is None:
+            return True
+        data_version = self._watch_conn.execute('PRAGMA data_version').fetchone()[0]
+        if data_version == self._data_version:
+            return False
+        self._data_version = data_version
+        return True
+
+    def poll(self):
+        """取出新的異動並淘汰對應快取（讀快取前呼叫）"""
+        if self.open_db is None:
+            return
+        with self._lock:
+            now = time.time()
+            if self._pid != os.getpid():
+                self._reset()
+                return
+            if CHANGE_POLL_MS and now - self._last_poll < CHANGE_POLL_MS / 1000:
+                return
+            if now - self._last_poll > CHANGE_LOG_RETENTION_SECONDS:
+                # 太久沒有 poll，中間的紀錄可能已被清掉
+                self._reset()
+                return
+            self._last_poll = now
+            self.stats['polls'] += 1
+            if not self._changed():
+                return
+
+            self.stats['tails'] += 1
+            with self.open_db() as conn:
+                while True:
+                    rows = conn.execute(
+                        "SELECT id, scope, user_id FROM change_log WHERE id > ? ORDER BY id LIMIT ?",
+                        (self._last_id, TAIL_BATCH)
+                    ).fetchall()
+                    for row in rows:
+                        self._notify(row['scope'], row['user_id'])
+                    self.stats['changes'] += len(rows)
+                    if rows:
+                        self._last_id = rows[-1]['id']
+                    if len(rows) < TAIL_BATCH:
+                        break
+
+    def prune_due(self, now):
+        """距離上次清除超過 PRUNE_INTERVAL_SECONDS 時回傳 True（同一時間只有一個寫入者負責清除）"""
+        with self._prune_lock:
+            if now - self._last_prune < PRUNE_INTERVAL_SECONDS:
+                return False
+            self._last_prune = now
+            return True
+
+    def prune(self, now=None):
+        """以獨立的寫入交易刪除超過保留時間的 change_log（手動維護用）"""
+        with self.open_db(immediate=True) as conn:
+            prune_change_log(conn, now)
+            conn.commit()
+
+
+change_bus = ChangeBus()
@@ -0,0 +1,246 @@
+"""
+回應壓縮（gzip / brotli）
+- 動態回應：after_request 依 Accept-Encoding 壓縮 HTML / JSON / JS / CSS 等文字內容；
+  小於 COMPRESS_MIN_SIZE 或壓縮後沒有變小時原樣送出
+- 串流回應（is_streamed）逐段壓縮，每段 flush，瀏覽器可以邊收邊顯示
+- 靜態檔：啟動時（或 `python compression.py build`）在原檔旁預先產生 .gz / .br（最高壓縮等級，只在原檔較新時重建），
+  static 路由依 Accept-Encoding 直接送出預壓縮檔，不必每次壓縮
+- 所有可壓縮的回應都帶 Vary: Accept-Encoding；動態回應原本的 ETag 改為 weak（同內容不同編碼）
+
+環境變數：
+    COMPRESSION_ENABLED    設 0 關閉（前面有 nginx 等代理負責壓縮時）
+    COMPRESS_MIN_SIZE      最小壓縮 bytes（預設 1024）
+    COMPRESS_GZIP_LEVEL    動態回應 gzip 等級（預設 6）
+    COMPRESS_BROTLI_QUALITY 動態回應 brotli 品質（預設 5）
+    COMPRESS_STATIC_AT_STARTUP 啟動時預壓縮靜態檔（預設 1，唯讀檔案系統請在建置時執行 build 並設為 0）
+
+命令列：
+    python compression.py build     # 預壓縮 static/ 下的文字檔
+"""
+
+import os
+import sys
+import zlib
+import tempfile
+from flask import request, send_from_directory
+
+# brotli（可選功能：未安裝時只提供 gzip）
+BROTLI_ENABLED = False
+try:
+    import brotli
+    BROTLI_ENABLED = True
+except ImportError:
+    brotli = None
+
+COMPRESSION_ENABLED = os.environ.get('COMPRESSION_ENABLED', '1') != '0'
+COMPRESS_MIN_SIZE = int(os.environ.get('COMPRESS_MIN_SIZE', '1024'))
+COMPRESS_GZIP_LEVEL = int(os.environ.get('COMPRESS_GZIP_LEVEL', '6'))
+COMPRESS_BROTLI_QUALITY = int(os.environ.get('COMPRESS_BROTLI_QUALITY', '5'))
+COMPRESS_STATIC_AT_STARTUP = os.environ.get('COMPRESS_STATIC_AT_STARTUP', '1') != '0'
+
+COMPRESSIBLE_TYPES = {
+    'text/html', 'text/css', 'text/plain', 'text/xml', 'text/javascript',
+    'application/javascript', 'application/json', 'application/manifest+json',
+    'application/xml', 'image/svg+xml',
+}
+STATIC_EXTENSIONS = {'.html', '.css', '.js', '.json', '.svg', '.txt', '.xml', '.webmanifest'}
+# 預壓縮時略過的目錄（用戶上傳的照片）
+STATIC_SKIP_DIRS = {'uploads'}
+
+# 編碼 → 預壓縮檔副檔名
+SUFFIXES = {'br': '.br', 'gzip': '.gz'}
+
+
+class _GzipEncoder:
+    def __init__(self, level):
+        # wbits=31：gzip 標頭
+        self._obj = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def compress(self, data):
+        return self._obj.compress(data)
+
+    def flush(self):
+        return self._obj.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        return self._obj.flush(zlib.Z_FINISH)
+
+
+class _BrotliEncoder:
+    def __init__(self, quality):
+        self._obj = brotli.Compressor(quality=quality)
+
+    def compress(self, data):
+        return self._obj.process(data)
+
+    def flush(self):
+        return self._obj.flush()
+
+    def finish(self):
+        return self._obj.finish()
+
+
+def make_encoder(encoding, static=False):
+    """static=True 時使用最高壓縮等級（預壓縮用）"""
+    if encoding == 'br':
+        return _BrotliEncoder(11 if static else COMPRESS_BROTLI_QUALITY)
+    return _GzipEncoder(9 if static else COMPRESS_GZIP_LEVEL)
+
+
+def compress_bytes(data, encoding, static=False):
+    encoder = make_encoder(encoding, static)
+    return encoder.compress(data) + encoder.finish()
+
+
+def choose_encoding(accept_encodings):
+    """依 Accept-Encoding 選擇編碼（br 優先），都不接受時回傳 None"""
+    candidates = (['br'] if BROTLI_ENABLED else []) + ['gzip']
+    best, best_quality = None, 0
+    for encoding in candidates:
+        quality = accept_encodings[encoding]
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+# ==================== 動態回應 ====================
+
+def _compressible(response):
+    if response.mimetype not in COMPRESSIBLE_TYPES:
+        return False
+    if response.status_code < 200 or response.status_code in (204, 206, 304):
+        return False
+    if 'Content-Encoding' in response.headers or response.direct_passthrough:
+        return False
+    if response.cache_control.no_transform:
+        return False
+    return True
+
+
+def _stream(chunks, encoder, charset='utf-8'):
+    for chunk in chunks:
+        if isinstance(chunk, str):
+            chunk = chunk.encode(charset)
+        data = encoder.compress(chunk) + encoder.flush()
+        if data:
+            yield data
+    yield encoder.finish()
+
+
+def compress_response(response):
+    """after_request：壓縮文字類回應"""
+    if not _compressible(response):
+        return response
+    response.vary.add('Accept-Encoding')
+    if request.method == 'HEAD' or 'Range' in request.headers:
+        return response
+    encoding = choose_encoding(request.accept_encodings)
+    if encoding is None:
+        return response
+
+    if response.is_streamed:
+        response.response = _stream(response.response, make_encoder(encoding))
+        response.headers.pop('Content-Length', None)
+    else:
+        data = response.get_data()
+        if len(data) < COMPRESS_MIN_SIZE:
+            return response
+        compressed = compress_bytes(data, encoding)
+        if len(compressed) >= len(data):
+            return response
+        response.set_data(compressed)
+
+    response.headers['Content-Encoding'] = encoding
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+    return response
+
+
+# ==================== 靜態檔 ====================
+
+def precompress_static(static_dir, min_size=COMPRESS_MIN_SIZE):
+    """
+    在原檔旁產生 .gz / .br（原檔比預壓縮檔新、或預壓縮檔不存在時才重建）
+
+    Returns:
+        dict: {'files': 檢查的檔案數, 'written': 新寫入的預壓縮檔數}
+    """
+    result = {'files': 0, 'written': 0}
+    encodings = [e for e in SUFFIXES if e != 'br' or BROTLI_ENABLED]
+    for root, dirs, files in os.walk(static_dir):
+        dirs[:] = [d for d in dirs if d not in STATIC_SKIP_DIRS and not d.startswith('.')]
+        for name in files:
+            if os.path.splitext(name)[1] not in STATIC_EXTENSIONS:
+                continue
+            path = os.path.join(root, name)
+            if os.path.getsize(path) < min_size:
+                continue
+            result['files'] += 1
+            mtime = os.path.getmtime(path)
+            data = None
+            for encoding in encodings:
+                target = path + SUFFIXES[encoding]
+                if os.path.exists(target) and os.path.getmtime(target) >= mtime:
+                    continue
+                if data is None:
+                    with open(path, 'rb') as f:
+                        data = f.read()
+                fd, tmp = tempfile.mkstemp(dir=root, prefix='.tmp-')
+                with os.fdopen(fd, 'wb') as f:
+                    f.write(compress_bytes(data, encoding, static=True))
+                os.replace(tmp, target)
+                result['written'] += 1
+    return result
+
+
+def serve_static(app, filename):
+    """取代 Flask 的 static 路由：有對應的預壓縮檔時直接送出"""
+    static_dir = app.static_folder
+    if os.path.splitext(filename)[1] in STATIC_EXTENSIONS:
+        encoding = choose_encoding(request.accept_encodings) if 'Range' not in request.headers else None
+        if encoding and os.path.isfile(os.path.join(static_dir, filename + SUFFIXES[encoding])):
+            import mimetypes
+            mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+            response = send_from_directory(static_dir, filename + SUFFIXES[encoding], mimetype=mimetype,
+                                           max_age=app.get_send_file_max_age(filename))
+            response.headers['Content-Encoding'] = encoding
+            response.vary.add('Accept-Encoding')
+            return response
+        response = app.send_static_file(filename)
+        response.vary.add('Accept-Encoding')
+        return response
+    return app.send_static_file(filename)
+
+
+def init_compression(app):
+    """掛上動態回應壓縮與預壓縮靜態檔的 static 路由"""
+    if not COMPRESSION_ENABLED:
+        return
+
+    if COMPRESS_STATIC_AT_STARTUP and app.static_folder:
+        try:
+            result = precompress_static(app.static_folder)
+            if result['written']:
+                print(f"✅ 已預壓縮 {result['written']} 個靜態檔")
+        except OSError as e:
+            print(f"⚠️ 靜態檔預壓縮失敗: {e}")
+
+    app.view_functions['static'] = lambda filename: serve_static(app, filename)
+    app.after_request(compress_response)
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if argv[:1] != ['build']:
+        print("用法：python compression.py build [static 目錄]")
+        return 1
+    static_dir = argv[1] if len(argv) > 1 else os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static')
+    result = precompress_static(static_dir)
+    encodings = 'gzip + brotli' if BROTLI_ENABLED else 'gzip（未安裝 brotli）'
+    print(f"✅ {result['files']} 個靜態檔，新寫入 {result['written']} 個預壓縮檔（{encodings}）")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
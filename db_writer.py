@@ -0,0 +1,138 @@
+"""
+SQLite 寫入協調
+- WAL 模式：讀取不會被寫入擋住，寫入只需要單一 writer lock
+- busy_timeout：拿不到 lock 時等待而不是立刻丟出 "database is locked"
+- 讀後寫的流程（先查重複再寫入）由呼叫端以 BEGIN IMMEDIATE 開始交易，避免升級 lock 時失敗
+- 選用：每個 worker 一條 writer thread，把同時送來的小寫入合併成一次 commit（group commit）
+
+環境變數：
+    SQLITE_BUSY_TIMEOUT_MS   等待 lock 的毫秒數（預設 5000）
+    SQLITE_WAL               1 = 使用 WAL（預設），0 = 維持 rollback journal
+    SQLITE_GROUP_COMMIT      1 = 啟用 writer thread（預設 0）
+    SQLITE_GROUP_COMMIT_MAX  單次 commit 最多合併的寫入數（預設 64）
+    SQLITE_GROUP_COMMIT_WAIT_MS  收到第一筆後再等待多久湊批次（預設 0，只合併已在排隊的寫入）
+"""
+
+import os
+import time
+import queue
+import threading
+from concurrent.futures import Future
+from profiling import record
+
+SQLITE_BUSY_TIMEOUT_MS = int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS', '5000'))
+SQLITE_WAL = os.environ.get('SQLITE_WAL', '1') != '0'
+SQLITE_GROUP_COMMIT = os.environ.get('SQLITE_GROUP_COMMIT', '0') == '1'
+SQLITE_GROUP_COMMIT_MAX = int(os.environ.get('SQLITE_GROUP_COMMIT_MAX', '64'))
+SQLITE_GROUP_COMMIT_WAIT_MS = float(os.environ.get('SQLITE_GROUP_COMMIT_WAIT_MS', '0'))
+
+# 等待 writer thread 回覆的上限（秒），超過視為寫入失敗
+WRITE_RESULT_TIMEOUT = max(30.0, SQLITE_BUSY_TIMEOUT_MS / 1000 * 2)
+
+
+def configure_connection(conn):
+    """每條連線的設定（journal_mode 存在資料庫檔內，在 enable_wal 設一次即可）"""
+    if SQLITE_WAL:
+        # WAL 下 NORMAL 仍能保證一致性，只是斷電時可能遺失最後幾筆交易
+        conn.execute('PRAGMA synchronous = NORMAL')
+
+
+def enable_wal(conn):
+    """切換為 WAL（持久設定，只需執行一次）"""
+    if not SQLITE_WAL:
+        return None
+    return conn.execute('PRAGMA journal_mode = WAL').fetchone()[0]
+
+
+class GroupCommitWriter:
+    """
+    單一 writer thread：把排隊中的寫入放進同一個交易，一次 commit
+    每個寫入各自包在 SAVEPOINT 內，單筆失敗只回滾該筆，不影響同批其他寫入
+    """
+
+    def __init__(self, open_db, max_batch=SQLITE_GROUP_COMMIT_MAX, wait_ms=SQLITE_GROUP_COMMIT_WAIT_MS):
+        self.open_db = open_db
+        self.max_batch = max_batch
+        self.wait = wait_ms / 1000
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        self.stats = {'batches': 0, 'writes': 0, 'failed': 0}
+
+    def _ensure_thread(self):
+        # gunicorn --preload 會在 fork 後沿用物件，thread 需在各 worker 內重新啟動
+        if self._thread and self._thread.is_alive() and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread and self._thread.is_alive() and self._pid == os.getpid():
+                return
+            self._queue = queue.Queue()
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._loop, name='sqlite-writer', daemon=True)
+            self._thread.start()
+
+    def submit(self, fn, *args):
+        """排入寫入 fn(conn, *args)，回傳 Future"""
+        self._ensure_thread()
+        future = Future()
+        self._queue.put((fn, args, future))
+        return future
+
+    def run(self, fn, *args):
+        """排入寫入並等待 commit 完成，回傳 fn 的結果"""
+        start = time.perf_counter()
+        try:
+            return self.submit(fn, *args).result(timeout=WRITE_RESULT_TIMEOUT)
+        finally:
+            record('sql', time.perf_counter() - start)
+
+    def _next_batch(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.wait
+        while len(batch) < self.max_batch:
+            try:
+                remaining = deadline - time.monotonic()
+                if remaining > 0:
+                    batch.append(self._queue.get(timeout=remaining))
+                else:
+                    batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _loop(self):
+        while True:
+            batch = self._next_batch()
+            try:
+                self._commit_batch(batch)
+            except Exception as e:
+                print(f"❌ 批次寫入失敗: {e}")
+                for _, _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+
+    def _commit_batch(self, batch):
+        outcomes = []
+        with self.open_db() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            for fn, args, future in batch:
+                conn.execute('SAVEPOINT write_job')
+                try:
+                    outcomes.append((future, fn(conn, *args), None))
+                    conn.execute('RELEASE write_job')
+                except Exception as e:
+                    conn.execute('ROLLBACK TO write_job')
+                    conn.execute('RELEASE write_job')
+                    outcomes.append((future, None, e))
+            conn.commit()
+
+        self.stats['batches'] += 1
+        self.stats['writes'] += len(batch)
+        # commit 成功後才通知呼叫端
+        for future, value, error in outcomes:
+            if error is not None:
+                self.stats['failed'] += 1
+                future.set_exception(error)
+            else:
+                future.set_result(value)
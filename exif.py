@@ -0,0 +1,166 @@
+"""
+JPEG EXIF 讀取（拍攝時間與 GPS）
+- 只讀檔案開頭 EXIF_READ_LIMIT bytes（APP1 區段最大 64KB），不載入整張照片
+- 不依賴 Pillow；只解析需要的 tag：DateTimeOriginal / DateTime 與 GPS 經緯度
+- 匯入工作在行程池內呼叫 read_exif(path)，本模組不 import app，子行程啟動成本低
+"""
+
+import struct
+
+EXIF_READ_LIMIT = 256 * 1024
+
+# TIFF 欄位型別 → 每個值的 bytes
+TYPE_SIZES = {1: 1, 2: 1, 3: 2, 4: 4, 5: 8, 7: 1, 9: 4, 10: 8}
+
+TAG_DATETIME = 0x0132
+TAG_EXIF_IFD = 0x8769
+TAG_GPS_IFD = 0x8825
+TAG_DATETIME_ORIGINAL = 0x9003
+TAG_DATETIME_DIGITIZED = 0x9004
+GPS_LATITUDE_REF = 1
+GPS_LATITUDE = 2
+GPS_LONGITUDE_REF = 3
+GPS_LONGITUDE = 4
+
+
+class ExifError(ValueError):
+    """不是 JPEG 或 EXIF 格式錯誤"""
+
+
+def _find_app1(data):
+    """回傳 JPEG 內 Exif APP1 的 TIFF 內容，沒有 EXIF 時回傳 None"""
+    if data[:2] != b'\xff\xd8':
+        raise ExifError('不是 JPEG 檔案')
+    i = 2
+    while i + 4 <= len(data):
+        if data[i] != 0xFF:
+            raise ExifError('JPEG 區段格式錯誤')
+        marker = data[i + 1]
+        if marker == 0xFF:
+            i += 1
+            continue
+        # SOS 之後是影像資料，EXIF 一定在前面
+        if marker in (0xDA, 0xD9):
+            return None
+        length = struct.unpack('>H', data[i + 2:i + 4])[0]
+        if marker == 0xE1 and data[i + 4:i + 10] == b'Exif\x00\x00':
+            return data[i + 10:i + 2 + length]
+        i += 2 + length
+    return None
+
+
+class _Tiff:
+    def __init__(self, data):
+        if data[:2] == b'II':
+            self.endian = '<'
+        elif data[:2] == b'MM':
+            self.endian = '>'
+        else:
+            raise ExifError('TIFF byte order 錯誤')
+        self.data = data
+        if self.unpack('H', 2) != 42:
+            raise ExifError('TIFF 標頭錯誤')
+
+    def unpack(self, fmt, offset):
+        size = struct.calcsize(self.endian + fmt)
+        if offset < 0 or offset + size > len(self.data):
+            raise ExifError('EXIF 位移超出範圍')
+        return struct.unpack(self.endian + fmt, self.data[offset:offset + size])[0]
+
+    def ifd(self, offset):
+        """讀取一個 IFD：{tag: (type, count, 值的位移)}"""
+        entries = {}
+        count = self.unpack('H', offset)
+        for n in range(count):
+            base = offset + 2 + n * 12
+            tag = self.unpack('H', base)
+            type_ = self.unpack('H', base + 2)
+            values = self.unpack('I', base + 4)
+            size = TYPE_SIZES.get(type_)
+            if size is None:
+                continue
+            value_offset = base + 8 if size * values <= 4 else self.unpack('I', base + 8)
+            entries[tag] = (type_, values, value_offset)
+        return entries
+
+    def ascii(self, entry):
+        _, count, offset = entry
+        return self.data[offset:offset + count].split(b'\x00', 1)[0].decode('ascii', 'replace').strip()
+
+    def long(self, entry):
+        type_, _, offset = entry
+        return self.unpack('H' if type_ == 3 else 'I', offset)
+
+    def rationals(self, entry):
+        _, count, offset = entry
+        values = []
+        for n in range(count):
+            num = self.unpack('I', offset + n * 8)
+            den = self.unpack('I', offset + n * 8 + 4)
+            values.append(num / den if den else 0.0)
+        return values
+
+
+def _to_degrees(values, ref, negative_ref):
+    if len(values) < 3:
+        raise ExifError('GPS 座標格式錯誤')
+    degrees = values[0] + values[1] / 60 + values[2] / 3600
+    return -degrees if ref.upper() == negative_ref else degrees
+
+
+def _format_datetime(text):
+    """'YYYY:MM:DD HH:MM:SS' → 'YYYY-MM-DD HH:MM:SS'（格式不符回傳 None）"""
+    if len(text) < 19 or text[4] != ':' or text[7] != ':':
+        return None
+    if text.startswith('0000'):
+        return None
+    return f"{text[0:4]}-{text[5:7]}-{text[8:10]} {text[11:19]}"
+
+
+def parse_exif(data):
+    """
+    解析 JPEG 開頭的 EXIF
+
+    Returns:
+        dict: {'taken_at': 'YYYY-MM-DD HH:MM:SS' 或 None, 'lat': float 或 None, 'lng': float 或 None}
+    """
+    result = {'taken_at': None, 'lat': None, 'lng': None}
+    tiff_data = _find_app1(data)
+    if not tiff_data:
+        return result
+
+    tiff = _Tiff(tiff_data)
+    ifd0 = tiff.ifd(tiff.unpack('I', 4))
+
+    taken_at = None
+    if TAG_EXIF_IFD in ifd0:
+        exif_ifd = tiff.ifd(tiff.long(ifd0[TAG_EXIF_IFD]))
+        for tag in (TAG_DATETIME_ORIGINAL, TAG_DATETIME_DIGITIZED):
+            if tag in exif_ifd:
+                taken_at = _format_datetime(tiff.ascii(exif_ifd[tag]))
+                if taken_at:
+                    break
+    if not taken_at and TAG_DATETIME in ifd0:
+        taken_at = _format_datetime(tiff.ascii(ifd0[TAG_DATETIME]))
+    result['taken_at'] = taken_at
+
+    if TAG_GPS_IFD in ifd0:
+        gps = tiff.ifd(tiff.long(ifd0[TAG_GPS_IFD]))
+        if GPS_LATITUDE in gps and GPS_LONGITUDE in gps:
+            lat_ref = tiff.ascii(gps[GPS_LATITUDE_REF]) if GPS_LATITUDE_REF in gps else 'N'
+            lng_ref = tiff.ascii(gps[GPS_LONGITUDE_REF]) if GPS_LONGITUDE_REF in gps else 'E'
+            lat = _to_degrees(tiff.rationals(gps[GPS_LATITUDE]), lat_ref, 'S')
+            lng = _to_degrees(tiff.rationals(gps[GPS_LONGITUDE]), lng_ref, 'W')
+            # 0,0 通常是相機沒有定位時寫入的預設值
+            if -90 <= lat <= 90 and -180 <= lng <= 180 and (lat, lng) != (0.0, 0.0):
+                result['lat'], result['lng'] = lat, lng
+    return result
+
+
+def read_exif(path):
+    """讀取檔案的 EXIF（行程池內執行），失敗時回傳 {'error': 訊息}"""
+    try:
+        with open(path, 'rb') as f:
+            return parse_exif(f.read(EXIF_READ_LIMIT))
+    except (OSError, ExifError, struct.error) as e:
+        return {'taken_at': None, 'lat': None, 'lng': None, 'error': str(e)}
@@ -0,0 +1,590 @@
+"""
+退休走讀 - 本機 Google 相簿 / 文件 / Drive / ImgBB 模擬伺服器
+讓同步流程（save_checkin_with_photo）可以離線量測與回歸測試
+
+實作 google_integration.py 用到的端點：
+- OAuth：/token（授權碼交換、refresh）、/oauth2/v2/userinfo
+- 相簿：/v1/albums（列表含 pageToken 分頁、建立）、/v1/uploads、/v1/mediaItems:batchCreate、/v1/mediaItems:search
+- 文件：/v1/documents（建立）、/v1/documents/<id>（讀取）、/v1/documents/<id>:batchUpdate
+- Drive：/drive/v3/files（依 name 搜尋文件）
+- ImgBB：/1/upload
+
+每類端點可設定延遲與失敗率（5xx / 429），/__stats 回傳各端點次數與延遲，/__reset 清空資料與統計
+
+用法：
+    python fake_google_api.py serve --port 9100 --latency-ms 80 --latency uploads=400,imgbb=600 --failure-rate 0.02
+    GOOGLE_OAUTH_BASE=http://127.0.0.1:9100 GOOGLE_APIS_BASE=http://127.0.0.1:9100 \\
+    PHOTOS_API_BASE=http://127.0.0.1:9100 DOCS_API_BASE=http://127.0.0.1:9100 \\
+    IMGBB_API_BASE=http://127.0.0.1:9100 IMGBB_API_KEY=fake python app.py
+
+    # 直接量測整條同步流程（伺服器在同一行程內啟動）
+    python fake_google_api.py bench --iterations 30 --concurrency 4 --latency-ms 80
+"""
+
+import re
+import sys
+import json
+import time
+import logging
+import uuid
+import random
+import argparse
+import threading
+import statistics
+from concurrent.futures import ThreadPoolExecutor
+from flask import Flask, request, jsonify
+from werkzeug.serving import make_server
+
+# 端點分類（延遲與失敗率以分類設定）
+ENDPOINT_KINDS = ('oauth', 'albums', 'uploads', 'media', 'docs', 'drive', 'imgbb')
+
+# 模擬 token 的有效秒數
+DEFAULT_TOKEN_TTL = 3600
+
+# 文件初始的結尾 index（Google 文件空白文件的 body 結尾為 2）
+EMPTY_DOC_END_INDEX = 2
+
+
+def parse_kind_values(text):
+    """解析 "uploads=400,imgbb=600" 形式的分類設定"""
+    values = {}
+    for part in (text or '').split(','):
+        if not part.strip():
+            continue
+        kind, _, value = part.partition('=')
+        kind = kind.strip()
+        if kind not in ENDPOINT_KINDS:
+            raise ValueError(f'未知的端點分類: {kind}（可用：{", ".join(ENDPOINT_KINDS)}）')
+        values[kind] = float(value)
+    return values
+
+
+def percentile(sorted_values, p):
+    """已排序數列的百分位數（最近秩）"""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(p / 100 * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+class FakeGoogleState:
+    """相簿、媒體、文件的記憶體內資料，以及延遲 / 失敗注入與統計"""
+
+    def __init__(self, latency_ms=0.0, jitter_ms=0.0, failure_rate=0.0, latency=None, failures=None,
+                 throttle_share=0.5, token_ttl=DEFAULT_TOKEN_TTL, seed=None):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.failure_rate = failure_rate
+        self.kind_latency = latency or {}
+        self.kind_failures = failures or {}
+        self.throttle_share = throttle_share
+        self.token_ttl = token_ttl
+        self.rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.albums = {}
+            self.media_items = {}
+            self.uploads = {}
+            self.documents = {}
+            self.tokens = {}
+            self.stats = {}
+
+    def reset_stats(self):
+        with self._lock:
+            self.stats = {}
+
+    # ---------- 注入 ----------
+
+    def delay_for(self, kind):
+        base = self.kind_latency.get(kind, self.latency_ms)
+        with self._lock:
+            jitter = self.rng.uniform(-self.jitter_ms, self.jitter_ms) if self.jitter_ms else 0.0
+        return max(0.0, base + jitter) / 1000
+
+    def injected_failure(self, kind):
+        """依失敗率回傳 (狀態碼, 訊息) 或 None"""
+        rate = self.kind_failures.get(kind, self.failure_rate)
+        with self._lock:
+            if not rate or self.rng.random() >= rate:
+                return None
+            if self.rng.random() < self.throttle_share:
+                return 429, 'RESOURCE_EXHAUSTED'
+            return 503, 'UNAVAILABLE'
+
+    def observe(self, kind, endpoint, status, elapsed):
+        with self._lock:
+            entry = self.stats.setdefault(endpoint, {'kind': kind, 'count': 0, 'errors': 0, 'latencies': []})
+            entry['count'] += 1
+            entry['errors'] += 1 if status >= 400 else 0
+            entry['latencies'].append(elapsed * 1000)
+
+    def snapshot(self):
+        with self._lock:
+            stats = {k: {**v, 'latencies': sorted(v['latencies'])} for k, v in self.stats.items()}
+            resources = {'albums': len(self.albums), 'media_items': len(self.media_items),
+                         'documents': len(self.documents)}
+        endpoints = {}
+        for endpoint, entry in sorted(stats.items()):
+            values = entry['latencies']
+            endpoints[endpoint] = {
+                'kind': entry['kind'],
+                'count': entry['count'],
+                'errors': entry['errors'],
+                'p50_ms': round(percentile(values, 50), 2),
+                'p95_ms': round(percentile(values, 95), 2),
+            }
+        return {'endpoints': endpoints, 'resources': resources}
+
+    # ---------- OAuth ----------
+
+    def issue_token(self, refresh_token=None):
+        access_token = f"fake-{uuid.uuid4().hex}"
+        with self._lock:
+            self.tokens[access_token] = time.time() + self.token_ttl
+        return {
+            'access_token': access_token,
+            'expires_in': int(self.token_ttl),
+            'refresh_token': refresh_token or f"fake-refresh-{uuid.uuid4().hex}",
+            'scope': 'photoslibrary documents drive.file',
+            'token_type': 'Bearer',
+        }
+
+    def token_valid(self, access_token):
+        """本伺服器簽發的 token 檢查到期；其他字串一律接受（方便直接帶假 token 測試）"""
+        with self._lock:
+            expires_at = self.tokens.get(access_token)
+        return expires_at is None or expires_at > time.time()
+
+    # ---------- 相簿 ----------
+
+    def create_album(self, title):
+        album_id = f"album-{uuid.uuid4().hex[:16]}"
+        album = {
+            'id': album_id,
+            'title': title,
+            'productUrl': f'https://photos.google.com/lr/album/{album_id}',
+            'isWriteable': True,
+            'mediaItemsCount': '0',
+        }
+        with self._lock:
+            self.albums[album_id] = album
+        return album
+
+    def get_album(self, album_id):
+        with self._lock:
+            album = self.albums.get(album_id)
+            return dict(album) if album else None
+
+    def list_albums(self, page_size, page_token):
+        with self._lock:
+            albums = list(self.albums.values())
+        return paginate(albums, page_size, page_token, 'albums')
+
+    def store_upload(self, data):
+        token = f"upload-{uuid.uuid4().hex}"
+        with self._lock:
+            self.uploads[token] = len(data)
+        return token
+
+    def batch_create(self, album_id, new_items):
+        results = []
+        with self._lock:
+            album = self.albums.get(album_id)
+            for item in new_items:
+                simple = item.get('simpleMediaItem', {})
+                upload_token = simple.get('uploadToken')
+                if upload_token not in self.uploads:
+                    results.append({'uploadToken': upload_token,
+                                    'status': {'code': 3, 'message': 'Invalid upload token'}})
+                    continue
+                media_id = f"media-{uuid.uuid4().hex[:16]}"
+                media = {
+                    'id': media_id,
+                    'description': item.get('description', ''),
+                    'productUrl': f'https://photos.google.com/lr/photo/{media_id}',
+                    'baseUrl': f'https://lh3.googleusercontent.com/fake/{media_id}',
+                    'mimeType': 'image/jpeg',
+                    'filename': simple.get('fileName'),
+                    'albumId': album_id,
+                    'mediaMetadata': {'creationTime': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime())},
+                }
+                self.media_items[media_id] = media
+                if album:
+                    album['mediaItemsCount'] = str(int(album['mediaItemsCount']) + 1)
+                results.append({'uploadToken': upload_token, 'status': {'message': 'Success'},
+                                'mediaItem': media})
+        return {'newMediaItemResults': results}
+
+    def search_media(self, album_id, page_size, page_token):
+        with self._lock:
+            items = [m for m in self.media_items.values() if m['albumId'] == album_id]
+        return paginate(items, page_size, page_token, 'mediaItems')
+
+    # ---------- 文件 ----------
+
+    def create_document(self, title):
+        doc_id = f"doc-{uuid.uuid4().hex[:20]}"
+        with self._lock:
+            self.documents[doc_id] = {'documentId': doc_id, 'title': title, 'end_index': EMPTY_DOC_END_INDEX,
+                                      'images': 0}
+        return {'documentId': doc_id, 'title': title}
+
+    def find_documents(self, name):
+        with self._lock:
+            return [{'id': d['documentId'], 'name': d['title']}
+                    for d in self.documents.values() if d['title'] == name]
+
+    def get_document(self, doc_id):
+        with self._lock:
+            doc = self.documents.get(doc_id)
+            if not doc:
+                return None
+            end_index = doc['end_index']
+            title = doc['title']
+        # 只回傳同步流程會讀的欄位（body 最後一段的 endIndex）
+        return {
+            'documentId': doc_id,
+            'title': title,
+            'body': {'content': [
+                {'endIndex': 1, 'sectionBreak': {}},
+                {'startIndex': 1, 'endIndex': end_index, 'paragraph': {}},
+            ]},
+        }
+
+    def batch_update(self, doc_id, operations):
+        """套用 insertText / insertInlineImage，其他樣式請求只驗證 index 範圍"""
+        with self._lock:
+            doc = self.documents.get(doc_id)
+            if not doc:
+                return None, 'Requested entity was not found.'
+            replies = []
+            for op in operations:
+                if 'insertText' in op:
+                    index = op['insertText']['location']['index']
+                    if index >= doc['end_index']:
+                        return None, f'Invalid requests[{len(replies)}].insertText: index {index} out of range'
+                    # Google 文件以 UTF-16 code unit 計算 index
+                    doc['end_index'] += len(op['insertText']['text'].encode('utf-16-le')) // 2
+                    replies.append({})
+                elif 'insertInlineImage' in op:
+                    doc['end_index'] += 1
+                    doc['images'] += 1
+                    replies.append({'insertInlineImage': {'objectId': f"kix.{uuid.uuid4().hex[:12]}"}})
+                else:
+                    replies.append({})
+        return {'documentId': doc_id, 'replies': replies, 'writeControl': {}}, None
+
+
+def paginate(items, page_size, page_token, key):
+    """以 offset 作為 pageToken 的分頁"""
+    try:
+        offset = int(page_token or 0)
+    except ValueError:
+        offset = 0
+    page = items[offset:offset + page_size]
+    body = {key: page} if page else {}
+    if offset + page_size < len(items):
+        body['nextPageToken'] = str(offset + page_size)
+    return body
+
+
+# ==================== Flask 伺服器 ====================
+
+def create_app(state):
+    fake = Flask(__name__)
+
+    def google_error(status, message, code_name='INVALID_ARGUMENT'):
+        response = jsonify({'error': {'code': status, 'message': message, 'status': code_name}})
+        response.status_code = status
+        return response
+
+    def endpoint(kind, name, auth=True):
+        """共用的延遲、失敗注入、驗證與統計"""
+        def decorator(fn):
+            def wrapper(*args, **kwargs):
+                start = time.perf_counter()
+                time.sleep(state.delay_for(kind))
+                failure = state.injected_failure(kind)
+                if failure:
+                    response = google_error(failure[0], 'Injected failure', failure[1])
+                elif auth and not state.token_valid(request.headers.get('Authorization', '')[7:]):
+                    response = google_error(401, 'Request had invalid authentication credentials.',
+                                            'UNAUTHENTICATED')
+                else:
+                    response = fn(*args, **kwargs)
+                    if isinstance(response, dict):
+                        response = jsonify(response)
+                state.observe(kind, name, response.status_code, time.perf_counter() - start)
+                return response
+            wrapper.__name__ = fn.__name__
+            return wrapper
+        return decorator
+
+    @fake.route('/token', methods=['POST'])
+    @endpoint('oauth', 'oauth.token', auth=False)
+    def oauth_token():
+        grant_type = request.form.get('grant_type')
+        if grant_type == 'refresh_token':
+            body = state.issue_token(request.form.get('refresh_token'))
+            body.pop('refresh_token')
+            return body
+        if grant_type == 'authorization_code' and request.form.get('code'):
+            return state.issue_token()
+        response = jsonify({'error': 'invalid_grant'})
+        response.status_code = 400
+        return response
+
+    @fake.route('/oauth2/v2/userinfo')
+    @endpoint('oauth', 'oauth.userinfo')
+    def userinfo():
+        return {'id': '1000', 'email': 'fake@example.com', 'name': '模擬用戶', 'picture': ''}
+
+    @fake.route('/v1/albums', methods=['GET'])
+    @endpoint('albums', 'albums.list')
+    def albums_list():
+        page_size = min(request.args.get('pageSize', 20, type=int), 50)
+        return state.list_albums(page_size, request.args.get('pageToken'))
+
+    @fake.route('/v1/albums/<album_id>', methods=['GET'])
+    @endpoint('albums', 'albums.get')
+    def albums_get(album_id):
+        album = state.get_album(album_id)
+        if not album:
+            return google_error(404, 'Requested entity was not found.', 'NOT_FOUND')
+        return album
+
+    @fake.route('/v1/albums', methods=['POST'])
+    @endpoint('albums', 'albums.create')
+    def albums_create():
+        title = (request.get_json(silent=True) or {}).get('album', {}).get('title')
+        if not title:
+            return google_error(400, 'Album title is required')
+        return state.create_album(title)
+
+    @fake.route('/v1/uploads', methods=['POST'])
+    @endpoint('uploads', 'uploads')
+    def uploads():
+        data = request.get_data()
+        if not data:
+            return google_error(400, 'Empty upload')
+        return fake.response_class(state.store_upload(data), mimetype='text/plain')
+
+    @fake.route('/v1/mediaItems:batchCreate', methods=['POST'])
+    @endpoint('media', 'mediaItems.batchCreate')
+    def media_batch_create():
+        body = request.get_json(silent=True) or {}
+        return state.batch_create(body.get('albumId'), body.get('newMediaItems') or [])
+
+    @fake.route('/v1/mediaItems:search', methods=['POST'])
+    @endpoint('media', 'mediaItems.search')
+    def media_search():
+        body = request.get_json(silent=True) or {}
+        page_size = min(int(body.get('pageSize') or 25), 100)
+        return state.search_media(body.get('albumId'), page_size, body.get('pageToken'))
+
+    @fake.route('/v1/documents', methods=['POST'])
+    @endpoint('docs', 'documents.create')
+    def documents_create():
+        title = (request.get_json(silent=True) or {}).get('title') or 'Untitled document'
+        return state.create_document(title)
+
+    @fake.route('/v1/documents/<doc_id>', methods=['GET'])
+    @endpoint('docs', 'documents.get')
+    def documents_get(doc_id):
+        doc = state.get_document(doc_id)
+        return doc if doc else google_error(404, 'Requested entity was not found.', 'NOT_FOUND')
+
+    @fake.route('/v1/documents/<doc_id>:batchUpdate', methods=['POST'])
+    @endpoint('docs', 'documents.batchUpdate')
+    def documents_batch_update(doc_id):
+        body = request.get_json(silent=True) or {}
+        result, error = state.batch_update(doc_id, body.get('requests') or [])
+        if error:
+            return google_error(404 if 'not found' in error else 400, error)
+        return result
+
+    @fake.route('/drive/v3/files')
+    @endpoint('drive', 'drive.files.list')
+    def drive_files():
+        match = re.search(r"name='((?:[^'\\]|\\.)*)'", request.args.get('q', ''))
+        return {'files': state.find_documents(match.group(1)) if match else []}
+
+    @fake.route('/1/upload', methods=['POST'])
+    @endpoint('imgbb', 'imgbb.upload', auth=False)
+    def imgbb_upload():
+        if not request.form.get('key'):
+            response = jsonify({'success': False, 'status': 400,
+                                'error': {'message': 'Missing API key', 'code': 100}})
+            response.status_code = 400
+            return response
+        image_id = uuid.uuid4().hex[:8]
+        name = request.form.get('name', 'image')
+        url = f'https://i.ibb.co/{image_id}/{name}'
+        return {'success': True, 'status': 200, 'data': {
+            'id': image_id,
+            'url': url,
+            'display_url': url,
+            'thumb': {'url': f'https://i.ibb.co/{image_id}/thumb.jpg'},
+            'delete_url': f'https://ibb.co/{image_id}/delete',
+        }}
+
+    @fake.route('/__stats')
+    def fake_stats():
+        return jsonify(state.snapshot())
+
+    @fake.route('/__reset', methods=['POST'])
+    def fake_reset():
+        state.reset()
+        return jsonify({'success': True})
+
+    return fake
+
+
+# ==================== 同步流程量測 ====================
+
+def point_integration_at(base_url):
+    """把 google_integration 的所有 API 位址改指向模擬伺服器"""
+    import os
+    import google_integration
+
+    for name in ('GOOGLE_OAUTH_BASE', 'GOOGLE_APIS_BASE', 'PHOTOS_API_BASE', 'DOCS_API_BASE', 'IMGBB_API_BASE'):
+        setattr(google_integration, name, base_url)
+    os.environ.setdefault('IMGBB_API_KEY', 'fake-imgbb-key')
+    return google_integration
+
+
+def run_bench(args, state):
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+    server = make_server('127.0.0.1', 0, create_app(state), threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f'http://127.0.0.1:{server.server_port}'
+    google_integration = point_integration_at(base_url)
+    if args.sequential:
+        # 對照組：不使用執行緒池，所有步驟依序執行
+        google_integration.sync_executor = None
+
+    # 先建好相簿與文件，量到的是穩定狀態（不含第一次建立）
+    access_token = 'fake-bench-token'
+    google_integration.get_or_create_album(access_token)
+    google_integration.get_or_create_travel_doc(access_token)
+    state.reset_stats()
+
+    image_data = b'\xff\xd8\xff\xe0' + bytes(args.photo_kb * 1024)
+
+    def one_checkin(i):
+        start = time.perf_counter()
+        result = google_integration.save_checkin_with_photo(
+            access_token, f'基準景點 {i}', '台北', '模擬同步',
+            image_data=image_data if args.photo_kb else None,
+            filename=f'bench_{i}.jpg' if args.photo_kb else None,
+        )
+        ok = result.get('success') and 'error' not in (result.get('entry') or {})
+        return (time.perf_counter() - start) * 1000, ok, result.get('timings', {})
+
+    print(f"⏱️ save_checkin_with_photo × {args.iterations}（並行 {args.concurrency}，"
+          f"照片 {args.photo_kb} KB，{'依序' if args.sequential else '相依圖'}）→ {base_url}")
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        outcomes = list(executor.map(one_checkin, range(args.iterations)))
+    wall = time.perf_counter() - started
+    server.shutdown()
+
+    durations = sorted(d for d, _, _ in outcomes)
+    failed = sum(1 for _, ok, _ in outcomes if not ok)
+    steps = {}
+    for _, _, timings in outcomes:
+        for name, t in timings.items():
+            entry = steps.setdefault(name, {'run': [], 'wait': [], 'not_done': 0})
+            entry['run'].append(t['run_ms'])
+            entry['wait'].append(t['wait_ms'])
+            entry['not_done'] += t['status'] != 'done'
+    summary = {
+        'iterations': args.iterations,
+        'concurrency': args.concurrency,
+        'failed': failed,
+        'throughput_per_s': round(args.iterations / wall, 2),
+        'sync_ms': {
+            'p50': round(percentile(durations, 50), 2),
+            'p95': round(percentile(durations, 95), 2),
+            'mean': round(statistics.fmean(durations), 2),
+        },
+        'steps': {
+            name: {
+                'run_p50': round(percentile(sorted(entry['run']), 50), 2),
+                'wait_p50': round(percentile(sorted(entry['wait']), 50), 2),
+                'not_done': entry['not_done'],
+            }
+            for name, entry in steps.items()
+        },
+        'api': state.snapshot()['endpoints'],
+    }
+
+    print(f"\n📊 每次同步 p50 {summary['sync_ms']['p50']} ms / p95 {summary['sync_ms']['p95']} ms，"
+          f"{summary['throughput_per_s']} 次/秒，失敗 {failed}")
+    print(f"   {'步驟':<26}{'執行 p50':>10}{'排隊 p50':>10}{'未完成':>6}")
+    for name, entry in summary['steps'].items():
+        print(f"   {name:<26}{entry['run_p50']:>10.1f}{entry['wait_p50']:>10.1f}{entry['not_done']:>6}")
+    print(f"   {'端點':<26}{'次數':>6}{'錯誤':>6}{'p50':>10}{'p95':>10}")
+    for name, entry in summary['api'].items():
+        print(f"   {name:<26}{entry['count']:>6}{entry['errors']:>6}{entry['p50_ms']:>10.1f}{entry['p95_ms']:>10.1f}")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(summary, f, ensure_ascii=False, indent=2)
+    return summary
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Google 相簿 / 文件 / Drive / ImgBB 模擬伺服器')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument('--latency-ms', type=float, default=0.0, help='所有端點的預設延遲')
+    common.add_argument('--jitter-ms', type=float, default=0.0, help='延遲的隨機浮動範圍')
+    common.add_argument('--latency', default='', help='依分類覆寫延遲，例如 uploads=400,imgbb=600')
+    common.add_argument('--failure-rate', type=float, default=0.0, help='所有端點的預設失敗率')
+    common.add_argument('--failures', default='', help='依分類覆寫失敗率，例如 docs=0.05')
+    common.add_argument('--throttle-share', type=float, default=0.5, help='失敗中回 429（其餘 503）的比例')
+    common.add_argument('--token-ttl', type=float, default=DEFAULT_TOKEN_TTL, help='簽發 token 的有效秒數')
+    common.add_argument('--seed', type=int)
+
+    serve = subparsers.add_parser('serve', parents=[common], help='啟動模擬伺服器')
+    serve.add_argument('--host', default='127.0.0.1')
+    serve.add_argument('--port', type=int, default=9100)
+
+    bench = subparsers.add_parser('bench', parents=[common], help='量測 save_checkin_with_photo')
+    bench.add_argument('--iterations', type=int, default=20)
+    bench.add_argument('--concurrency', type=int, default=1)
+    bench.add_argument('--photo-kb', type=int, default=200, help='模擬照片大小，0 表示不附照片')
+    bench.add_argument('--sequential', action='store_true', help='步驟依序執行（對照組）')
+    bench.add_argument('--json', help='將結果寫入 JSON 檔')
+
+    # 沒有指定子命令時視為 serve
+    argv = list(sys.argv[1:] if argv is None else argv)
+    if not argv or argv[0].startswith('-') and argv[0] not in ('-h', '--help'):
+        argv.insert(0, 'serve')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    state = FakeGoogleState(
+        latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, failure_rate=args.failure_rate,
+        latency=parse_kind_values(args.latency), failures=parse_kind_values(args.failures),
+        throttle_share=args.throttle_share, token_ttl=args.token_ttl, seed=args.seed,
+    )
+    if args.command == 'bench':
+        return run_bench(args, state)
+
+    base_url = f'http://{args.host}:{args.port}'
+    print(f"☁️ Google API 模擬伺服器 {base_url}")
+    print(f"   GOOGLE_OAUTH_BASE={base_url} GOOGLE_APIS_BASE={base_url} PHOTOS_API_BASE={base_url} "
+          f"DOCS_API_BASE={base_url} IMGBB_API_BASE={base_url}")
+    create_app(state).run(host=args.host, port=args.port, threaded=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,245 @@
+"""
+退休走讀 - 本機 LINE Messaging API 模擬伺服器
+用於壓力測試 LINE Bot，不需連到真正的 LINE 平台
+
+- 實作 reply / push 兩個 API（/v2/bot/message/reply、/v2/bot/message/push）
+- Reply token 由壓測工具產生，內含簽發時間：超過有效期或重複使用 → 400 Invalid reply token
+- 可設定延遲、429 機率與每秒請求上限（超過也回 429）
+- /__stats 回傳各 API 的次數與延遲，/__reset 清除統計
+
+用法：
+    python fake_line_api.py --port 9000 --token-ttl 30 --latency-ms 40 --rate-limit 200
+    LINE_API_HOST=http://127.0.0.1:9000 gunicorn app:app
+"""
+
+import hmac
+import json
+import time
+import uuid
+import base64
+import random
+import hashlib
+import argparse
+import threading
+from flask import Flask, request, jsonify
+
+# 預設 reply token 有效期（秒）
+DEFAULT_TOKEN_TTL = 30
+
+
+# ==================== Webhook 工具（壓測 / 基準測試共用） ====================
+
+def sign_body(channel_secret, body):
+    """計算 X-Line-Signature"""
+    digest = hmac.new(channel_secret.encode('utf-8'), body.encode('utf-8'), hashlib.sha256).digest()
+    return base64.b64encode(digest).decode('ascii')
+
+
+def make_reply_token(issued_at=None):
+    """產生內含簽發時間（毫秒）的 reply token"""
+    issued_ms = int((issued_at if issued_at is not None else time.time()) * 1000)
+    return f"{issued_ms}.{uuid.uuid4().hex}"
+
+
+def reply_token_issued_at(reply_token):
+    """解析 reply token 的簽發時間（秒），格式不符時回傳 None"""
+    try:
+        return int(reply_token.split('.', 1)[0]) / 1000
+    except (ValueError, AttributeError):
+        return None
+
+
+def build_text_webhook(user_id, text, reply_token=None):
+    """組出單一文字訊息事件的 webhook body"""
+    now_ms = int(time.time() * 1000)
+    return json.dumps({
+        'destination': 'Ufakebot',
+        'events': [{
+            'type': 'message',
+            'mode': 'active',
+            'timestamp': now_ms,
+            'webhookEventId': uuid.uuid4().hex,
+            'deliveryContext': {'isRedelivery': False},
+            'source': {'type': 'user', 'userId': user_id},
+            'replyToken': reply_token or make_reply_token(),
+            'message': {'type': 'text', 'id': str(now_ms), 'text': text, 'quoteToken': 'fake'},
+        }]
+    }, ensure_ascii=False)
+
+
+# ==================== 模擬狀態 ====================
+
+def percentile(sorted_values, p):
+    """已排序數列的百分位數（最近秩）"""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(p / 100 * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+class FakeLinePlatform:
+    """reply token 狀態、速率限制與統計"""
+
+    def __init__(self, token_ttl=DEFAULT_TOKEN_TTL, latency_ms=0.0, jitter_ms=0.0,
+                 error_rate=0.0, rate_limit=0, seed=None):
+        self.token_ttl = token_ttl
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.rate_limit = rate_limit
+        self.rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.used_tokens = {}
+            self.window_start = time.monotonic()
+            self.window_count = 0
+            self.counts = {
+                'reply_ok': 0, 'reply_expired': 0, 'reply_reused': 0, 'reply_invalid': 0,
+                'push_ok': 0, 'throttled': 0, 'messages': 0,
+            }
+            self.latencies = {'reply': [], 'push': []}
+
+    def _throttled(self):
+        """隨機 429，或超過每秒請求上限"""
+        if self.error_rate and self.rng.random() < self.error_rate:
+            return True
+        if not self.rate_limit:
+            return False
+        now = time.monotonic()
+        if now - self.window_start >= 1.0:
+            self.window_start = now
+            self.window_count = 0
+        self.window_count += 1
+        return self.window_count > self.rate_limit
+
+    def _prune_tokens(self, now):
+        """清掉已過期的 token（過期後本來就會被拒絕）"""
+        if len(self.used_tokens) > 10000:
+            cutoff = now - self.token_ttl
+            self.used_tokens = {t: ts for t, ts in self.used_tokens.items() if ts >= cutoff}
+
+    def simulate_latency(self):
+        delay = self.latency_ms + (self.rng.uniform(-self.jitter_ms, self.jitter_ms) if self.jitter_ms else 0)
+        if delay > 0:
+            time.sleep(delay / 1000)
+
+    def reply(self, payload):
+        """回傳 (HTTP 狀態碼, 回應內容)"""
+        token = payload.get('replyToken')
+        now = time.time()
+        with self._lock:
+            if self._throttled():
+                self.counts['throttled'] += 1
+                return 429, {'message': 'The API rate limit has been exceeded. Try again later.'}
+
+            issued_at = reply_token_issued_at(token)
+            if issued_at is None:
+                self.counts['reply_invalid'] += 1
+                return 400, {'message': 'Invalid reply token'}
+            if now - issued_at > self.token_ttl:
+                self.counts['reply_expired'] += 1
+                return 400, {'message': 'Invalid reply token'}
+            if token in self.used_tokens:
+                self.counts['reply_reused'] += 1
+                return 400, {'message': 'Invalid reply token'}
+
+            self.used_tokens[token] = issued_at
+            self._prune_tokens(now)
+            self.counts['reply_ok'] += 1
+            self.counts['messages'] += len(payload.get('messages') or [])
+        return 200, {'sentMessages': [{'id': uuid.uuid4().hex[:18], 'quoteToken': 'fake'}]}
+
+    def push(self, payload):
+        with self._lock:
+            if self._throttled():
+                self.counts['throttled'] += 1
+                return 429, {'message': 'The API rate limit has been exceeded. Try again later.'}
+            self.counts['push_ok'] += 1
+            self.counts['messages'] += len(payload.get('messages') or [])
+        return 200, {'sentMessages': [{'id': uuid.uuid4().hex[:18], 'quoteToken': 'fake'}]}
+
+    def observe(self, kind, elapsed):
+        with self._lock:
+            self.latencies[kind].append(elapsed * 1000)
+
+    def stats(self):
+        with self._lock:
+            counts = dict(self.counts)
+            latencies = {k: sorted(v) for k, v in self.latencies.items()}
+
+        reply_attempts = (counts['reply_ok'] + counts['reply_expired'] + counts['reply_reused']
+                          + counts['reply_invalid'])
+        result = {
+            'counts': counts,
+            'reply_attempts': reply_attempts,
+            # push 次數 ÷ reply 嘗試次數 ≈ safe_reply 降級為 push 的比例
+            'push_fallback_rate': round(counts['push_ok'] / reply_attempts, 4) if reply_attempts else 0.0,
+            'latency_ms': {},
+        }
+        for kind, values in latencies.items():
+            result['latency_ms'][kind] = {
+                'count': len(values),
+                'p50': round(percentile(values, 50), 2),
+                'p95': round(percentile(values, 95), 2),
+                'p99': round(percentile(values, 99), 2),
+            }
+        return result
+
+
+# ==================== Flask 伺服器 ====================
+
+def create_app(platform):
+    fake = Flask(__name__)
+
+    def handle(kind, fn):
+        start = time.perf_counter()
+        platform.simulate_latency()
+        status, body = fn(request.get_json(silent=True) or {})
+        platform.observe(kind, time.perf_counter() - start)
+        response = jsonify(body)
+        response.status_code = status
+        response.headers['X-Line-Request-Id'] = uuid.uuid4().hex
+        return response
+
+    @fake.route('/v2/bot/message/reply', methods=['POST'])
+    def reply_message():
+        return handle('reply', platform.reply)
+
+    @fake.route('/v2/bot/message/push', methods=['POST'])
+    def push_message():
+        return handle('push', platform.push)
+
+    @fake.route('/__stats')
+    def fake_stats():
+        return jsonify(platform.stats())
+
+    @fake.route('/__reset', methods=['POST'])
+    def fake_reset():
+        platform.reset()
+        return jsonify({'success': True})
+
+    return fake
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='本機 LINE Messaging API 模擬伺服器')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=9000)
+    parser.add_argument('--token-ttl', type=float, default=DEFAULT_TOKEN_TTL, help='reply token 有效秒數')
+    parser.add_argument('--latency-ms', type=float, default=0.0, help='每次 API 呼叫的延遲')
+    parser.add_argument('--jitter-ms', type=float, default=0.0, help='延遲的隨機浮動範圍')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='隨機回 429 的機率')
+    parser.add_argument('--rate-limit', type=int, default=0, help='每秒請求上限，0 表示不限')
+    parser.add_argument('--seed', type=int)
+    return parser.parse_args(argv)
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    platform = FakeLinePlatform(args.token_ttl, args.latency_ms, args.jitter_ms,
+                                args.error_rate, args.rate_limit, args.seed)
+    print(f"🤖 LINE API 模擬伺服器 http://{args.host}:{args.port}（token 有效 {args.token_ttl:g} 秒）")
+    create_app(platform).run(host=args.host, port=args.port, threaded=True)
@@ -0,0 +1,464 @@
+const userId = document.body.dataset.userId;
+let currentSpotId = null;
+let currentSpotName = null;
+let selectedPhoto = null;
+let currentFilter = 'all';
+
+// ========== 搜尋和篩選功能 ==========
+const searchInput = document.getElementById('search-input');
+const clearBtn = document.getElementById('clear-search');
+const searchHint = document.getElementById('search-hint');
+const searchCount = document.getElementById('search-count');
+const filterBtns = document.querySelectorAll('.filter-btn');
+const allSpots = document.querySelectorAll('.spot-card');
+const allRouteGroups = document.querySelectorAll('.route-group');
+
+// 搜尋輸入
+searchInput.addEventListener('input', function() {
+    const query = this.value.trim().toLowerCase();
+    clearBtn.style.display = query ? 'flex' : 'none';
+    filterSpots();
+});
+
+// 清除搜尋
+clearBtn.addEventListener('click', clearSearch);
+
+function clearSearch() {
+    searchInput.value = '';
+    clearBtn.style.display = 'none';
+    filterSpots();
+}
+
+// 篩選按鈕
+filterBtns.forEach(btn => {
+    btn.addEventListener('click', function() {
+        filterBtns.forEach(b => b.classList.remove('active'));
+        this.classList.add('active');
+        currentFilter = this.dataset.filter;
+        filterSpots();
+    });
+});
+
+// 執行篩選
+function filterSpots() {
+    const query = searchInput.value.trim().toLowerCase();
+    let visibleCount = 0;
+
+    allSpots.forEach(spot => {
+        const name = spot.dataset.name.toLowerCase();
+        const isCollected = spot.classList.contains('collected');
+
+        // 搜尋匹配
+        const matchesSearch = !query || name.includes(query);
+
+        // 篩選匹配
+        let matchesFilter = true;
+        if (currentFilter === 'collected') {
+            matchesFilter = isCollected;
+        } else if (currentFilter === 'uncollected') {
+            matchesFilter = !isCollected;
+        }
+
+        // 顯示或隱藏
+        if (matchesSearch && matchesFilter) {
+            spot.classList.remove('hidden');
+            visibleCount++;
+        } else {
+            spot.classList.add('hidden');
+        }
+    });
+
+    // 更新路線群組顯示
+    allRouteGroups.forEach(group => {
+        const visibleSpots = group.querySelectorAll('.spot-card:not(.hidden)');
+        if (visibleSpots.length === 0) {
+            group.classList.add('hidden');
+        } else {
+            group.classList.remove('hidden');
+        }
+    });
+
+    // 顯示搜尋結果提示
+    if (query || currentFilter !== 'all') {
+        searchHint.style.display = 'flex';
+        searchCount.textContent = visibleCount;
+    } else {
+        searchHint.style.display = 'none';
+    }
+}
+
+// ========== 打卡功能 ==========
+
+// 未打卡景點 - 開啟打卡彈窗
+document.querySelectorAll('.spot-card:not(.collected)').forEach(card => {
+    card.addEventListener('click', () => {
+        currentSpotId = card.dataset.id;
+        currentSpotName = card.dataset.name;
+        document.getElementById('modal-title').textContent = currentSpotName;
+
+        // 重置到輸入視圖
+        resetCheckinModal();
+
+        document.getElementById('checkin-modal').classList.add('active');
+        // 重置表單
+        document.getElementById('checkin-note').value = '';
+        document.getElementById('photo-input').value = '';
+        document.getElementById('photo-preview').innerHTML = `
+            <div class="upload-hint">
+                <span class="camera-icon">📷</span>
+                <span>點擊拍照或上傳照片</span>
+                <span class="optional">（選填）</span>
+            </div>
+        `;
+        selectedPhoto = null;
+    });
+});
+
+// 已打卡景點 - 開啟詳情彈窗
+document.querySelectorAll('.spot-card.collected').forEach(card => {
+    card.addEventListener('click', () => {
+        currentSpotId = card.dataset.id;
+        currentSpotName = card.dataset.name;
+        const date = card.dataset.date || '';
+        const note = card.dataset.note || '（無心得）';
+        const photo = card.dataset.photo || '';
+
+        document.getElementById('detail-title').textContent = currentSpotName;
+        document.getElementById('detail-date').textContent = '📅 打卡日期：' + (date || '未知');
+        document.getElementById('detail-note').textContent = note || '（無心得）';
+
+        const photoDiv = document.getElementById('detail-photo');
+        if (photo) {
+            photoDiv.innerHTML = `<img src="${photo}" alt="打卡照片">`;
+            photoDiv.style.display = 'block';
+        } else {
+            photoDiv.style.display = 'none';
+        }
+
+        document.getElementById('detail-modal').classList.add('active');
+    });
+});
+
+// 照片上傳預覽
+document.getElementById('photo-input').addEventListener('change', function(e) {
+    const file = e.target.files[0];
+    if (file) {
+        selectedPhoto = file;
+        const reader = new FileReader();
+        reader.onload = function(e) {
+            document.getElementById('photo-preview').innerHTML = `
+                <img src="${e.target.result}" alt="預覽">
+                <div class="photo-remove" onclick="removePhoto(event)">✕</div>
+            `;
+        };
+        reader.readAsDataURL(file);
+    }
+});
+
+function removePhoto(e) {
+    e.stopPropagation();
+    selectedPhoto = null;
+    document.getElementById('photo-input').value = '';
+    document.getElementById('photo-preview').innerHTML = `
+        <div class="upload-hint">
+            <span class="camera-icon">📷</span>
+            <span>點擊拍照或上傳照片</span>
+            <span class="optional">（選填）</span>
+        </div>
+    `;
+}
+
+function closeModal() {
+    document.getElementById('checkin-modal').classList.remove('active');
+}
+
+function closeDetailModal() {
+    document.getElementById('detail-modal').classList.remove('active');
+}
+
+async function confirmCheckin() {
+    if (!currentSpotId) return;
+
+    const note = document.getElementById('checkin-note').value.trim();
+
+    // 切換到進度視圖
+    document.getElementById('checkin-input-view').style.display = 'none';
+    document.getElementById('checkin-progress-view').style.display = 'block';
+    document.getElementById('checkin-result-view').style.display = 'none';
+
+    // 重置進度
+    updateProgress(0, '準備上傳...');
+    updateStep(1, 'active');
+    updateStep(2, 'pending');
+    updateStep(3, 'pending');
+
+    try {
+        // 驗證 spot ID
+        if (!currentSpotId || isNaN(parseInt(currentSpotId))) {
+            throw new Error('景點 ID 無效');
+        }
+
+        const spotId = parseInt(currentSpotId);
+        console.log('打卡景點 ID:', spotId);
+
+        // 步驟 1: 準備資料
+        updateProgress(10, '準備打卡資料...');
+
+        const formData = new FormData();
+        formData.append('user_id', userId || 'default');
+        formData.append('note', note || '');
+        // 冪等鍵：離線暫存後重送也不會重複打卡
+        formData.append('idempotency_key', window.crypto && crypto.randomUUID ? crypto.randomUUID() : Date.now() + '-' + Math.random());
+
+        if (selectedPhoto) {
+            // 檢查檔案大小
+            if (selectedPhoto.size > 10 * 1024 * 1024) {
+                throw new Error('照片太大，請選擇小於 10MB 的照片');
+            }
+            formData.append('photo', selectedPhoto);
+            updateProgress(20, '準備照片中...');
+            console.log('照片大小:', selectedPhoto.size, 'bytes');
+        }
+
+        // 步驟 2: 發送請求
+        updateProgress(30, '上傳中...');
+        updateStep(1, 'done');
+        updateStep(2, 'active');
+
+        const url = '/spot/' + spotId + '/checkin';
+        console.log('請求 URL:', url);
+
+        const res = await fetch(url, {
+            method: 'POST',
+            body: formData
+        });
+
+        console.log('回應狀態:', res.status);
+        updateProgress(70, '處理回應...');
+
+        // 檢查 HTTP 狀態
+        if (!res.ok) {
+            const errorText = await res.text();
+            console.error('伺服器錯誤:', errorText);
+            throw new Error('伺服器錯誤 (' + res.status + ')');
+        }
+
+        let data;
+        try {
+            data = await res.json();
+            console.log('回應資料:', data);
+        } catch (jsonError) {
+            console.error('JSON 解析錯誤:', jsonError);
+            throw new Error('伺服器回應格式錯誤');
+        }
+
+        // 步驟 3: 檢查結果
+        updateStep(2, 'done');
+        updateStep(3, 'active');
+        updateProgress(90, '完成同步...');
+
+        // 顯示結果
+        setTimeout(() => {
+            updateProgress(100, '完成！');
+            updateStep(3, data.google_sync ? 'done' : 'warning');
+
+            // 切換到結果視圖
+            document.getElementById('checkin-progress-view').style.display = 'none';
+            document.getElementById('checkin-result-view').style.display = 'block';
+
+            if (data.queued) {
+                document.getElementById('result-icon').textContent = '📥';
+                document.getElementById('result-title').textContent = '已離線暫存';
+                document.getElementById('result-message').textContent = data.message;
+                document.getElementById('result-details').innerHTML = `
+                    <div class="detail-item">
+                        <span>上傳狀態</span>
+                        <span class="warning">⏳ 等待連線</span>
+                    </div>
+                `;
+            } else if (data.success) {
+                document.getElementById('result-icon').textContent = '✅';
+                document.getElementById('result-title').textContent = '打卡成功！';
+                document.getElementById('result-message').textContent = data.message;
+
+                // 詳細結果
+                let details = `
+                    <div class="detail-item">
+                        <span>本地打卡</span>
+                        <span class="success">✓ 成功</span>
+                    </div>
+                `;
+
+                if (selectedPhoto) {
+                    details += `
+                        <div class="detail-item">
+                            <span>照片上傳</span>
+                            <span class="success">✓ 已儲存</span>
+                        </div>
+                    `;
+                }
+
+                if (data.google_sync) {
+                    details += `
+                        <div class="detail-item">
+                            <span>Google 同步</span>
+                            <span class="success">✓ 成功</span>
+                        </div>
+                    `;
+                } else if (data.google_sync === false) {
+                    details += `
+                        <div class="detail-item">
+                            <span>Google 同步</span>
+                            <span class="warning">⚠ 未連動</span>
+                        </div>
+                    `;
+                }
+
+                if (data.imgbb_error) {
+                    details += `
+                        <div class="detail-item">
+                            <span>圖片託管</span>
+                            <span class="error">✗ ${data.imgbb_error}</span>
+                        </div>
+                    `;
+                }
+
+                document.getElementById('result-details').innerHTML = details;
+
+                // 顯示成就
+                if (data.unlocked && data.unlocked.length > 0) {
+                    const toast = document.getElementById('achievement-toast');
+                    document.getElementById('toast-title').textContent = data.unlocked[0].icon + ' ' + data.unlocked[0].name;
+                    document.getElementById('toast-desc').textContent = '成就解鎖！';
+                    toast.classList.add('show');
+                    setTimeout(() => toast.classList.remove('show'), 3000);
+                }
+            } else {
+                document.getElementById('result-icon').textContent = '❌';
+                document.getElementById('result-title').textContent = '打卡失敗';
+                document.getElementById('result-message').textContent = data.message || '未知錯誤';
+                document.getElementById('result-details').innerHTML = `
+                    <div class="detail-item">
+                        <span>錯誤訊息</span>
+                        <span class="error">${data.message || '請稍後再試'}</span>
+                    </div>
+                `;
+            }
+        }, 300);
+
+    } catch (e) {
+        console.error('打卡錯誤:', e);
+
+        // 顯示錯誤
+        document.getElementById('checkin-progress-view').style.display = 'none';
+        document.getElementById('checkin-result-view').style.display = 'block';
+        document.getElementById('result-icon').textContent = '❌';
+        document.getElementById('result-title').textContent = '發生錯誤';
+        document.getElementById('result-message').textContent = '網路連線問題或伺服器錯誤';
+        document.getElementById('result-details').innerHTML = `
+            <div class="detail-item">
+                <span>錯誤詳情</span>
+                <span class="error">${e.message || '未知錯誤'}</span>
+            </div>
+        `;
+    }
+}
+
+function updateProgress(percent, status) {
+    document.getElementById('progress-bar').style.width = percent + '%';
+    document.getElementById('progress-status').textContent = status;
+}
+
+function updateStep(stepNum, state) {
+    const step = document.getElementById('step-' + stepNum);
+    step.className = 'step ' + state;
+    const icon = step.querySelector('.step-icon');
+    if (state === 'done') icon.textContent = '✓';
+    else if (state === 'error') icon.textContent = '✗';
+    else if (state === 'warning') icon.textContent = '⚠';
+    else if (state === 'active') icon.textContent = '⏳';
+    else icon.textContent = '○';
+}
+
+function resetCheckinModal() {
+    document.getElementById('checkin-input-view').style.display = 'block';
+    document.getElementById('checkin-progress-view').style.display = 'none';
+    document.getElementById('checkin-result-view').style.display = 'none';
+    document.getElementById('progress-bar').style.width = '0%';
+}
+
+async function cancelCheckin() {
+    if (!currentSpotId) return;
+
+    if (!confirm(`確定要取消「${currentSpotName}」的打卡嗎？\n照片和心得都會被刪除！`)) {
+        return;
+    }
+
+    try {
+        const res = await fetch(`/spot/${currentSpotId}/checkin/cancel`, {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ user_id: userId })
+        });
+
+        const data = await res.json();
+
+        if (data.success) {
+            closeDetailModal();
+            alert('已取消打卡');
+            location.reload();
+        } else {
+            alert(data.message || '取消失敗');
+        }
+    } catch (e) {
+        alert('發生錯誤，請稍後再試');
+    }
+}
+
+// 點擊外部關閉
+document.getElementById('checkin-modal').addEventListener('click', e => {
+    if (e.target.classList.contains('modal-overlay')) {
+        // 如果在結果視圖，刷新頁面
+        if (document.getElementById('checkin-result-view').style.display !== 'none') {
+            location.reload();
+        } else if (document.getElementById('checkin-progress-view').style.display === 'none') {
+            closeModal();
+        }
+    }
+});
+document.getElementById('detail-modal').addEventListener('click', e => {
+    if (e.target.classList.contains('modal-overlay')) closeDetailModal();
+});
+
+// ========== 離線打卡同步 ==========
+if ('serviceWorker' in navigator) {
+    // 不支援 Background Sync 的瀏覽器，恢復連線時請 Service Worker 重送
+    window.addEventListener('online', () => {
+        if (navigator.serviceWorker.controller) {
+            navigator.serviceWorker.controller.postMessage({ type: 'replay-checkins' });
+        }
+    });
+    navigator.serviceWorker.addEventListener('message', event => {
+        if (event.data && event.data.type === 'checkin-synced') {
+            const result = event.data.result || {};
+            const card = document.querySelector(`.spot-card[data-id="${event.data.spot_id}"]`);
+            if (result.success) {
+                if (card) card.classList.add('collected');
+            } else {
+                const name = card ? `「${card.dataset.name}」` : '';
+                alert(`離線打卡${name}未完成：${result.message || '同步失敗'}`);
+            }
+        }
+    });
+}
+
+// 綁定按鈕事件
+document.getElementById('btn-cancel').addEventListener('click', closeModal);
+document.getElementById('btn-confirm').addEventListener('click', confirmCheckin);
+document.getElementById('btn-cancel-checkin').addEventListener('click', cancelCheckin);
+document.getElementById('btn-close-detail').addEventListener('click', closeDetailModal);
+document.getElementById('btn-done').addEventListener('click', () => {
+    resetCheckinModal();
+    closeModal();
+    location.reload();
+});
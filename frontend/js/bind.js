@@ -0,0 +1,6 @@
+// 將 user_id 存到 localStorage
+const userId = document.body.dataset.userId;
+if (userId && userId !== 'default') {
+    localStorage.setItem('retire_reading_user_id', userId);
+    console.log('✅ LINE 帳號已綁定:', userId.substring(0, 20) + '...');
+}
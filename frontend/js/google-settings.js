@@ -0,0 +1,222 @@
+let isConnected = false;
+let albumUrl = '';
+let docUrl = '';
+
+// 檢查連動狀態
+async function checkStatus() {
+    document.getElementById('loading').classList.add('show');
+
+    try {
+        const response = await fetch('/google/status');
+        const data = await response.json();
+
+        document.getElementById('loading').classList.remove('show');
+        document.getElementById('status-content').style.display = 'block';
+
+        if (data.connected) {
+            isConnected = true;
+            document.getElementById('connected-view').style.display = 'block';
+            document.getElementById('disconnected-view').style.display = 'none';
+
+            // 顯示使用者資訊
+            if (data.user) {
+                if (data.user.picture) {
+                    document.getElementById('user-avatar').src = data.user.picture;
+                }
+                document.getElementById('user-name').textContent = data.user.name || '';
+                document.getElementById('user-email').textContent = data.user.email || '';
+            }
+
+            // 啟用功能卡片
+            document.getElementById('feature-photos').classList.remove('disabled');
+            document.getElementById('feature-docs').classList.remove('disabled');
+
+            // 預先取得相簿和文件連結
+            loadAlbumAndDoc();
+        } else {
+            isConnected = false;
+            document.getElementById('connected-view').style.display = 'none';
+            document.getElementById('disconnected-view').style.display = 'block';
+
+            // 停用功能卡片
+            document.getElementById('feature-photos').classList.add('disabled');
+            document.getElementById('feature-docs').classList.add('disabled');
+        }
+
+        // 檢查 ImgBB 狀態
+        checkImgbbStatus();
+    } catch (error) {
+        console.error('檢查狀態失敗:', error);
+        document.getElementById('loading').classList.remove('show');
+        document.getElementById('status-content').style.display = 'block';
+        document.getElementById('disconnected-view').style.display = 'block';
+    }
+}
+
+// 載入相簿和文件資訊
+async function loadAlbumAndDoc() {
+    try {
+        // 取得相簿
+        const albumRes = await fetch('/google/album');
+        const album = await albumRes.json();
+        if (album.productUrl) {
+            albumUrl = album.productUrl;
+        }
+
+        // 取得文件
+        const docRes = await fetch('/google/doc');
+        const doc = await docRes.json();
+        if (doc.url) {
+            docUrl = doc.url;
+        }
+    } catch (error) {
+        console.error('載入資源失敗:', error);
+    }
+}
+
+// 解除連動
+async function disconnect() {
+    if (!confirm('確定要解除 Google 連動嗎？')) return;
+
+    try {
+        await fetch('/google/disconnect');
+        location.reload();
+    } catch (error) {
+        alert('解除連動失敗');
+    }
+}
+
+// 開啟相簿
+function openAlbum() {
+    if (!isConnected) {
+        alert('請先連動 Google 帳號');
+        return;
+    }
+    if (albumUrl) {
+        window.open(albumUrl, '_blank');
+    } else {
+        alert('相簿連結尚未準備好，請稍後再試');
+    }
+}
+
+// 開啟文件
+function openDoc() {
+    if (!isConnected) {
+        alert('請先連動 Google 帳號');
+        return;
+    }
+    if (docUrl) {
+        window.open(docUrl, '_blank');
+    } else {
+        alert('文件連結尚未準備好，請稍後再試');
+    }
+}
+
+// 瀏覽照片
+async function viewPhotos() {
+    if (!isConnected) {
+        alert('請先連動 Google 帳號');
+        return;
+    }
+
+    try {
+        const response = await fetch('/google/album/photos');
+        const data = await response.json();
+
+        if (data.total > 0) {
+            alert(`相簿中有 ${data.total} 張照片`);
+        } else {
+            alert('相簿中還沒有照片');
+        }
+    } catch (error) {
+        alert('載入照片失敗');
+    }
+}
+
+// 測試寫入文件
+async function testEntry() {
+    if (!isConnected) {
+        alert('請先連動 Google 帳號');
+        return;
+    }
+
+    try {
+        const response = await fetch('/google/doc/entry', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({
+                spot_name: '測試景點',
+                location: '台灣某處',
+                notes: '這是一筆測試記錄，確認 Google 文件整合功能正常運作！'
+            })
+        });
+
+        const result = await response.json();
+
+        if (result.doc_url) {
+            if (confirm('測試寫入成功！是否開啟文件查看？')) {
+                window.open(result.doc_url, '_blank');
+            }
+        } else {
+            alert('寫入失敗：' + JSON.stringify(result));
+        }
+    } catch (error) {
+        alert('測試寫入失敗：' + error.message);
+    }
+}
+
+// 檢查 ImgBB 狀態
+async function checkImgbbStatus() {
+    try {
+        const response = await fetch('/google/imgbb/status');
+        const data = await response.json();
+
+        const statusText = document.getElementById('imgbb-status-text');
+        const featureCard = document.getElementById('feature-imgbb');
+
+        console.log('ImgBB 狀態:', data);  // 除錯用
+
+        if (data.configured || data.from_module) {
+            statusText.textContent = '✅ 已設定 (長度: ' + data.key_length + ')';
+            statusText.style.color = '#00d4aa';
+            featureCard.classList.remove('disabled');
+        } else {
+            statusText.textContent = '❌ 未設定 IMGBB_API_KEY';
+            statusText.style.color = '#ff6b6b';
+            featureCard.classList.add('disabled');
+        }
+    } catch (error) {
+        console.error('檢查 ImgBB 狀態失敗:', error);
+        document.getElementById('imgbb-status-text').textContent = '檢查失敗';
+    }
+}
+
+// 測試 ImgBB 上傳
+async function testImgbb() {
+    const statusText = document.getElementById('imgbb-status-text');
+    statusText.textContent = '🔄 測試中...';
+
+    try {
+        const response = await fetch('/google/imgbb/test', {
+            method: 'POST'
+        });
+        const result = await response.json();
+
+        if (result.success) {
+            statusText.textContent = '✅ 測試成功';
+            statusText.style.color = '#00d4aa';
+            alert('ImgBB 上傳測試成功！\n\n圖片 URL：\n' + result.url);
+        } else {
+            statusText.textContent = '❌ ' + (result.error || '測試失敗');
+            statusText.style.color = '#ff6b6b';
+            alert('ImgBB 測試失敗：' + (result.error || '未知錯誤'));
+        }
+    } catch (error) {
+        statusText.textContent = '❌ 測試失敗';
+        statusText.style.color = '#ff6b6b';
+        alert('ImgBB 測試失敗：' + error.message);
+    }
+}
+
+// 頁面載入時檢查狀態
+checkStatus();
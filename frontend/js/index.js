@@ -0,0 +1,21 @@
+// PWA Service Worker 註冊
+if ('serviceWorker' in navigator) {
+    // 移除舊版只能控制 /static/ 的註冊
+    navigator.serviceWorker.getRegistrations().then(regs => {
+        regs.filter(reg => reg.scope.endsWith('/static/')).forEach(reg => reg.unregister());
+    });
+    navigator.serviceWorker.register('/sw.js')
+        .then(reg => console.log('SW registered'))
+        .catch(err => console.log('SW error:', err));
+}
+
+// 開機動畫結束
+window.addEventListener('load', () => {
+    setTimeout(() => {
+        const splash = document.getElementById('splash');
+        if (splash) {
+            splash.classList.add('hidden');
+            setTimeout(() => splash.remove(), 500);
+        }
+    }, 2200); // 等待載入動畫完成
+});
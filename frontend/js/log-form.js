@@ -0,0 +1,2 @@
+// 預設日期為今天
+document.getElementById('travel_date').valueAsDate = new Date();
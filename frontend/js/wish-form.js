@@ -0,0 +1,7 @@
+// 優先度選擇器互動
+document.querySelectorAll('.priority-option').forEach(option => {
+    option.addEventListener('click', function() {
+        document.querySelectorAll('.priority-option').forEach(o => o.classList.remove('selected'));
+        this.classList.add('selected');
+    });
+});
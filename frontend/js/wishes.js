@@ -0,0 +1,12 @@
+const userId = document.body.dataset.userId;
+function toggleComplete(id, done) {
+    if (done) return;
+    fetch(`/wishes/${id}/complete`, { method: 'POST', headers: {'Content-Type':'application/json'}, body: JSON.stringify({user_id: userId}) })
+        .then(r => r.json()).then(d => { if(d.success) { showToast('🎉 恭喜完成！'); setTimeout(() => location.reload(), 1000); } });
+}
+function deleteWish(id) {
+    if (!confirm('確定刪除？')) return;
+    fetch(`/wishes/${id}/delete`, { method: 'POST', headers: {'Content-Type':'application/json'}, body: JSON.stringify({user_id: userId}) })
+        .then(r => r.json()).then(d => { if(d.success) document.querySelector(`[data-id="${id}"]`).remove(); });
+}
+function showToast(msg) { const t = document.getElementById('toast'); t.textContent = msg; t.style.display = 'block'; setTimeout(() => t.style.display = 'none', 3000); }
@@ -0,0 +1,265 @@
+"""
+退休走讀 - 大量測試資料產生器
+用於負載與擴充性測試：讓效能功能能在接近正式規模的資料表上量測
+
+- 用戶活躍度為冪律分布（少數重度用戶、多數輕度用戶）
+- 景點熱門度依稀有度加權（普通景點最常被打卡，傳說景點最少）
+- 以 executemany 分批寫入，單一交易，可在數十秒內產生十萬用戶
+
+用法：
+    python gen_dataset.py --db bench.db --preset large
+    python gen_dataset.py --db bench.db --users 200000 --mean-checkins 10 --seed 7
+"""
+
+import os
+import sys
+import time
+import random
+import sqlite3
+import argparse
+from datetime import date, timedelta
+
+# 預設規模
+PRESETS = {
+    'small': {'users': 1_000},
+    'medium': {'users': 10_000},
+    'large': {'users': 100_000},
+}
+
+# 稀有度對應的熱門度權重
+RARITY_POPULARITY = {'common': 1.0, 'rare': 0.55, 'epic': 0.25, 'legendary': 0.1}
+
+# 每批寫入的用戶數（控制記憶體用量）
+USER_CHUNK = 5_000
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='產生大量測試資料')
+    parser.add_argument('--db', required=True, help='SQLite 檔案路徑')
+    parser.add_argument('--preset', choices=PRESETS.keys(), help='預設規模 small / medium / large')
+    parser.add_argument('--users', type=int, help='用戶數')
+    parser.add_argument('--mean-checkins', type=float, default=8.0, help='活躍用戶平均打卡數')
+    parser.add_argument('--activity-alpha', type=float, default=1.5, help='活躍度冪律指數（越小越集中）')
+    parser.add_argument('--inactive', type=float, default=0.25, help='完全沒有打卡的用戶比例')
+    parser.add_argument('--photo-ratio', type=float, default=0.35, help='附照片的打卡比例')
+    parser.add_argument('--wish-ratio', type=float, default=0.6, help='每次打卡對應的願望數')
+    parser.add_argument('--log-ratio', type=float, default=0.2, help='每次打卡對應的旅遊紀錄數')
+    parser.add_argument('--days', type=int, default=730, help='打卡日期分布的天數')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--reset', action='store_true', help='先刪除既有資料庫')
+    args = parser.parse_args(argv)
+
+    if args.users is None:
+        args.users = PRESETS[args.preset or 'small']['users']
+    return args
+
+
+def load_app(db_path):
+    """以指定資料庫載入 app（觸發 init_db 建表與 144 景點）"""
+    os.environ['DATABASE_PATH'] = db_path
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import app as retire_app
+    retire_app.DATABASE = db_path
+    retire_app.init_db()
+    return retire_app
+
+
+class DatasetGenerator:
+    """依參數產生用戶、打卡、願望、旅遊紀錄與成就"""
+
+    def __init__(self, conn, args, achievement_check):
+        self.conn = conn
+        self.args = args
+        self.rng = random.Random(args.seed)
+        self.is_achievement_met = achievement_check
+        self.today = date.today()
+
+        self.spots = conn.execute('''
+            SELECT s.id, s.route_id, s.name, s.rarity, r.region, r.distance_km
+            FROM spots s JOIN routes r ON s.route_id = r.id
+            ORDER BY s.id
+        ''').fetchall()
+        self.achievements = conn.execute('SELECT * FROM achievements').fetchall()
+
+        # 稀有度權重再乘上個別景點的隨機熱度
+        weights = [RARITY_POPULARITY.get(s['rarity'], 0.5) * self.rng.lognormvariate(0, 0.5)
+                   for s in self.spots]
+        self.cum_weights = []
+        total = 0.0
+        for w in weights:
+            total += w
+            self.cum_weights.append(total)
+        self.weights = weights
+
+        # 冪律下限：讓 Pareto 分布的平均值等於 mean_checkins
+        alpha = args.activity_alpha
+        self.pareto_xm = args.mean_checkins * (alpha - 1) / alpha if alpha > 1 else 1.0
+
+        self.counts = {'users': 0, 'checkins': 0, 'wishes': 0, 'travel_logs': 0, 'user_achievements': 0}
+
+    def user_activity(self):
+        """該用戶打卡的景點數"""
+        if self.rng.random() < self.args.inactive:
+            return 0
+        k = int(self.rng.paretovariate(self.args.activity_alpha) * self.pareto_xm)
+        return max(1, min(k, len(self.spots)))
+
+    def pick_spots(self, k):
+        """依熱門度抽出 k 個不重複景點"""
+        if k * 3 < len(self.spots):
+            picked = set()
+            while len(picked) < k:
+                for idx in self.rng.choices(range(len(self.spots)), cum_weights=self.cum_weights, k=k * 2):
+                    picked.add(idx)
+                    if len(picked) == k:
+                        break
+            return [self.spots[i] for i in picked]
+
+        # 重度用戶：加權不放回抽樣（Efraimidis-Spirakis）
+        keyed = sorted(range(len(self.spots)),
+                       key=lambda i: self.rng.random() ** (1.0 / self.weights[i]), reverse=True)
+        return [self.spots[i] for i in keyed[:k]]
+
+    def random_day(self):
+        return self.today - timedelta(days=self.rng.randrange(self.args.days))
+
+    def generate_user(self, user_id, rows):
+        rng = self.rng
+        k = self.user_activity()
+        spots = self.pick_spots(k) if k else []
+
+        checkins = []
+        for spot in spots:
+            day = self.random_day()
+            created = f"{day.isoformat()} {rng.randrange(6, 20):02d}:{rng.randrange(60):02d}:{rng.randrange(60):02d}"
+            photo_url = f"/static/uploads/{user_id}_{spot['id']}_synthetic.jpg" if rng.random() < self.args.photo_ratio else None
+            note = rng.choice(['', '', '風景很美', '值得再來', '人有點多', '天氣很好'])
+            checkins.append((created, user_id, spot['id'], spot['route_id'], day.isoformat(), photo_url, note,
+                             rng.randint(3, 5)))
+        checkins.sort()
+
+        for c in checkins:
+            rows['checkins'].append((c[1], c[2], c[3], c[4], c[5], c[6], c[7], c[0]))
+            rows['checkin_events'].append((c[1], c[2], 'checkin', c[0]))
+
+        # 願望清單
+        wish_count = int(k * self.args.wish_ratio + rng.random() * 2)
+        wish_complete = 0
+        for _ in range(wish_count):
+            spot = self.spots[rng.randrange(len(self.spots))]
+            completed = 1 if rng.random() < 0.4 else 0
+            wish_complete += completed
+            rows['wishes'].append((
+                spot['name'], spot['region'], '', rng.choice(['春', '夏', '秋', '冬', '四季皆宜']),
+                rng.choice([0, 3000, 8000, 20000]), rng.randint(1, 5), completed,
+                self.random_day().isoformat() if completed else None, '', user_id
+            ))
+
+        # 旅遊紀錄
+        log_count = int(k * self.args.log_ratio + rng.random())
+        diary_count = 0
+        for _ in range(log_count):
+            spot = self.spots[rng.randrange(len(self.spots))]
+            diary = rng.choice(['', '慢慢走，好好讀。', '和老朋友一起出遊，很開心。'])
+            diary_count += 1 if diary else 0
+            rows['travel_logs'].append((
+                None, spot['route_id'], self.random_day().isoformat(),
+                rng.choice([0, 1500, 5000]), rng.randint(3, 5), diary, user_id
+            ))
+
+        total_distance = round(sum(s['distance_km'] or 0 for s in spots) / 3, 1)
+        rows['user_settings'].append((user_id, total_distance, len(checkins)))
+
+        # 依 app 的成就規則計算已解鎖成就
+        stats = {
+            'checkin_count': len(checkins),
+            'photo_count': sum(1 for c in checkins if c[5]),
+            'wish_complete': wish_complete,
+            'diary_count': diary_count,
+            'total_distance': total_distance,
+        }
+        for ach in self.achievements:
+            if self.is_achievement_met(ach, stats):
+                rows['user_achievements'].append((user_id, ach['id'], checkins[-1][0] if checkins else None))
+
+    def flush(self, rows):
+        """寫入一批資料"""
+        executemany = self.conn.executemany
+        executemany('''
+            INSERT INTO checkins (user_id, spot_id, route_id, checkin_date, photo_url, note, rating, created_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ''', rows['checkins'])
+        executemany('''
+            INSERT INTO checkin_events (user_id, spot_id, action, created_at) VALUES (?, ?, ?, ?)
+        ''', rows['checkin_events'])
+        executemany('''
+            INSERT INTO wishes (name, region, description, best_season, budget, priority, completed,
+                                completed_date, notes, user_id)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', rows['wishes'])
+        executemany('''
+            INSERT INTO travel_logs (wish_id, route_id, travel_date, actual_budget, rating, diary, user_id)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', rows['travel_logs'])
+        executemany('''
+            INSERT OR REPLACE INTO user_settings (user_id, total_distance, total_spots) VALUES (?, ?, ?)
+        ''', rows['user_settings'])
+        executemany('''
+            INSERT OR IGNORE INTO user_achievements (user_id, achievement_id, unlocked_at)
+            VALUES (?, ?, COALESCE(?, CURRENT_TIMESTAMP))
+        ''', rows['user_achievements'])
+
+        self.counts['users'] += len(rows['user_settings'])
+        for table in ('checkins', 'wishes', 'travel_logs', 'user_achievements'):
+            self.counts[table] += len(rows[table])
+
+    def run(self):
+        rows = None
+        for i in range(self.args.users):
+            if i % USER_CHUNK == 0:
+                if rows:
+                    self.flush(rows)
+                    print(f"  … {i:,} 位用戶")
+                rows = {t: [] for t in ('checkins', 'checkin_events', 'wishes', 'travel_logs',
+                                        'user_settings', 'user_achievements')}
+            self.generate_user(f"U{self.rng.getrandbits(128):032x}", rows)
+        if rows:
+            self.flush(rows)
+        return self.counts
+
+
+def generate(args):
+    if args.reset and os.path.exists(args.db):
+        os.remove(args.db)
+
+    retire_app = load_app(args.db)
+
+    conn = sqlite3.connect(args.db)
+    conn.row_factory = sqlite3.Row
+    # 大量寫入期間關閉同步，換取速度（資料可重新產生）
+    conn.execute('PRAGMA synchronous = OFF')
+    conn.execute('PRAGMA cache_size = -65536')
+
+    print(f"📦 產生 {args.users:,} 位用戶的測試資料 → {args.db}")
+    start = time.perf_counter()
+    try:
+        generator = DatasetGenerator(conn, args, retire_app.is_achievement_met)
+        counts = generator.run()
+        # 收集分數由打卡重新計算（同時通知執行中的 worker 清空所有用戶的快取）
+        retire_app.rebuild_scores(conn)
+        retire_app.analytics.rebuild_rollups(conn)
+        conn.commit()
+        conn.execute('ANALYZE')
+    finally:
+        conn.close()
+    elapsed = time.perf_counter() - start
+
+    total_rows = sum(counts.values())
+    print(f"✅ 完成，耗時 {elapsed:.1f} 秒（{total_rows / elapsed:,.0f} 筆/秒）")
+    for table, count in counts.items():
+        print(f"   {table}: {count:,}")
+    return counts
+
+
+if __name__ == '__main__':
+    generate(parse_args())
@@ -11,6 +11,9 @@ import base64
 import requests
 from datetime import datetime
 from urllib.parse import quote
+from concurrent.futures import ThreadPoolExecutor
+from profiling import instrument_http_session
+from task_graph import Step, run_graph, DONE
 
 # Google OAuth 設定
 GOOGLE_CLIENT_ID = os.environ.get('GOOGLE_CLIENT_ID', '')
@@ -20,6 +23,59 @@ GOOGLE_REDIRECT_URI = os.environ.get('GOOGLE_REDIRECT_URI', '')
 # ImgBB API Key（用於圖片託管）
 IMGBB_API_KEY = os.environ.get('IMGBB_API_KEY', '')
 
+# API 位址（可用環境變數改指向本機模擬伺服器 fake_google_api.py）
+GOOGLE_OAUTH_BASE = os.environ.get('GOOGLE_OAUTH_BASE', 'https://oauth2.googleapis.com').rstrip('/')
+GOOGLE_APIS_BASE = os.environ.get('GOOGLE_APIS_BASE', 'https://www.googleapis.com').rstrip('/')
+PHOTOS_API_BASE = os.environ.get('PHOTOS_API_BASE', 'https://photoslibrary.googleapis.com').rstrip('/')
+DOCS_API_BASE = os.environ.get('DOCS_API_BASE', 'https://docs.googleapis.com').rstrip('/')
+IMGBB_API_BASE = os.environ.get('IMGBB_API_BASE', 'https://api.imgbb.com').rstrip('/')
+
+# 外部 API 的 HTTP timeout（秒）：逾時的同步步驟不會無限期佔住執行緒
+GOOGLE_HTTP_TIMEOUT = float(os.environ.get('GOOGLE_HTTP_TIMEOUT', '30'))
+
+# 打卡同步：共用執行緒池大小（0 = 依序執行）與單一步驟的時限（秒）
+GOOGLE_SYNC_THREADS = int(os.environ.get('GOOGLE_SYNC_THREADS', '8'))
+GOOGLE_SYNC_STEP_TIMEOUT = float(os.environ.get('GOOGLE_SYNC_STEP_TIMEOUT', '20'))
+
+
+class TimeoutSession(requests.Session):
+    """未指定 timeout 的請求套用 GOOGLE_HTTP_TIMEOUT"""
+
+    def request(self, *args, **kwargs):
+        kwargs.setdefault('timeout', GOOGLE_HTTP_TIMEOUT)
+        return super().request(*args, **kwargs)
+
+
+# 共用 HTTP 連線（保持連線重用，並讓效能分析記錄外部呼叫）
+http_session = instrument_http_session(TimeoutSession())
+# 連線池需容納同時進行的同步步驟
+http_session.mount('https://', requests.adapters.HTTPAdapter(pool_maxsize=max(10, GOOGLE_SYNC_THREADS * 2)))
+http_session.mount('http://', requests.adapters.HTTPAdapter(pool_maxsize=max(10, GOOGLE_SYNC_THREADS * 2)))
+
+# 所有打卡共用的執行緒池（有上限，避免大量打卡同時開出過多連線）
+sync_executor = ThreadPoolExecutor(max_workers=GOOGLE_SYNC_THREADS, thread_name_prefix='google-sync') \
+    if GOOGLE_SYNC_THREADS > 0 else None
+
+# 走讀圖鑑相簿名稱
+ALBUM_TITLE = "退休走讀圖鑑"
+
+
+class GoogleAPIError(Exception):
+    """Google API 回傳錯誤（分頁串流時使用）"""
+
+    def __init__(self, status_code, message):
+        super().__init__(f"{status_code}: {message}")
+        self.status_code = status_code
+
+
+def _api_error(response):
+    try:
+        message = response.json().get('error', {}).get('message', response.reason)
+    except ValueError:
+        message = response.reason
+    return GoogleAPIError(response.status_code, message)
+
+
 # API Scopes
 SCOPES = [
     'https://www.googleapis.com/auth/photoslibrary',
@@ -47,7 +103,7 @@ def get_auth_url():
 
 def exchange_code_for_tokens(code):
     """用授權碼換取 tokens"""
-    response = requests.post('https://oauth2.googleapis.com/token', data={
+    response = http_session.post(f'{GOOGLE_OAUTH_BASE}/token', data={
         'client_id': GOOGLE_CLIENT_ID,
         'client_secret': GOOGLE_CLIENT_SECRET,
         'code': code,
@@ -59,7 +115,7 @@ def exchange_code_for_tokens(code):
 
 def refresh_access_token(refresh_token):
     """刷新 access token"""
-    response = requests.post('https://oauth2.googleapis.com/token', data={
+    response = http_session.post(f'{GOOGLE_OAUTH_BASE}/token', data={
         'client_id': GOOGLE_CLIENT_ID,
         'client_secret': GOOGLE_CLIENT_SECRET,
         'refresh_token': refresh_token,
@@ -71,7 +127,7 @@ def refresh_access_token(refresh_token):
 def get_user_info(access_token):
     """取得使用者資訊"""
     headers = {'Authorization': f'Bearer {access_token}'}
-    response = requests.get('https://www.googleapis.com/oauth2/v2/userinfo', headers=headers)
+    response = http_session.get(f'{GOOGLE_APIS_BASE}/oauth2/v2/userinfo', headers=headers)
     return response.json()
 
 
@@ -104,8 +160,8 @@ def upload_to_imgbb(image_data, filename=None):
         image_base64 = base64.b64encode(image_data).decode('utf-8')
         
         # 上傳到 ImgBB
-        response = requests.post(
-            'https://api.imgbb.com/1/upload',
+        response = http_session.post(
+            f'{IMGBB_API_BASE}/1/upload',
             data={
                 'key': api_key,
                 'image': image_base64,
@@ -142,30 +198,56 @@ def create_album(access_token, album_title):
     data = {
         'album': {'title': album_title}
     }
-    response = requests.post(
-        'https://photoslibrary.googleapis.com/v1/albums',
+    response = http_session.post(
+        f'{PHOTOS_API_BASE}/v1/albums',
         headers=headers,
         json=data
     )
     return response.json()
 
 
-def get_or_create_album(access_token, album_title="退休走讀圖鑑"):
-    """取得或建立相簿"""
+def iter_albums(access_token, page_size=50):
+    """逐頁列出所有相簿（依 nextPageToken 串接），API 錯誤時丟出 GoogleAPIError"""
     headers = {'Authorization': f'Bearer {access_token}'}
-    
-    # 搜尋現有相簿
-    response = requests.get(
-        'https://photoslibrary.googleapis.com/v1/albums',
-        headers=headers,
-        params={'pageSize': 50}
-    )
-    
-    if response.status_code == 200:
-        albums = response.json().get('albums', [])
-        for album in albums:
+    params = {'pageSize': page_size}
+    
+    while True:
+        response = http_session.get(f'{PHOTOS_API_BASE}/v1/albums', headers=headers, params=params)
+        if response.status_code != 200:
+            raise _api_error(response)
+        body = response.json()
+        yield from body.get('albums', [])
+        
+        if not body.get('nextPageToken'):
+            return
+        params['pageToken'] = body['nextPageToken']
+
+
+def get_album(access_token, album_id):
+    """取得單一相簿（含 mediaItemsCount）"""
+    headers = {'Authorization': f'Bearer {access_token}'}
+    response = http_session.get(f'{PHOTOS_API_BASE}/v1/albums/{album_id}', headers=headers)
+    if response.status_code != 200:
+        raise _api_error(response)
+    return response.json()
+
+
+def album_product_url(album_id):
+    """相簿在 Google 相簿網站的網址（與 albums API 回傳的 productUrl 相同格式）"""
+    return f'https://photos.google.com/lr/album/{album_id}'
+
+
+def get_or_create_album(access_token, album_title=ALBUM_TITLE):
+    """取得或建立相簿"""
+    # 搜尋所有頁的現有相簿
+    try:
+        for album in iter_albums(access_token):
             if album.get('title') == album_title:
                 return album
+    except GoogleAPIError as e:
+        # 列表失敗時不知道相簿是否已存在，不建立新相簿以免重複
+        print(f"⚠️ 無法列出相簿: {e}")
+        return {'error': str(e)}
     
     # 建立新相簿
     return create_album(access_token, album_title)
@@ -181,8 +263,8 @@ def upload_photo_to_album(access_token, album_id, image_data, filename, descript
         'X-Goog-Upload-Protocol': 'raw'
     }
     
-    upload_response = requests.post(
-        'https://photoslibrary.googleapis.com/v1/uploads',
+    upload_response = http_session.post(
+        f'{PHOTOS_API_BASE}/v1/uploads',
         headers=headers,
         data=image_data
     )
@@ -209,8 +291,8 @@ def upload_photo_to_album(access_token, album_id, image_data, filename, descript
         }]
     }
     
-    response = requests.post(
-        'https://photoslibrary.googleapis.com/v1/mediaItems:batchCreate',
+    response = http_session.post(
+        f'{PHOTOS_API_BASE}/v1/mediaItems:batchCreate',
         headers=headers,
         json=data
     )
@@ -218,8 +300,8 @@ def upload_photo_to_album(access_token, album_id, image_data, filename, descript
     return response.json()
 
 
-def list_album_photos(access_token, album_id, page_size=25):
-    """列出相簿中的照片"""
+def list_album_photos(access_token, album_id, page_size=25, page_token=None):
+    """列出相簿中的照片（單頁，下一頁以回傳的 nextPageToken 取得）"""
     headers = {
         'Authorization': f'Bearer {access_token}',
         'Content-Type': 'application/json'
@@ -229,9 +311,11 @@ def list_album_photos(access_token, album_id, page_size=25):
         'albumId': album_id,
         'pageSize': page_size
     }
+    if page_token:
+        data['pageToken'] = page_token
     
-    response = requests.post(
-        'https://photoslibrary.googleapis.com/v1/mediaItems:search',
+    response = http_session.post(
+        f'{PHOTOS_API_BASE}/v1/mediaItems:search',
         headers=headers,
         json=data
     )
@@ -239,6 +323,26 @@ def list_album_photos(access_token, album_id, page_size=25):
     return response.json()
 
 
+def iter_album_media(access_token, album_id, page_size=100):
+    """逐頁串流相簿中的媒體（每次 yield 一頁的 mediaItems），API 錯誤時丟出 GoogleAPIError"""
+    headers = {
+        'Authorization': f'Bearer {access_token}',
+        'Content-Type': 'application/json'
+    }
+    data = {'albumId': album_id, 'pageSize': page_size}
+    
+    while True:
+        response = http_session.post(f'{PHOTOS_API_BASE}/v1/mediaItems:search', headers=headers, json=data)
+        if response.status_code != 200:
+            raise _api_error(response)
+        body = response.json()
+        yield body.get('mediaItems', [])
+        
+        if not body.get('nextPageToken'):
+            return
+        data['pageToken'] = body['nextPageToken']
+
+
 # ==================== Google 文件 API ====================
 
 def create_travel_doc(access_token, title):
@@ -250,8 +354,8 @@ def create_travel_doc(access_token, title):
     
     data = {'title': title}
     
-    response = requests.post(
-        'https://docs.googleapis.com/v1/documents',
+    response = http_session.post(
+        f'{DOCS_API_BASE}/v1/documents',
         headers=headers,
         json=data
     )
@@ -265,8 +369,8 @@ def get_or_create_travel_doc(access_token, title="退休走讀旅遊日誌"):
     
     # 搜尋現有文件
     query = f"name='{title}' and mimeType='application/vnd.google-apps.document' and trashed=false"
-    response = requests.get(
-        'https://www.googleapis.com/drive/v3/files',
+    response = http_session.get(
+        f'{GOOGLE_APIS_BASE}/drive/v3/files',
         headers=headers,
         params={'q': query, 'fields': 'files(id,name)'}
     )
@@ -288,8 +392,8 @@ def append_to_doc(access_token, doc_id, content):
     }
     
     # 先取得文件長度
-    doc_response = requests.get(
-        f'https://docs.googleapis.com/v1/documents/{doc_id}',
+    doc_response = http_session.get(
+        f'{DOCS_API_BASE}/v1/documents/{doc_id}',
         headers=headers
     )
     
@@ -309,8 +413,8 @@ def append_to_doc(access_token, doc_id, content):
         }]
     }
     
-    response = requests.post(
-        f'https://docs.googleapis.com/v1/documents/{doc_id}:batchUpdate',
+    response = http_session.post(
+        f'{DOCS_API_BASE}/v1/documents/{doc_id}:batchUpdate',
         headers=headers,
         json=requests_data
     )
@@ -361,8 +465,8 @@ def create_formatted_travel_entry(access_token, doc_id, spot_name, location, dat
     }
     
     # 先取得文件長度
-    doc_response = requests.get(
-        f'https://docs.googleapis.com/v1/documents/{doc_id}',
+    doc_response = http_session.get(
+        f'{DOCS_API_BASE}/v1/documents/{doc_id}',
         headers=headers
     )
     
@@ -442,8 +546,8 @@ def create_formatted_travel_entry(access_token, doc_id, spot_name, location, dat
     ]
     
     # 先執行文字插入
-    response = requests.post(
-        f'https://docs.googleapis.com/v1/documents/{doc_id}:batchUpdate',
+    response = http_session.post(
+        f'{DOCS_API_BASE}/v1/documents/{doc_id}:batchUpdate',
         headers=headers,
         json={'requests': requests_list}
     )
@@ -453,8 +557,8 @@ def create_formatted_travel_entry(access_token, doc_id, spot_name, location, dat
     # 如果有 ImgBB 圖片 URL，插入實際圖片
     if imgbb_url:
         # 重新取得文件長度
-        doc_response = requests.get(
-            f'https://docs.googleapis.com/v1/documents/{doc_id}',
+        doc_response = http_session.get(
+            f'{DOCS_API_BASE}/v1/documents/{doc_id}',
             headers=headers
         )
         doc = doc_response.json()
@@ -474,8 +578,8 @@ def create_formatted_travel_entry(access_token, doc_id, spot_name, location, dat
             }
         ]
         
-        img_response = requests.post(
-            f'https://docs.googleapis.com/v1/documents/{doc_id}:batchUpdate',
+        img_response = http_session.post(
+            f'{DOCS_API_BASE}/v1/documents/{doc_id}:batchUpdate',
             headers=headers,
             json={'requests': image_requests}
         )
@@ -483,15 +587,15 @@ def create_formatted_travel_entry(access_token, doc_id, spot_name, location, dat
         img_result = img_response.json()
         
         # 插入圖片後換行
-        doc_response = requests.get(
-            f'https://docs.googleapis.com/v1/documents/{doc_id}',
+        doc_response = http_session.get(
+            f'{DOCS_API_BASE}/v1/documents/{doc_id}',
             headers=headers
         )
         doc = doc_response.json()
         final_end_index = doc.get('body', {}).get('content', [{}])[-1].get('endIndex', 1) - 1
         
-        requests.post(
-            f'https://docs.googleapis.com/v1/documents/{doc_id}:batchUpdate',
+        http_session.post(
+            f'{DOCS_API_BASE}/v1/documents/{doc_id}:batchUpdate',
             headers=headers,
             json={'requests': [{'insertText': {'location': {'index': final_end_index}, 'text': '\n\n'}}]}
         )
@@ -509,8 +613,8 @@ def insert_image_to_doc(access_token, doc_id, image_url):
     }
     
     # 取得文件長度
-    doc_response = requests.get(
-        f'https://docs.googleapis.com/v1/documents/{doc_id}',
+    doc_response = http_session.get(
+        f'{DOCS_API_BASE}/v1/documents/{doc_id}',
         headers=headers
     )
     
@@ -533,8 +637,8 @@ def insert_image_to_doc(access_token, doc_id, image_url):
         }]
     }
     
-    response = requests.post(
-        f'https://docs.googleapis.com/v1/documents/{doc_id}:batchUpdate',
+    response = http_session.post(
+        f'{DOCS_API_BASE}/v1/documents/{doc_id}:batchUpdate',
         headers=headers,
         json=requests_data
     )
@@ -544,14 +648,17 @@ def insert_image_to_doc(access_token, doc_id, image_url):
 
 # ==================== 整合功能 ====================
 
-def save_checkin_with_photo(access_token, spot_name, location, notes, image_data=None, filename=None):
+def save_checkin_with_photo(access_token, spot_name, location, notes, image_data=None, filename=None,
+                            find_album=None):
     """
     打卡並儲存到 Google 相簿 + 文件（圖文並茂）
+    find_album(access_token) 回傳 {'id', 'productUrl'}，預設為 get_or_create_album（會列出所有相簿），
+    app 傳入有快取的 media_cache.album_info
     
-    流程：
-    1. 上傳照片到 Google 相簿
-    2. 上傳照片到 ImgBB（取得公開 URL）
-    3. 建立/更新 Google 文件，插入圖文並茂的記錄
+    流程（相依圖，互不相依的步驟在共用執行緒池 sync_executor 同時進行）：
+    1. 取得相簿 ∥ 取得文件 ∥ 上傳照片到 ImgBB（取得公開 URL）
+    2. 上傳照片到 Google 相簿（需要相簿）
+    3. 在文件插入圖文並茂的記錄（需要文件；等照片上傳結束，失敗則不附圖）
     
     Returns:
         dict: {
@@ -560,64 +667,70 @@ def save_checkin_with_photo(access_token, spot_name, location, notes, image_data
             'photo': photo_info,
             'imgbb': imgbb_info,
             'doc': doc_info,
-            'entry': entry_info
+            'entry': entry_info,
+            'timings': {步驟: {'status', 'wait_ms', 'run_ms'}}
         }
     """
-    result = {'success': False}
     date_str = datetime.now().strftime('%Y/%m/%d %H:%M')
+    has_photo = bool(image_data and filename)
+    
+    def upload_photo(results):
+        album_id = results['album'].get('id')
+        if not album_id:
+            return None
+        description = f"{spot_name} - {date_str}"
+        return upload_photo_to_album(access_token, album_id, image_data, filename, description)
+    
+    def upload_imgbb(results):
+        imgbb_result = upload_to_imgbb(image_data, filename)
+        if imgbb_result.get('success'):
+            print(f"✅ ImgBB 上傳成功: {imgbb_result.get('url')}")
+        else:
+            print(f"⚠️ ImgBB 上傳失敗: {imgbb_result.get('error')}")
+        return imgbb_result
     
-    try:
-        # 1. 取得或建立相簿
-        album = get_or_create_album(access_token)
-        result['album'] = album
-        album_id = album.get('id')
+    def write_entry(results):
+        doc_id = results['doc'].get('documentId')
+        if not doc_id:
+            return None
         
+        # 取得 Google 相簿照片 URL
         photo_url = None
-        imgbb_url = None
-        
-        # 2. 處理照片（如果有）
-        if image_data and filename and album_id:
-            description = f"{spot_name} - {date_str}"
-            
-            # 2a. 上傳到 Google 相簿
-            photo_result = upload_photo_to_album(
-                access_token, album_id, image_data, filename, description
-            )
-            result['photo'] = photo_result
-            
-            # 取得 Google 相簿照片 URL
-            if 'newMediaItemResults' in photo_result:
-                media_item = photo_result['newMediaItemResults'][0].get('mediaItem', {})
-                photo_url = media_item.get('productUrl')
-            
-            # 2b. 上傳到 ImgBB（用於 Google 文件插入圖片）
-            imgbb_result = upload_to_imgbb(image_data, filename)
-            result['imgbb'] = imgbb_result
-            
-            if imgbb_result.get('success'):
-                imgbb_url = imgbb_result.get('url')
-                print(f"✅ ImgBB 上傳成功: {imgbb_url}")
-            else:
-                print(f"⚠️ ImgBB 上傳失敗: {imgbb_result.get('error')}")
-        
-        # 3. 取得或建立文件
-        doc = get_or_create_travel_doc(access_token)
-        result['doc'] = doc
-        doc_id = doc.get('documentId')
+        photo_result = results.get('photo') or {}
+        if 'newMediaItemResults' in photo_result:
+            media_item = photo_result['newMediaItemResults'][0].get('mediaItem', {})
+            photo_url = media_item.get('productUrl')
         
-        # 4. 加入圖文並茂的旅遊記錄
-        if doc_id:
-            entry_result = create_formatted_travel_entry(
-                access_token, doc_id, spot_name, location, date_str, notes,
-                photo_url=photo_url,
-                imgbb_url=imgbb_url  # 傳入 ImgBB URL 用於插入圖片
-            )
-            result['entry'] = entry_result
-        
-        result['success'] = True
-        
-    except Exception as e:
-        result['error'] = str(e)
-        print(f"❌ save_checkin_with_photo 錯誤: {e}")
+        imgbb_result = results.get('imgbb') or {}
+        return create_formatted_travel_entry(
+            access_token, doc_id, spot_name, location, date_str, notes,
+            photo_url=photo_url,
+            imgbb_url=imgbb_result.get('url') if imgbb_result.get('success') else None  # 用於插入圖片
+        )
+    
+    steps = [
+        Step('album', lambda results: (find_album or get_or_create_album)(access_token)),
+        Step('doc', lambda results: get_or_create_travel_doc(access_token)),
+    ]
+    if has_photo:
+        steps += [
+            Step('photo', upload_photo, deps=('album',)),
+            Step('imgbb', upload_imgbb),
+        ]
+    steps.append(Step('entry', write_entry, deps=('doc',), after=('photo', 'imgbb') if has_photo else ()))
+    
+    results, timings = run_graph(steps, sync_executor, timeout=GOOGLE_SYNC_STEP_TIMEOUT)
+    
+    result = {key: value for key, value in results.items() if value is not None}
+    result['timings'] = timings
+    # ImgBB 只影響文件是否附圖，逾時與上傳失敗同樣處理
+    if has_photo and timings['imgbb']['status'] != DONE:
+        result['imgbb'] = {'success': False, 'error': timings['imgbb'].get('error', timings['imgbb']['status'])}
+    errors = [f"{name}: {t.get('error', t['status'])}" for name, t in timings.items()
+              if t['status'] != DONE and name != 'imgbb']
+    result['success'] = not errors
+    if errors:
+        result['error'] = '; '.join(errors)
+        print(f"❌ save_checkin_with_photo 錯誤: {result['error']}")
     
     return result
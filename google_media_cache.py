@@ -0,0 +1,235 @@
+"""
+Google 相簿媒體索引快取
+- 每個相簿的媒體清單存在 google_media_items，/google/album/photos?cursor= 直接從快取分頁，不必每頁都呼叫 Google
+- 版本檢查：距上次確認超過 GOOGLE_MEDIA_CHECK_SECONDS 才呼叫 albums.get；
+  Photos API 沒有 ETag 或「某時間之後」的相簿查詢，因此以相簿的 mediaItemsCount 當作 ETag，有變動才重新串流整個相簿
+- 照片的 baseUrl 約 60 分鐘失效：完整同步超過 GOOGLE_MEDIA_RESYNC_SECONDS 一律重建
+- 重建時以新的 generation 逐頁寫入，完成後才切換，讀取端不會看到一半的清單
+- 使用者（Google email）→ 相簿 id 也快取，不必每次列出所有相簿
+
+環境變數：
+    GOOGLE_MEDIA_CHECK_SECONDS   多久確認一次相簿版本（預設 300）
+    GOOGLE_MEDIA_RESYNC_SECONDS  多久一定完整重建（預設 3000，需短於 baseUrl 的有效期）
+"""
+
+import os
+import time
+import zlib
+import threading
+from google_integration import (
+    ALBUM_TITLE, GoogleAPIError, album_product_url, get_album, get_or_create_album, iter_album_media
+)
+
+GOOGLE_MEDIA_CHECK_SECONDS = float(os.environ.get('GOOGLE_MEDIA_CHECK_SECONDS', '300'))
+GOOGLE_MEDIA_RESYNC_SECONDS = float(os.environ.get('GOOGLE_MEDIA_RESYNC_SECONDS', '3000'))
+
+# 串流時每頁向 Google 取的數量（API 上限 100）
+SYNC_PAGE_SIZE = 100
+# 分頁 API 每頁上限
+MAX_PAGE_LIMIT = 100
+LOCK_STRIPES = 64
+
+
+def _item_to_row(album_id, generation, position, item):
+    metadata = item.get('mediaMetadata') or {}
+    return (album_id, generation, position, item.get('id'), item.get('baseUrl'), item.get('productUrl'),
+            item.get('filename'), item.get('mimeType'), item.get('description'), metadata.get('creationTime'))
+
+
+def _row_to_item(row):
+    """還原成 Google mediaItem 的格式"""
+    return {
+        'id': row['media_id'],
+        'baseUrl': row['base_url'],
+        'productUrl': row['product_url'],
+        'filename': row['filename'],
+        'mimeType': row['mime_type'],
+        'description': row['description'],
+        'mediaMetadata': {'creationTime': row['creation_time']},
+    }
+
+
+class MediaIndexCache:
+    """google_media_albums / google_media_items 的存取（open_db 由 app 注入）"""
+
+    def __init__(self, open_db=None):
+        self.open_db = open_db
+        self._locks = [threading.Lock() for _ in range(LOCK_STRIPES)]
+        self.stats = {'hits': 0, 'checks': 0, 'syncs': 0, 'sync_failed': 0}
+
+    def configure(self, open_db):
+        self.open_db = open_db
+
+    def _lock_for(self, album_id):
+        return self._locks[zlib.crc32(album_id.encode('utf-8')) % LOCK_STRIPES]
+
+    def _meta(self, album_id):
+        with self.open_db() as conn:
+            return conn.execute("SELECT * FROM google_media_albums WHERE album_id = ?", (album_id,)).fetchone()
+
+    @staticmethod
+    def _is_fresh(meta, now):
+        return (meta is not None and meta['synced_at'] is not None and meta['checked_at'] is not None
+                and now - meta['checked_at'] < GOOGLE_MEDIA_CHECK_SECONDS
+                and now - meta['synced_at'] < GOOGLE_MEDIA_RESYNC_SECONDS)
+
+    # ---------- 相簿查詢 ----------
+
+    def album_for(self, access_token, owner=None, title=ALBUM_TITLE):
+        """使用者的走讀相簿 id（有快取就不呼叫 Google），取得失敗回傳 None"""
+        if owner:
+            with self.open_db() as conn:
+                row = conn.execute(
+                    "SELECT album_id FROM google_media_albums WHERE owner = ? AND title = ?", (owner, title)
+                ).fetchone()
+            if row:
+                return row['album_id']
+
+        album_id = get_or_create_album(access_token, title).get('id')
+        if album_id and owner:
+            with self.open_db(immediate=True) as conn:
+                conn.execute("INSERT OR IGNORE INTO google_media_albums (album_id) VALUES (?)", (album_id,))
+                conn.execute("UPDATE google_media_albums SET owner = ?, title = ? WHERE album_id = ?",
+                             (owner, title, album_id))
+                conn.commit()
+        return album_id
+
+    def album_info(self, access_token, owner=None, title=ALBUM_TITLE):
+        """album_for 的 dict 版本，格式與 get_or_create_album 相同：{'id', 'productUrl'}（失敗時含 error）"""
+        album_id = self.album_for(access_token, owner, title)
+        if not album_id:
+            return {'error': '無法取得相簿'}
+        return {'id': album_id, 'productUrl': album_product_url(album_id)}
+
+    def invalidate(self, album_id):
+        """相簿內容有變動（例如剛上傳照片）：下次讀取時重新確認版本並重建"""
+        with self.open_db(immediate=True) as conn:
+            conn.execute("UPDATE google_media_albums SET etag = NULL, checked_at = NULL WHERE album_id = ?",
+                         (album_id,))
+            conn.commit()
+
+    def forget(self, album_id):
+        """相簿已不存在：移除快取與使用者對應"""
+        with self.open_db(immediate=True) as conn:
+            conn.execute("DELETE FROM google_media_items WHERE album_id = ?", (album_id,))
+            conn.execute("DELETE FROM google_media_albums WHERE album_id = ?", (album_id,))
+            conn.commit()
+
+    # ---------- 同步 ----------
+
+    def ensure_fresh(self, access_token, album_id):
+        """快取過期時確認版本，有變動才重建；回傳是否重建"""
+        if self._is_fresh(self._meta(album_id), time.time()):
+            self.stats['hits'] += 1
+            return False
+
+        # single flight：同一個相簿同時只有一個請求確認 / 重建，其餘等結果
+        with self._lock_for(album_id):
+            meta = self._meta(album_id)
+            now = time.time()
+            if self._is_fresh(meta, now):
+                self.stats['hits'] += 1
+                return False
+
+            self.stats['checks'] += 1
+            try:
+                etag = str(get_album(access_token, album_id).get('mediaItemsCount', '0'))
+            except GoogleAPIError as e:
+                if e.status_code == 404:
+                    self.forget(album_id)
+                    raise
+                if meta is not None and meta['synced_at'] is not None:
+                    # 暫時無法確認：繼續提供舊快取
+                    print(f"⚠️ 無法確認相簿版本，使用快取: {e}")
+                    return False
+                raise
+
+            if (meta is not None and meta['synced_at'] is not None and meta['etag'] == etag
+                    and now - meta['synced_at'] < GOOGLE_MEDIA_RESYNC_SECONDS):
+                with self.open_db(immediate=True) as conn:
+                    conn.execute("UPDATE google_media_albums SET checked_at = ? WHERE album_id = ?", (now, album_id))
+                    conn.commit()
+                return False
+
+            self._sync(access_token, album_id, etag, (meta['generation'] if meta is not None else 0) + 1)
+            return True
+
+    def _sync(self, access_token, album_id, etag, generation):
+        """以新的 generation 逐頁寫入整個相簿，完成後切換並刪除舊資料"""
+        position = 0
+        newest = None
+        try:
+            for items in iter_album_media(access_token, album_id, SYNC_PAGE_SIZE):
+                rows = [_item_to_row(album_id, generation, position + i, item) for i, item in enumerate(items)]
+                position += len(rows)
+                times = [row[-1] for row in rows if row[-1]]
+                if times:
+                    newest = max(times + ([newest] if newest else []))
+                with self.open_db(immediate=True) as conn:
+                    conn.executemany('''
+                        INSERT INTO google_media_items
+                            (album_id, generation, position, media_id, base_url, product_url,
+                             filename, mime_type, description, creation_time)
+                        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                    ''', rows)
+                    conn.commit()
+        except Exception:
+            self.stats['sync_failed'] += 1
+            with self.open_db(immediate=True) as conn:
+                conn.execute("DELETE FROM google_media_items WHERE album_id = ? AND generation = ?",
+                             (album_id, generation))
+                conn.commit()
+            raise
+
+        now = time.time()
+        with self.open_db(immediate=True) as conn:
+            conn.execute("INSERT OR IGNORE INTO google_media_albums (album_id) VALUES (?)", (album_id,))
+            conn.execute('''
+                UPDATE google_media_albums
+                SET etag = ?, item_count = ?, newest_creation_time = ?, generation = ?,
+                    synced_at = ?, checked_at = ?
+                WHERE album_id = ?
+            ''', (etag, position, newest, generation, now, now, album_id))
+            conn.execute("DELETE FROM google_media_items WHERE album_id = ? AND generation != ?",
+                         (album_id, generation))
+            conn.commit()
+        self.stats['syncs'] += 1
+
+    # ---------- 分頁 ----------
+
+    def page(self, access_token, album_id, cursor=None, limit=25):
+        """
+        從快取取一頁媒體
+
+        Args:
+            cursor: 上一頁回傳的 nextCursor（第一頁為 None）
+
+        Returns:
+            dict: {'mediaItems', 'nextCursor', 'total', 'newestCreationTime', 'syncedAt'}
+        """
+        self.ensure_fresh(access_token, album_id)
+        try:
+            offset = max(0, int(cursor or 0))
+        except ValueError:
+            offset = 0
+        limit = max(1, min(int(limit), MAX_PAGE_LIMIT))
+
+        with self.open_db() as conn:
+            meta = conn.execute("SELECT * FROM google_media_albums WHERE album_id = ?", (album_id,)).fetchone()
+            rows = conn.execute('''
+                SELECT * FROM google_media_items
+                WHERE album_id = ? AND generation = ? AND position >= ?
+                ORDER BY position LIMIT ?
+            ''', (album_id, meta['generation'], offset, limit)).fetchall()
+
+        end = offset + len(rows)
+        return {
+            'mediaItems': [_row_to_item(r) for r in rows],
+            'nextCursor': str(end) if end < meta['item_count'] else None,
+            'total': meta['item_count'],
+            'newestCreationTime': meta['newest_creation_time'],
+            'syncedAt': meta['synced_at'],
+        }
+
+
+media_cache = MediaIndexCache()
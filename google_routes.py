@@ -3,7 +3,7 @@ Google OAuth 路由
 處理授權、回調、API 操作
 """
 
-from flask import Blueprint, request, redirect, session, jsonify, url_for, render_template
+from flask import Blueprint, request, redirect, jsonify, url_for, render_template
 import os
 import base64
 from datetime import datetime
@@ -11,8 +11,10 @@ from google_integration import (
     get_auth_url, exchange_code_for_tokens, refresh_access_token,
     get_user_info, get_or_create_album, upload_photo_to_album,
     list_album_photos, get_or_create_travel_doc, create_formatted_travel_entry,
-    save_checkin_with_photo, upload_to_imgbb, IMGBB_API_KEY
+    save_checkin_with_photo, upload_to_imgbb, IMGBB_API_KEY, GoogleAPIError
 )
+from google_tokens import login_session, logout_session, session_access_token, session_user
+from google_media_cache import media_cache
 
 google_bp = Blueprint('google', __name__, url_prefix='/google')
 
@@ -49,32 +51,31 @@ def google_callback():
                              success=False, 
                              message=f'換取 Token 失敗：{tokens.get("error_description", tokens["error"])}')
     
-    # 儲存到 session
-    session['google_access_token'] = tokens.get('access_token')
-    session['google_refresh_token'] = tokens.get('refresh_token')
-    session['google_token_expiry'] = tokens.get('expires_in')
-    
     # 取得使用者資訊
     user_info = get_user_info(tokens['access_token'])
-    session['google_user'] = {
+    user = {
         'email': user_info.get('email'),
         'name': user_info.get('name'),
         'picture': user_info.get('picture')
     }
     
+    # tokens 存在伺服器端，cookie 只記錄 google_sid
+    login_session(tokens, user)
+    
     return render_template('google_result.html', 
                          success=True, 
                          message='Google 帳號連動成功！',
-                         user=session['google_user'])
+                         user=user)
 
 
 @google_bp.route('/status')
 def google_status():
     """檢查 Google 連動狀態"""
-    if 'google_access_token' in session:
+    user = session_user()
+    if user is not None:
         return jsonify({
             'connected': True,
-            'user': session.get('google_user', {})
+            'user': user
         })
     return jsonify({'connected': False})
 
@@ -82,9 +83,7 @@ def google_status():
 @google_bp.route('/disconnect')
 def google_disconnect():
     """解除 Google 連動"""
-    session.pop('google_access_token', None)
-    session.pop('google_refresh_token', None)
-    session.pop('google_user', None)
+    logout_session()
     return jsonify({'success': True, 'message': '已解除 Google 連動'})
 
 
@@ -93,7 +92,7 @@ def google_disconnect():
 @google_bp.route('/album')
 def get_album():
     """取得走讀圖鑑相簿"""
-    access_token = session.get('google_access_token')
+    access_token = session_access_token()
     if not access_token:
         return jsonify({'error': '請先連動 Google 帳號'}), 401
     
@@ -103,25 +102,33 @@ def get_album():
 
 @google_bp.route('/album/photos')
 def get_album_photos():
-    """取得相簿中的照片"""
-    access_token = session.get('google_access_token')
+    """
+    取得相簿中的照片（從本機媒體索引快取分頁）
+    ?cursor= 帶入上一頁回傳的 nextCursor，?limit= 每頁數量（最多 100）
+    """
+    access_token = session_access_token()
     if not access_token:
         return jsonify({'error': '請先連動 Google 帳號'}), 401
     
-    album = get_or_create_album(access_token)
-    album_id = album.get('id')
+    user = session_user() or {}
+    album_id = media_cache.album_for(access_token, user.get('email'))
     
     if not album_id:
         return jsonify({'error': '無法取得相簿'}), 500
     
-    photos = list_album_photos(access_token, album_id)
-    return jsonify(photos)
+    try:
+        page = media_cache.page(access_token, album_id,
+                                cursor=request.args.get('cursor'),
+                                limit=request.args.get('limit', 25, type=int))
+    except GoogleAPIError as e:
+        return jsonify({'error': f'無法取得相簿照片：{e}'}), 502
+    return jsonify(page)
 
 
 @google_bp.route('/upload', methods=['POST'])
 def upload_photo():
     """上傳照片到走讀圖鑑相簿"""
-    access_token = session.get('google_access_token')
+    access_token = session_access_token()
     if not access_token:
         return jsonify({'error': '請先連動 Google 帳號'}), 401
     
@@ -149,6 +156,7 @@ def upload_photo():
     full_description = f"{spot_name}\n{description}" if description else spot_name
     
     result = upload_photo_to_album(access_token, album_id, image_data, filename, full_description)
+    media_cache.invalidate(album_id)
     
     return jsonify(result)
 
@@ -158,7 +166,7 @@ def upload_photo():
 @google_bp.route('/doc')
 def get_travel_doc():
     """取得旅遊日誌文件"""
-    access_token = session.get('google_access_token')
+    access_token = session_access_token()
     if not access_token:
         return jsonify({'error': '請先連動 Google 帳號'}), 401
     
@@ -174,7 +182,7 @@ def get_travel_doc():
 @google_bp.route('/doc/entry', methods=['POST'])
 def add_doc_entry():
     """新增旅遊記錄到文件"""
-    access_token = session.get('google_access_token')
+    access_token = session_access_token()
     if not access_token:
         return jsonify({'error': '請先連動 Google 帳號'}), 401
     
@@ -212,7 +220,7 @@ def checkin_with_google():
     """
     打卡並同步到 Google 相簿 + 文件
     """
-    access_token = session.get('google_access_token')
+    access_token = session_access_token()
     if not access_token:
         return jsonify({'error': '請先連動 Google 帳號'}), 401
     
@@ -235,6 +243,9 @@ def checkin_with_google():
         access_token, spot_name, location, notes, image_data, filename
     )
     
+    if result.get('photo') and result.get('album', {}).get('id'):
+        media_cache.invalidate(result['album']['id'])
+    
     # 加入文件連結
     if result.get('doc', {}).get('documentId'):
         result['doc_url'] = f"https://docs.google.com/document/d/{result['doc']['documentId']}/edit"
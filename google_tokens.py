@@ -0,0 +1,201 @@
+"""
+Google OAuth token 伺服器端儲存
+- cookie 只保存不透明的 google_sid；access / refresh token、到期時間與使用者資訊存在 google_tokens 資料表
+- 取用時距離到期不到 GOOGLE_TOKEN_REFRESH_MARGIN 秒就先刷新，API 呼叫不會拿到過期的 token
+- 刷新為 single flight：同一行程內以分段鎖排隊，跨 worker 以資料表上的租約（refresh_lease_until）
+  確保同一時間只有一個請求呼叫 token endpoint，其餘請求沿用尚未過期的舊 token 或等待刷新結果
+
+環境變數：
+    GOOGLE_TOKEN_REFRESH_MARGIN  提前刷新的秒數（預設 300）
+"""
+
+import os
+import time
+import zlib
+import secrets
+import threading
+from flask import session
+from google_integration import refresh_access_token
+
+GOOGLE_TOKEN_REFRESH_MARGIN = float(os.environ.get('GOOGLE_TOKEN_REFRESH_MARGIN', '300'))
+
+# 刷新租約秒數（持有租約的 worker 當掉時，過期後其他 worker 可接手）
+REFRESH_LEASE_SECONDS = 30
+# token 已過期且其他 worker 正在刷新時，最多等待的秒數
+REFRESH_WAIT_SECONDS = 10
+REFRESH_POLL_SECONDS = 0.1
+# 分段鎖數量（同一個 sid 固定落在同一把鎖）
+LOCK_STRIPES = 64
+
+
+class GoogleTokenStore:
+    """google_tokens 資料表的存取與刷新（open_db 由 app 注入，與 get_db 相同介面）"""
+
+    def __init__(self, open_db=None):
+        self.open_db = open_db
+        self._locks = [threading.Lock() for _ in range(LOCK_STRIPES)]
+        self.stats = {'refreshed': 0, 'refresh_failed': 0, 'waited': 0}
+
+    def configure(self, open_db):
+        self.open_db = open_db
+
+    def _lock_for(self, sid):
+        return self._locks[zlib.crc32(sid.encode('utf-8')) % LOCK_STRIPES]
+
+    def _load(self, sid):
+        with self.open_db() as conn:
+            return conn.execute("SELECT * FROM google_tokens WHERE session_id = ?", (sid,)).fetchone()
+
+    def create(self, tokens, user_info=None, expires_at=None):
+        """儲存新取得的 tokens，回傳 session id"""
+        sid = secrets.token_urlsafe(32)
+        user_info = user_info or {}
+        if expires_at is None:
+            expires_at = time.time() + float(tokens.get('expires_in') or 3600)
+        with self.open_db(immediate=True) as conn:
+            conn.execute('''
+                INSERT INTO google_tokens
+                    (session_id, access_token, refresh_token, expires_at, email, name, picture)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''', (sid, tokens.get('access_token'), tokens.get('refresh_token'), expires_at,
+                  user_info.get('email'), user_info.get('name'), user_info.get('picture')))
+            conn.commit()
+        return sid
+
+    def delete(self, sid):
+        with self.open_db(immediate=True) as conn:
+            conn.execute("DELETE FROM google_tokens WHERE session_id = ?", (sid,))
+            conn.commit()
+
+    def get_user(self, sid):
+        row = self._load(sid)
+        if row is None:
+            return None
+        return {'email': row['email'], 'name': row['name'], 'picture': row['picture']}
+
+    def get_access_token(self, sid):
+        """取得有效的 access token（快到期時先刷新），無法取得時回傳 None"""
+        row = self._load(sid)
+        if row is None:
+            return None
+        if row['expires_at'] - time.time() > GOOGLE_TOKEN_REFRESH_MARGIN:
+            return row['access_token']
+        with self._lock_for(sid):
+            return self._refresh(sid)
+
+    def _acquire_lease(self, sid, now):
+        with self.open_db(immediate=True) as conn:
+            cursor = conn.execute('''
+                UPDATE google_tokens SET refresh_lease_until = ?
+                WHERE session_id = ? AND (refresh_lease_until IS NULL OR refresh_lease_until < ?)
+            ''', (now + REFRESH_LEASE_SECONDS, sid, now))
+            conn.commit()
+            return cursor.rowcount == 1
+
+    def _refresh(self, sid):
+        deadline = time.monotonic() + REFRESH_WAIT_SECONDS
+        while True:
+            row = self._load(sid)
+            if row is None:
+                return None
+            now = time.time()
+            # 排在前面的請求（或其他 worker）已經刷新過
+            if row['expires_at'] - now > GOOGLE_TOKEN_REFRESH_MARGIN:
+                return row['access_token']
+            if not row['refresh_token']:
+                return row['access_token'] if row['expires_at'] > now else None
+            if self._acquire_lease(sid, now):
+                break
+            # 其他 worker 正在刷新：舊 token 還沒過期就先用
+            if row['expires_at'] > now:
+                return row['access_token']
+            if time.monotonic() >= deadline:
+                return None
+            self.stats['waited'] += 1
+            time.sleep(REFRESH_POLL_SECONDS)
+
+        try:
+            tokens = refresh_access_token(row['refresh_token'])
+        except Exception as e:
+            tokens = {'error': str(e)}
+
+        if tokens.get('access_token'):
+            expires_at = time.time() + float(tokens.get('expires_in') or 3600)
+            with self.open_db(immediate=True) as conn:
+                # Google 可能發新的 refresh token（rotation），沒有則沿用
+                conn.execute('''
+                    UPDATE google_tokens
+                    SET access_token = ?, refresh_token = COALESCE(?, refresh_token), expires_at = ?,
+                        refresh_lease_until = NULL, updated_at = CURRENT_TIMESTAMP
+                    WHERE session_id = ?
+                ''', (tokens['access_token'], tokens.get('refresh_token'), expires_at, sid))
+                conn.commit()
+            self.stats['refreshed'] += 1
+            return tokens['access_token']
+
+        self.stats['refresh_failed'] += 1
+        print(f"⚠️ Google token 刷新失敗: {tokens.get('error_description', tokens.get('error'))}")
+        with self.open_db(immediate=True) as conn:
+            if tokens.get('error') == 'invalid_grant':
+                # refresh token 已被撤銷，需重新授權
+                conn.execute("DELETE FROM google_tokens WHERE session_id = ?", (sid,))
+            else:
+                conn.execute("UPDATE google_tokens SET refresh_lease_until = NULL WHERE session_id = ?", (sid,))
+            conn.commit()
+        return row['access_token'] if row['expires_at'] > time.time() else None
+
+
+token_store = GoogleTokenStore()
+
+
+# ==================== Flask session ====================
+
+def _pop_legacy_session():
+    """移除舊版直接存在 cookie 內的 token 與使用者資訊"""
+    session.pop('google_token_expiry', None)
+    return (session.pop('google_access_token', None), session.pop('google_refresh_token', None),
+            session.pop('google_user', None))
+
+
+def _migrate_legacy_session():
+    """舊版 cookie 內直接存放 token：搬到伺服器端，cookie 改存 google_sid"""
+    access_token, refresh_token, user_info = _pop_legacy_session()
+    if access_token and 'google_sid' not in session:
+        # 不知道舊 token 何時簽發：視為快到期，下次取用時刷新
+        session['google_sid'] = token_store.create(
+            {'access_token': access_token, 'refresh_token': refresh_token}, user_info,
+            expires_at=time.time() + 60
+        )
+
+
+def login_session(tokens, user_info):
+    """OAuth 完成：儲存 tokens 並在 cookie 記錄 google_sid"""
+    _pop_legacy_session()
+    old_sid = session.get('google_sid')
+    if old_sid:
+        token_store.delete(old_sid)
+    session['google_sid'] = token_store.create(tokens, user_info)
+
+
+def logout_session():
+    _pop_legacy_session()
+    sid = session.pop('google_sid', None)
+    if sid:
+        token_store.delete(sid)
+
+
+def session_access_token():
+    """目前 session 的有效 access token（未連動或無法刷新時回傳 None）"""
+    if 'google_access_token' in session:
+        _migrate_legacy_session()
+    sid = session.get('google_sid')
+    if not sid:
+        return None
+    return token_store.get_access_token(sid)
+
+
+def session_user():
+    if 'google_access_token' in session:
+        _migrate_legacy_session()
+    sid = session.get('google_sid')
+    return token_store.get_user(sid) if sid else None
@@ -0,0 +1,240 @@
+"""
+收集分數排行榜
+- 分數 = 已打卡景點的稀有度權重總和（普通 1、稀有 3、史詩 8、傳說 20）
+- user_scores 在打卡 / 取消的同一個交易內增減（全台 region='' 與該景點所在地區各一筆），不必對 checkins 做 GROUP BY
+- 每個 worker 為每個地區維護一棵以分數為索引的 Fenwick tree（各分數的人數），
+  名次 = 分數比自己高的人數 + 1，查詢與更新都是 O(log 最高分)
+- 前 N 名直接走 user_scores(region, score) 索引
+- 其他 worker 的打卡 / 取消經由 change_bus 得知，只重新載入受影響用戶的分數
+"""
+
+import threading
+from change_bus import change_bus, record_change
+
+RARITY_POINTS = {'common': 1, 'rare': 3, 'epic': 8, 'legendary': 20}
+
+# 全台排行使用的 region 值
+OVERALL = ''
+
+# 每次 IN (...) 重新載入的用戶數
+RELOAD_CHUNK = 500
+# 前 N 名的上限
+MAX_TOP = 100
+
+POINTS_SQL = ("CASE s.rarity WHEN 'rare' THEN 3 WHEN 'epic' THEN 8 "
+              "WHEN 'legendary' THEN 20 ELSE 1 END")
+
+
+def rarity_points(rarity):
+    return RARITY_POINTS.get(rarity, RARITY_POINTS['common'])
+
+
+def mask_user_id(user_id):
+    """排行榜上不顯示完整的 LINE user id"""
+    if not user_id or len(user_id) <= 8:
+        return user_id
+    return f"{user_id[:4]}…{user_id[-3:]}"
+
+
+# ==================== 寫入 ====================
+
+def apply_checkin(conn, user_id, spot, delta):
+    """打卡（delta=1）或取消（delta=-1）時更新分數，需與打卡寫入在同一交易內（spot 含 rarity、region）"""
+    points = rarity_points(spot['rarity']) * delta
+    regions = [OVERALL] + ([spot['region']] if spot['region'] else [])
+    for region in regions:
+        conn.execute('''
+            INSERT INTO user_scores (user_id, region, score, checkin_count) VALUES (?, ?, ?, ?)
+            ON CONFLICT (user_id, region) DO UPDATE SET
+                score = user_scores.score + excluded.score,
+                checkin_count = user_scores.checkin_count + excluded.checkin_count
+        ''', (user_id, region, points, delta))
+    if delta < 0:
+        conn.execute("DELETE FROM user_scores WHERE user_id = ? AND checkin_count <= 0", (user_id,))
+
+
+def rebuild_scores(conn):
+    """由 checkins 重新計算所有分數（大量匯入或初次升級時使用），由呼叫端 commit"""
+    conn.execute("DELETE FROM user_scores")
+    conn.execute(f'''
+        INSERT INTO user_scores (user_id, region, score, checkin_count)
+        SELECT c.user_id, '', SUM({POINTS_SQL}), COUNT(*)
+        FROM checkins c JOIN spots s ON c.spot_id = s.id
+        GROUP BY c.user_id
+    ''')
+    conn.execute(f'''
+        INSERT INTO user_scores (user_id, region, score, checkin_count)
+        SELECT c.user_id, r.region, SUM({POINTS_SQL}), COUNT(*)
+        FROM checkins c JOIN spots s ON c.spot_id = s.id JOIN routes r ON s.route_id = r.id
+        WHERE r.region IS NOT NULL AND r.region != ''
+        GROUP BY c.user_id, r.region
+    ''')
+    # 所有用戶的分數都可能改變：各 worker 重建
+    record_change(conn, 'user')
+
+
+# ==================== 名次 ====================
+
+class FenwickTree:
+    """索引為分數、值為該分數人數的 Fenwick tree（binary indexed tree）"""
+
+    def __init__(self, size):
+        self.size = size
+        self._tree = [0] * (size + 1)
+
+    def add(self, index, delta):
+        if index < 0:
+            # i 會停在 0（i += i & -i 不會前進），迴圈永遠不結束
+            raise ValueError(f'分數不可為負: {index}')
+        i = index + 1
+        while i <= self.size:
+            self._tree[i] += delta
+            i += i & -i
+
+    def prefix(self, index):
+        """分數 0..index 的人數"""
+        i = min(index, self.size - 1) + 1
+        total = 0
+        while i > 0:
+            total += self._tree[i]
+            i -= i & -i
+        return total
+
+
+class RegionBoard:
+    """單一地區：用戶分數與分數分布"""
+
+    def __init__(self, max_score):
+        self.scores = {}
+        self.tree = FenwickTree(max_score + 1)
+
+    def _grow(self, score):
+        size = self.tree.size
+        while score >= size:
+            size *= 2
+        tree = FenwickTree(size)
+        for value in self.scores.values():
+            tree.add(value, 1)
+        self.tree = tree
+
+    def set(self, user_id, score):
+        """score <= 0 視為沒有分數（景點稀有度調高後取消打卡，扣回的分數可能比當初加的多）"""
+        old = self.scores.pop(user_id, None)
+        if old is not None:
+            self.tree.add(old, -1)
+        if score > 0:
+            if score >= self.tree.size:
+                self._grow(score)
+            self.scores[user_id] = score
+            self.tree.add(score, 1)
+
+    def rank(self, score):
+        """競賽排名：分數比自己高的人數 + 1"""
+        return len(self.scores) - self.tree.prefix(score) + 1
+
+
+class Leaderboard:
+    """各地區排行（open_db 由 app 注入）"""
+
+    def __init__(self, open_db=None):
+        self.open_db = open_db
+        self._lock = threading.Lock()
+        self._boards = None
+        self._dirty = set()
+        self.stats = {'builds': 0, 'reloaded_users': 0}
+        change_bus.subscribe('user', self._mark_dirty)
+
+    def configure(self, open_db):
+        self.open_db = open_db
+
+    def reset(self):
+        """丟棄行程內的排名，下次查詢時重建"""
+        self._mark_dirty(None)
+
+    def _mark_dirty(self, user_id):
+        with self._lock:
+            if user_id is None:
+                self._boards = None
+                self._dirty.clear()
+            elif self._boards is not None:
+                self._dirty.add(user_id)
+
+    def _build(self, conn):
+        max_score = conn.execute(
+            f"SELECT COALESCE(SUM({POINTS_SQL}), 0) FROM spots s"
+        ).fetchone()[0]
+        boards = {}
+        for row in conn.execute("SELECT user_id, region, score FROM user_scores"):
+            board = boards.get(row[1])
+            if board is None:
+                board = boards[row[1]] = RegionBoard(max_score)
+            board.set(row[0], row[2])
+        self._boards = boards
+        self._max_score = max_score
+        self.stats['builds'] += 1
+
+    def _reload(self, conn, user_ids):
+        user_ids = list(user_ids)
+        for start in range(0, len(user_ids), RELOAD_CHUNK):
+            chunk = user_ids[start:start + RELOAD_CHUNK]
+            placeholders = ','.join('?' * len(chunk))
+            current = {}
+            for row in conn.execute(
+                f"SELECT user_id, region, score FROM user_scores WHERE user_id IN ({placeholders})", chunk
+            ):
+                current[(row[0], row[1])] = row[2]
+            for board_region, board in self._boards.items():
+                for user_id in chunk:
+                    board.set(user_id, current.pop((user_id, board_region), 0))
+            # 第一次出現的地區
+            for (user_id, region), score in current.items():
+                if region not in self._boards:
+                    self._boards[region] = RegionBoard(self._max_score)
+                self._boards[region].set(user_id, score)
+        self.stats['reloaded_users'] += len(user_ids)
+
+    def _sync(self):
+        """呼叫端持有 self._lock"""
+        if self._boards is not None and not self._dirty:
+            return
+        with self.open_db() as conn:
+            if self._boards is None:
+                self._build(conn)
+            else:
+                dirty, self._dirty = self._dirty, set()
+                self._reload(conn, dirty)
+
+    def rank(self, user_id, region=OVERALL):
+        """用戶在地區內的名次，沒有分數時回傳 None"""
+        change_bus.poll()
+        with self._lock:
+            self._sync()
+            board = self._boards.get(region)
+            score = board.scores.get(user_id) if board else None
+            if score is None:
+                return None
+            return {'rank': board.rank(score), 'score': score, 'total': len(board.scores)}
+
+    def top(self, region=OVERALL, limit=10):
+        """前 N 名（同分同名次）"""
+        limit = max(1, min(int(limit), MAX_TOP))
+        change_bus.poll()
+        with self.open_db() as conn:
+            rows = conn.execute('''
+                SELECT user_id, score, checkin_count FROM user_scores
+                WHERE region = ? AND score > 0 ORDER BY score DESC, user_id LIMIT ?
+            ''', (region, limit)).fetchall()
+        with self._lock:
+            self._sync()
+            board = self._boards.get(region)
+            total = len(board.scores) if board else 0
+            entries = [{
+                'rank': board.rank(row['score']) if board else i + 1,
+                'user_id': row['user_id'],
+                'score': row['score'],
+                'checkins': row['checkin_count'],
+            } for i, row in enumerate(rows)]
+        return entries, total
+
+
+leaderboard = Leaderboard()
@@ -0,0 +1,197 @@
+"""
+退休走讀 - LINE webhook 壓測工具
+以固定速率（open-loop）對 /callback 送出簽章後的混合指令流量
+
+- 以 LINE_CHANNEL_SECRET 簽章，和正式 LINE 平台送來的 webhook 相同
+- 延遲從「排定送出時間」起算，server 排隊變慢時不會低估（避免 coordinated omission）
+- 搭配 fake_line_api.py 時，會一併回報 reply 失敗與 safe_reply 降級為 push 的比例
+
+用法：
+    python fake_line_api.py --port 9000 --token-ttl 30 --latency-ms 40 &
+    LINE_API_HOST=http://127.0.0.1:9000 gunicorn -w 4 app:app &
+    python line_loadgen.py --target http://127.0.0.1:8000 --fake-api http://127.0.0.1:9000 --rate 50 --duration 30
+"""
+
+import os
+import json
+import time
+import random
+import sqlite3
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from fake_line_api import sign_body, build_text_webhook, make_reply_token, percentile
+
+# 預設指令組合（權重大致依正式環境的使用比例）
+DEFAULT_MIX = {
+    '選單': 15, '圖鑑': 20, '願望': 12, '路線': 10, '成就': 8, '統計': 10,
+    '北部': 4, '中部': 3, '網頁': 5, '新增 {place}': 5, '完成 {place}': 3, '{place}': 5,
+}
+
+SAMPLE_PLACES = ['阿里山', '太魯閣', '日月潭', '九份', '淡水', '鹿港', '墾丁', '合歡山']
+
+
+def parse_mix(text):
+    """解析 "選單=10,圖鑑=20" 形式的指令權重"""
+    if not text:
+        return dict(DEFAULT_MIX)
+    mix = {}
+    for part in text.split(','):
+        command, _, weight = part.partition('=')
+        mix[command.strip()] = float(weight or 1)
+    return mix
+
+
+def load_user_ids(db_path, limit):
+    """從資料庫挑出有打卡紀錄的用戶（讓查詢打到真實資料量）"""
+    conn = sqlite3.connect(db_path)
+    try:
+        rows = conn.execute('''
+            SELECT user_id FROM checkins GROUP BY user_id ORDER BY COUNT(*) DESC LIMIT ?
+        ''', (limit,)).fetchall()
+    finally:
+        conn.close()
+    return [r[0] for r in rows]
+
+
+class LoadGenerator:
+    """依目標速率排程送出 webhook，並收集結果"""
+
+    def __init__(self, args, user_ids, mix):
+        self.args = args
+        self.user_ids = user_ids
+        self.commands = list(mix.keys())
+        self.weights = list(mix.values())
+        self.rng = random.Random(args.seed)
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=args.concurrency)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.lock = threading.Lock()
+        self.latencies = []
+        self.status_counts = {}
+
+    def next_message(self):
+        command = self.rng.choices(self.commands, weights=self.weights)[0]
+        text = command.format(place=self.rng.choice(SAMPLE_PLACES))
+        return self.rng.choice(self.user_ids), text
+
+    def send(self, scheduled_at, user_id, text):
+        # token_age 模擬 webhook 延遲送達（token 一送到就已經過了一段時間）
+        reply_token = make_reply_token(time.time() - self.args.token_age)
+        body = build_text_webhook(user_id, text, reply_token)
+        try:
+            response = self.session.post(
+                self.args.target.rstrip('/') + '/callback',
+                data=body.encode('utf-8'),
+                headers={'Content-Type': 'application/json',
+                         'X-Line-Signature': sign_body(self.args.secret, body)},
+                timeout=self.args.timeout,
+            )
+            status = str(response.status_code)
+        except requests.RequestException as e:
+            status = type(e).__name__
+        elapsed = (time.perf_counter() - scheduled_at) * 1000
+
+        with self.lock:
+            self.latencies.append(elapsed)
+            self.status_counts[status] = self.status_counts.get(status, 0) + 1
+
+    def run(self):
+        interval = 1.0 / self.args.rate
+        total = int(self.args.rate * self.args.duration)
+        start = time.perf_counter()
+
+        with ThreadPoolExecutor(max_workers=self.args.concurrency) as executor:
+            for i in range(total):
+                scheduled_at = start + i * interval
+                delay = scheduled_at - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                user_id, text = self.next_message()
+                executor.submit(self.send, scheduled_at, user_id, text)
+
+        wall = time.perf_counter() - start
+        latencies = sorted(self.latencies)
+        ok = self.status_counts.get('200', 0)
+        return {
+            'sent': total,
+            'wall_seconds': round(wall, 2),
+            'achieved_rps': round(total / wall, 2),
+            'status': dict(sorted(self.status_counts.items())),
+            'error_rate': round(1 - ok / total, 4) if total else 0.0,
+            'latency_ms': {
+                'p50': round(percentile(latencies, 50), 2),
+                'p95': round(percentile(latencies, 95), 2),
+                'p99': round(percentile(latencies, 99), 2),
+                'max': round(latencies[-1], 2) if latencies else 0.0,
+            },
+        }
+
+
+def fake_api_call(base_url, path, method='get'):
+    try:
+        response = getattr(requests, method)(base_url.rstrip('/') + path, timeout=5)
+        return response.json()
+    except (requests.RequestException, ValueError) as e:
+        print(f"⚠️ 無法連到 LINE API 模擬伺服器: {e}")
+        return None
+
+
+def print_report(result, line_stats):
+    latency = result['latency_ms']
+    print(f"\n📊 送出 {result['sent']:,} 則（{result['achieved_rps']} req/s，{result['wall_seconds']} 秒）")
+    print(f"   狀態碼: {result['status']}")
+    print(f"   端到端延遲 p50 {latency['p50']} ms / p95 {latency['p95']} ms / p99 {latency['p99']} ms"
+          f" / max {latency['max']} ms")
+    if line_stats:
+        counts = line_stats['counts']
+        print(f"   reply 成功 {counts['reply_ok']:,}、過期 {counts['reply_expired']:,}、"
+              f"重複 {counts['reply_reused']:,}、429 {counts['throttled']:,}")
+        print(f"   safe_reply 降級為 push 的比例: {line_stats['push_fallback_rate']:.2%}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='LINE webhook 壓測工具')
+    parser.add_argument('--target', default='http://127.0.0.1:5000', help='app 位址')
+    parser.add_argument('--fake-api', help='fake_line_api.py 位址（回報 reply / push 統計）')
+    parser.add_argument('--secret', default=os.environ.get('LINE_CHANNEL_SECRET', ''), help='預設讀 LINE_CHANNEL_SECRET')
+    parser.add_argument('--rate', type=float, default=20, help='每秒送出的 webhook 數')
+    parser.add_argument('--duration', type=float, default=30, help='秒數')
+    parser.add_argument('--concurrency', type=int, default=64, help='同時進行中的請求上限')
+    parser.add_argument('--timeout', type=float, default=30)
+    parser.add_argument('--mix', help='指令權重，例如 "選單=10,圖鑑=20,{place}=5"（{place} 代入地名）')
+    parser.add_argument('--db', help='從資料庫挑選真實用戶 ID（例如 gen_dataset 產生的檔案）')
+    parser.add_argument('--users', type=int, default=200, help='模擬的用戶數')
+    parser.add_argument('--token-age', type=float, default=0.0, help='reply token 送達時已經過的秒數')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--json', help='將結果寫入 JSON 檔')
+    args = parser.parse_args(argv)
+    if not args.secret:
+        parser.error('需要 --secret 或 LINE_CHANNEL_SECRET')
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    user_ids = load_user_ids(args.db, args.users) if args.db else []
+    if not user_ids:
+        user_ids = [f"Uload{i:027d}" for i in range(args.users)]
+
+    if args.fake_api:
+        fake_api_call(args.fake_api, '/__reset', 'post')
+
+    print(f"🚀 {args.rate:g} req/s × {args.duration:g} 秒 → {args.target}/callback（{len(user_ids)} 位用戶）")
+    result = LoadGenerator(args, user_ids, parse_mix(args.mix)).run()
+    line_stats = fake_api_call(args.fake_api, '/__stats') if args.fake_api else None
+    print_report(result, line_stats)
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({'callback': result, 'line_api': line_stats}, f, ensure_ascii=False, indent=2)
+    return result
+
+
+if __name__ == '__main__':
+    main()
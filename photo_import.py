@@ -0,0 +1,423 @@
+"""
+相簿批次匯入：依照片 EXIF 的 GPS 自動打卡
+- 上傳時每張照片直接寫到暫存目錄（不整批留在記憶體），建立 import_jobs 後立刻回應
+- 背景執行緒逐批處理（每批 IMPORT_BATCH_SIZE 張）：
+    1. 行程池讀 EXIF（只讀檔案開頭，見 exif.py）
+    2. 以景點格網索引找半徑 IMPORT_MATCH_RADIUS_M 內最近的景點
+    3. 整批打卡在同一個交易內寫入（打卡日期為拍攝日期），並更新工作進度與每張照片的結果
+- 同一個匯入內多張照片對到同一景點時只打卡第一張；已打卡過的景點回報 duplicate
+- GET /api/import/<job_id> 查詢進度與每張照片的結果
+- 處理中的行程持有暫存目錄的檔案鎖（行程結束時系統自動釋放）；啟動時 recover 接手沒有行程持有的
+  queued / running 工作，從未處理的照片繼續，暫存照片已不在的工作標記 failed，並刪除沒有工作的暫存目錄
+  （多台主機處理匯入時 IMPORT_STAGING_DIR 需共用）
+
+環境變數：
+    IMPORT_MATCH_RADIUS_M   照片與景點的最大距離（公尺，預設 300）
+    IMPORT_BATCH_SIZE       每批處理的照片數（預設 50）
+    IMPORT_PROCESSES        讀 EXIF 的行程數（預設 2，0 = 在背景執行緒內直接讀）
+    IMPORT_MAX_FILES        單次匯入的照片上限（預設 500）
+    IMPORT_STAGING_DIR      上傳暫存目錄（預設系統暫存目錄下的 retire_import）
+"""
+
+import os
+import math
+import time
+import uuid
+import shutil
+import tempfile
+import threading
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from exif import read_exif
+from upload_store import upload_store
+
+try:
+    import fcntl
+except ImportError:  # Windows：沒有 flock，只適用單一行程
+    fcntl = None
+
+IMPORT_MATCH_RADIUS_M = float(os.environ.get('IMPORT_MATCH_RADIUS_M', '300'))
+IMPORT_BATCH_SIZE = int(os.environ.get('IMPORT_BATCH_SIZE', '50'))
+IMPORT_PROCESSES = int(os.environ.get('IMPORT_PROCESSES', '2'))
+IMPORT_MAX_FILES = int(os.environ.get('IMPORT_MAX_FILES', '500'))
+IMPORT_STAGING_DIR = os.environ.get('IMPORT_STAGING_DIR', os.path.join(tempfile.gettempdir(), 'retire_import'))
+
+# 暫存目錄內的鎖檔；沒有工作且超過寬限期（秒）的暫存目錄才視為孤兒（建立工作時先建目錄再上鎖）
+STAGING_LOCK = '.lock'
+ORPHAN_GRACE_SECONDS = 60
+
+# 可匯入的副檔名（EXIF 只解析 JPEG）
+ALLOWED_EXTENSIONS = {'jpg', 'jpeg'}
+EARTH_RADIUS_M = 6371000.0
+METERS_PER_DEGREE = 111320.0
+# 景點格網的格子大小（度，約 1 公里）
+GRID_CELL_DEGREES = 0.01
+
+# 工作狀態
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+
+def haversine_m(lat1, lng1, lat2, lng2):
+    p1, p2 = math.radians(lat1), math.radians(lat2)
+    dp = p2 - p1
+    dl = math.radians(lng2 - lng1)
+    a = math.sin(dp / 2) ** 2 + math.cos(p1) * math.cos(p2) * math.sin(dl / 2) ** 2
+    return 2 * EARTH_RADIUS_M * math.asin(math.sqrt(a))
+
+
+def lock_staging(staging):
+    """鎖住工作的暫存目錄，回傳持有鎖的檔案；目錄已不在或已被其他行程鎖住時回傳 None"""
+    try:
+        handle = open(os.path.join(staging, STAGING_LOCK), 'a')
+    except OSError:
+        return None
+    if fcntl is not None:
+        try:
+            fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            handle.close()
+            return None
+    return handle
+
+
+class SpotGrid:
+    """景點的格網索引：只比對照片附近格子內的景點"""
+
+    def __init__(self, spots, cell=GRID_CELL_DEGREES):
+        self.cell = cell
+        self.cells = {}
+        for spot in spots:
+            if spot['lat'] is None or spot['lng'] is None:
+                continue
+            key = (math.floor(spot['lat'] / cell), math.floor(spot['lng'] / cell))
+            self.cells.setdefault(key, []).append(spot)
+
+    def nearest(self, lat, lng, radius_m):
+        """半徑內最近的景點，回傳 (spot, 距離公尺)，沒有時回傳 (None, None)"""
+        lat_cells = math.ceil(radius_m / METERS_PER_DEGREE / self.cell)
+        lng_span = radius_m / (METERS_PER_DEGREE * max(math.cos(math.radians(lat)), 0.01))
+        lng_cells = math.ceil(lng_span / self.cell)
+        row, col = math.floor(lat / self.cell), math.floor(lng / self.cell)
+
+        best, best_distance = None, None
+        for r in range(row - lat_cells, row + lat_cells + 1):
+            for c in range(col - lng_cells, col + lng_cells + 1):
+                for spot in self.cells.get((r, c), ()):
+                    distance = haversine_m(lat, lng, spot['lat'], spot['lng'])
+                    if distance <= radius_m and (best_distance is None or distance < best_distance):
+                        best, best_distance = spot, distance
+        return best, best_distance
+
+
+class PhotoImporter:
+    """
+    匯入工作的建立與執行（由 app 注入資料庫與打卡函式）
+    insert_checkin(conn, user_id, spot_id, note, photo_url, checkin_date=...) 與 app.insert_checkin 相同
+    """
+
+    def __init__(self):
+        self.open_db = None
+        self.run_write = None
+        self.insert_checkin = None
+        self.after_import = None
+        self.upload_dir = None
+        self._jobs = None
+        self._pool = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def configure(self, open_db, run_write, insert_checkin, upload_dir, after_import=None):
+        self.open_db = open_db
+        self.run_write = run_write
+        self.insert_checkin = insert_checkin
+        self.upload_dir = upload_dir
+        self.after_import = after_import
+
+    def _executors(self):
+        """工作執行緒與 EXIF 行程池（fork 後在各 worker 內重新建立）"""
+        with self._lock:
+            if self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._jobs = ThreadPoolExecutor(max_workers=1, thread_name_prefix='photo-import')
+                self._pool = None
+                if IMPORT_PROCESSES > 0:
+                    # 背景執行緒中 fork 可能複製到被鎖住的 lock，改用 forkserver / spawn 建立子行程
+                    methods = multiprocessing.get_all_start_methods()
+                    context = multiprocessing.get_context('forkserver' if 'forkserver' in methods else 'spawn')
+                    self._pool = ProcessPoolExecutor(max_workers=IMPORT_PROCESSES, mp_context=context)
+            return self._jobs, self._pool
+
+    # ---------- 建立工作 ----------
+
+    def create_job(self, user_id, files, radius_m=None):
+        """
+        將上傳的照片寫入暫存目錄並排入背景工作
+
+        Args:
+            files: werkzeug FileStorage 列表
+
+        Returns:
+            dict: 工作狀態（含 id）
+        """
+        job_id = uuid.uuid4().hex
+        staging = os.path.join(IMPORT_STAGING_DIR, job_id)
+        os.makedirs(staging, exist_ok=True)
+        lock = lock_staging(staging)
+        radius_m = radius_m or IMPORT_MATCH_RADIUS_M
+
+        items = []
+        for position, storage in enumerate(files):
+            filename = os.path.basename(storage.filename or f'photo_{position}.jpg')
+            ext = filename.rsplit('.', 1)[-1].lower() if '.' in filename else ''
+            if ext not in ALLOWED_EXTENSIONS:
+                items.append((job_id, position, filename, 'invalid', '只支援 JPEG 照片'))
+                continue
+            # FileStorage.save 分段寫檔，大檔不會整個讀進記憶體
+            storage.save(os.path.join(staging, f'{position}.{ext}'))
+            items.append((job_id, position, filename, 'pending', None))
+
+        def insert(conn):
+            conn.execute('''
+                INSERT INTO import_jobs (id, user_id, status, radius_m, total, processed)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', (job_id, user_id, QUEUED, radius_m, len(items),
+                  sum(1 for item in items if item[3] != 'pending')))
+            conn.executemany('''
+                INSERT INTO import_job_items (job_id, position, filename, status, message)
+                VALUES (?, ?, ?, ?, ?)
+            ''', items)
+        self.run_write(insert)
+
+        jobs, _ = self._executors()
+        jobs.submit(self._run, job_id, user_id, staging, radius_m, lock)
+        return self.status(job_id, user_id)
+
+    # ---------- 重啟後接手 ----------
+
+    def recover(self):
+        """
+        接手行程重啟時中斷的工作並清除孤兒暫存目錄（啟動時呼叫，多個 worker 同時執行也安全）
+
+        Returns:
+            dict: {'resumed': 重新排入數, 'failed': 標記失敗數, 'removed': 刪除的暫存目錄數}
+        """
+        with self.open_db() as conn:
+            active = conn.execute(
+                "SELECT id, user_id, radius_m FROM import_jobs WHERE status IN (?, ?)", (QUEUED, RUNNING)
+            ).fetchall()
+        result = {'resumed': 0, 'failed': 0, 'removed': 0}
+        for job in active:
+            staging = os.path.join(IMPORT_STAGING_DIR, job['id'])
+            if not os.path.isdir(staging):
+                result['failed'] += self._fail_lost(job['id'])
+                continue
+            lock = lock_staging(staging)
+            if lock is None:
+                continue  # 其他行程正在處理
+            jobs, _ = self._executors()
+            jobs.submit(self._run, job['id'], job['user_id'], staging, job['radius_m'], lock)
+            result['resumed'] += 1
+
+        active_ids = {job['id'] for job in active}
+        now = time.time()
+        names = os.listdir(IMPORT_STAGING_DIR) if os.path.isdir(IMPORT_STAGING_DIR) else []
+        for name in names:
+            staging = os.path.join(IMPORT_STAGING_DIR, name)
+            if name in active_ids or not os.path.isdir(staging):
+                continue
+            if now - os.path.getmtime(staging) < ORPHAN_GRACE_SECONDS:
+                continue
+            lock = lock_staging(staging)
+            if lock is None:
+                continue
+            shutil.rmtree(staging, ignore_errors=True)
+            lock.close()
+            result['removed'] += 1
+
+        if any(result.values()):
+            print(f"♻️ 相簿匯入：接手 {result['resumed']} 個中斷的工作，"
+                  f"{result['failed']} 個暫存照片已遺失，清除 {result['removed']} 個暫存目錄")
+        return result
+
+    def _fail_lost(self, job_id):
+        """暫存照片已不在的工作：未處理的照片與工作都標記失敗（查詢後已完成的工作不動）"""
+        message = '匯入中斷，暫存照片已遺失'
+
+        def write(conn):
+            cursor = conn.execute('''
+                UPDATE import_jobs SET status = ?, error = ?, processed = total,
+                    updated_at = CURRENT_TIMESTAMP, finished_at = CURRENT_TIMESTAMP
+                WHERE id = ? AND status IN (?, ?)
+            ''', (FAILED, message, job_id, QUEUED, RUNNING))
+            if not cursor.rowcount:
+                return 0
+            conn.execute('''
+                UPDATE import_job_items SET status = 'invalid', message = ?
+                WHERE job_id = ? AND status = 'pending'
+            ''', (message, job_id))
+            return 1
+        return self.run_write(write)
+
+    # ---------- 執行 ----------
+
+    def _load_spots(self):
+        with self.open_db() as conn:
+            return [dict(r) for r in conn.execute("SELECT id, name, lat, lng FROM spots").fetchall()]
+
+    def _pending(self, job_id, after, limit):
+        with self.open_db() as conn:
+            return conn.execute('''
+                SELECT position, filename FROM import_job_items
+                WHERE job_id = ? AND status = 'pending' AND position > ?
+                ORDER BY position LIMIT ?
+            ''', (job_id, after, limit)).fetchall()
+
+    def _set_status(self, job_id, status, error=None):
+        finished = status in (DONE, FAILED)
+        self.run_write(lambda conn: conn.execute(f'''
+            UPDATE import_jobs SET status = ?, error = ?, updated_at = CURRENT_TIMESTAMP
+                {', finished_at = CURRENT_TIMESTAMP' if finished else ''}
+            WHERE id = ?
+        ''', (status, error, job_id)))
+
+    def _run(self, job_id, user_id, staging, radius_m, lock):
+        try:
+            self._set_status(job_id, RUNNING)
+            grid = SpotGrid(self._load_spots())
+            created_spots = set()
+            created = 0
+            last = -1
+            while True:
+                batch = self._pending(job_id, last, IMPORT_BATCH_SIZE)
+                if not batch:
+                    break
+                last = batch[-1]['position']
+                created += self._process_batch(job_id, user_id, staging, radius_m, grid, batch, created_spots)
+
+            self._set_status(job_id, DONE)
+            print(f"✅ 相簿匯入完成 {job_id}：新增 {created} 筆打卡")
+            if created and self.after_import:
+                self.after_import(user_id)
+        except Exception as e:
+            print(f"❌ 相簿匯入失敗 {job_id}: {e}")
+            self._set_status(job_id, FAILED, str(e))
+        finally:
+            # 先刪目錄再放鎖：其他行程拿到鎖時目錄一定已經不在
+            shutil.rmtree(staging, ignore_errors=True)
+            if lock is not None:
+                lock.close()
+
+    def _staged_path(self, staging, item):
+        ext = item['filename'].rsplit('.', 1)[-1].lower()
+        return os.path.join(staging, f"{item['position']}.{ext}")
+
+    def _process_batch(self, job_id, user_id, staging, radius_m, grid, batch, created_spots):
+        paths = [self._staged_path(staging, item) for item in batch]
+        _, pool = self._executors()
+        exifs = list(pool.map(read_exif, paths)) if pool else [read_exif(p) for p in paths]
+
+        # 比對景點，對到的照片先搬到 uploads 並登記（交易失敗或未打卡時再刪除）
+        results = []
+        moved = []
+        for item, path, exif in zip(batch, paths, exifs):
+            result = {'position': item['position'], 'taken_at': exif.get('taken_at'),
+                      'spot_id': None, 'distance_m': None, 'photo_url': None}
+            results.append(result)
+            if exif.get('error'):
+                result.update(status='invalid', message=exif['error'])
+                continue
+            if exif['lat'] is None:
+                result.update(status='no_gps', message='照片沒有 GPS 資訊')
+                continue
+            spot, distance = grid.nearest(exif['lat'], exif['lng'], radius_m)
+            if spot is None:
+                result.update(status='no_match', message=f'{radius_m:g} 公尺內沒有景點')
+                continue
+            result.update(spot_id=spot['id'], distance_m=round(distance, 1))
+            if spot['id'] in created_spots:
+                result.update(status='duplicate', message=f"同一次匯入已打卡「{spot['name']}」")
+                continue
+            created_spots.add(spot['id'])
+            photo_filename = f"{user_id}_{spot['id']}_{uuid.uuid4().hex[:8]}.jpg"
+            os.makedirs(self.upload_dir, exist_ok=True)
+            target = os.path.join(self.upload_dir, photo_filename)
+            shutil.move(path, target)
+            moved.append((photo_filename, user_id, os.path.getsize(target)))
+            result['photo_url'] = f"/static/uploads/{photo_filename}"
+        upload_store.register_many(moved)
+
+        def write(conn):
+            for result in results:
+                if not result['photo_url']:
+                    continue
+                checkin_date = (result['taken_at'] or '')[:10] or None
+                status, spot = self.insert_checkin(conn, user_id, result['spot_id'], '相簿匯入',
+                                                   result['photo_url'], checkin_date=checkin_date)
+                if status == 'created':
+                    result.update(status='created', message=f"已打卡「{spot['name']}」")
+                elif status == 'duplicate':
+                    result.update(status='duplicate', message='已經打卡過了')
+                else:
+                    result.update(status='no_match', message='找不到景點')
+            conn.executemany('''
+                UPDATE import_job_items
+                SET status = ?, message = ?, spot_id = ?, distance_m = ?, taken_at = ?
+                WHERE job_id = ? AND position = ?
+            ''', [(r['status'], r['message'], r['spot_id'], r['distance_m'], r['taken_at'], job_id, r['position'])
+                  for r in results])
+            created = sum(1 for r in results if r['status'] == 'created')
+            conn.execute('''
+                UPDATE import_jobs
+                SET processed = processed + ?, created = created + ?, updated_at = CURRENT_TIMESTAMP
+                WHERE id = ?
+            ''', (len(results), created, job_id))
+            return created
+
+        try:
+            created = self.run_write(write)
+        except Exception:
+            for result in results:
+                upload_store.discard(result['photo_url'])
+            raise
+        for result in results:
+            if result['photo_url'] and result['status'] != 'created':
+                upload_store.discard(result['photo_url'])
+        return created
+
+    # ---------- 查詢 ----------
+
+    def status(self, job_id, user_id, include_items=False):
+        """工作狀態（不是該用戶的工作時回傳 None）"""
+        with self.open_db() as conn:
+            job = conn.execute(
+                "SELECT * FROM import_jobs WHERE id = ? AND user_id = ?", (job_id, user_id)
+            ).fetchone()
+            if job is None:
+                return None
+            counts = {r['status']: r['n'] for r in conn.execute('''
+                SELECT status, COUNT(*) AS n FROM import_job_items WHERE job_id = ? GROUP BY status
+            ''', (job_id,)).fetchall()}
+            result = {
+                'id': job['id'],
+                'status': job['status'],
+                'total': job['total'],
+                'processed': job['processed'],
+                'created': job['created'],
+                'progress': round(job['processed'] / job['total'], 3) if job['total'] else 1.0,
+                'counts': counts,
+                'error': job['error'],
+                'created_at': job['created_at'],
+                'finished_at': job['finished_at'],
+            }
+            if include_items:
+                result['items'] = [dict(r) for r in conn.execute('''
+                    SELECT position, filename, status, message, spot_id, distance_m, taken_at
+                    FROM import_job_items WHERE job_id = ? ORDER BY position
+                ''', (job_id,)).fetchall()]
+        return result
+
+
+photo_importer = PhotoImporter()
@@ -0,0 +1,131 @@
+"""
+打卡照片的讀取端：/photos/<檔名>[?w=寬度]
+- 上傳檔名含隨機碼且不會被覆寫（{user_id}_{spot_id}_{隨機}.{副檔名}），回應一律 immutable 長效快取
+- 原圖與縮圖都以 send_file(conditional=True) 回應：支援 Range（206）、ETag / If-None-Match
+- 設定 PHOTO_ACCEL_REDIRECT 時改回 X-Accel-Redirect，由 nginx 直接送檔（internal location 指向 uploads 目錄）
+- ?w= 依 PHOTO_WIDTHS 取不小於要求的寬度，第一次請求時產生縮圖存到 uploads/.variants/<寬度>/，之後直接讀檔；
+  未安裝 Pillow 時回傳原圖。原圖被 GC / 取消打卡刪除時一併刪除縮圖
+
+環境變數：
+    PHOTO_ACCEL_REDIRECT   nginx internal location 前綴（例如 /_uploads/，未設定則由 Flask 送檔）
+    PHOTO_MAX_AGE          快取秒數（預設 31536000）
+
+nginx 設定範例：
+    location /_uploads/ { internal; alias /app/static/uploads/; }
+"""
+
+import os
+import shutil
+import tempfile
+import threading
+
+# Pillow（可選功能：產生縮圖）
+RESIZE_ENABLED = False
+try:
+    from PIL import Image, ImageOps
+    RESIZE_ENABLED = True
+except ImportError:
+    Image = None
+    ImageOps = None
+
+PHOTO_ACCEL_REDIRECT = os.environ.get('PHOTO_ACCEL_REDIRECT', '')
+PHOTO_MAX_AGE = int(os.environ.get('PHOTO_MAX_AGE', str(365 * 24 * 3600)))
+
+# 可產生的縮圖寬度（其他寬度取下一個較大的，避免縮圖種類無限增加）
+PHOTO_WIDTHS = (160, 320, 640, 1280)
+VARIANT_DIR = '.variants'
+JPEG_QUALITY = 82
+RESIZABLE_EXTENSIONS = {'jpg', 'jpeg', 'png', 'webp'}
+
+# 同一張縮圖只產生一次（依檔名分段鎖）
+LOCK_STRIPES = 32
+_locks = [threading.Lock() for _ in range(LOCK_STRIPES)]
+
+
+def variant_width(requested):
+    """?w= → 實際產生的寬度（None 表示原圖）"""
+    if not requested or requested <= 0:
+        return None
+    for width in PHOTO_WIDTHS:
+        if width >= requested:
+            return width
+    return PHOTO_WIDTHS[-1]
+
+
+def variant_relpath(width, filename):
+    """縮圖相對於 uploads 目錄的路徑"""
+    return f'{VARIANT_DIR}/{width}/{filename}'
+
+
+def photo_src(photo_url, width=None):
+    """/static/uploads/<檔名> → /photos/<檔名>?w=寬度（其他網址原樣回傳，模板用）"""
+    prefix = '/static/uploads/'
+    if not photo_url or not photo_url.startswith(prefix):
+        return photo_url
+    src = '/photos/' + photo_url[len(prefix):]
+    return f'{src}?w={width}' if width else src
+
+
+def ensure_variant(upload_dir, filename, width):
+    """
+    取得縮圖（沒有時產生），回傳相對於 upload_dir 的路徑
+    無法縮圖（未安裝 Pillow、格式不支援、檔案損毀）時回傳 None，由呼叫端改送原圖
+    """
+    if not RESIZE_ENABLED or width is None:
+        return None
+    if filename.rsplit('.', 1)[-1].lower() not in RESIZABLE_EXTENSIONS:
+        return None
+    relpath = variant_relpath(width, filename)
+    target = os.path.join(upload_dir, relpath)
+    if os.path.exists(target):
+        return relpath
+
+    with _locks[hash(relpath) % LOCK_STRIPES]:
+        if os.path.exists(target):
+            return relpath
+        source = os.path.join(upload_dir, filename)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        # 先寫暫存檔再 rename，其他行程不會讀到寫到一半的縮圖
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(target), prefix='.tmp-')
+        os.close(fd)
+        try:
+            if not _resize(source, tmp, width):
+                # 原圖已經夠小：直接複製一份，之後不用再開圖檢查
+                shutil.copyfile(source, tmp)
+            os.replace(tmp, target)
+        except Exception as e:
+            print(f"⚠️ 縮圖失敗 {filename} ({width}px): {e}")
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+            return None
+    return relpath
+
+
+def _resize(source, target, width):
+    """縮到指定寬度寫入 target；原圖不比 width 寬時回傳 False"""
+    with Image.open(source) as img:
+        if img.width <= width:
+            return False
+        fmt = img.format
+        # JPEG 解碼時直接縮小，大圖不必整張展開
+        img.draft('RGB', (width, width * img.height // img.width))
+        img = ImageOps.exif_transpose(img)
+        img.thumbnail((width, width * 10))
+        if fmt == 'JPEG':
+            if img.mode not in ('RGB', 'L'):
+                img = img.convert('RGB')
+            img.save(target, 'JPEG', quality=JPEG_QUALITY, optimize=True, progressive=True)
+        else:
+            img.save(target, fmt)
+    return True
+
+
+def remove_variants(upload_dir, filename):
+    """刪除某張照片的所有縮圖"""
+    for width in PHOTO_WIDTHS:
+        try:
+            os.remove(os.path.join(upload_dir, variant_relpath(width, filename)))
+        except OSError:
+            pass
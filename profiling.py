@@ -0,0 +1,253 @@
+"""
+請求效能分析模組
+- 每個請求：總耗時、SQL 次數與耗時、外部 HTTP 呼叫次數與耗時、模板渲染耗時
+- 結果寫入 Server-Timing header，並累積到行程內的直方圖
+- /metrics 以 Prometheus 文字格式輸出（數據為單一 worker 行程內的累計）
+- /metrics 需要 Authorization: Bearer <METRICS_TOKEN>；未設定 METRICS_TOKEN 時不開放（回 404）
+
+環境變數：
+    PROFILING_ENABLED  請求計時與 /metrics（預設 1，設 0 關閉）
+    METRICS_TOKEN      /metrics 的 Bearer token（Prometheus scrape 設定 authorization.credentials）
+"""
+
+import os
+import sqlite3
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from flask import g, has_request_context, request, before_render_template, template_rendered
+from auth import require_token
+from slow_query_log import log_if_slow, SLOW_QUERY_ENABLED
+
+PROFILING_ENABLED = os.environ.get('PROFILING_ENABLED', '1') != '0'
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+
+# 請求耗時直方圖的分界（秒）
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+# 背景執行緒（例如 task_graph 的步驟）暫存的統計
+_thread_state = threading.local()
+
+
+def _current_profile():
+    """取得目前請求的統計（不在請求中時回傳 None）"""
+    if has_request_context():
+        return g.get('_profile')
+    return getattr(_thread_state, 'profile', None)
+
+
+@contextmanager
+def capture_profile():
+    """在背景執行緒收集 sql / http 耗時，之後由請求執行緒以 merge_profile 併入"""
+    previous = getattr(_thread_state, 'profile', None)
+    profile = _thread_state.profile = defaultdict(int)
+    try:
+        yield profile
+    finally:
+        _thread_state.profile = previous
+
+
+def merge_profile(captured):
+    """將 capture_profile 收集到的統計併入目前請求"""
+    profile = _current_profile()
+    if profile is None:
+        return
+    for key, value in captured.items():
+        profile[key] = profile.get(key, 0) + value
+
+
+def record(kind, elapsed):
+    """累加一次 sql / http / tpl 的耗時到目前請求"""
+    profile = _current_profile()
+    if profile is not None:
+        profile[f'{kind}_count'] += 1
+        profile[f'{kind}_time'] += elapsed
+
+
+# ==================== SQLite ====================
+
+class ProfiledConnection(sqlite3.Connection):
+    """會記錄 SQL 次數與耗時（並檢查慢查詢）的連線，給 sqlite3.connect(factory=...) 使用"""
+
+    def execute(self, sql, parameters=()):
+        start = time.perf_counter()
+        try:
+            cursor = super().execute(sql, parameters)
+        finally:
+            elapsed = time.perf_counter() - start
+            record('sql', elapsed)
+        log_if_slow(self, sql, parameters, elapsed)
+        return cursor
+
+    def executemany(self, sql, seq_of_parameters):
+        start = time.perf_counter()
+        try:
+            cursor = super().executemany(sql, seq_of_parameters)
+        finally:
+            elapsed = time.perf_counter() - start
+            record('sql', elapsed)
+        log_if_slow(self, sql, seq_of_parameters, elapsed, many=True)
+        return cursor
+
+    def executescript(self, sql_script):
+        start = time.perf_counter()
+        try:
+            return super().executescript(sql_script)
+        finally:
+            record('sql', time.perf_counter() - start)
+
+
+def connection_factory():
+    """get_db 使用的連線類別（效能分析與慢查詢都停用時回傳預設類別）"""
+    if PROFILING_ENABLED or SLOW_QUERY_ENABLED:
+        return ProfiledConnection
+    return sqlite3.Connection
+
+
+# ==================== 外部 HTTP ====================
+
+def instrument_http_session(http_session):
+    """包裝 requests.Session.request，記錄外部 HTTP 呼叫次數與耗時（含下載內容）"""
+    original_request = http_session.request
+
+    def timed_request(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return original_request(*args, **kwargs)
+        finally:
+            record('http', time.perf_counter() - start)
+
+    http_session.request = timed_request
+    return http_session
+
+
+# ==================== 行程內統計 ====================
+
+class MetricsRegistry:
+    """依 endpoint 累計的直方圖與計數器"""
+
+    def __init__(self, buckets=DURATION_BUCKETS):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._endpoints = {}
+
+    def observe(self, endpoint, profile, duration):
+        with self._lock:
+            stats = self._endpoints.get(endpoint)
+            if stats is None:
+                stats = self._endpoints[endpoint] = {
+                    'bucket_counts': [0] * len(self.buckets),
+                    'count': 0,
+                    'sum': 0.0,
+                    'sql_count': 0,
+                    'sql_time': 0.0,
+                    'http_count': 0,
+                    'http_time': 0.0,
+                    'tpl_count': 0,
+                    'tpl_time': 0.0,
+                }
+            for i, bound in enumerate(self.buckets):
+                if duration <= bound:
+                    stats['bucket_counts'][i] += 1
+            stats['count'] += 1
+            stats['sum'] += duration
+            for key in ('sql_count', 'sql_time', 'http_count', 'http_time', 'tpl_count', 'tpl_time'):
+                stats[key] += profile[key]
+
+    def render_prometheus(self):
+        """輸出 Prometheus 文字格式"""
+        with self._lock:
+            snapshot = {k: {**v, 'bucket_counts': list(v['bucket_counts'])} for k, v in self._endpoints.items()}
+
+        lines = [
+            '# HELP retire_request_duration_seconds Request wall time by endpoint.',
+            '# TYPE retire_request_duration_seconds histogram',
+        ]
+        for endpoint, stats in sorted(snapshot.items()):
+            label = f'endpoint="{endpoint}"'
+            for bound, count in zip(self.buckets, stats['bucket_counts']):
+                lines.append(f'retire_request_duration_seconds_bucket{{{label},le="{bound}"}} {count}')
+            lines.append(f'retire_request_duration_seconds_bucket{{{label},le="+Inf"}} {stats["count"]}')
+            lines.append(f'retire_request_duration_seconds_sum{{{label}}} {stats["sum"]:.6f}')
+            lines.append(f'retire_request_duration_seconds_count{{{label}}} {stats["count"]}')
+
+        counters = [
+            ('retire_sql_statements_total', 'sql_count', 'SQL statements executed by endpoint.'),
+            ('retire_sql_duration_seconds_total', 'sql_time', 'Cumulative SQL execute time by endpoint.'),
+            ('retire_http_requests_total', 'http_count', 'Outbound HTTP calls by endpoint.'),
+            ('retire_http_duration_seconds_total', 'http_time', 'Cumulative outbound HTTP time by endpoint.'),
+            ('retire_template_renders_total', 'tpl_count', 'Template renders by endpoint.'),
+            ('retire_template_render_seconds_total', 'tpl_time', 'Cumulative template render time by endpoint.'),
+        ]
+        for name, key, help_text in counters:
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} counter')
+            for endpoint, stats in sorted(snapshot.items()):
+                value = stats[key]
+                value = f'{value:.6f}' if isinstance(value, float) else value
+                lines.append(f'{name}{{endpoint="{endpoint}"}} {value}')
+
+        return '\n'.join(lines) + '\n'
+
+
+metrics = MetricsRegistry()
+
+
+# ==================== Flask 掛載 ====================
+
+def _start_request():
+    g._profile = {
+        'start': time.perf_counter(),
+        'sql_count': 0, 'sql_time': 0.0,
+        'http_count': 0, 'http_time': 0.0,
+        'tpl_count': 0, 'tpl_time': 0.0,
+        'tpl_started': [],
+    }
+
+
+def _finish_request(response):
+    profile = g.pop('_profile', None)
+    if profile is None:
+        return response
+
+    duration = time.perf_counter() - profile['start']
+    response.headers['Server-Timing'] = ', '.join([
+        f'db;dur={profile["sql_time"] * 1000:.1f};desc="{profile["sql_count"]} queries"',
+        f'http;dur={profile["http_time"] * 1000:.1f};desc="{profile["http_count"]} calls"',
+        f'tpl;dur={profile["tpl_time"] * 1000:.1f}',
+        f'total;dur={duration * 1000:.1f}',
+    ])
+    metrics.observe(request.endpoint or 'unmatched', profile, duration)
+    return response
+
+
+def _template_started(sender, template, context, **extra):
+    profile = _current_profile()
+    if profile is not None:
+        profile['tpl_started'].append(time.perf_counter())
+
+
+def _template_finished(sender, template, context, **extra):
+    profile = _current_profile()
+    if profile is not None and profile['tpl_started']:
+        record('tpl', time.perf_counter() - profile['tpl_started'].pop())
+
+
+def init_profiling(app):
+    """掛上請求計時、模板計時與 /metrics"""
+    if not PROFILING_ENABLED:
+        return
+
+    app.before_request(_start_request)
+    app.after_request(_finish_request)
+    before_render_template.connect(_template_started, app)
+    template_rendered.connect(_template_finished, app)
+
+    @app.route('/metrics')
+    def prometheus_metrics():
+        """Prometheus 指標（本 worker 行程），需要 METRICS_TOKEN"""
+        require_token(METRICS_TOKEN)
+        return app.response_class(metrics.render_prometheus(),
+                                  content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,482 @@
+"""
+資料存取層
+- app 的頁面、API 與 LINE Bot 只透過這裡的函式讀寫資料，不直接寫 SQL
+- 每個函式接收呼叫端的連線（get_db / run_write 取得），不自行 commit：交易範圍由呼叫端決定
+- SQL 只使用 SQLite 與 PostgreSQL 共通的語法（storage.py 只轉換 placeholder 與 INSERT OR IGNORE 等少數方言差異），
+  兩種後端由 tests/test_repository.py 以同一組測試驗證
+- 統計類查詢一次交給資料庫端計算，不在 Python 迴圈內逐筆查詢；對 PostgreSQL 而言每次查詢都是一趟網路往返，
+  合併查詢的效果比 SQLite 更明顯
+"""
+
+# 可由表單寫入的欄位（其餘欄位使用資料表預設值）
+WISH_FIELDS = ('name', 'region', 'description', 'best_season', 'budget', 'priority', 'notes')
+TRAVEL_LOG_FIELDS = ('wish_id', 'route_id', 'travel_date', 'actual_budget', 'rating', 'diary')
+
+
+def _equals(column, value):
+    """column = ?；value 為 None 時改用 IS NULL（NULL 不等於任何值）"""
+    return (f'{column} IS NULL', ()) if value is None else (f'{column} = ?', (value,))
+
+
+def _find_id(conn, table, user_id, **natural_key):
+    """依自然鍵（欄位 = 值）找出用戶既有資料的 id，找不到回傳 None"""
+    conditions, params = ['user_id = ?'], [user_id]
+    for column, value in natural_key.items():
+        condition, param = _equals(column, value)
+        conditions.append(condition)
+        params.extend(param)
+    row = conn.execute(
+        f"SELECT id FROM {table} WHERE {' AND '.join(conditions)} ORDER BY id LIMIT 1", params
+    ).fetchone()
+    return row[0] if row else None
+
+
+def _insert(conn, table, allowed, user_id, fields):
+    columns = [c for c in allowed if c in fields]
+    placeholders = ', '.join('?' * (len(columns) + 1))
+    return conn.execute(
+        f"INSERT INTO {table} ({', '.join(columns)}, user_id) VALUES ({placeholders})",
+        (*[fields[c] for c in columns], user_id)
+    )
+
+
+# ==================== 用戶統計 ====================
+
+def get_user_stats(conn, user_id):
+    """用戶統計（成就判斷、統計 API、LINE 統計共用）"""
+    row = conn.execute('''
+        SELECT
+            (SELECT COUNT(*) FROM checkins WHERE user_id = ?) AS checkin_count,
+            (SELECT COUNT(photo_url) FROM checkins WHERE user_id = ?) AS photo_count,
+            (SELECT COUNT(*) FROM wishes WHERE user_id = ? AND completed = 1) AS wish_complete,
+            (SELECT COUNT(*) FROM travel_logs
+             WHERE user_id = ? AND diary IS NOT NULL AND diary != '') AS diary_count,
+            (SELECT COALESCE(MAX(total_distance), 0) FROM user_settings WHERE user_id = ?) AS total_distance,
+            (SELECT COUNT(*) FROM user_achievements WHERE user_id = ?) AS achievement_count
+    ''', (user_id,) * 6).fetchone()
+    return {key: row[key] for key in row.keys()}
+
+
+def get_home_summary(conn, user_id):
+    """首頁的各項計數"""
+    row = conn.execute('''
+        SELECT
+            (SELECT COUNT(*) FROM wishes WHERE user_id = ?) AS wishes_total,
+            (SELECT COUNT(*) FROM wishes WHERE user_id = ? AND completed = 1) AS wishes_done,
+            (SELECT COUNT(*) FROM routes) AS routes_total,
+            (SELECT COUNT(*) FROM spots) AS spots_total,
+            (SELECT COUNT(*) FROM checkins WHERE user_id = ?) AS checkin_count,
+            (SELECT COUNT(*) FROM user_achievements WHERE user_id = ?) AS achievement_count
+    ''', (user_id,) * 4).fetchone()
+    return {key: row[key] for key in row.keys()}
+
+
+def get_catalog_totals(conn):
+    """景點與成就總數（LINE 統計訊息用）"""
+    row = conn.execute('''
+        SELECT (SELECT COUNT(*) FROM spots) AS spots_total,
+               (SELECT COUNT(*) FROM achievements) AS achievements_total
+    ''').fetchone()
+    return {key: row[key] for key in row.keys()}
+
+
+# ==================== 路線與景點 ====================
+
+def get_routes_with_progress(conn, user_id, region=None, difficulty=None):
+    """路線列表與每條路線的收集進度（單一 GROUP BY，取代逐條路線查詢）"""
+    query = '''
+        SELECT r.*, COUNT(s.id) AS total_spots, COUNT(c.id) AS collected_spots
+        FROM routes r
+        LEFT JOIN spots s ON s.route_id = r.id
+        LEFT JOIN checkins c ON c.spot_id = s.id AND c.user_id = ?
+        WHERE 1=1
+    '''
+    params = [user_id]
+
+    if region:
+        query += " AND r.region = ?"
+        params.append(region)
+
+    if difficulty:
+        query += " AND r.difficulty = ?"
+        params.append(difficulty)
+
+    query += " GROUP BY r.id ORDER BY r.accessibility DESC, r.name"
+    return [dict(r) for r in conn.execute(query, params).fetchall()]
+
+
+def get_seasonal_routes(conn, season, limit):
+    """當季（或四季皆宜）的推薦路線"""
+    return conn.execute('''
+        SELECT * FROM routes
+        WHERE best_season LIKE ? OR best_season LIKE '%四季%'
+        ORDER BY accessibility DESC LIMIT ?
+    ''', (f'%{season}%', limit)).fetchall()
+
+
+def get_route_regions(conn):
+    return conn.execute("SELECT DISTINCT region FROM routes").fetchall()
+
+
+def get_route_names(conn):
+    """路線下拉選單"""
+    return conn.execute("SELECT id, name FROM routes ORDER BY name").fetchall()
+
+
+def get_routes_by_region(conn, region):
+    return conn.execute(
+        "SELECT * FROM routes WHERE region = ? ORDER BY accessibility DESC", (region,)
+    ).fetchall()
+
+
+def get_route(conn, route_id):
+    return conn.execute("SELECT * FROM routes WHERE id = ?", (route_id,)).fetchone()
+
+
+def get_route_spots(conn, route_id, user_id):
+    """路線的景點與用戶打卡狀態"""
+    return conn.execute('''
+        SELECT s.*,
+               CASE WHEN c.id IS NOT NULL THEN 1 ELSE 0 END as collected,
+               c.checkin_date, c.photo_url, c.note as checkin_note
+        FROM spots s
+        LEFT JOIN checkins c ON s.id = c.spot_id AND c.user_id = ?
+        WHERE s.route_id = ?
+        ORDER BY s.order_num
+    ''', (user_id, route_id)).fetchall()
+
+
+def get_atlas_spots(conn, user_id):
+    """圖鑑頁：所有景點與用戶打卡狀態（依地區、路線排序）"""
+    return conn.execute('''
+        SELECT s.*, r.name as route_name, r.region,
+               CASE WHEN c.id IS NOT NULL THEN 1 ELSE 0 END as collected,
+               c.checkin_date, c.photo_url, c.note as checkin_note
+        FROM spots s
+        JOIN routes r ON s.route_id = r.id
+        LEFT JOIN checkins c ON s.id = c.spot_id AND c.user_id = ?
+        ORDER BY r.region, r.name, s.order_num
+    ''', (user_id,)).fetchall()
+
+
+def get_atlas_catalog(conn):
+    """圖鑑靜態目錄：(路線, 景點)"""
+    routes = conn.execute('''
+        SELECT id, name, region, cover_emoji FROM routes ORDER BY id
+    ''').fetchall()
+    spots = conn.execute('''
+        SELECT id, route_id, name, spot_type, description, lat, lng, order_num, icon, rarity
+        FROM spots ORDER BY id
+    ''').fetchall()
+    return routes, spots
+
+
+def get_spot(conn, spot_id):
+    """景點與所屬路線名稱、地區"""
+    return conn.execute('''
+        SELECT s.*, r.name as route_name, r.region
+        FROM spots s JOIN routes r ON s.route_id = r.id
+        WHERE s.id = ?
+    ''', (spot_id,)).fetchone()
+
+
+def search_content(conn, keyword, user_id, limit=3):
+    """關鍵字搜尋：(路線, 景點, 願望)"""
+    pattern = f'%{keyword}%'
+    routes = conn.execute('''
+        SELECT * FROM routes
+        WHERE name LIKE ? OR region LIKE ? OR highlights LIKE ?
+        LIMIT ?
+    ''', (pattern, pattern, pattern, limit)).fetchall()
+    spots = conn.execute('''
+        SELECT s.*, r.name as route_name FROM spots s
+        JOIN routes r ON s.route_id = r.id
+        WHERE s.name LIKE ?
+        LIMIT ?
+    ''', (pattern, limit)).fetchall()
+    wishes = conn.execute(
+        "SELECT * FROM wishes WHERE name LIKE ? AND user_id = ? LIMIT ?",
+        (pattern, user_id, limit)
+    ).fetchall()
+    return routes, spots, wishes
+
+
+# ==================== 打卡 ====================
+
+def get_checkin(conn, user_id, spot_id):
+    return conn.execute(
+        "SELECT id, photo_url, checkin_date FROM checkins WHERE user_id = ? AND spot_id = ?",
+        (user_id, spot_id)
+    ).fetchone()
+
+
+def insert_checkin(conn, user_id, spot_id, route_id, checkin_date, note, photo_url):
+    conn.execute('''
+        INSERT INTO checkins (user_id, spot_id, route_id, checkin_date, note, photo_url)
+        VALUES (?, ?, ?, ?, ?, ?)
+    ''', (user_id, spot_id, route_id, checkin_date, note, photo_url))
+
+
+def delete_checkin(conn, user_id, spot_id):
+    conn.execute("DELETE FROM checkins WHERE user_id = ? AND spot_id = ?", (user_id, spot_id))
+
+
+def get_user_checkins(conn, user_id):
+    """打卡記錄頁：用戶所有打卡（新到舊）"""
+    return conn.execute('''
+        SELECT c.*, s.name as spot_name, s.icon, s.spot_type,
+               r.name as route_name, r.region
+        FROM checkins c
+        JOIN spots s ON c.spot_id = s.id
+        JOIN routes r ON c.route_id = r.id
+        WHERE c.user_id = ?
+        ORDER BY c.checkin_date DESC, c.id DESC
+    ''', (user_id,)).fetchall()
+
+
+def get_recent_checkins(conn, user_id, limit):
+    return conn.execute('''
+        SELECT c.*, s.name as spot_name, s.icon, r.name as route_name
+        FROM checkins c
+        JOIN spots s ON c.spot_id = s.id
+        JOIN routes r ON c.route_id = r.id
+        WHERE c.user_id = ?
+        ORDER BY c.created_at DESC LIMIT ?
+    ''', (user_id, limit)).fetchall()
+
+
+def get_collected_spot_ids(conn, user_id):
+    return [r['spot_id'] for r in conn.execute(
+        "SELECT spot_id FROM checkins WHERE user_id = ?", (user_id,)
+    ).fetchall()]
+
+
+def get_checkins_for_spots(conn, user_id, spot_ids):
+    if not spot_ids:
+        return []
+    placeholders = ','.join('?' * len(spot_ids))
+    return [dict(r) for r in conn.execute(f'''
+        SELECT spot_id, checkin_date, photo_url, note FROM checkins
+        WHERE user_id = ? AND spot_id IN ({placeholders})
+    ''', (user_id, *spot_ids)).fetchall()]
+
+
+# ==================== 打卡異動紀錄 ====================
+
+def insert_checkin_event(conn, user_id, spot_id, action):
+    conn.execute(
+        "INSERT INTO checkin_events (user_id, spot_id, action) VALUES (?, ?, ?)",
+        (user_id, spot_id, action)
+    )
+
+
+def get_spot_scoring(conn, spot_id):
+    """收集分數與 rollup 需要的景點欄位"""
+    return conn.execute('''
+        SELECT s.id, s.route_id, s.rarity, r.region FROM spots s JOIN routes r ON s.route_id = r.id
+        WHERE s.id = ?
+    ''', (spot_id,)).fetchone()
+
+
+def get_collection_version(conn, user_id):
+    """用戶收集狀態的版本（最後一筆異動 id）"""
+    return conn.execute(
+        "SELECT COALESCE(MAX(id), 0) FROM checkin_events WHERE user_id = ?", (user_id,)
+    ).fetchone()[0]
+
+
+def get_checkin_events(conn, user_id, since, until):
+    """since < id <= until 的異動（依 id 排序）"""
+    return conn.execute('''
+        SELECT spot_id, action FROM checkin_events
+        WHERE user_id = ? AND id > ? AND id <= ?
+        ORDER BY id
+    ''', (user_id, since, until)).fetchall()
+
+
+# ==================== 打卡冪等鍵 ====================
+
+def get_checkin_request(conn, user_id, idempotency_key):
+    return conn.execute(
+        "SELECT response, spot_id FROM checkin_requests WHERE user_id = ? AND idempotency_key = ?",
+        (user_id, idempotency_key)
+    ).fetchone()
+
+
+def insert_checkin_request(conn, user_id, idempotency_key, spot_id):
+    """冪等鍵已存在時丟出 IntegrityError"""
+    conn.execute('''
+        INSERT INTO checkin_requests (user_id, idempotency_key, spot_id)
+        VALUES (?, ?, ?)
+    ''', (user_id, idempotency_key, spot_id))
+
+
+def save_checkin_response(conn, user_id, idempotency_key, response):
+    """response 為 JSON 字串"""
+    conn.execute(
+        "UPDATE checkin_requests SET response = ? WHERE user_id = ? AND idempotency_key = ?",
+        (response, user_id, idempotency_key)
+    )
+
+
+# ==================== 成就 ====================
+
+def get_achievements(conn):
+    return conn.execute("SELECT * FROM achievements").fetchall()
+
+
+def get_unlocked_achievement_ids(conn, user_id):
+    return [r['achievement_id'] for r in conn.execute(
+        "SELECT achievement_id FROM user_achievements WHERE user_id = ?", (user_id,)
+    ).fetchall()]
+
+
+def unlock_achievement(conn, user_id, achievement_id):
+    """回傳是否實際寫入（已解鎖過回傳 False）"""
+    cursor = conn.execute('''
+        INSERT OR IGNORE INTO user_achievements (user_id, achievement_id)
+        VALUES (?, ?)
+    ''', (user_id, achievement_id))
+    return bool(cursor.rowcount)
+
+
+def get_achievements_with_status(conn, user_id):
+    """成就頁：所有成就與用戶解鎖狀態"""
+    return conn.execute('''
+        SELECT a.*,
+               CASE WHEN ua.id IS NOT NULL THEN 1 ELSE 0 END as unlocked,
+               ua.unlocked_at
+        FROM achievements a
+        LEFT JOIN user_achievements ua ON a.id = ua.achievement_id AND ua.user_id = ?
+        ORDER BY a.rarity DESC, a.condition_value
+    ''', (user_id,)).fetchall()
+
+
+def get_unlocked_achievements(conn, user_id, limit=None):
+    """用戶已解鎖的成就（新到舊）"""
+    query = '''
+        SELECT a.*, ua.unlocked_at
+        FROM achievements a
+        JOIN user_achievements ua ON a.id = ua.achievement_id
+        WHERE ua.user_id = ?
+        ORDER BY ua.unlocked_at DESC
+    '''
+    params = [user_id]
+    if limit:
+        query += " LIMIT ?"
+        params.append(limit)
+    return conn.execute(query, params).fetchall()
+
+
+# ==================== 願望清單 ====================
+
+def get_wishes(conn, user_id, status=None, region=None):
+    """status：pending / done / None（全部）"""
+    query = "SELECT * FROM wishes WHERE user_id = ?"
+    params = [user_id]
+
+    if status == 'pending':
+        query += " AND completed = 0"
+    elif status == 'done':
+        query += " AND completed = 1"
+
+    if region:
+        query += " AND region = ?"
+        params.append(region)
+
+    query += " ORDER BY priority ASC, created_at DESC"
+    return conn.execute(query, params).fetchall()
+
+
+def get_pending_wishes(conn, user_id, limit):
+    return conn.execute(
+        "SELECT * FROM wishes WHERE completed = 0 AND user_id = ? ORDER BY priority LIMIT ?",
+        (user_id, limit)
+    ).fetchall()
+
+
+def get_wish_regions(conn, user_id):
+    return conn.execute(
+        "SELECT DISTINCT region FROM wishes WHERE region IS NOT NULL AND user_id = ?", (user_id,)
+    ).fetchall()
+
+
+def get_wish_names(conn, user_id):
+    """願望下拉選單"""
+    return conn.execute(
+        "SELECT id, name FROM wishes WHERE user_id = ? ORDER BY name", (user_id,)
+    ).fetchall()
+
+
+def get_wish(conn, user_id, wish_id):
+    return conn.execute(
+        "SELECT * FROM wishes WHERE id = ? AND user_id = ?", (wish_id, user_id)
+    ).fetchone()
+
+
+def insert_wish(conn, user_id, fields):
+    """fields 只取 WISH_FIELDS 內的欄位，未提供的欄位使用預設值"""
+    _insert(conn, 'wishes', WISH_FIELDS, user_id, fields)
+
+
+def find_wish_id(conn, user_id, name, created_at):
+    """同一用戶同名且建立時間相同的願望視為同一筆（匯入去重用）"""
+    return _find_id(conn, 'wishes', user_id, name=name, created_at=created_at)
+
+
+def update_wish(conn, user_id, wish_id, fields):
+    columns = [c for c in WISH_FIELDS if c in fields]
+    if not columns:
+        return 0
+    assignments = ', '.join(f'{c} = ?' for c in columns)
+    return conn.execute(
+        f"UPDATE wishes SET {assignments} WHERE id = ? AND user_id = ?",
+        (*[fields[c] for c in columns], wish_id, user_id)
+    ).rowcount
+
+
+def complete_wish(conn, user_id, wish_id, completed_date):
+    return conn.execute('''
+        UPDATE wishes SET completed = 1, completed_date = ? WHERE id = ? AND user_id = ?
+    ''', (completed_date, wish_id, user_id)).rowcount
+
+
+def complete_wishes_by_name(conn, user_id, keyword, completed_date):
+    """名稱包含 keyword 的未完成願望標記為完成，回傳更新筆數"""
+    return conn.execute('''
+        UPDATE wishes SET completed = 1, completed_date = ?
+        WHERE name LIKE ? AND completed = 0 AND user_id = ?
+    ''', (completed_date, f'%{keyword}%', user_id)).rowcount
+
+
+def delete_wish(conn, user_id, wish_id):
+    """刪除願望；引用它的旅遊紀錄保留，只解除關聯（PostgreSQL 會檢查外鍵）"""
+    conn.execute(
+        "UPDATE travel_logs SET wish_id = NULL WHERE wish_id = ? AND user_id = ?", (wish_id, user_id)
+    )
+    return conn.execute(
+        "DELETE FROM wishes WHERE id = ? AND user_id = ?", (wish_id, user_id)
+    ).rowcount
+
+
+# ==================== 旅遊紀錄 ====================
+
+def get_travel_logs(conn, user_id):
+    return conn.execute('''
+        SELECT l.*, w.name as wish_name, r.name as route_name
+        FROM travel_logs l
+        LEFT JOIN wishes w ON l.wish_id = w.id
+        LEFT JOIN routes r ON l.route_id = r.id
+        WHERE l.user_id = ?
+        ORDER BY l.travel_date DESC
+    ''', (user_id,)).fetchall()
+
+
+def insert_travel_log(conn, user_id, fields):
+    """fields 只取 TRAVEL_LOG_FIELDS 內的欄位，未提供的欄位使用預設值"""
+    _insert(conn, 'travel_logs', TRAVEL_LOG_FIELDS, user_id, fields)
+
+
+def find_travel_log_id(conn, user_id, travel_date, created_at):
+    """同一用戶旅遊日期與建立時間都相同的紀錄視為同一筆（匯入去重用）"""
+    return _find_id(conn, 'travel_logs', user_id, travel_date=travel_date, created_at=created_at)
@@ -0,0 +1,147 @@
+"""
+SQLite 慢查詢紀錄
+- 超過門檻的 SQL 記錄：SQL 文字、參數型態（不含值）、耗時、EXPLAIN QUERY PLAN
+- 依比例取樣，執行計畫依 SQL 文字快取，避免紀錄本身拖慢請求
+- 寫入可輪替的檔案（每行一筆 JSON）
+
+環境變數：
+    SLOW_QUERY_MS       門檻毫秒數，0 表示停用（預設 100）
+    SLOW_QUERY_SAMPLE   取樣比例 0~1（預設 1.0）
+    SLOW_QUERY_LOG      紀錄檔路徑（預設 slow_queries.log）
+    SLOW_QUERY_LOG_MB   單檔大小上限 MB（預設 5）
+    SLOW_QUERY_LOG_BACKUPS  保留的舊檔數（預設 3）
+"""
+
+import os
+import re
+import json
+import random
+import sqlite3
+import logging
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from logging.handlers import RotatingFileHandler
+from flask import has_request_context, request
+
+SLOW_QUERY_MS = float(os.environ.get('SLOW_QUERY_MS', '100'))
+SLOW_QUERY_SAMPLE = float(os.environ.get('SLOW_QUERY_SAMPLE', '1.0'))
+SLOW_QUERY_LOG = os.environ.get('SLOW_QUERY_LOG', 'slow_queries.log')
+SLOW_QUERY_LOG_MB = float(os.environ.get('SLOW_QUERY_LOG_MB', '5'))
+SLOW_QUERY_LOG_BACKUPS = int(os.environ.get('SLOW_QUERY_LOG_BACKUPS', '3'))
+
+SLOW_QUERY_ENABLED = SLOW_QUERY_MS > 0
+
+# 執行計畫快取（同一段 SQL 只 EXPLAIN 一次）
+PLAN_CACHE_SIZE = 256
+
+_logger = None
+_logger_lock = threading.Lock()
+_plan_cache = OrderedDict()
+_plan_lock = threading.Lock()
+
+
+def _get_logger():
+    """第一次寫入時才建立紀錄檔"""
+    global _logger
+    if _logger is None:
+        with _logger_lock:
+            if _logger is None:
+                logger = logging.getLogger('retire_reading.slow_query')
+                logger.setLevel(logging.INFO)
+                logger.propagate = False
+                handler = RotatingFileHandler(
+                    SLOW_QUERY_LOG,
+                    maxBytes=int(SLOW_QUERY_LOG_MB * 1024 * 1024),
+                    backupCount=SLOW_QUERY_LOG_BACKUPS,
+                    encoding='utf-8'
+                )
+                handler.setFormatter(logging.Formatter('%(message)s'))
+                logger.addHandler(handler)
+                _logger = logger
+    return _logger
+
+
+def normalize_sql(sql):
+    """壓縮空白，方便比對與分組"""
+    return re.sub(r'\s+', ' ', sql).strip()
+
+
+def parameter_shapes(parameters):
+    """
+    參數只記錄型態與長度，不記錄值
+    LIKE 參數若以 % 開頭會標記 leading%（索引無法使用的情況）
+    """
+    if isinstance(parameters, dict):
+        items = parameters.items()
+    else:
+        items = enumerate(parameters or ())
+
+    shapes = {}
+    for key, value in items:
+        if isinstance(value, str):
+            shape = f'str({len(value)})'
+            if value.startswith('%'):
+                shape += ' leading%'
+        elif isinstance(value, (bytes, bytearray, memoryview)):
+            shape = f'bytes({len(value)})'
+        else:
+            shape = type(value).__name__
+        shapes[str(key)] = shape
+    return shapes
+
+
+def explain_query_plan(conn, sql, parameters):
+    """取得 EXPLAIN QUERY PLAN（依樹狀縮排成多行）"""
+    key = normalize_sql(sql)
+    with _plan_lock:
+        if key in _plan_cache:
+            _plan_cache.move_to_end(key)
+            return _plan_cache[key]
+
+    try:
+        # 直接呼叫 sqlite3.Connection.execute，避免被計入請求統計
+        rows = sqlite3.Connection.execute(conn, 'EXPLAIN QUERY PLAN ' + sql, parameters).fetchall()
+        depth = {0: -1}
+        plan = []
+        for row in rows:
+            node_id, parent, detail = row[0], row[1], row[3]
+            depth[node_id] = depth.get(parent, -1) + 1
+            plan.append('  ' * depth[node_id] + detail)
+    except sqlite3.Error as e:
+        plan = [f'(EXPLAIN 失敗: {e})']
+
+    with _plan_lock:
+        _plan_cache[key] = plan
+        if len(_plan_cache) > PLAN_CACHE_SIZE:
+            _plan_cache.popitem(last=False)
+    return plan
+
+
+def log_if_slow(conn, sql, parameters, elapsed, many=False):
+    """若超過門檻（且被取樣到）就寫入慢查詢紀錄"""
+    if not SLOW_QUERY_ENABLED or elapsed * 1000 < SLOW_QUERY_MS:
+        return
+    if SLOW_QUERY_SAMPLE < 1.0 and random.random() >= SLOW_QUERY_SAMPLE:
+        return
+
+    try:
+        # executemany 只取第一組參數做代表（iterator 已被消耗時就不帶參數）
+        sample_params = parameters
+        if many:
+            is_sequence = isinstance(parameters, (list, tuple))
+            sample_params = parameters[0] if is_sequence and parameters else ()
+
+        entry = {
+            'ts': datetime.now().isoformat(timespec='milliseconds'),
+            'elapsed_ms': round(elapsed * 1000, 2),
+            'endpoint': request.endpoint if has_request_context() else None,
+            'sql': normalize_sql(sql),
+            'params': parameter_shapes(sample_params),
+            'plan': explain_query_plan(conn, sql, sample_params),
+        }
+        if many and is_sequence:
+            entry['rows'] = len(parameters)
+        _get_logger().info(json.dumps(entry, ensure_ascii=False))
+    except Exception as e:
+        print(f"⚠️ 慢查詢紀錄失敗: {e}")
@@ -1,44 +1,250 @@
 // 退休走讀 Service Worker
-const CACHE_NAME = 'retire-reading-v1';
-const urlsToCache = [
-  '/',
-  '/static/manifest.json'
-];
+// 由 /sw.js 路由提供，回應時注入建置版本與預快取清單
+const BUILD_VERSION = '__BUILD_VERSION__';
+const PRECACHE_URLS = ['__PRECACHE_URLS__'];
 
-// 安裝
+const PRECACHE_NAME = `retire-reading-precache-${BUILD_VERSION}`;
+const RUNTIME_NAME = `retire-reading-runtime-${BUILD_VERSION}`;
+
+// 圖鑑目錄類 API：先回快取，同時背景更新
+const SWR_PATHS = [/^\/api\/atlas$/];
+// 打卡請求：離線時存入 IndexedDB，恢復連線後重送
+const CHECKIN_PATH = /^\/spot\/(\d+)\/checkin$/;
+const SYNC_TAG = 'checkin-queue';
+const QUEUE_DB = 'retire-reading';
+const QUEUE_STORE = 'checkin-queue';
+
+// 安裝：預快取本版本資源
 self.addEventListener('install', event => {
   event.waitUntil(
-    caches.open(CACHE_NAME)
-      .then(cache => cache.addAll(urlsToCache))
+    caches.open(PRECACHE_NAME)
+      .then(cache => cache.addAll(PRECACHE_URLS))
+      .then(() => self.skipWaiting())
   );
-  self.skipWaiting();
 });
 
-// 啟動
+// 啟動：清除舊版本快取，並嘗試送出排隊中的打卡
 self.addEventListener('activate', event => {
   event.waitUntil(
-    caches.keys().then(cacheNames => {
-      return Promise.all(
-        cacheNames.map(cacheName => {
-          if (cacheName !== CACHE_NAME) {
-            return caches.delete(cacheName);
-          }
-        })
-      );
-    })
+    caches.keys()
+      .then(cacheNames => Promise.all(
+        cacheNames
+          .filter(name => name !== PRECACHE_NAME && name !== RUNTIME_NAME)
+          .map(name => caches.delete(name))
+      ))
+      .then(() => self.clients.claim())
+      .then(() => replayQueue().catch(() => {}))
   );
-  self.clients.claim();
 });
 
 // 攔截請求
 self.addEventListener('fetch', event => {
-  event.respondWith(
-    caches.match(event.request)
-      .then(response => {
-        if (response) {
-          return response;
-        }
-        return fetch(event.request);
-      })
-  );
+  const request = event.request;
+  const url = new URL(request.url);
+  if (url.origin !== self.location.origin) {
+    return;
+  }
+
+  if (request.method === 'POST' && CHECKIN_PATH.test(url.pathname)) {
+    event.respondWith(checkinOrQueue(request, url));
+    return;
+  }
+  if (request.method !== 'GET') {
+    return;
+  }
+
+  if (SWR_PATHS.some(re => re.test(url.pathname))) {
+    event.respondWith(staleWhileRevalidate(event, request));
+  } else if (PRECACHE_URLS.includes(url.pathname)) {
+    event.respondWith(cacheFirst(request));
+  } else if (request.mode === 'navigate' || url.pathname.startsWith('/api/')) {
+    event.respondWith(networkFirst(request));
+  }
+});
+
+// Background Sync：恢復連線後重送
+self.addEventListener('sync', event => {
+  if (event.tag === SYNC_TAG) {
+    event.waitUntil(replayQueue());
+  }
 });
+
+// 不支援 Background Sync 的瀏覽器由頁面在 online 時通知
+self.addEventListener('message', event => {
+  if (event.data && event.data.type === 'replay-checkins') {
+    event.waitUntil(replayQueue().catch(() => {}));
+  }
+});
+
+// ==================== 快取策略 ====================
+
+async function cacheFirst(request) {
+  const cached = await caches.match(request);
+  return cached || fetch(request);
+}
+
+async function networkFirst(request) {
+  try {
+    const response = await fetch(request);
+    if (response.ok) {
+      const cache = await caches.open(RUNTIME_NAME);
+      cache.put(request, response.clone());
+    }
+    return response;
+  } catch (err) {
+    const cached = await caches.match(request) || await caches.match(request, { ignoreSearch: true });
+    if (cached) {
+      return cached;
+    }
+    throw err;
+  }
+}
+
+async function staleWhileRevalidate(event, request) {
+  const cache = await caches.open(RUNTIME_NAME);
+  const cached = await cache.match(request);
+  const network = fetch(request)
+    .then(response => {
+      if (response.ok) {
+        cache.put(request, response.clone());
+      }
+      return response;
+    });
+
+  if (cached) {
+    event.waitUntil(network.catch(() => {}));
+    return cached;
+  }
+  return network;
+}
+
+// ==================== 離線打卡佇列 ====================
+
+function openQueueDb() {
+  return new Promise((resolve, reject) => {
+    const req = indexedDB.open(QUEUE_DB, 1);
+    req.onupgradeneeded = () => req.result.createObjectStore(QUEUE_STORE, { keyPath: 'key' });
+    req.onsuccess = () => resolve(req.result);
+    req.onerror = () => reject(req.error);
+  });
+}
+
+async function queueRequest(mode, fn) {
+  const db = await openQueueDb();
+  return new Promise((resolve, reject) => {
+    const tx = db.transaction(QUEUE_STORE, mode);
+    const req = fn(tx.objectStore(QUEUE_STORE));
+    tx.oncomplete = () => resolve(req && req.result);
+    tx.onerror = () => reject(tx.error);
+  });
+}
+
+async function checkinOrQueue(request, url) {
+  // 先複製一份，網路失敗時才能讀出表單內容
+  const backup = request.clone();
+  try {
+    return await fetch(request);
+  } catch (err) {
+    const entry = await readCheckinEntry(backup, url);
+    await queueRequest('readwrite', store => store.put(entry));
+    if (self.registration.sync) {
+      await self.registration.sync.register(SYNC_TAG).catch(() => {});
+    }
+    return new Response(JSON.stringify({
+      success: true,
+      queued: true,
+      message: '目前離線，打卡已暫存，恢復連線後會自動上傳'
+    }), { status: 202, headers: { 'Content-Type': 'application/json' } });
+  }
+}
+
+async function readCheckinEntry(request, url) {
+  const spotId = parseInt(url.pathname.match(CHECKIN_PATH)[1], 10);
+  let fields = {};
+  let photo = null;
+
+  if ((request.headers.get('Content-Type') || '').includes('application/json')) {
+    fields = await request.json();
+  } else {
+    const form = await request.formData();
+    for (const [name, value] of form.entries()) {
+      if (name === 'photo' && value instanceof Blob) {
+        photo = value;
+      } else {
+        fields[name] = value;
+      }
+    }
+  }
+
+  return {
+    key: request.headers.get('Idempotency-Key') || fields.idempotency_key || self.crypto.randomUUID(),
+    spot_id: spotId,
+    user_id: fields.user_id || 'default',
+    note: fields.note || '',
+    photo: photo,
+    photo_name: photo && photo.name ? photo.name : null,
+    queued_at: Date.now()
+  };
+}
+
+// 每位用戶一個批次請求送到 /api/checkins/batch
+const BATCH_SIZE = 50;
+// 批次結果中可以從佇列刪除的狀態：已打卡，或重送也不會成功的錯誤
+const FINAL_STATUSES = ['created', 'replayed', 'duplicate', 'not_found', 'invalid', 'key_conflict'];
+
+async function replayQueue() {
+  const entries = await queueRequest('readonly', store => store.getAll()) || [];
+  const byUser = {};
+  entries.forEach(entry => {
+    (byUser[entry.user_id] = byUser[entry.user_id] || []).push(entry);
+  });
+
+  for (const [userId, userEntries] of Object.entries(byUser)) {
+    for (let i = 0; i < userEntries.length; i += BATCH_SIZE) {
+      await replayBatch(userId, userEntries.slice(i, i + BATCH_SIZE));
+    }
+  }
+}
+
+async function replayBatch(userId, entries) {
+  const form = new FormData();
+  const items = entries.map((entry, index) => {
+    const item = { spot_id: entry.spot_id, note: entry.note, idempotency_key: entry.key };
+    if (entry.photo) {
+      item.photo = `photo_${index}`;
+      form.append(item.photo, entry.photo, entry.photo_name || 'photo.jpg');
+    }
+    return item;
+  });
+  form.append('payload', JSON.stringify({ user_id: userId, items: items }));
+
+  const response = await fetch('/api/checkins/batch', { method: 'POST', body: form });
+  // 非 2xx（5xx、413、429 等）或回應無法解析：整批保留在佇列中，交給下一次 sync 重試
+  if (!response.ok) {
+    throw new Error(`replay failed: ${response.status}`);
+  }
+  const data = await response.json().catch(() => null);
+  if (!data || !Array.isArray(data.results)) {
+    throw new Error('replay failed: invalid response');
+  }
+
+  // 結果與送出的項目順序相同；只刪除已確定的項目（成功或重送也不會成功的錯誤）
+  const settled = [];
+  data.results.forEach((result, index) => {
+    const entry = entries[index];
+    if (entry && result && FINAL_STATUSES.includes(result.status)) {
+      settled.push({ entry: entry, result: result });
+    }
+  });
+  await queueRequest('readwrite', store => {
+    settled.forEach(({ entry }) => store.delete(entry.key));
+  });
+  settled.forEach(({ entry, result }) => {
+    notifyClients({ type: 'checkin-synced', spot_id: entry.spot_id, result: result });
+  });
+}
+
+async function notifyClients(message) {
+  const clients = await self.clients.matchAll({ type: 'window' });
+  clients.forEach(client => client.postMessage(message));
+}
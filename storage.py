@@ -0,0 +1,289 @@
+"""
+儲存後端
+- 預設使用 SQLite（DATABASE_PATH）
+- DATABASE_URL 設為 postgresql://... 時改用 PostgreSQL（需安裝 psycopg[pool]），以連線池供多台機器共用
+
+app 內既有的 SQL 以 SQLite 語法撰寫；PostgreSQL 後端提供相同的連線介面
+（execute / executemany / executescript / commit / rollback，列可用欄位名或索引取值），
+並轉換 placeholder 與少數方言差異（INSERT OR IGNORE、AUTOINCREMENT、PRAGMA、BEGIN IMMEDIATE）
+
+環境變數：
+    DATABASE_URL       PostgreSQL 連線字串（未設定則用 SQLite）
+    DB_POOL_MIN_SIZE   連線池最小連線數（預設 1）
+    DB_POOL_MAX_SIZE   連線池最大連線數（預設 10）
+"""
+
+import os
+import re
+import sqlite3
+import time
+from contextlib import contextmanager
+from functools import lru_cache
+from profiling import record
+
+# PostgreSQL（可選功能）
+PSYCOPG_AVAILABLE = False
+try:
+    import psycopg
+    from psycopg_pool import ConnectionPool
+    PSYCOPG_AVAILABLE = True
+except ImportError:
+    psycopg = None
+    ConnectionPool = None
+
+DB_POOL_MIN_SIZE = int(os.environ.get('DB_POOL_MIN_SIZE', '1'))
+DB_POOL_MAX_SIZE = int(os.environ.get('DB_POOL_MAX_SIZE', '10'))
+
+# BEGIN IMMEDIATE 在 PostgreSQL 以交易級 advisory lock 模擬（與 SQLite 相同：讀後寫的交易依序執行）
+WRITE_LOCK_KEY = 727100
+
+# INSERT OR REPLACE 轉成 ON CONFLICT 時使用的唯一鍵
+UPSERT_KEYS = {
+    'user_settings': ('user_id',),
+    'checkin_requests': ('user_id', 'idempotency_key'),
+    'user_achievements': ('user_id', 'achievement_id'),
+}
+
+# 兩種後端的唯一鍵衝突例外
+IntegrityError = (sqlite3.IntegrityError, psycopg.IntegrityError) if PSYCOPG_AVAILABLE else sqlite3.IntegrityError
+
+
+def is_postgres_url(url):
+    return bool(url) and url.split(':', 1)[0] in ('postgres', 'postgresql')
+
+
+# ==================== SQLite → PostgreSQL 語法轉換 ====================
+
+def _split_statements(script):
+    """依分號切開 SQL script（忽略字串與註解內的分號）"""
+    statements, current = [], []
+    quote = None
+    i = 0
+    while i < len(script):
+        ch = script[i]
+        if quote:
+            current.append(ch)
+            if ch == quote:
+                quote = None
+        elif ch in ("'", '"'):
+            quote = ch
+            current.append(ch)
+        elif script.startswith('--', i):
+            end = script.find('\n', i)
+            end = len(script) if end == -1 else end
+            current.append(script[i:end])
+            i = end
+            continue
+        elif ch == ';':
+            statements.append(''.join(current))
+            current = []
+        else:
+            current.append(ch)
+        i += 1
+    statements.append(''.join(current))
+    return [s for s in statements if re.sub(r'--[^\n]*', '', s).strip()]
+
+
+def _convert_placeholders(sql):
+    """? → %s；其餘 % 需跳脫（psycopg 會解析整段字串，包含字串常數內的 %）"""
+    out = []
+    quote = None
+    for ch in sql:
+        if ch == '%':
+            out.append('%%')
+        elif quote:
+            out.append(ch)
+            if ch == quote:
+                quote = None
+        elif ch in ("'", '"'):
+            quote = ch
+            out.append(ch)
+        elif ch == '?':
+            out.append('%s')
+        else:
+            out.append(ch)
+    return ''.join(out)
+
+
+@lru_cache(maxsize=512)
+def translate_sql(sql):
+    """
+    將 SQLite 語法的 SQL 轉成 PostgreSQL
+    回傳 None 表示在 PostgreSQL 不需執行（例如 PRAGMA）
+    """
+    stripped = sql.strip().rstrip(';').strip()
+    upper = stripped.upper()
+
+    if upper.startswith('PRAGMA'):
+        return None
+    if upper.startswith('BEGIN'):
+        # psycopg 在第一個語句自動開始交易；IMMEDIATE 需要先拿寫入鎖
+        return f'SELECT pg_advisory_xact_lock({WRITE_LOCK_KEY})' if 'IMMEDIATE' in upper else None
+
+    # 資料表定義
+    stripped = re.sub(r'INTEGER\s+PRIMARY\s+KEY\s+AUTOINCREMENT', 'BIGSERIAL PRIMARY KEY', stripped, flags=re.I)
+    stripped = re.sub(r'\bREAL\b', 'DOUBLE PRECISION', stripped)
+    # TEXT 欄位的預設時間維持 SQLite 的 'YYYY-MM-DD HH:MM:SS'（UTC）格式
+    stripped = re.sub(r"\bTEXT(\s+)DEFAULT\s+CURRENT_TIMESTAMP",
+                      r"TEXT\1DEFAULT to_char(CURRENT_TIMESTAMP AT TIME ZONE 'UTC', 'YYYY-MM-DD HH24:MI:SS')",
+                      stripped, flags=re.I)
+
+    # INSERT OR IGNORE / INSERT OR REPLACE
+    match = re.match(r'INSERT\s+OR\s+(IGNORE|REPLACE)\s+INTO\s+(\w+)\s*\(([^)]*)\)', stripped, flags=re.I)
+    if match:
+        mode, table, columns = match.group(1).upper(), match.group(2), match.group(3)
+        stripped = re.sub(r'INSERT\s+OR\s+(IGNORE|REPLACE)\s+INTO', 'INSERT INTO', stripped, count=1, flags=re.I)
+        if mode == 'IGNORE':
+            stripped += ' ON CONFLICT DO NOTHING'
+        else:
+            keys = UPSERT_KEYS.get(table.lower())
+            if not keys:
+                raise ValueError(f'INSERT OR REPLACE INTO {table} 缺少唯一鍵設定（UPSERT_KEYS）')
+            updates = [c.strip() for c in columns.split(',') if c.strip() not in keys]
+            action = ', '.join(f'{c} = EXCLUDED.{c}' for c in updates) if updates else None
+            stripped += f" ON CONFLICT ({', '.join(keys)}) " + (f'DO UPDATE SET {action}' if action else 'DO NOTHING')
+
+    return _convert_placeholders(stripped)
+
+
+# ==================== PostgreSQL 連線 ====================
+
+class PgRow:
+    """同時支援 row['欄位'] 與 row[0]，對應 sqlite3.Row 的用法"""
+
+    __slots__ = ('_index', '_values')
+
+    def __init__(self, index, values):
+        self._index = index
+        self._values = tuple(values)
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            return self._values[self._index[key]]
+        return self._values[key]
+
+    def __iter__(self):
+        return iter(self._values)
+
+    def __len__(self):
+        return len(self._values)
+
+    def keys(self):
+        return list(self._index)
+
+    def __repr__(self):
+        return f'PgRow({dict(zip(self._index, self._values))})'
+
+
+def pg_row_factory(cursor):
+    index = {column.name: i for i, column in enumerate(cursor.description or [])}
+    return lambda values: PgRow(index, values)
+
+
+class _EmptyCursor:
+    """PRAGMA 等在 PostgreSQL 略過的語句"""
+    rowcount = -1
+
+    def fetchone(self):
+        return None
+
+    def fetchall(self):
+        return []
+
+
+class PostgresConnection:
+    """包裝 psycopg 連線，提供 app 使用的 sqlite3 連線介面"""
+
+    def __init__(self, raw):
+        self.raw = raw
+
+    def execute(self, sql, parameters=()):
+        query = translate_sql(sql)
+        if query is None:
+            return _EmptyCursor()
+        start = time.perf_counter()
+        try:
+            # 永遠帶參數序列：psycopg 才會把 %% 還原成 %
+            return self.raw.execute(query, tuple(parameters or ()))
+        finally:
+            record('sql', time.perf_counter() - start)
+
+    def executemany(self, sql, seq_of_parameters):
+        query = translate_sql(sql)
+        if query is None:
+            return _EmptyCursor()
+        start = time.perf_counter()
+        try:
+            cursor = self.raw.cursor()
+            cursor.executemany(query, [tuple(p) for p in seq_of_parameters])
+            return cursor
+        finally:
+            record('sql', time.perf_counter() - start)
+
+    def executescript(self, script):
+        for statement in _split_statements(script):
+            self.execute(statement)
+
+    def commit(self):
+        self.raw.commit()
+
+    def rollback(self):
+        self.raw.rollback()
+
+
+# ==================== 後端 ====================
+
+class SQLiteBackend:
+    """本機 SQLite 檔案（path_fn 每次連線時取得路徑，方便測試工具切換資料庫）"""
+
+    name = 'sqlite'
+
+    def __init__(self, path_fn, connect):
+        self.path_fn = path_fn
+        self._connect = connect
+
+    @contextmanager
+    def connect(self, immediate=False):
+        conn = self._connect(self.path_fn())
+        try:
+            if immediate:
+                conn.execute('BEGIN IMMEDIATE')
+            yield conn
+        finally:
+            conn.close()
+
+
+class PostgresBackend:
+    """PostgreSQL + 連線池"""
+
+    name = 'postgres'
+
+    def __init__(self, url, min_size=DB_POOL_MIN_SIZE, max_size=DB_POOL_MAX_SIZE):
+        if not PSYCOPG_AVAILABLE:
+            raise RuntimeError('使用 PostgreSQL 需要安裝 psycopg[binary,pool]')
+        self.pool = ConnectionPool(url, min_size=min_size, max_size=max_size,
+                                   kwargs={'row_factory': pg_row_factory}, open=True)
+
+    @contextmanager
+    def connect(self, immediate=False):
+        with self.pool.connection() as raw:
+            conn = PostgresConnection(raw)
+            try:
+                if immediate:
+                    conn.execute('BEGIN IMMEDIATE')
+                yield conn
+            finally:
+                # 與 SQLite 關閉連線相同：未 commit 的內容一律捨棄，再歸還連線池
+                raw.rollback()
+
+    def close(self):
+        self.pool.close()
+
+
+def create_backend(database_url, sqlite_path_fn, sqlite_connect):
+    """依 DATABASE_URL 選擇後端"""
+    if is_postgres_url(database_url):
+        backend = PostgresBackend(database_url)
+        print(f"🐘 使用 PostgreSQL（連線池 {DB_POOL_MIN_SIZE}~{DB_POOL_MAX_SIZE}）")
+        return backend
+    return SQLiteBackend(sqlite_path_fn, sqlite_connect)
@@ -0,0 +1,185 @@
+"""
+退休走讀 - SQLite 並行寫入壓力測試
+模擬多個 gunicorn worker（多行程 × 多執行緒）同時打卡、取消打卡、新增與完成願望，
+統計 "database is locked" 等寫入錯誤，並以非 0 結束碼回報（可放進 CI）
+
+用法：
+    python stress_writes.py --workers 4 --threads 8 --rate 300 --duration 15
+    python stress_writes.py --group-commit                 # 啟用 writer thread
+    python stress_writes.py --no-wal --busy-timeout-ms 0   # 對照組：舊設定
+"""
+
+import os
+import sys
+import time
+import random
+import tempfile
+import argparse
+import threading
+import multiprocessing as mp
+
+# 寫入組合（權重）
+OPERATIONS = {'checkin': 50, 'cancel': 25, 'wish_add': 15, 'wish_complete': 10}
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(p / 100 * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+def worker_main(worker_id, args, env, result_queue, start_at):
+    """單一 worker 行程（啟動失敗也要回報，主行程才不會卡住）"""
+    try:
+        run_worker(worker_id, args, env, result_queue, start_at)
+    except Exception as e:
+        result_queue.put({'counts': {'ok': 0, 'locked': 0, 'error': 1}, 'latencies': [],
+                          'errors': [f'worker {worker_id} 啟動失敗: {e}'], 'writer': None})
+
+
+def run_worker(worker_id, args, env, result_queue, start_at):
+    """載入 app 後以多執行緒送出寫入"""
+    os.environ.update(env)
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import app as retire_app
+    # 例外直接丟回呼叫端，才能分辨是不是 lock 錯誤
+    retire_app.app.testing = True
+
+    with retire_app.get_db() as conn:
+        spot_ids = [r['id'] for r in conn.execute("SELECT id FROM spots").fetchall()]
+
+    per_thread_rate = args.rate / (args.workers * args.threads)
+    counts = {'ok': 0, 'locked': 0, 'error': 0}
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+
+    def run_thread(thread_id):
+        rng = random.Random(args.seed * 1000 + worker_id * 100 + thread_id)
+        client = retire_app.app.test_client()
+        ops, weights = list(OPERATIONS), list(OPERATIONS.values())
+        total = int(per_thread_rate * args.duration)
+        # 各執行緒錯開起點，避免所有請求在同一瞬間送出
+        t0 = start_at + rng.random() / per_thread_rate
+
+        for i in range(total):
+            delay = t0 + i / per_thread_rate - time.time()
+            if delay > 0:
+                time.sleep(delay)
+
+            op = rng.choices(ops, weights=weights)[0]
+            user_id = f"Ustress{rng.randrange(args.users):06d}"
+            started = time.perf_counter()
+            try:
+                if op == 'checkin':
+                    response = client.post(f'/spot/{rng.choice(spot_ids)}/checkin', json={'user_id': user_id})
+                elif op == 'cancel':
+                    response = client.post(f'/spot/{rng.choice(spot_ids)}/checkin/cancel', json={'user_id': user_id})
+                elif op == 'wish_add':
+                    response = client.post(f'/wishes/add?user={user_id}', data={
+                        'name': f'壓測願望 {rng.randrange(1000)}', 'region': '北部',
+                        'description': '', 'best_season': '四季皆宜',
+                    })
+                else:
+                    response = client.post(f'/wishes/{rng.randrange(1, 2000)}/complete', json={'user_id': user_id})
+                body = response.get_data(as_text=True)
+                status = response.status_code
+            except Exception as e:
+                status, body = 599, str(e)
+            elapsed = (time.perf_counter() - started) * 1000
+
+            with lock:
+                latencies.append(elapsed)
+                if status < 400 or (op in ('checkin', 'cancel') and status == 404):
+                    counts['ok'] += 1
+                elif 'locked' in body or 'busy' in body.lower():
+                    counts['locked'] += 1
+                    errors.append(f'{op}: {body[:120]}')
+                else:
+                    counts['error'] += 1
+                    errors.append(f'{op} {status}: {body[:120]}')
+
+    threads = [threading.Thread(target=run_thread, args=(t,)) for t in range(args.threads)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    writer_stats = retire_app.db_writer.stats if retire_app.db_writer else None
+    result_queue.put({'counts': counts, 'latencies': latencies, 'errors': errors[:5], 'writer': writer_stats})
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='SQLite 並行寫入壓力測試')
+    parser.add_argument('--workers', type=int, default=4, help='行程數（模擬 gunicorn worker）')
+    parser.add_argument('--threads', type=int, default=8, help='每個行程的執行緒數')
+    parser.add_argument('--rate', type=float, default=200, help='目標總寫入數 / 秒')
+    parser.add_argument('--duration', type=float, default=10, help='秒數')
+    parser.add_argument('--users', type=int, default=500, help='模擬用戶數（越少衝突越多）')
+    parser.add_argument('--db', help='資料庫路徑（預設為暫存檔）')
+    parser.add_argument('--busy-timeout-ms', type=int, help='覆寫 SQLITE_BUSY_TIMEOUT_MS')
+    parser.add_argument('--no-wal', action='store_true', help='不使用 WAL')
+    parser.add_argument('--group-commit', action='store_true', help='啟用 writer thread group commit')
+    parser.add_argument('--seed', type=int, default=42)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    db_path = args.db or os.path.join(tempfile.mkdtemp(prefix='stress_'), 'stress.db')
+
+    env = {'DATABASE_PATH': db_path, 'SLOW_QUERY_MS': '0', 'PROFILING_ENABLED': '0',
+           'SQLITE_WAL': '0' if args.no_wal else '1',
+           'SQLITE_GROUP_COMMIT': '1' if args.group_commit else '0'}
+    if args.busy_timeout_ms is not None:
+        env['SQLITE_BUSY_TIMEOUT_MS'] = str(args.busy_timeout_ms)
+
+    # 先在主行程建好資料表，避免各 worker 同時初始化
+    os.environ.update(env)
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import app  # noqa: F401  (import 時執行 init_db)
+
+    ctx = mp.get_context('spawn')
+    result_queue = ctx.Queue()
+    start_at = time.time() + 2.0 + args.workers * 0.5
+    processes = [ctx.Process(target=worker_main, args=(i, args, env, result_queue, start_at))
+                 for i in range(args.workers)]
+    print(f"🔨 {args.workers} 行程 × {args.threads} 執行緒，目標 {args.rate:g} 寫入/秒 × {args.duration:g} 秒"
+          f"（WAL={'否' if args.no_wal else '是'}，group commit={'是' if args.group_commit else '否'}）")
+    for p in processes:
+        p.start()
+    results = [result_queue.get() for _ in processes]
+    for p in processes:
+        p.join()
+
+    counts = {'ok': 0, 'locked': 0, 'error': 0}
+    latencies = []
+    for r in results:
+        for key in counts:
+            counts[key] += r['counts'][key]
+        latencies.extend(r['latencies'])
+    latencies.sort()
+    total = sum(counts.values())
+
+    print(f"\n📊 共 {total:,} 次寫入：成功 {counts['ok']:,}、lock 錯誤 {counts['locked']:,}、其他錯誤 {counts['error']:,}")
+    print(f"   實際 {total / args.duration:,.0f} 次/秒，延遲 p50 {percentile(latencies, 50):.1f} ms / "
+          f"p99 {percentile(latencies, 99):.1f} ms / max {latencies[-1] if latencies else 0:.1f} ms")
+    writer = [r['writer'] for r in results if r['writer']]
+    if writer:
+        batches = sum(w['batches'] for w in writer)
+        writes = sum(w['writes'] for w in writer)
+        print(f"   group commit：{writes:,} 筆寫入 / {batches:,} 次 commit（平均 {writes / max(batches, 1):.1f} 筆）")
+    for r in results:
+        for e in r['errors']:
+            print(f"   ⚠️ {e}")
+
+    if counts['locked'] or counts['error']:
+        print("❌ 有寫入失敗")
+        return 1
+    print("✅ 沒有 lock 錯誤")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,143 @@
+"""
+小型相依圖執行器
+- 每個步驟宣告相依的步驟，相依全部完成後立刻送進共用的執行緒池（執行緒數有上限）
+- 記錄每個步驟的排隊時間與執行時間
+- 步驟逾時或失敗：相依於它的步驟不再執行，尚未開始的會被取消；其餘步驟照常完成
+  （after 只要求「先結束」，不論成功與否，適合可有可無的前置步驟）
+- 背景執行緒內的 SQL / HTTP 耗時併回目前請求的效能分析
+
+用法：
+    steps = [
+        Step('album', lambda r: get_album()),
+        Step('photo', lambda r: upload(r['album']), deps=('album',)),
+    ]
+    results, timings = run_graph(steps, executor, timeout=20)
+"""
+
+import time
+from concurrent.futures import wait, FIRST_COMPLETED
+from profiling import capture_profile, merge_profile
+
+# 步驟狀態
+DONE = 'done'
+FAILED = 'failed'
+TIMEOUT = 'timeout'
+SKIPPED = 'skipped'
+
+
+class StepTimeout(Exception):
+    """步驟超過時限"""
+
+
+class Step:
+    """
+    一個步驟：fn(results) 取得先前步驟的結果（dict）並回傳自己的結果
+    deps：必須成功的步驟；after：只需先結束的步驟（失敗時 results 內沒有它的結果）
+    """
+
+    def __init__(self, name, fn, deps=(), after=(), timeout=None):
+        self.name = name
+        self.fn = fn
+        self.deps = tuple(deps)
+        self.after = tuple(after)
+        self.timeout = timeout
+
+
+def _run_step(step, results):
+    started = time.perf_counter()
+    with capture_profile() as profile:
+        value = step.fn(results)
+    return value, started, time.perf_counter(), profile
+
+
+def run_graph(steps, executor=None, timeout=None):
+    """
+    執行相依圖
+
+    Args:
+        steps: Step 列表（名稱不可重複，相依只能指向列表內的步驟）
+        executor: 共用執行緒池；None 表示在目前執行緒依序執行
+        timeout: 每個步驟預設的時限（秒，從送進執行緒池開始計算）
+
+    Returns:
+        tuple: (results, timings)
+            results: {步驟名稱: 回傳值}（只含成功的步驟）
+            timings: {步驟名稱: {'status', 'wait_ms', 'run_ms', 'error'}}
+    """
+    by_name = {step.name: step for step in steps}
+    for step in steps:
+        missing = [d for d in step.deps + step.after if d not in by_name]
+        if missing:
+            raise ValueError(f"步驟 {step.name} 的相依 {missing} 不存在")
+
+    results = {}
+    timings = {}
+    waiting = list(steps)
+    running = {}  # future -> (step, submitted, deadline)
+
+    def finish(step, status, submitted, started=None, ended=None, error=None):
+        ended = ended or time.perf_counter()
+        started = started or ended
+        timings[step.name] = {
+            'status': status,
+            'wait_ms': round((started - submitted) * 1000, 2),
+            'run_ms': round((ended - started) * 1000, 2),
+        }
+        if error is not None:
+            timings[step.name]['error'] = str(error) or error.__class__.__name__
+
+    def collect(step, submitted, outcome):
+        value, started, ended, profile = outcome
+        merge_profile(profile)
+        results[step.name] = value
+        finish(step, DONE, submitted, started, ended)
+
+    while waiting or running:
+        # 相依失敗 / 逾時 / 略過 → 不執行
+        for step in list(waiting):
+            blocked = [d for d in step.deps if d in timings and timings[d]['status'] != DONE]
+            if blocked:
+                waiting.remove(step)
+                finish(step, SKIPPED, time.perf_counter(), error=f"相依步驟未完成: {', '.join(blocked)}")
+
+        ready = [s for s in waiting
+                 if all(d in results for d in s.deps) and all(d in timings for d in s.after)]
+        for step in ready:
+            waiting.remove(step)
+            submitted = time.perf_counter()
+            if executor is None:
+                try:
+                    collect(step, submitted, _run_step(step, results))
+                except Exception as e:
+                    finish(step, FAILED, submitted, error=e)
+                continue
+            step_timeout = step.timeout if step.timeout is not None else timeout
+            deadline = submitted + step_timeout if step_timeout else None
+            running[executor.submit(_run_step, step, dict(results))] = (step, submitted, deadline)
+
+        if not running:
+            if waiting and not ready:
+                raise ValueError(f"相依圖有循環: {[s.name for s in waiting]}")
+            continue
+
+        deadlines = [d for _, _, d in running.values() if d is not None]
+        wait_for = max(0.0, min(deadlines) - time.perf_counter()) if deadlines else None
+        done, _ = wait(list(running), timeout=wait_for, return_when=FIRST_COMPLETED)
+
+        for future in done:
+            step, submitted, _ = running.pop(future)
+            try:
+                collect(step, submitted, future.result())
+            except Exception as e:
+                finish(step, FAILED, submitted, error=e)
+
+        now = time.perf_counter()
+        for future, (step, submitted, deadline) in list(running.items()):
+            if deadline is not None and now >= deadline:
+                # 尚未開始的直接取消；已在執行的讓它自行結束（HTTP 呼叫有各自的 timeout），結果不再使用
+                future.cancel()
+                running.pop(future)
+                finish(step, TIMEOUT, submitted,
+                       error=StepTimeout(f"超過 {deadline - submitted:g} 秒"))
+
+    return results, timings
@@ -0,0 +1,16 @@
+"""
+測試共用設定
+- 匯入 app 前先把 SQLite 指到暫存檔，app 啟動時的 init_db 不會碰到工作目錄的資料庫
+- 設定 DATABASE_URL=postgresql://... 時另外對 PostgreSQL 跑一次（未設定則略過）
+"""
+
+import os
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+TEST_DATABASE_URL = os.environ.pop('DATABASE_URL', '')
+os.environ['DATABASE_PATH'] = os.path.join(tempfile.mkdtemp(prefix='retire-test-'), 'test.db')
+os.environ.setdefault('COMPRESS_STATIC_AT_STARTUP', '0')
@@ -0,0 +1,83 @@
+"""
+ASGI 橋接：請求內容由 WSGI 執行緒邊讀邊收（分段、chunked、不讀內容的請求不收）
+"""
+
+import asyncio
+import os
+import uuid
+
+import pytest
+
+import app as retire_app
+from upload_store import upload_store
+
+asgi = pytest.importorskip('asgi')
+
+
+@pytest.fixture
+def uploads(tmp_path, monkeypatch):
+    monkeypatch.setattr(retire_app, 'UPLOAD_DIR', str(tmp_path))
+    monkeypatch.setattr(upload_store, 'upload_dir', str(tmp_path))
+    return tmp_path
+
+
+def request(method, path, chunks=(), headers=()):
+    """以 ASGI 呼叫 app，回傳 (status, body, 被取走的段數)"""
+    pending = [{'type': 'http.request', 'body': chunk, 'more_body': i < len(chunks) - 1}
+               for i, chunk in enumerate(chunks)] or [{'type': 'http.request', 'body': b''}]
+    received = []
+    sent = []
+
+    async def receive():
+        received.append(pending[len(received)])
+        return received[-1]
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {'type': 'http', 'method': method, 'path': path, 'query_string': b'',
+             'headers': [(k.encode('latin-1'), v.encode('latin-1')) for k, v in headers]}
+    asyncio.run(asgi.app(scope, receive, send))
+    status = sent[0]['status']
+    body = b''.join(m.get('body', b'') for m in sent[1:])
+    return status, body, len(received)
+
+
+def multipart(fields, files):
+    boundary = uuid.uuid4().hex
+    parts = []
+    for name, value in fields.items():
+        parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode())
+    for name, (filename, content) in files.items():
+        parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"; filename="{filename}"\r\n'
+                     f'Content-Type: image/jpeg\r\n\r\n'.encode() + content + b'\r\n')
+    parts.append(f'--{boundary}--\r\n'.encode())
+    return f'multipart/form-data; boundary={boundary}', b''.join(parts)
+
+
+def split(data, size):
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+@pytest.mark.parametrize('chunked', [False, True])
+def test_upload_streamed_in_chunks(uploads, chunked):
+    user_id = f'test-{uuid.uuid4().hex[:12]}'
+    photo = b'\xff\xd8' + os.urandom(300 * 1024)
+    content_type, body = multipart({'user_id': user_id}, {'photo': ('p.jpg', photo)})
+    headers = [('content-type', content_type)]
+    if not chunked:
+        headers.append(('content-length', str(len(body))))
+    chunks = split(body, 16 * 1024)
+
+    status, response, received = request('POST', '/spot/1/checkin', chunks, headers)
+    assert status == 200
+    assert b'"success":true' in response.replace(b' ', b'')
+    assert received == len(chunks)
+    saved = [name for name in os.listdir(uploads) if name.startswith(user_id)]
+    assert len(saved) == 1 and (uploads / saved[0]).read_bytes() == photo
+
+
+def test_body_not_read_is_not_received():
+    status, _, received = request('GET', '/')
+    assert status == 200
+    assert received == 0
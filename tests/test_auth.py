@@ -0,0 +1,33 @@
+"""營運用端點的 Bearer token 驗證"""
+
+from flask import Flask
+
+from auth import require_token
+
+
+def make_client(token):
+    app = Flask(__name__)
+
+    @app.route('/admin')
+    def admin():
+        require_token(token)
+        return 'ok'
+
+    return app.test_client()
+
+
+def test_unset_token_disables_endpoint():
+    client = make_client('')
+    assert client.get('/admin').status_code == 404
+    assert client.get('/admin', headers={'Authorization': 'Bearer '}).status_code == 404
+
+
+def test_bearer_token():
+    client = make_client('s3cret')
+    response = client.get('/admin')
+    assert response.status_code == 401
+    assert response.headers['WWW-Authenticate'] == 'Bearer'
+    assert client.get('/admin', headers={'Authorization': 'Bearer wrong'}).status_code == 401
+    assert client.get('/admin', headers={'Authorization': 'Basic s3cret'}).status_code == 401
+    assert client.get('/admin', headers={'Authorization': 'Bearer s3cret'}).data == b'ok'
+    assert client.get('/admin', headers={'Authorization': 'bearer s3cret'}).status_code == 200
@@ -0,0 +1,130 @@
+"""
+批次打卡 /api/checkins/batch：各項目狀態、冪等鍵重送與衝突、照片清除、group commit
+"""
+
+import io
+import json
+import os
+import uuid
+
+import pytest
+
+import app as retire_app
+import repository
+from db_writer import GroupCommitWriter
+from upload_store import upload_store
+
+
+@pytest.fixture
+def uploads(tmp_path, monkeypatch):
+    monkeypatch.setattr(retire_app, 'UPLOAD_DIR', str(tmp_path))
+    monkeypatch.setattr(upload_store, 'upload_dir', str(tmp_path))
+    return tmp_path
+
+
+@pytest.fixture
+def client(uploads):
+    return retire_app.app.test_client()
+
+
+@pytest.fixture
+def user_id():
+    return f'test-{uuid.uuid4().hex[:12]}'
+
+
+@pytest.fixture(scope='module')
+def spot_ids():
+    with retire_app.get_db() as conn:
+        return [s['id'] for s in repository.get_atlas_spots(conn, 'nobody')[:4]]
+
+
+def post_batch(client, user_id, items, photos=None):
+    if photos is None:
+        return client.post('/api/checkins/batch', json={'user_id': user_id, 'items': items})
+    data = {'payload': json.dumps({'user_id': user_id, 'items': items})}
+    for field, content in photos.items():
+        data[field] = (io.BytesIO(content), f'{field}.jpg')
+    return client.post('/api/checkins/batch', data=data, content_type='multipart/form-data')
+
+
+def checked_in(user_id):
+    with retire_app.get_db() as conn:
+        return sorted(repository.get_collected_spot_ids(conn, user_id))
+
+
+def test_item_statuses(client, user_id, spot_ids):
+    retire_app.run_write(retire_app.insert_checkin, user_id, spot_ids[1], '', None)
+    response = post_batch(client, user_id, [
+        {'spot_id': spot_ids[0]},
+        {'spot_id': spot_ids[1]},
+        {'spot_id': 999999},
+        {'spot_id': True},
+        {'spot_id': '3'},
+        'not-an-item',
+    ])
+    assert response.status_code == 200
+    body = response.get_json()
+    assert [r['status'] for r in body['results']] == [
+        'created', 'duplicate', 'not_found', 'invalid', 'invalid', 'invalid']
+    assert body['created'] == 1
+    assert checked_in(user_id) == sorted(spot_ids[:2])
+
+
+def test_bool_spot_id_does_not_check_in_spot_1(client, user_id):
+    body = post_batch(client, user_id, [{'spot_id': True}, {'spot_id': False}]).get_json()
+    assert [r['status'] for r in body['results']] == ['invalid', 'invalid']
+    assert checked_in(user_id) == []
+
+
+def test_replay_and_key_conflict(client, user_id, spot_ids):
+    items = [{'spot_id': spot_ids[0], 'idempotency_key': 'k1'},
+             {'spot_id': spot_ids[1], 'idempotency_key': 'k2'}]
+    first = post_batch(client, user_id, items).get_json()
+    assert [r['status'] for r in first['results']] == ['created', 'created']
+
+    again = post_batch(client, user_id, items + [
+        {'spot_id': spot_ids[2], 'idempotency_key': 'k1'},  # 同一個鍵用在別的景點
+        {'spot_id': spot_ids[3], 'idempotency_key': 'k3'},
+        {'spot_id': spot_ids[3], 'idempotency_key': 'k3'},  # 本批重複
+    ]).get_json()
+    statuses = [(r['status'], r['success']) for r in again['results']]
+    assert statuses == [('replayed', True), ('replayed', True), ('key_conflict', False),
+                        ('created', True), ('replayed', True)]
+    assert again['results'][0]['message'] == first['results'][0]['message']
+    assert again['created'] == 1
+    assert checked_in(user_id) == sorted([spot_ids[0], spot_ids[1], spot_ids[3]])
+
+
+def test_photos_removed_unless_created(client, user_id, spot_ids, uploads):
+    retire_app.run_write(retire_app.insert_checkin, user_id, spot_ids[1], '', None)
+    body = post_batch(client, user_id, [
+        {'spot_id': spot_ids[0], 'photo': 'p0'},
+        {'spot_id': spot_ids[1], 'photo': 'p1'},
+    ], photos={'p0': b'\xff\xd8' + os.urandom(500), 'p1': b'\xff\xd8' + os.urandom(500)}).get_json()
+    assert [r['status'] for r in body['results']] == ['created', 'duplicate']
+    assert body['results'][0]['has_photo']
+    with retire_app.get_db() as conn:
+        photo_url = repository.get_checkin(conn, user_id, spot_ids[0])['photo_url']
+    assert os.listdir(uploads) == [photo_url.rsplit('/', 1)[-1]]
+
+
+def test_failed_transaction_removes_all_photos(client, user_id, spot_ids, uploads, monkeypatch):
+    def broken(*args, **kwargs):
+        raise RuntimeError('boom')
+    monkeypatch.setattr(retire_app, 'insert_checkin', broken)
+    response = post_batch(client, user_id, [{'spot_id': spot_ids[0], 'photo': 'p0'}],
+                          photos={'p0': b'\xff\xd8' + os.urandom(500)})
+    assert response.status_code == 500
+    assert os.listdir(uploads) == []
+    assert checked_in(user_id) == []
+
+
+def test_batch_goes_through_group_commit_writer(client, user_id, spot_ids, monkeypatch):
+    writer = GroupCommitWriter(retire_app.get_db)
+    monkeypatch.setattr(retire_app, 'db_writer', writer)
+    # 成就檢查另外寫入，這裡只計算批次打卡本身
+    monkeypatch.setattr(retire_app, 'check_achievements', lambda user_id: [])
+    body = post_batch(client, user_id, [{'spot_id': s, 'idempotency_key': f'g{s}'} for s in spot_ids]).get_json()
+    assert body['created'] == len(spot_ids)
+    assert writer.stats['writes'] == 1
+    assert checked_in(user_id) == sorted(spot_ids)
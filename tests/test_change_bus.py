@@ -0,0 +1,74 @@
+"""
+change_log 清除：由寫入端在所屬交易內執行，poll 不開寫入交易
+"""
+
+import time
+import uuid
+
+import pytest
+
+import app as retire_app
+import change_bus as bus_module
+from change_bus import change_bus, record_change, prune_change_log, CHANGE_LOG_RETENTION_SECONDS
+
+
+def change_ids():
+    with retire_app.get_db() as conn:
+        return [r['id'] for r in conn.execute("SELECT id FROM change_log ORDER BY id").fetchall()]
+
+
+def add_changes(ages):
+    """依序寫入 created_at 為 now - age 的紀錄，回傳 id"""
+    now = time.time()
+
+    def write(conn):
+        for age in ages:
+            conn.execute("INSERT INTO change_log (scope, user_id, created_at) VALUES (?, ?, ?)",
+                         ('test', f'test-{uuid.uuid4().hex[:12]}', now - age))
+        return conn.execute("SELECT id FROM change_log ORDER BY id DESC LIMIT ?", (len(ages),)).fetchall()
+    return sorted(r['id'] for r in retire_app.run_write(write))
+
+
+@pytest.fixture
+def empty_log():
+    retire_app.run_write(lambda conn: conn.execute("DELETE FROM change_log"))
+
+
+def test_prune_keeps_unexpired_rows(empty_log):
+    expired = CHANGE_LOG_RETENTION_SECONDS + 60
+    ids = add_changes([expired, expired, 10, 0])
+    retire_app.run_write(prune_change_log)
+    assert change_ids() == ids[2:]
+
+    retire_app.run_write(prune_change_log, time.time() + 2 * CHANGE_LOG_RETENTION_SECONDS)
+    assert change_ids() == []
+
+
+def test_record_change_prunes_once_per_interval(empty_log, monkeypatch):
+    expired = CHANGE_LOG_RETENTION_SECONDS + 60
+    add_changes([expired])
+    monkeypatch.setattr(change_bus, '_last_prune', 0.0)
+    retire_app.run_write(record_change, 'test', 'a')
+    assert len(change_ids()) == 1
+
+    # 間隔內不再清除
+    add_changes([expired])
+    retire_app.run_write(record_change, 'test', 'b')
+    assert len(change_ids()) == 3
+
+
+def test_poll_does_not_open_write_transaction(monkeypatch):
+    opened = []
+    open_db = change_bus.open_db
+
+    def recording_open_db(immediate=False):
+        opened.append(immediate)
+        return open_db(immediate=immediate)
+
+    monkeypatch.setattr(change_bus, 'open_db', recording_open_db)
+    monkeypatch.setattr(change_bus, '_last_prune', 0.0)
+    monkeypatch.setattr(bus_module, 'PRUNE_INTERVAL_SECONDS', 0)
+    change_bus.poll()
+    add_changes([0])
+    change_bus.poll()
+    assert opened and not any(opened)
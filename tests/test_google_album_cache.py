@@ -0,0 +1,65 @@
+"""
+打卡同步與打卡記錄頁的相簿查詢走 media_cache：相簿列表只在第一次查詢（以本機模擬的 Google API 驗證）
+"""
+
+import io
+import logging
+import os
+import threading
+import uuid
+
+import pytest
+from werkzeug.serving import make_server
+
+import app as retire_app
+import fake_google_api
+from upload_store import upload_store
+
+pytestmark = pytest.mark.skipif(not retire_app.GOOGLE_ENABLED, reason='未載入 Google 模組')
+
+
+@pytest.fixture
+def fake_google(monkeypatch):
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+    state = fake_google_api.FakeGoogleState()
+    server = make_server('127.0.0.1', 0, fake_google_api.create_app(state), threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    import google_integration
+    for name in ('GOOGLE_OAUTH_BASE', 'GOOGLE_APIS_BASE', 'PHOTOS_API_BASE', 'DOCS_API_BASE', 'IMGBB_API_BASE'):
+        monkeypatch.setattr(google_integration, name, f'http://127.0.0.1:{server.server_port}')
+    yield state
+    server.shutdown()
+
+
+@pytest.fixture
+def client(fake_google, tmp_path, monkeypatch):
+    from google_tokens import token_store
+    monkeypatch.setattr(retire_app, 'UPLOAD_DIR', str(tmp_path))
+    monkeypatch.setattr(upload_store, 'upload_dir', str(tmp_path))
+    client = retire_app.app.test_client()
+    # 每個測試一個新的 Google 帳號，相簿 id 快取不受其他測試影響
+    sid = token_store.create({'access_token': 'fake-token', 'expires_in': 3600},
+                             {'email': f'{uuid.uuid4().hex[:8]}@example.com'})
+    with client.session_transaction() as session:
+        session['google_sid'] = sid
+    return client
+
+
+def album_calls(state):
+    endpoints = state.snapshot()['endpoints']
+    return {name: entry['count'] for name, entry in endpoints.items() if name.startswith('albums.')}
+
+
+def test_album_listed_once_across_checkins_and_page_views(client, fake_google):
+    user_id = f'test-{uuid.uuid4().hex[:12]}'
+    for spot_id in (1, 2, 3):
+        response = client.post(f'/spot/{spot_id}/checkin', data={
+            'user_id': user_id, 'photo': (io.BytesIO(b'\xff\xd8' + os.urandom(500)), 'p.jpg'),
+        }, content_type='multipart/form-data')
+        assert response.get_json()['success']
+    for _ in range(3):
+        response = client.get(f'/checkins?user={user_id}')
+        assert b'photos.google.com/lr/album/' in response.data
+
+    assert album_calls(fake_google).get('albums.list') == 1
+    assert fake_google.snapshot()['resources']['media_items'] == 3
@@ -0,0 +1,103 @@
+"""
+收集排行榜：Fenwick tree、同分名次、擴充大小、負分，以及增量更新與重建的名次一致
+"""
+
+import uuid
+
+import pytest
+
+import app as retire_app
+import repository
+from leaderboard import FenwickTree, RegionBoard, Leaderboard, OVERALL, rarity_points
+
+
+def test_fenwick_prefix_counts():
+    tree = FenwickTree(10)
+    for score in (0, 3, 3, 7, 9):
+        tree.add(score, 1)
+    assert [tree.prefix(i) for i in (0, 2, 3, 6, 7, 9, 50)] == [1, 1, 3, 3, 4, 5, 5]
+    tree.add(3, -1)
+    assert tree.prefix(3) == 2
+
+
+def test_fenwick_rejects_negative_index():
+    with pytest.raises(ValueError):
+        FenwickTree(10).add(-1, 1)
+
+
+def test_ties_share_rank():
+    board = RegionBoard(50)
+    for user_id, score in (('a', 20), ('b', 8), ('c', 8), ('d', 3), ('e', 8)):
+        board.set(user_id, score)
+    assert [board.rank(board.scores[u]) for u in 'abcde'] == [1, 2, 2, 5, 2]
+
+    board.set('a', 1)
+    assert [board.rank(board.scores[u]) for u in 'abcde'] == [5, 1, 1, 4, 1]
+
+
+def test_grow_keeps_counts():
+    board = RegionBoard(4)
+    for user_id, score in (('a', 1), ('b', 3), ('c', 5)):
+        board.set(user_id, score)
+    board.set('d', 100)
+    assert board.tree.size > 100
+    assert [board.rank(board.scores[u]) for u in 'dcba'] == [1, 2, 3, 4]
+    assert board.tree.prefix(1000) == 4
+
+
+@pytest.mark.parametrize('score', [0, -3])
+def test_non_positive_score_removes_user(score):
+    board = RegionBoard(10)
+    board.set('a', 5)
+    board.set('b', 2)
+    board.set('a', score)
+    assert 'a' not in board.scores
+    assert board.rank(board.scores['b']) == 1
+    assert board.tree.prefix(10) == 1
+
+
+def new_user():
+    return f'test-{uuid.uuid4().hex[:12]}'
+
+
+def fresh_ranks(region=OVERALL):
+    """重新由 user_scores 建立（不經增量更新）"""
+    board = Leaderboard(retire_app.get_db)
+    with board._lock:
+        board._sync()
+    target = board._boards.get(region)
+    return {user_id: target.rank(score) for user_id, score in target.scores.items()}
+
+
+def test_incremental_matches_rebuild():
+    with retire_app.get_db() as conn:
+        spots = [dict(s) for s in repository.get_atlas_spots(conn, new_user())]
+    # 稀有度高的排前面，各用戶分數才會拉開
+    spots = sorted(spots, key=lambda s: -rarity_points(s['rarity']))[:8]
+    users = [new_user() for _ in range(5)]
+    retire_app.leaderboard.rank(users[0])  # 先建好，之後走增量更新
+
+    for i, user_id in enumerate(users):
+        for spot in spots[:i + 1]:
+            status, _ = retire_app.run_write(retire_app.insert_checkin, user_id, spot['id'], '', None)
+            assert status == 'created'
+    # 取消其中一筆，讓分數減少
+    retire_app.app.test_client().post(f"/spot/{spots[0]['id']}/checkin/cancel", json={'user_id': users[4]})
+
+    expected = fresh_ranks()
+    for user_id in users:
+        result = retire_app.leaderboard.rank(user_id)
+        assert result['rank'] == expected[user_id]
+    assert retire_app.leaderboard.rank(users[4])['score'] == sum(
+        rarity_points(s['rarity']) for s in spots[1:5])
+
+
+def test_negative_stored_score_does_not_hang():
+    user_id = new_user()
+    retire_app.run_write(lambda conn: conn.execute(
+        "INSERT INTO user_scores (user_id, region, score, checkin_count) VALUES (?, ?, ?, ?)",
+        (user_id, OVERALL, -5, 1)))
+    retire_app.leaderboard.reset()
+    assert retire_app.leaderboard.rank(user_id) is None
+    entries, _ = retire_app.leaderboard.top(OVERALL, 100)
+    assert user_id not in [e['user_id'] for e in entries]
@@ -0,0 +1,110 @@
+"""
+相簿匯入重啟後接手：沒有行程持有的工作重新執行、被鎖住的不動、暫存照片遺失的標記失敗、清除孤兒暫存目錄
+"""
+
+import os
+import time
+import uuid
+
+import pytest
+
+import app as retire_app
+import photo_import
+from photo_import import photo_importer, lock_staging, QUEUED, RUNNING, DONE, FAILED
+
+
+@pytest.fixture
+def staging_root(tmp_path, monkeypatch):
+    monkeypatch.setattr(photo_import, 'IMPORT_STAGING_DIR', str(tmp_path))
+    monkeypatch.setattr(photo_import, 'IMPORT_PROCESSES', 0)
+    monkeypatch.setattr(photo_importer, '_pid', None)
+    yield tmp_path
+    # 留下的未完成工作不影響下一個測試的計數
+    retire_app.run_write(lambda conn: conn.execute(
+        "UPDATE import_jobs SET status = ? WHERE status IN (?, ?)", (DONE, QUEUED, RUNNING)))
+
+
+def make_job(staging_root, status=RUNNING, staged=True):
+    """模擬中斷的工作：第 0 張已處理、第 1、2 張還在暫存目錄"""
+    job_id = uuid.uuid4().hex
+    user_id = f'test-{uuid.uuid4().hex[:12]}'
+
+    def insert(conn):
+        conn.execute('''
+            INSERT INTO import_jobs (id, user_id, status, radius_m, total, processed)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', (job_id, user_id, status, 300, 3, 1))
+        conn.executemany('''
+            INSERT INTO import_job_items (job_id, position, filename, status, message)
+            VALUES (?, ?, ?, ?, ?)
+        ''', [(job_id, 0, 'a.jpg', 'no_gps', '照片沒有 GPS 資訊'),
+              (job_id, 1, 'b.jpg', 'pending', None),
+              (job_id, 2, 'c.jpg', 'pending', None)])
+    retire_app.run_write(insert)
+    staging = staging_root / job_id
+    if staged:
+        staging.mkdir()
+        for position in (1, 2):
+            (staging / f'{position}.jpg').write_bytes(b'\xff\xd8\xff\xd9')
+    return job_id, user_id, staging
+
+
+def wait_finished(job_id, user_id, timeout=10):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        job = photo_importer.status(job_id, user_id, include_items=True)
+        if job['status'] in (DONE, FAILED):
+            return job
+        time.sleep(0.05)
+    raise AssertionError(f'工作 {job_id} 沒有結束')
+
+
+@pytest.mark.parametrize('status', [QUEUED, RUNNING])
+def test_unlocked_job_is_resumed(staging_root, status):
+    job_id, user_id, staging = make_job(staging_root, status)
+    assert photo_importer.recover()['resumed'] == 1
+
+    job = wait_finished(job_id, user_id)
+    assert job['status'] == DONE
+    assert job['processed'] == 3
+    assert [item['status'] for item in job['items']] == ['no_gps', 'no_gps', 'no_gps']
+    assert not staging.exists()
+
+
+def test_locked_job_is_left_to_its_owner(staging_root):
+    job_id, user_id, staging = make_job(staging_root)
+    lock = lock_staging(str(staging))
+    try:
+        result = photo_importer.recover()
+    finally:
+        lock.close()
+    assert result == {'resumed': 0, 'failed': 0, 'removed': 0}
+    assert photo_importer.status(job_id, user_id)['status'] == RUNNING
+    assert staging.exists()
+
+
+def test_job_without_staging_is_failed(staging_root):
+    job_id, user_id, _ = make_job(staging_root, staged=False)
+    assert photo_importer.recover()['failed'] == 1
+
+    job = photo_importer.status(job_id, user_id, include_items=True)
+    assert job['status'] == FAILED
+    assert job['processed'] == job['total'] == 3
+    assert job['finished_at']
+    assert [item['status'] for item in job['items']] == ['no_gps', 'invalid', 'invalid']
+
+
+def test_orphan_staging_dirs_are_removed(staging_root):
+    old = time.time() - photo_import.ORPHAN_GRACE_SECONDS - 10
+    orphan, fresh, locked = (staging_root / name for name in ('orphan', 'fresh', 'locked'))
+    for path in (orphan, fresh, locked):
+        path.mkdir()
+        (path / '0.jpg').write_bytes(b'\xff\xd8')
+    lock = lock_staging(str(locked))
+    for path in (orphan, locked):
+        os.utime(path, (old, old))
+    try:
+        assert photo_importer.recover()['removed'] == 1
+    finally:
+        lock.close()
+    assert sorted(os.listdir(staging_root)) == ['fresh', 'locked']
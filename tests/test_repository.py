@@ -0,0 +1,163 @@
+"""
+資料存取層冒煙測試：同一組測試分別在 SQLite 與 PostgreSQL（有 DATABASE_URL 時）執行
+
+    python -m pytest -q tests
+    DATABASE_URL=postgresql://localhost/retire_test python -m pytest -q tests
+"""
+
+import json
+import uuid
+
+import pytest
+
+from conftest import TEST_DATABASE_URL
+import app as retire_app
+import repository
+import storage
+
+
+@pytest.fixture(scope='module', params=['sqlite', 'postgres'])
+def backend(request):
+    if request.param == 'sqlite':
+        backend = retire_app.db_backend
+    else:
+        if not TEST_DATABASE_URL:
+            pytest.skip('未設定 DATABASE_URL')
+        if not storage.PSYCOPG_AVAILABLE:
+            pytest.skip('未安裝 psycopg[pool]')
+        backend = storage.PostgresBackend(TEST_DATABASE_URL, min_size=1, max_size=2)
+
+    original = retire_app.db_backend
+    retire_app.db_backend = backend
+    retire_app.init_db()
+    yield backend
+    retire_app.db_backend = original
+    if backend is not original:
+        backend.close()
+
+
+@pytest.fixture
+def user_id():
+    # 每個測試用新的用戶，PostgreSQL 資料庫重複使用時不受上次結果影響
+    return f'test-{uuid.uuid4().hex[:12]}'
+
+
+def write(backend, fn, *args):
+    with backend.connect(immediate=True) as conn:
+        result = fn(conn, *args)
+        conn.commit()
+        return result
+
+
+def read(backend, fn, *args, **kwargs):
+    with backend.connect() as conn:
+        return fn(conn, *args, **kwargs)
+
+
+def first_route_and_spot(backend):
+    routes, spots = read(backend, repository.get_atlas_catalog)
+    assert routes and spots
+    return routes[0], spots[0]
+
+
+def test_catalog(backend):
+    route, spot = first_route_and_spot(backend)
+    totals = read(backend, repository.get_catalog_totals)
+    assert totals['spots_total'] > 0 and totals['achievements_total'] > 0
+
+    assert read(backend, repository.get_route, route['id'])['name'] == route['name']
+    assert read(backend, repository.get_spot, spot['id'])['route_name']
+    assert read(backend, repository.get_spot_scoring, spot['id'])['rarity'] == spot['rarity']
+    assert read(backend, repository.get_route_regions)
+    assert read(backend, repository.get_route_names)
+    assert read(backend, repository.get_routes_by_region, route['region'])
+    assert len(read(backend, repository.get_seasonal_routes, '春', 3)) <= 3
+
+
+def test_checkin_flow(backend, user_id):
+    _, spot = first_route_and_spot(backend)
+    assert read(backend, repository.get_checkin, user_id, spot['id']) is None
+
+    def checkin(conn):
+        repository.insert_checkin_request(conn, user_id, 'key-1', spot['id'])
+        repository.insert_checkin(conn, user_id, spot['id'], spot['route_id'], '2025-04-01', '筆記', None)
+        repository.insert_checkin_event(conn, user_id, spot['id'], 'checkin')
+        repository.save_checkin_response(conn, user_id, 'key-1', json.dumps({'success': True}))
+    write(backend, checkin)
+
+    assert read(backend, repository.get_checkin, user_id, spot['id'])['checkin_date'] == '2025-04-01'
+    assert read(backend, repository.get_collected_spot_ids, user_id) == [spot['id']]
+    assert read(backend, repository.get_checkins_for_spots, user_id, [spot['id']])[0]['note'] == '筆記'
+    assert read(backend, repository.get_checkins_for_spots, user_id, []) == []
+    assert read(backend, repository.get_user_checkins, user_id)[0]['spot_name'] == spot['name']
+    assert read(backend, repository.get_recent_checkins, user_id, 5)[0]['spot_name'] == spot['name']
+
+    request_row = read(backend, repository.get_checkin_request, user_id, 'key-1')
+    assert request_row['spot_id'] == spot['id'] and json.loads(request_row['response'])['success']
+    with pytest.raises(storage.IntegrityError):
+        write(backend, repository.insert_checkin_request, user_id, 'key-1', spot['id'])
+
+    version = read(backend, repository.get_collection_version, user_id)
+    assert version > 0
+    events = read(backend, repository.get_checkin_events, user_id, 0, version)
+    assert [e['action'] for e in events] == ['checkin']
+
+    stats = read(backend, repository.get_user_stats, user_id)
+    assert stats['checkin_count'] == 1 and stats['photo_count'] == 0
+    progress = read(backend, repository.get_routes_with_progress, user_id)
+    assert sum(r['collected_spots'] for r in progress) == 1
+    atlas = read(backend, repository.get_atlas_spots, user_id)
+    assert sum(s['collected'] for s in atlas) == 1
+    assert sum(s['collected'] for s in read(backend, repository.get_route_spots, spot['route_id'], user_id)) == 1
+
+    write(backend, repository.delete_checkin, user_id, spot['id'])
+    assert read(backend, repository.get_collected_spot_ids, user_id) == []
+
+
+def test_achievements(backend, user_id):
+    achievements = read(backend, repository.get_achievements)
+    target = achievements[0]
+    assert write(backend, repository.unlock_achievement, user_id, target['id'])
+    assert not write(backend, repository.unlock_achievement, user_id, target['id'])
+
+    assert read(backend, repository.get_unlocked_achievement_ids, user_id) == [target['id']]
+    assert read(backend, repository.get_unlocked_achievements, user_id, limit=6)[0]['name'] == target['name']
+    with_status = read(backend, repository.get_achievements_with_status, user_id)
+    assert sum(a['unlocked'] for a in with_status) == 1
+    assert read(backend, repository.get_home_summary, user_id)['achievement_count'] == 1
+
+
+def test_wishes_and_logs(backend, user_id):
+    write(backend, repository.insert_wish, user_id, {'name': '合歡山', 'region': '南投', 'priority': 1})
+    write(backend, repository.insert_wish, user_id, {'name': '太魯閣'})
+    wishes = read(backend, repository.get_wishes, user_id)
+    assert [w['name'] for w in wishes][0] == '合歡山'
+    wish_id = wishes[0]['id']
+
+    assert write(backend, repository.update_wish, user_id, wish_id, {'notes': '秋天去', 'unknown': 1}) == 1
+    assert read(backend, repository.get_wish, user_id, wish_id)['notes'] == '秋天去'
+    assert [r['region'] for r in read(backend, repository.get_wish_regions, user_id)] == ['南投']
+    assert len(read(backend, repository.get_wish_names, user_id)) == 2
+    assert len(read(backend, repository.get_pending_wishes, user_id, 8)) == 2
+
+    assert write(backend, repository.complete_wish, user_id, wish_id, '2025-05-01') == 1
+    assert write(backend, repository.complete_wishes_by_name, user_id, '魯閣', '2025-05-02') == 1
+    assert len(read(backend, repository.get_wishes, user_id, status='done')) == 2
+    assert read(backend, repository.get_wishes, user_id, status='pending') == []
+    assert len(read(backend, repository.get_wishes, user_id, region='南投')) == 1
+
+    write(backend, repository.insert_travel_log, user_id,
+          {'wish_id': wish_id, 'travel_date': '2025-05-01', 'rating': 4, 'diary': '很棒'})
+    logs = read(backend, repository.get_travel_logs, user_id)
+    assert logs[0]['wish_name'] == '合歡山'
+    assert read(backend, repository.find_wish_id, user_id, '合歡山', wishes[0]['created_at']) == wish_id
+    assert read(backend, repository.find_wish_id, user_id, '合歡山', None) is None
+    assert read(backend, repository.find_travel_log_id, user_id, '2025-05-01', logs[0]['created_at']) == logs[0]['id']
+    assert read(backend, repository.find_travel_log_id, user_id, '2025-05-02', logs[0]['created_at']) is None
+    assert read(backend, repository.get_user_stats, user_id)['diary_count'] == 1
+
+    routes, spots, found = read(backend, repository.search_content, '合歡', user_id)
+    assert [w['name'] for w in found] == ['合歡山']
+
+    assert write(backend, repository.delete_wish, user_id, wish_id) == 1
+    assert len(read(backend, repository.get_wishes, user_id)) == 1
@@ -0,0 +1,171 @@
+"""
+用戶資料匯出 / 匯入：簽章連結、管理 token、來回匯入、重複匯入去重、格式錯誤與大小上限
+"""
+
+import io
+import json
+import os
+import uuid
+import zipfile
+
+import pytest
+
+import app as retire_app
+import repository
+import user_archive as archive_module
+from upload_store import upload_store
+from user_archive import user_archive, ArchiveError, ARCHIVE_FORMAT, ARCHIVE_VERSION
+
+ADMIN = {'Authorization': 'Bearer test-admin'}
+
+
+@pytest.fixture
+def uploads(tmp_path, monkeypatch):
+    # 照片寫到暫存目錄，不碰 static/uploads
+    upload_dir = tmp_path / 'uploads'
+    upload_dir.mkdir()
+    monkeypatch.setattr(retire_app, 'UPLOAD_DIR', str(upload_dir))
+    monkeypatch.setattr(upload_store, 'upload_dir', str(upload_dir))
+    monkeypatch.setattr(user_archive, 'upload_dir', str(upload_dir))
+    return upload_dir
+
+
+@pytest.fixture
+def client(uploads, monkeypatch):
+    monkeypatch.setattr(retire_app, 'ADMIN_TOKEN', 'test-admin')
+    return retire_app.app.test_client()
+
+
+def new_user():
+    return f'test-{uuid.uuid4().hex[:12]}'
+
+
+def seed_user(client, user_id):
+    """一個願望、一筆連到願望的旅遊紀錄、兩個有照片的打卡"""
+    retire_app.run_write(repository.insert_wish, user_id, {'name': '墾丁', 'region': '南部'})
+    with retire_app.get_db() as conn:
+        wish_id = repository.get_wishes(conn, user_id)[0]['id']
+    retire_app.run_write(repository.insert_travel_log, user_id,
+                         {'wish_id': wish_id, 'travel_date': '2025-01-02', 'rating': 4, 'diary': '好玩'})
+    for spot_id in (1, 2):
+        response = client.post(f'/spot/{spot_id}/checkin', data={
+            'user_id': user_id, 'note': f'n{spot_id}',
+            'photo': (io.BytesIO(b'\xff\xd8' + os.urandom(2000)), 'p.jpg'),
+        }, content_type='multipart/form-data')
+        assert response.get_json()['success']
+
+
+def counts(user_id):
+    with retire_app.get_db() as conn:
+        return {table: conn.execute(f"SELECT COUNT(*) FROM {table} WHERE user_id = ?", (user_id,)).fetchone()[0]
+                for table in ('wishes', 'travel_logs', 'checkins', 'checkin_events')}
+
+
+def import_archive(client, data, user_id, headers=ADMIN):
+    return client.post('/api/import/archive', headers=headers, content_type='multipart/form-data',
+                       data={'user_id': user_id, 'archive': (io.BytesIO(data), 'user.zip')})
+
+
+def make_archive(path, files, manifest=None):
+    manifest = manifest if manifest is not None else {'format': ARCHIVE_FORMAT, 'version': ARCHIVE_VERSION}
+    with zipfile.ZipFile(path, 'w', compression=zipfile.ZIP_DEFLATED) as zf:
+        for name, content in files.items():
+            zf.writestr(name, content)
+        zf.writestr('manifest.json', json.dumps(manifest))
+    return path
+
+
+def test_export_requires_signed_link(client):
+    user_id = new_user()
+    assert client.get(f'/api/export/{user_id}').status_code == 403
+    assert client.get(f'/api/export/{user_id}?token=forged').status_code == 403
+    other = retire_app.export_signer.dumps(new_user())
+    assert client.get(f'/api/export/{user_id}?token={other}').status_code == 403
+
+    token = retire_app.export_signer.dumps(user_id)
+    response = client.get(f'/api/export/{user_id}?token={token}')
+    assert response.status_code == 200
+    assert 'manifest.json' in zipfile.ZipFile(io.BytesIO(response.data)).namelist()
+
+
+def test_import_requires_admin_token(client, monkeypatch):
+    data = b''.join(user_archive.export_stream(new_user()))
+    assert import_archive(client, data, new_user(), headers={}).status_code == 401
+    monkeypatch.setattr(retire_app, 'ADMIN_TOKEN', '')
+    assert import_archive(client, data, new_user()).status_code == 404
+
+
+def test_round_trip_and_reimport(client, uploads):
+    source, target = new_user(), new_user()
+    seed_user(client, source)
+    data = b''.join(user_archive.export_stream(source))
+
+    response = import_archive(client, data, target)
+    assert response.status_code == 200
+    imported = response.get_json()['imported']
+    assert (imported['wishes'], imported['travel_logs'], imported['checkins'], imported['photos']) == (1, 1, 2, 2)
+    assert counts(target) == counts(source)
+    with retire_app.get_db() as conn:
+        log = repository.get_travel_logs(conn, target)[0]
+        assert log['wish_name'] == '墾丁'
+        photos = [c['photo_url'] for c in repository.get_user_checkins(conn, target)]
+    assert all(os.path.isfile(uploads / p.rsplit('/', 1)[-1]) for p in photos)
+
+    # 重複匯入：全部略過，資料與照片都不增加
+    files_before = len(os.listdir(uploads))
+    imported = import_archive(client, data, target).get_json()['imported']
+    assert (imported['wishes'], imported['travel_logs'], imported['checkins'], imported['photos']) == (0, 0, 0, 0)
+    assert (imported['wishes_skipped'], imported['travel_logs_skipped'], imported['checkins_skipped']) == (1, 1, 2)
+    assert counts(target) == counts(source)
+    assert len(os.listdir(uploads)) == files_before
+
+
+@pytest.mark.parametrize('files, message', [
+    ({'wishes.jsonl': '[1, 2]\n'}, '不是 JSON 物件'),
+    ({'wishes.jsonl': '{"id": 1}\n'}, '缺少 name'),
+    ({'wishes.jsonl': '{"id": true, "name": "墾丁"}\n'}, 'id 格式錯誤'),
+    ({'wishes.jsonl': '{"id": 1, "name": "墾丁"}\n', 'checkins.jsonl': '{"spot_name": ["x"]}\n'}, 'spot_name'),
+    ({'travel_logs.jsonl': '{"wish_id": 1,\n'}, '格式錯誤'),
+    ({'achievements.jsonl': b'\xff\xfe\n'}, '格式錯誤'),
+])
+def test_malformed_rows_are_rejected_before_writing(tmp_path, uploads, files, message):
+    user_id = new_user()
+    path = make_archive(tmp_path / 'bad.zip', files)
+    with pytest.raises(ArchiveError, match=message):
+        user_archive.import_file(str(path), user_id)
+    assert counts(user_id) == {'wishes': 0, 'travel_logs': 0, 'checkins': 0, 'checkin_events': 0}
+
+
+def test_bad_archives(tmp_path, uploads):
+    (tmp_path / 'junk.zip').write_bytes(b'junk')
+    with pytest.raises(ArchiveError, match='不是 ZIP'):
+        user_archive.import_file(str(tmp_path / 'junk.zip'), new_user())
+    with pytest.raises(ArchiveError, match='不支援'):
+        user_archive.import_file(str(make_archive(tmp_path / 'list.zip', {}, manifest=[1])), new_user())
+    with zipfile.ZipFile(tmp_path / 'empty.zip', 'w'):
+        pass
+    with pytest.raises(ArchiveError, match='manifest'):
+        user_archive.import_file(str(tmp_path / 'empty.zip'), new_user())
+
+
+def test_size_limits(tmp_path, uploads, monkeypatch):
+    monkeypatch.setattr(archive_module, 'ARCHIVE_MAX_PHOTO_BYTES', 1024)
+    monkeypatch.setattr(archive_module, 'ARCHIVE_MAX_UNCOMPRESSED_BYTES', 64 * 1024)
+    checkin = json.dumps({'spot_name': '台北車站', 'photo_url': '/static/uploads/a.jpg'}) + '\n'
+
+    big_photo = make_archive(tmp_path / 'photo.zip', {'checkins.jsonl': checkin, 'photos/a.jpg': b'\0' * 2048})
+    with pytest.raises(ArchiveError, match='照片'):
+        user_archive.import_file(str(big_photo), new_user())
+
+    # 高壓縮率的檔案（zip bomb）以解壓後大小計算
+    bomb = make_archive(tmp_path / 'bomb.zip', {'wishes.jsonl': b' ' * (128 * 1024)})
+    assert os.path.getsize(bomb) < 4096
+    with pytest.raises(ArchiveError, match='解壓後'):
+        user_archive.import_file(str(bomb), new_user())
+    assert os.listdir(uploads) == []
+
+
+def test_upload_size_limit(client, monkeypatch):
+    monkeypatch.setattr(retire_app, 'ARCHIVE_MAX_UPLOAD_BYTES', 100)
+    response = import_archive(client, b'\0' * 1000, new_user())
+    assert response.status_code == 413
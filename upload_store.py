@@ -0,0 +1,313 @@
+"""
+上傳檔案管理（static/uploads）
+- 每個上傳檔在 uploads 表記錄擁有者、大小與參照數（打卡的 photo_url）
+- 寫檔後立即 register（參照數 0），打卡寫入時在同一交易內 acquire（+1），取消打卡時 release（-1）
+  → 打卡失敗、行程中斷留下的檔案一定有紀錄，不會變成找不到的孤兒
+- 參照數為 0 超過 UPLOAD_GC_GRACE_SECONDS 的檔案由 GC 刪除：每次最多 UPLOAD_GC_BATCH 個，
+  每隔 UPLOAD_GC_INTERVAL_SECONDS 在上傳時順便執行一輪（寬限期避免刪掉交易尚未提交的新照片）
+- reconcile 依磁碟與 checkins 重建整張表（既有資料庫升級、手動修正用）
+
+命令列：
+    python upload_store.py gc          # 清到沒有可刪的孤兒檔
+    python upload_store.py reconcile   # 依磁碟與 checkins 重建 uploads
+    python upload_store.py usage       # 用量統計
+
+環境變數：
+    UPLOAD_GC_GRACE_SECONDS      參照數為 0 後保留的秒數（預設 3600）
+    UPLOAD_GC_BATCH              每輪最多刪除的檔案數（預設 100）
+    UPLOAD_GC_INTERVAL_SECONDS   自動 GC 的最短間隔（預設 300，0 = 不自動執行）
+"""
+
+import os
+import sys
+import time
+import shutil
+import threading
+from photo_server import remove_variants
+
+UPLOAD_GC_GRACE_SECONDS = float(os.environ.get('UPLOAD_GC_GRACE_SECONDS', '3600'))
+UPLOAD_GC_BATCH = int(os.environ.get('UPLOAD_GC_BATCH', '100'))
+UPLOAD_GC_INTERVAL_SECONDS = float(os.environ.get('UPLOAD_GC_INTERVAL_SECONDS', '300'))
+
+UPLOAD_URL_PREFIX = '/static/uploads/'
+# reconcile 每次 executemany 寫入的筆數
+RECONCILE_CHUNK = 1000
+
+
+def upload_filename(photo_url):
+    """/static/uploads/<檔名> → 檔名（其他網址回傳 None）"""
+    if not photo_url or not photo_url.startswith(UPLOAD_URL_PREFIX):
+        return None
+    name = photo_url[len(UPLOAD_URL_PREFIX):]
+    # 只接受單層檔名，避免 ../ 之類的路徑
+    if not name or name != os.path.basename(name) or name.startswith('.'):
+        return None
+    return name
+
+
+def upload_url(filename):
+    return UPLOAD_URL_PREFIX + filename
+
+
+class UploadStore:
+    """上傳檔的登記、參照計數、GC 與用量（由 app 注入資料庫）"""
+
+    def __init__(self):
+        self.open_db = None
+        self.run_write = None
+        self.upload_dir = None
+        self._lock = threading.Lock()
+        self._last_gc = 0.0
+        self.stats = {'registered': 0, 'collected': 0, 'collected_bytes': 0}
+
+    def configure(self, open_db, run_write, upload_dir):
+        self.open_db = open_db
+        self.run_write = run_write
+        self.upload_dir = upload_dir
+
+    def path(self, filename):
+        return os.path.join(self.upload_dir, filename)
+
+    # ---------- 登記與參照 ----------
+
+    def register(self, filename, user_id, size):
+        """檔案寫入後登記（參照數 0，之後由打卡 acquire）"""
+        self.register_many([(filename, user_id, size)])
+
+    def register_many(self, files):
+        """一次登記多個檔案：files 為 (檔名, user_id, bytes) 列表"""
+        if not files:
+            return
+        now = time.time()
+        self.run_write(lambda conn: conn.executemany('''
+            INSERT INTO uploads (filename, user_id, size, refcount, created_at, orphaned_at)
+            VALUES (?, ?, ?, 0, ?, ?)
+            ON CONFLICT (filename) DO UPDATE SET size = excluded.size
+        ''', [(filename, user_id, size, now, now) for filename, user_id, size in files]))
+        self.stats['registered'] += len(files)
+        self.maybe_collect()
+
+    def acquire(self, conn, photo_url):
+        """打卡參照照片（與打卡寫入在同一交易內）"""
+        filename = upload_filename(photo_url)
+        if filename:
+            conn.execute(
+                "UPDATE uploads SET refcount = refcount + 1, orphaned_at = NULL WHERE filename = ?",
+                (filename,)
+            )
+
+    def release(self, conn, photo_url):
+        """取消參照（與刪除打卡在同一交易內）；參照數歸 0 時開始計算寬限期"""
+        filename = upload_filename(photo_url)
+        if filename:
+            conn.execute('''
+                UPDATE uploads
+                SET refcount = CASE WHEN refcount > 0 THEN refcount - 1 ELSE 0 END,
+                    orphaned_at = CASE WHEN refcount <= 1 THEN ? ELSE orphaned_at END
+                WHERE filename = ?
+            ''', (time.time(), filename))
+
+    def discard(self, photo_url):
+        """
+        立即刪除沒有參照的上傳檔（取消打卡、打卡失敗時）
+        仍有參照時保留；沒有紀錄的舊檔案直接刪除
+
+        Returns:
+            bool: 是否已刪除
+        """
+        filename = upload_filename(photo_url)
+        if not filename:
+            return False
+
+        def delete(conn):
+            row = conn.execute("SELECT refcount FROM uploads WHERE filename = ?", (filename,)).fetchone()
+            if row and row['refcount'] > 0:
+                return False
+            conn.execute("DELETE FROM uploads WHERE filename = ?", (filename,))
+            return True
+
+        if not self.run_write(delete):
+            return False
+        self._remove_file(filename)
+        return True
+
+    def _remove_file(self, filename):
+        try:
+            os.remove(self.path(filename))
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            print(f"⚠️ 無法刪除上傳檔 {filename}: {e}")
+        remove_variants(self.upload_dir, filename)
+
+    # ---------- GC ----------
+
+    def maybe_collect(self):
+        """距離上次 GC 超過 UPLOAD_GC_INTERVAL_SECONDS 時執行一輪"""
+        if not UPLOAD_GC_INTERVAL_SECONDS:
+            return
+        now = time.time()
+        with self._lock:
+            if now - self._last_gc < UPLOAD_GC_INTERVAL_SECONDS:
+                return
+            self._last_gc = now
+        try:
+            self.collect()
+        except Exception as e:
+            print(f"⚠️ 上傳檔 GC 失敗: {e}")
+
+    def collect(self, limit=UPLOAD_GC_BATCH, now=None):
+        """
+        刪除一批參照數為 0 且超過寬限期的檔案
+
+        Returns:
+            dict: {'files': 刪除數, 'bytes': 釋放的 bytes}
+        """
+        cutoff = (now or time.time()) - UPLOAD_GC_GRACE_SECONDS
+        with self.open_db() as conn:
+            candidates = conn.execute('''
+                SELECT filename, size FROM uploads
+                WHERE refcount = 0 AND orphaned_at < ?
+                ORDER BY orphaned_at LIMIT ?
+            ''', (cutoff, limit)).fetchall()
+        if not candidates:
+            return {'files': 0, 'bytes': 0}
+
+        def delete(conn):
+            deleted = []
+            for row in candidates:
+                # 查詢後才被打卡參照的檔案不刪
+                cursor = conn.execute(
+                    "DELETE FROM uploads WHERE filename = ? AND refcount = 0", (row['filename'],)
+                )
+                if cursor.rowcount:
+                    deleted.append((row['filename'], row['size'] or 0))
+            return deleted
+
+        deleted = self.run_write(delete)
+        for filename, _ in deleted:
+            self._remove_file(filename)
+        freed = sum(size for _, size in deleted)
+        self.stats['collected'] += len(deleted)
+        self.stats['collected_bytes'] += freed
+        if deleted:
+            print(f"🧹 已清除 {len(deleted)} 個未使用的上傳檔（{freed / 1024 / 1024:.1f} MB）")
+        return {'files': len(deleted), 'bytes': freed}
+
+    # ---------- 重建 ----------
+
+    def reconcile(self, conn):
+        """
+        依磁碟上的檔案與 checkins 的 photo_url 重建 uploads（由呼叫端 commit）
+        磁碟上沒有參照的檔案從現在開始計算寬限期；紀錄中已不存在的檔案移除
+        """
+        now = time.time()
+        refs = {}
+        for row in conn.execute('''
+            SELECT photo_url, MIN(user_id) AS user_id, COUNT(*) AS n FROM checkins
+            WHERE photo_url LIKE '/static/uploads/%' GROUP BY photo_url
+        '''):
+            filename = upload_filename(row['photo_url'])
+            if filename:
+                refs[filename] = (row['user_id'], row['n'])
+
+        rows, on_disk = [], set()
+        if os.path.isdir(self.upload_dir):
+            with os.scandir(self.upload_dir) as entries:
+                for entry in entries:
+                    if not entry.is_file() or entry.name.startswith('.'):
+                        continue
+                    on_disk.add(entry.name)
+                    # 沒有參照的檔案依命名規則 {user_id}_{spot_id}_{隨機}.{副檔名} 取出擁有者
+                    user_id, refcount = refs.get(entry.name) or (entry.name.rsplit('_', 2)[0], 0)
+                    stat = entry.stat()
+                    rows.append((entry.name, user_id, stat.st_size, refcount,
+                                 stat.st_mtime, None if refcount else now))
+
+        for start in range(0, len(rows), RECONCILE_CHUNK):
+            conn.executemany('''
+                INSERT INTO uploads (filename, user_id, size, refcount, created_at, orphaned_at)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT (filename) DO UPDATE SET
+                    size = excluded.size,
+                    refcount = excluded.refcount,
+                    orphaned_at = CASE WHEN excluded.refcount > 0 THEN NULL
+                                       ELSE COALESCE(uploads.orphaned_at, excluded.orphaned_at) END
+            ''', rows[start:start + RECONCILE_CHUNK])
+
+        missing = [(name,) for (name,) in conn.execute("SELECT filename FROM uploads") if name not in on_disk]
+        conn.executemany("DELETE FROM uploads WHERE filename = ?", missing)
+        return {'files': len(rows), 'referenced': sum(1 for r in rows if r[3]),
+                'missing_files': len(missing), 'missing_references': len(set(refs) - on_disk)}
+
+    # ---------- 用量 ----------
+
+    def usage(self, user_id):
+        """單一用戶的上傳用量"""
+        with self.open_db() as conn:
+            row = conn.execute('''
+                SELECT COUNT(*) AS files, COALESCE(SUM(size), 0) AS bytes,
+                       COALESCE(SUM(CASE WHEN refcount > 0 THEN size ELSE 0 END), 0) AS referenced_bytes
+                FROM uploads WHERE user_id = ?
+            ''', (user_id,)).fetchone()
+        return {'user_id': user_id, 'files': row['files'], 'bytes': row['bytes'],
+                'referenced_bytes': row['referenced_bytes']}
+
+    def totals(self, top=10):
+        """全站用量、待清除量、用量最多的用戶與磁碟剩餘空間"""
+        with self.open_db() as conn:
+            row = conn.execute('''
+                SELECT COUNT(*) AS files, COALESCE(SUM(size), 0) AS bytes,
+                       COALESCE(SUM(CASE WHEN refcount = 0 THEN 1 ELSE 0 END), 0) AS orphaned_files,
+                       COALESCE(SUM(CASE WHEN refcount = 0 THEN size ELSE 0 END), 0) AS orphaned_bytes
+                FROM uploads
+            ''').fetchone()
+            users = conn.execute('''
+                SELECT user_id, COUNT(*) AS files, SUM(size) AS bytes FROM uploads
+                GROUP BY user_id ORDER BY bytes DESC LIMIT ?
+            ''', (top,)).fetchall()
+        result = dict(row)
+        result['top_users'] = [dict(u) for u in users]
+        if os.path.isdir(self.upload_dir):
+            disk = shutil.disk_usage(self.upload_dir)
+            result['disk'] = {'total': disk.total, 'used': disk.used, 'free': disk.free}
+        return result
+
+
+upload_store = UploadStore()
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    command = argv[0] if argv else ''
+    if command not in ('gc', 'reconcile', 'usage'):
+        print("用法：python upload_store.py gc | reconcile | usage")
+        return 1
+    import app as retire_app
+
+    if command == 'gc':
+        total = {'files': 0, 'bytes': 0}
+        while True:
+            result = upload_store.collect()
+            total['files'] += result['files']
+            total['bytes'] += result['bytes']
+            if result['files'] < UPLOAD_GC_BATCH:
+                break
+        print(f"✅ GC 完成：刪除 {total['files']:,} 個檔案，釋放 {total['bytes'] / 1024 / 1024:.1f} MB")
+    elif command == 'reconcile':
+        with retire_app.get_db(immediate=True) as conn:
+            result = upload_store.reconcile(conn)
+            conn.commit()
+        print(f"✅ uploads 已重建：{result['files']:,} 個檔案（{result['referenced']:,} 個有參照），"
+              f"移除 {result['missing_files']:,} 筆不存在的紀錄，{result['missing_references']:,} 個打卡照片遺失")
+    else:
+        totals = upload_store.totals()
+        print(f"📦 {totals['files']:,} 個檔案，{totals['bytes'] / 1024 / 1024:.1f} MB；"
+              f"待清除 {totals['orphaned_files']:,} 個（{totals['orphaned_bytes'] / 1024 / 1024:.1f} MB）")
+        for user in totals['top_users']:
+            print(f"   {user['user_id']:<36}{user['files']:>8,}{user['bytes'] / 1024 / 1024:>10.1f} MB")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,504 @@
+"""
+用戶資料匯出 / 匯入（ZIP：每張表一個 JSON Lines 檔 + 打卡照片）
+- 匯出邊查邊寫：每張表以 id 分頁讀取（每頁 ARCHIVE_BATCH_SIZE 筆），ZIP 寫到只保留一小段的緩衝區，
+  累積到 ARCHIVE_CHUNK_SIZE 就交給回應送出，記憶體用量與用戶資料量無關
+- 匯入時上傳檔先寫到暫存檔，逐行讀取各表並分批寫入（每批一個交易）
+- 景點 / 路線 / 成就在不同站台的 id 可能不同：匯出時附上名稱與成就代碼，匯入時依名稱對應回本站 id；
+  願望的新 id 會套用到旅遊紀錄的 wish_id
+- 打卡照片以新的檔名寫入 static/uploads；打卡經由 app 的 insert_checkin 寫入，已打卡過的景點略過（不重複打卡）
+- 重複匯入同一個檔案不會產生重複資料：願望以（名稱, 建立時間）、旅遊紀錄以（旅遊日期, 建立時間）
+  比對用戶既有資料，已存在就略過（願望沿用既有 id 給旅遊紀錄對應）
+- 匯入前先檢查：每個照片檔與所有檔案解壓後的總大小不得超過上限（ZIP 宣告的大小，解壓時也以此為界），
+  每一行必須是 JSON 物件、欄位型別正確（寫入前先完整讀過一次）；不符時整個檔案不匯入（ArchiveError）
+- 每批各自 commit，資料庫錯誤等中途失敗時已寫入的批次會保留；重新匯入同一個檔案即可補齊（已存在的資料會略過）
+
+環境變數：
+    ARCHIVE_BATCH_SIZE              每批筆數（預設 500）
+    ARCHIVE_MAX_UPLOAD_BYTES        上傳的 ZIP 檔上限（預設 200 MB）
+    ARCHIVE_MAX_PHOTO_BYTES         單張照片解壓後上限（預設 20 MB）
+    ARCHIVE_MAX_UNCOMPRESSED_BYTES  所有檔案解壓後總和上限（預設 1 GB）
+
+ZIP 內容：
+    wishes.jsonl / travel_logs.jsonl / checkins.jsonl / achievements.jsonl / settings.jsonl
+    photos/<檔名>
+    manifest.json（最後寫入，含各表筆數）
+
+命令列（站台間搬移用戶）：
+    python user_archive.py export <user_id> <輸出.zip>
+    python user_archive.py import <檔案.zip> [目標 user_id]
+"""
+
+import io
+import os
+import sys
+import json
+import uuid
+import zlib
+import zipfile
+import itertools
+from datetime import datetime, timezone
+import repository
+from upload_store import upload_store, upload_filename, upload_url
+
+ARCHIVE_FORMAT = 'retire-reading-user'
+ARCHIVE_VERSION = 1
+ARCHIVE_BATCH_SIZE = int(os.environ.get('ARCHIVE_BATCH_SIZE', '500'))
+ARCHIVE_CHUNK_SIZE = 64 * 1024
+ARCHIVE_MAX_UPLOAD_BYTES = int(os.environ.get('ARCHIVE_MAX_UPLOAD_BYTES', str(200 * 1024 * 1024)))
+ARCHIVE_MAX_PHOTO_BYTES = int(os.environ.get('ARCHIVE_MAX_PHOTO_BYTES', str(20 * 1024 * 1024)))
+ARCHIVE_MAX_UNCOMPRESSED_BYTES = int(os.environ.get('ARCHIVE_MAX_UNCOMPRESSED_BYTES', str(1024 * 1024 * 1024)))
+
+_TEXT = (str,)
+_INT = (int,)
+_NUMBER = (int, float)
+
+# 匯入檔每一行的欄位型別（值可為 null；REQUIRED_FIELDS 內的欄位不可缺少）
+ROW_FIELDS = {
+    'settings.jsonl': {'display_name': _TEXT, 'total_distance': _NUMBER, 'total_spots': _INT},
+    'wishes.jsonl': {'id': _INT, 'name': _TEXT, 'region': _TEXT, 'description': _TEXT, 'best_season': _TEXT,
+                     'budget': _NUMBER, 'priority': _INT, 'completed': _INT, 'completed_date': _TEXT,
+                     'notes': _TEXT, 'created_at': _TEXT},
+    'travel_logs.jsonl': {'wish_id': _INT, 'route_name': _TEXT, 'travel_date': _TEXT, 'actual_budget': _NUMBER,
+                          'rating': _INT, 'photos': _TEXT, 'diary': _TEXT, 'weather': _TEXT,
+                          'companions': _TEXT, 'created_at': _TEXT},
+    'checkins.jsonl': {'spot_name': _TEXT, 'route_name': _TEXT, 'checkin_date': _TEXT, 'photo_url': _TEXT,
+                       'note': _TEXT},
+    'achievements.jsonl': {'code': _TEXT, 'unlocked_at': _TEXT},
+}
+REQUIRED_FIELDS = {
+    'wishes.jsonl': ('id', 'name'),
+    'checkins.jsonl': ('spot_name',),
+    'achievements.jsonl': ('code',),
+}
+
+# 用戶設定只有一筆，不分頁
+SETTINGS_QUERY = '''
+    SELECT display_name, total_distance, total_spots, created_at FROM user_settings WHERE user_id = ?
+'''
+
+# (檔名, 查詢)：查詢以 id 分頁，? 依序為 user_id、上一頁最後的 id、筆數
+EXPORT_TABLES = (
+    ('wishes.jsonl', '''
+        SELECT id, name, region, description, best_season, budget, priority,
+               completed, completed_date, notes, created_at
+        FROM wishes WHERE user_id = ? AND id > ? ORDER BY id LIMIT ?
+    '''),
+    ('travel_logs.jsonl', '''
+        SELECT l.id, l.wish_id, r.name AS route_name, l.travel_date, l.actual_budget, l.rating,
+               l.photos, l.diary, l.weather, l.companions, l.created_at
+        FROM travel_logs l LEFT JOIN routes r ON l.route_id = r.id
+        WHERE l.user_id = ? AND l.id > ? ORDER BY l.id LIMIT ?
+    '''),
+    ('checkins.jsonl', '''
+        SELECT c.id, s.name AS spot_name, r.name AS route_name, c.checkin_date,
+               c.photo_url, c.note, c.rating, c.created_at
+        FROM checkins c JOIN spots s ON c.spot_id = s.id LEFT JOIN routes r ON s.route_id = r.id
+        WHERE c.user_id = ? AND c.id > ? ORDER BY c.id LIMIT ?
+    '''),
+    ('achievements.jsonl', '''
+        SELECT ua.id, a.code, ua.unlocked_at
+        FROM user_achievements ua JOIN achievements a ON ua.achievement_id = a.id
+        WHERE ua.user_id = ? AND ua.id > ? ORDER BY ua.id LIMIT ?
+    '''),
+)
+
+
+class ArchiveError(ValueError):
+    """匯入檔格式錯誤"""
+
+
+class _ChunkBuffer:
+    """ZipFile 的輸出目標：只實作 write/flush（不可 seek，ZipFile 會改用 data descriptor）"""
+
+    def __init__(self):
+        self.chunks = []
+        self.size = 0
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.size += len(data)
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def take(self):
+        data = b''.join(self.chunks)
+        self.chunks, self.size = [], 0
+        return data
+
+
+class UserArchive:
+    """匯出 / 匯入（由 app 注入資料庫與打卡寫入函式）"""
+
+    def __init__(self):
+        self.open_db = None
+        self.run_write = None
+        self.insert_checkin = None
+        self.record_change = None
+        self.upload_dir = None
+
+    def configure(self, open_db, run_write, insert_checkin, record_change, upload_dir):
+        self.open_db = open_db
+        self.run_write = run_write
+        self.insert_checkin = insert_checkin
+        self.record_change = record_change
+        self.upload_dir = upload_dir
+
+    # ---------- 匯出 ----------
+
+    def export_stream(self, user_id):
+        """產生 ZIP 內容的 bytes 片段（給 Flask 串流回應或寫檔）"""
+        buffer = _ChunkBuffer()
+        counts = {}
+        with zipfile.ZipFile(buffer, 'w', compression=zipfile.ZIP_DEFLATED) as zf:
+            with self.open_db() as conn:
+                settings = conn.execute(SETTINGS_QUERY, (user_id,)).fetchone()
+                zf.writestr('settings.jsonl', json.dumps(dict(settings), ensure_ascii=False) + '\n' if settings else '')
+                counts['settings.jsonl'] = 1 if settings else 0
+
+                for name, query in EXPORT_TABLES:
+                    counts[name] = 0
+                    with zf.open(name, 'w', force_zip64=True) as out:
+                        last = -1
+                        while True:
+                            rows = conn.execute(query, (user_id, last, ARCHIVE_BATCH_SIZE)).fetchall()
+                            if not rows:
+                                break
+                            last = rows[-1]['id']
+                            for row in rows:
+                                out.write(json.dumps(dict(row), ensure_ascii=False).encode('utf-8') + b'\n')
+                            counts[name] += len(rows)
+                            if buffer.size >= ARCHIVE_CHUNK_SIZE:
+                                yield buffer.take()
+
+                counts['photos'] = 0
+                for filename in self._photo_files(conn, user_id):
+                    path = os.path.join(self.upload_dir, filename)
+                    if not os.path.isfile(path):
+                        continue
+                    # 照片已是壓縮格式，直接存入
+                    with open(path, 'rb') as src, zf.open(zipfile.ZipInfo(f'photos/{filename}'), 'w') as out:
+                        while True:
+                            data = src.read(ARCHIVE_CHUNK_SIZE)
+                            if not data:
+                                break
+                            out.write(data)
+                            if buffer.size >= ARCHIVE_CHUNK_SIZE:
+                                yield buffer.take()
+                    counts['photos'] += 1
+
+            zf.writestr('manifest.json', json.dumps({
+                'format': ARCHIVE_FORMAT,
+                'version': ARCHIVE_VERSION,
+                'user_id': user_id,
+                'exported_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+                'counts': counts,
+            }, ensure_ascii=False, indent=2))
+        yield buffer.take()
+
+    def _photo_files(self, conn, user_id):
+        last = -1
+        while True:
+            rows = conn.execute('''
+                SELECT id, photo_url FROM checkins
+                WHERE user_id = ? AND id > ? AND photo_url IS NOT NULL ORDER BY id LIMIT ?
+            ''', (user_id, last, ARCHIVE_BATCH_SIZE)).fetchall()
+            if not rows:
+                return
+            last = rows[-1]['id']
+            for row in rows:
+                filename = upload_filename(row['photo_url'])
+                if filename:
+                    yield filename
+
+    def export_to_file(self, user_id, path):
+        with open(path, 'wb') as f:
+            for chunk in self.export_stream(user_id):
+                f.write(chunk)
+
+    # ---------- 匯入 ----------
+
+    def import_file(self, path, user_id=None):
+        """
+        匯入 ZIP 檔（user_id 為 None 時匯入到原本的用戶）
+
+        Returns:
+            dict: 各類資料的匯入 / 略過筆數
+        """
+        try:
+            zf = zipfile.ZipFile(path)
+        except zipfile.BadZipFile as e:
+            raise ArchiveError(f'不是 ZIP 檔案: {e}')
+        with zf:
+            _check_sizes(zf)
+            try:
+                manifest = json.loads(zf.read('manifest.json'))
+            except (KeyError, ValueError):
+                raise ArchiveError('缺少 manifest.json')
+            if (not isinstance(manifest, dict) or manifest.get('format') != ARCHIVE_FORMAT
+                    or manifest.get('version') != ARCHIVE_VERSION):
+                raise ArchiveError('不支援的匯出格式')
+            user_id = user_id or manifest.get('user_id')
+            if not user_id or not isinstance(user_id, str):
+                raise ArchiveError('未指定用戶')
+            # 先完整讀過一次檢查格式，格式錯誤時不寫入任何資料
+            try:
+                for name in ROW_FIELDS:
+                    for _ in _read_batches(zf, name):
+                        pass
+            except (zipfile.BadZipFile, zlib.error) as e:
+                raise ArchiveError(f'ZIP 檔損毀: {e}')
+
+            catalog = self._catalog()
+            result = {'user_id': user_id, 'wishes': 0, 'wishes_skipped': 0, 'travel_logs': 0,
+                      'travel_logs_skipped': 0, 'checkins': 0, 'checkins_skipped': 0, 'photos': 0,
+                      'achievements': 0}
+            wish_ids = {}
+
+            for batch in _read_batches(zf, 'settings.jsonl'):
+                self.run_write(self._import_settings, user_id, batch)
+            for batch in _read_batches(zf, 'wishes.jsonl'):
+                ids, created = self.run_write(self._import_wishes, user_id, batch)
+                wish_ids.update(ids)
+                result['wishes'] += created
+                result['wishes_skipped'] += len(batch) - created
+            for batch in _read_batches(zf, 'travel_logs.jsonl'):
+                created = self.run_write(self._import_travel_logs, user_id, batch, catalog, wish_ids)
+                result['travel_logs'] += created
+                result['travel_logs_skipped'] += len(batch) - created
+            for batch in _read_batches(zf, 'checkins.jsonl'):
+                created, photos = self._import_checkins(zf, user_id, batch, catalog)
+                result['checkins'] += created
+                result['checkins_skipped'] += len(batch) - created
+                result['photos'] += photos
+            for batch in _read_batches(zf, 'achievements.jsonl'):
+                result['achievements'] += self.run_write(self._import_achievements, user_id, batch, catalog)
+
+        print(f"✅ 用戶資料已匯入 {user_id}：願望 {result['wishes']}（略過 {result['wishes_skipped']}）、"
+              f"旅遊紀錄 {result['travel_logs']}（略過 {result['travel_logs_skipped']}）、"
+              f"打卡 {result['checkins']}（略過 {result['checkins_skipped']}）、照片 {result['photos']}")
+        return result
+
+    def _catalog(self):
+        """本站的路線 / 景點 / 成就對照（依名稱與代碼）"""
+        with self.open_db() as conn:
+            routes = {r['name']: r['id'] for r in conn.execute("SELECT id, name FROM routes")}
+            spots = {}
+            for r in conn.execute('''
+                SELECT s.id, s.route_id, s.name, r.name AS route_name
+                FROM spots s LEFT JOIN routes r ON s.route_id = r.id
+            '''):
+                spots[(r['route_name'], r['name'])] = (r['id'], r['route_id'])
+                spots.setdefault((None, r['name']), (r['id'], r['route_id']))
+            achievements = {r['code']: r['id'] for r in conn.execute("SELECT id, code FROM achievements")}
+        return {'routes': routes, 'spots': spots, 'achievements': achievements}
+
+    def _import_settings(self, conn, user_id, rows):
+        for row in rows:
+            conn.execute('''
+                INSERT OR IGNORE INTO user_settings (user_id, display_name, total_distance, total_spots)
+                VALUES (?, ?, ?, ?)
+            ''', (user_id, row.get('display_name'), row.get('total_distance') or 0, row.get('total_spots') or 0))
+
+    def _import_wishes(self, conn, user_id, rows):
+        """回傳 ({匯出檔的 wish id: 本站 id}, 新增筆數)；已存在的願望略過並沿用既有 id"""
+        ids, created = {}, 0
+        for row in rows:
+            existing = repository.find_wish_id(conn, user_id, row['name'], row.get('created_at'))
+            if existing is not None:
+                ids[row['id']] = existing
+                continue
+            new_id = conn.execute('''
+                INSERT INTO wishes (name, region, description, best_season, budget, priority,
+                                    completed, completed_date, notes, created_at, user_id)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                RETURNING id
+            ''', (row['name'], row.get('region'), row.get('description'), row.get('best_season'),
+                  row.get('budget') or 0, row.get('priority') or 3, row.get('completed') or 0,
+                  row.get('completed_date'), row.get('notes'), row.get('created_at'), user_id)).fetchone()[0]
+            ids[row['id']] = new_id
+            created += 1
+        if created:
+            self.record_change(conn, 'user', user_id)
+        return ids, created
+
+    def _import_travel_logs(self, conn, user_id, rows, catalog, wish_ids):
+        """回傳新增筆數；已存在的紀錄略過"""
+        rows = [row for row in rows
+                if repository.find_travel_log_id(conn, user_id, row.get('travel_date'), row.get('created_at')) is None]
+        if not rows:
+            return 0
+        conn.executemany('''
+            INSERT INTO travel_logs (wish_id, route_id, travel_date, actual_budget, rating,
+                                     photos, diary, weather, companions, created_at, user_id)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', [(wish_ids.get(row.get('wish_id')), catalog['routes'].get(row.get('route_name')),
+               row.get('travel_date'), row.get('actual_budget'), row.get('rating') or 5, row.get('photos'),
+               row.get('diary'), row.get('weather'), row.get('companions'), row.get('created_at'), user_id)
+              for row in rows])
+        self.record_change(conn, 'user', user_id)
+        return len(rows)
+
+    def _import_checkins(self, zf, user_id, rows, catalog):
+        """一批打卡：照片先解壓到 uploads 並登記，交易失敗或略過的打卡再刪除照片"""
+        pending, extracted = [], []
+        try:
+            for row in rows:
+                spot = (catalog['spots'].get((row.get('route_name'), row.get('spot_name')))
+                        or catalog['spots'].get((None, row.get('spot_name'))))
+                if spot is None:
+                    continue
+                photo = self._extract_photo(zf, user_id, spot[0], row.get('photo_url'))
+                if photo:
+                    extracted.append((photo[0], user_id, photo[1]))
+                pending.append({'row': row, 'spot_id': spot[0], 'photo': upload_url(photo[0]) if photo else None})
+        except Exception:
+            # 尚未登記的照片不會被 GC 看到，直接刪除
+            for filename, _, _ in extracted:
+                os.remove(os.path.join(self.upload_dir, filename))
+            raise
+        upload_store.register_many(extracted)
+
+        def write(conn):
+            for item in pending:
+                row = item['row']
+                # created 才算匯入；duplicate（已打卡）/ not_found 都略過
+                status, _ = self.insert_checkin(conn, user_id, item['spot_id'], row.get('note'), item['photo'],
+                                                checkin_date=row.get('checkin_date'))
+                item['created'] = status == 'created'
+
+        try:
+            self.run_write(write)
+        except Exception:
+            for item in pending:
+                upload_store.discard(item['photo'])
+            raise
+        photos = 0
+        for item in pending:
+            if not item.get('created'):
+                upload_store.discard(item['photo'])
+            elif item['photo']:
+                photos += 1
+        return sum(1 for item in pending if item.get('created')), photos
+
+    def _extract_photo(self, zf, user_id, spot_id, photo_url):
+        """將照片寫到 uploads（以新檔名，不使用壓縮檔內的路徑），回傳 (新檔名, bytes)"""
+        filename = upload_filename(photo_url)
+        if not filename:
+            return None
+        try:
+            src = zf.open(f'photos/{filename}')
+        except KeyError:
+            return None
+        ext = filename.rsplit('.', 1)[-1].lower() if '.' in filename else 'jpg'
+        new_name = f"{user_id}_{spot_id}_{uuid.uuid4().hex[:8]}.{ext}"
+        os.makedirs(self.upload_dir, exist_ok=True)
+        path = os.path.join(self.upload_dir, new_name)
+        try:
+            with src, open(path, 'wb') as dst:
+                size = _copy_photo(src, dst, filename)
+        except BaseException:
+            if os.path.exists(path):
+                os.remove(path)
+            raise
+        return new_name, size
+
+    def _import_achievements(self, conn, user_id, rows, catalog):
+        imported = 0
+        for row in rows:
+            achievement_id = catalog['achievements'].get(row.get('code'))
+            if achievement_id is None:
+                continue
+            cursor = conn.execute('''
+                INSERT OR IGNORE INTO user_achievements (user_id, achievement_id, unlocked_at)
+                VALUES (?, ?, ?)
+            ''', (user_id, achievement_id, row.get('unlocked_at')))
+            imported += max(cursor.rowcount, 0)
+        self.record_change(conn, 'user', user_id)
+        return imported
+
+
+def _check_sizes(zf):
+    """依 ZIP 宣告的解壓大小檢查單張照片與總和上限（ZipExtFile 解壓時也不會超過宣告的大小）"""
+    total = 0
+    for info in zf.infolist():
+        if info.filename.startswith('photos/') and info.file_size > ARCHIVE_MAX_PHOTO_BYTES:
+            raise ArchiveError(f'照片 {info.filename} 超過 {ARCHIVE_MAX_PHOTO_BYTES // 1024 // 1024} MB')
+        total += info.file_size
+    if total > ARCHIVE_MAX_UNCOMPRESSED_BYTES:
+        raise ArchiveError(f'解壓後超過 {ARCHIVE_MAX_UNCOMPRESSED_BYTES // 1024 // 1024} MB')
+
+
+def _copy_photo(src, dst, filename):
+    """複製照片，超過 ARCHIVE_MAX_PHOTO_BYTES 或資料損毀時丟出 ArchiveError，回傳 bytes"""
+    size = 0
+    while True:
+        try:
+            data = src.read(ARCHIVE_CHUNK_SIZE)
+        except (zipfile.BadZipFile, zlib.error) as e:
+            raise ArchiveError(f'照片 {filename} 損毀: {e}')
+        if not data:
+            return size
+        size += len(data)
+        if size > ARCHIVE_MAX_PHOTO_BYTES:
+            raise ArchiveError(f'照片 {filename} 超過 {ARCHIVE_MAX_PHOTO_BYTES // 1024 // 1024} MB')
+        dst.write(data)
+
+
+def _parse_row(name, number, line):
+    """解析一行並檢查欄位型別（bool 不算整數）"""
+    row = json.loads(line)
+    if not isinstance(row, dict):
+        raise ArchiveError(f'{name} 第 {number} 行不是 JSON 物件')
+    for key in REQUIRED_FIELDS.get(name, ()):
+        if row.get(key) is None:
+            raise ArchiveError(f'{name} 第 {number} 行缺少 {key}')
+    for key, types in ROW_FIELDS.get(name, {}).items():
+        value = row.get(key)
+        if value is not None and (isinstance(value, bool) or not isinstance(value, types)):
+            raise ArchiveError(f'{name} 第 {number} 行的 {key} 格式錯誤')
+    return row
+
+
+def _read_batches(zf, name):
+    """逐行讀取 JSON Lines，每 ARCHIVE_BATCH_SIZE 筆一批（檔案不存在時不產生任何批次）"""
+    try:
+        raw = zf.open(name)
+    except KeyError:
+        return
+    with io.TextIOWrapper(raw, encoding='utf-8') as lines:
+        rows = (_parse_row(name, number, line) for number, line in enumerate(lines, 1) if line.strip())
+        while True:
+            try:
+                batch = list(itertools.islice(rows, ARCHIVE_BATCH_SIZE))
+            except ArchiveError:
+                raise
+            except ValueError as e:  # JSON 或 UTF-8 解碼錯誤
+                raise ArchiveError(f'{name} 格式錯誤: {e}')
+            if not batch:
+                return
+            yield batch
+
+
+user_archive = UserArchive()
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if len(argv) >= 3 and argv[0] == 'export':
+        import app  # noqa: F401  載入時設定 user_archive
+        user_archive.export_to_file(argv[1], argv[2])
+        print(f"✅ 已匯出 {argv[1]} → {argv[2]}")
+        return 0
+    if len(argv) >= 2 and argv[0] == 'import':
+        import app  # noqa: F401
+        user_archive.import_file(argv[1], argv[2] if len(argv) > 2 else None)
+        return 0
+    print("用法：python user_archive.py export <user_id> <輸出.zip>\n"
+          "      python user_archive.py import <檔案.zip> [目標 user_id]")
+    return 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())